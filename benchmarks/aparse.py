@@ -0,0 +1,89 @@
+"""Measure how long a large parse stalls an asyncio event loop
+
+Parses a generated document of key=value lines on an event loop while
+a heartbeat task records the longest gap between its turns, for
+parse() called directly, aparse() tagging in slices (the GIL-free
+engine switched off) and aparse() tagging in a worker thread.  The
+longest gap of the aparse() runs should stay far below the time of the
+parse; most of what remains is full collections of the cyclic garbage
+collector over the growing result (compare after gc.disable()).
+
+    python benchmarks/aparse.py [repeats] [lines] [slice steps]
+"""
+import asyncio
+import sys
+import time
+from simpleparse.parser import Parser
+from simpleparse.stt.TextTools import set_release_gil
+
+DECLARATION = r'''
+file := line*
+line := key, '=', value, '\n'
+key := [a-z]+
+value := [0-9]+
+'''
+
+
+def timeit(function, repeats):
+    best = None
+    for i in range(repeats):
+        t = time.perf_counter()
+        function()
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+async def stall(parse):
+    """Run parse(), return the longest gap between heartbeat turns"""
+    gaps = [0.0]
+    done = asyncio.Event()
+
+    async def heartbeat():
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0)
+            now = time.perf_counter()
+            gaps[0] = max(gaps[0], now - last)
+            last = now
+
+    task = asyncio.ensure_future(heartbeat())
+    await asyncio.sleep(0)
+    # freeing the result takes time as well, not counted here
+    result = await parse()
+    done.set()
+    await task
+    return gaps[0], result
+
+
+def main(repeats=5, lines=200000, steps=4096):
+    parser = Parser(DECLARATION, "file")
+    text = "".join("key%s=%d\n" % ("abc"[: i % 3 + 1], i) for i in range(lines))
+
+    async def blocking():
+        return parser.parse(text)
+
+    async def sliced():
+        set_release_gil(0)
+        try:
+            return await parser.aparse(text, sliceSteps=steps)
+        finally:
+            set_release_gil(1)
+
+    async def threaded():
+        return await parser.aparse(text)
+
+    print("%-10s %10s %14s" % ("method", "seconds", "longest stall"))
+    for name, parse in (
+        ("parse", blocking),
+        ("sliced", sliced),
+        ("thread", threaded),
+    ):
+        seconds = timeit(lambda: asyncio.run(parse()), repeats)
+        longest = min(asyncio.run(stall(parse))[0] for i in range(repeats))
+        print("%-10s %10.4f %14.6f" % (name, seconds, longest))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
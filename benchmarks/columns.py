@@ -0,0 +1,68 @@
+"""Compare converting results to columns in Python and with to_arrays()
+
+Parses a generated document of key=value lines and reports the best
+time to turn the result into tag, start, stop and depth columns with a
+Python walk over the tree and with to_arrays(), for the usual result
+and for a compact one.
+
+    python benchmarks/columns.py [repeats] [lines]
+"""
+import sys
+import time
+from array import array
+from simpleparse.parser import Parser
+from simpleparse.stt.TextTools import to_arrays
+
+DECLARATION = r'''
+file := line*
+line := key, '=', value, '\n'
+key := [a-z]+
+value := [0-9]+
+'''
+
+
+def timeit(function, repeats):
+    best = None
+    for i in range(repeats):
+        t = time.perf_counter()
+        function()
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def walk(children):
+    ids = {}
+    columns = [array("q") for i in range(4)]
+
+    def add(children, depth):
+        for tag, start, stop, subtree in children:
+            columns[0].append(ids.setdefault(tag, len(ids)))
+            columns[1].append(start)
+            columns[2].append(stop)
+            columns[3].append(depth)
+            if subtree:
+                add(subtree, depth + 1)
+
+    add(children, 0)
+    return tuple(columns) + (tuple(ids),)
+
+
+def main(repeats=5, lines=200000):
+    parser = Parser(DECLARATION, "file")
+    text = "".join("key%s=%d\n" % ("abc"[: i % 3 + 1], i) for i in range(lines))
+
+    print("%-8s %10s %10s" % ("result", "python", "to_arrays"))
+    for name, compact in (("tuples", False), ("compact", True)):
+        children = parser.parse(text, compact=compact)[1]
+        assert walk(children) == to_arrays(children)
+        print("%-8s %10.4f %10.4f" % (
+            name,
+            timeit(lambda: walk(children), repeats),
+            timeit(lambda: to_arrays(children), repeats),
+        ))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
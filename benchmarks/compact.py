@@ -0,0 +1,64 @@
+"""Compare the usual result tree with compact results
+
+Parses a generated document of key=value lines with parse() and with
+parse(..., compact=True) and reports the best time, the memory held by
+the result, the peak while parsing and the number of memory blocks
+held, as traced by tracemalloc, and the time to walk all nodes of the
+result.
+
+    python benchmarks/compact.py [repeats] [lines]
+"""
+import sys
+import time
+import tracemalloc
+from simpleparse.parser import Parser
+
+DECLARATION = r'''
+file := line*
+line := key, '=', value, '\n'
+key := [a-z]+
+value := [0-9]+
+'''
+
+
+def timeit(function, repeats):
+    best = None
+    for i in range(repeats):
+        t = time.perf_counter()
+        function()
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def walk(children):
+    count = 0
+    for tag, start, stop, subtree in children:
+        count += 1
+        if subtree:
+            count += walk(subtree)
+    return count
+
+
+def main(repeats=5, lines=200000):
+    parser = Parser(DECLARATION, "file")
+    text = "".join("key%s=%d\n" % ("abc"[: i % 3 + 1], i) for i in range(lines))
+
+    print("%-8s %9s %12s %12s %10s %9s" % (
+        "result", "seconds", "held bytes", "peak bytes", "blocks", "walk"))
+    for name, compact in (("tuples", False), ("compact", True)):
+        seconds = timeit(lambda: parser.parse(text, compact=compact), repeats)
+        tracemalloc.start()
+        result = parser.parse(text, compact=compact)
+        held, peak = tracemalloc.get_traced_memory()
+        blocks = sum(stat.count for stat in tracemalloc.take_snapshot().statistics("filename"))
+        tracemalloc.stop()
+        walking = timeit(lambda: walk(result[1]), repeats)
+        print("%-8s %9.4f %12d %12d %10d %9.4f" % (
+            name, seconds, held, peak, blocks, walking))
+        del result
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
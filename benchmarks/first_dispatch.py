@@ -0,0 +1,81 @@
+"""Measure FirstOf groups dispatching on the first character
+
+Parses the Python grammar with the EBNF grammar from
+examples/py_ebnf.py and a generated document with the XML grammar
+(simpleparse.xmlparser), using tables with the Dispatch entries
+(the default) and with the plain chains of alternatives
+(FirstOfGroup.maxDispatchGrowth = 0).
+
+    python benchmarks/first_dispatch.py [repeats]
+"""
+import os
+import sys
+import time
+from simpleparse.parser import Parser
+from simpleparse.objectgenerator import FirstOfGroup
+from simpleparse.stt.TextTools import tag, TagTable, BytesTagTable
+from simpleparse.xmlparser import xml_parser
+
+EXAMPLES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "examples")
+sys.path.insert(0, EXAMPLES)
+import py_ebnf
+
+
+def makeDocument(count):
+    items = []
+    for i in range(count):
+        items.append(
+            '  <item id="i%d" kind=\'%s\'>text &amp; more &#%d; '
+            '<b>bold</b><!-- note %d --><empty a="1"/></item>\n'
+            % (i, ("x", "y", "z")[i % 3], 65 + i % 26, i)
+        )
+    return (
+        '<?xml version="1.0"?>\n<!DOCTYPE items [ <!ELEMENT items ANY> ]>\n'
+        "<items>\n%s</items>\n" % ("".join(items),)
+    ).encode("utf-8")
+
+
+def buildTable(declaration, root, factory, dispatch):
+    previous = FirstOfGroup.maxDispatchGrowth
+    if not dispatch:
+        FirstOfGroup.maxDispatchGrowth = 0
+    try:
+        return factory(Parser(declaration, root)._generator.buildParser(root))
+    finally:
+        FirstOfGroup.maxDispatchGrowth = previous
+
+
+def timeit(function, repeats):
+    best = None
+    for i in range(repeats):
+        t = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - t
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main(repeats=5):
+    with open(os.path.join(EXAMPLES, "py_grammar.txt")) as file:
+        grammar = file.read() * 20
+    cases = [
+        ("py_ebnf", py_ebnf.declaration, "declarationset", TagTable, grammar),
+        ("xml", xml_parser.declaration, "document", BytesTagTable, makeDocument(5000)),
+    ]
+    print("%-10s %10s %12s %12s %8s" % ("grammar", "size", "chain (s)", "dispatch (s)", "speedup"))
+    for name, declaration, root, factory, text in cases:
+        old = buildTable(declaration, root, factory, 0)
+        new = buildTable(declaration, root, factory, 1)
+        result = tag(text, new)
+        assert result[0] and result == tag(text, old)
+        oldTime = timeit(lambda: tag(text, old), repeats)
+        newTime = timeit(lambda: tag(text, new), repeats)
+        print(
+            "%-10s %10d %12.4f %12.4f %7.2fx"
+            % (name, len(text), oldTime, newTime, oldTime / newTime)
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
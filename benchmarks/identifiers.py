@@ -0,0 +1,108 @@
+"""Measure character range matching on identifier-heavy input
+
+Compares the tables generated for the identifier grammar (Range
+productions compiled to AllInCharSet/IsInCharSet) against the same
+tables using AllIn/IsIn with the expanded character strings, for
+str input and for UTF-8 bytes input.
+
+    python benchmarks/identifiers.py [repeats]
+"""
+import random
+import sys
+import time
+from simpleparse.parser import Parser
+from simpleparse.stt.TextTools import (
+    tag, TagTable, EncodedTagTable, AllIn, IsIn, AllNotIn, IsNotIn, CharSetType,
+    Dispatch,
+)
+from simpleparse.stt.TextTools.TextTools import AllInCharSet
+
+declaration = r'''
+file := (ws, (identifier / number / punctuation))*, ws
+identifier := [a-zA-Z_], [a-zA-Z0-9_]*
+number := [0-9]+
+<punctuation> := []-+*/=<>(){}[.,:;]+
+<ws> := [ \t\n]*
+'''
+
+
+def makeText(size):
+    random.seed(0)
+    first = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ_'
+    rest = first + '0123456789'
+    words = []
+    total = 0
+    while total < size:
+        word = random.choice(first) + ''.join(
+            [random.choice(rest) for i in range(random.randint(2, 20))]
+        )
+        words.append(word)
+        words.append(random.choice([' ', ' = ', '(', ', ', ')\n', '.', ' + ']))
+        total += len(word) + 2
+    return ''.join(words)
+
+
+def expanded(table, tables, replacements):
+    """Replace the CharSet commands of table with AllIn/IsIn commands
+
+    TableInList references into tables are redirected to replacements;
+    Dispatch entries, which only pick the alternative to try, are kept.
+    """
+    result = []
+    for entry in table:
+        command, argument = entry[1], entry[2]
+        if command & 0xFF == Dispatch:
+            pass
+        elif isinstance(argument, tuple) and argument and argument[0] is tables:
+            entry = entry[:2] + ((replacements, argument[1]),) + entry[3:]
+        elif isinstance(argument, tuple):
+            entry = entry[:2] + (expanded(argument, tables, replacements),) + entry[3:]
+        elif isinstance(argument, CharSetType):
+            negative = chr(0x10FFFF) in argument
+            members = ''.join(
+                [chr(i) for i in range(128) if (chr(i) in argument) != negative]
+            )
+            if command & 0xFF == AllInCharSet:
+                replacement = AllNotIn if negative else AllIn
+            else:
+                replacement = IsNotIn if negative else IsIn
+            entry = (entry[0], command - (command & 0xFF) + replacement, members) + entry[3:]
+        result.append(entry)
+    return tuple(result)
+
+
+def timeit(function, repeats):
+    best = None
+    for i in range(repeats):
+        t = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - t
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main(repeats=5):
+    text = makeText(1000000)
+    data = text.encode('utf-8')
+    generator = Parser(declaration, 'file')._generator
+    charSetTable = generator.buildParser('file')
+    tables = generator.getParserList()
+    replacements = []
+    replacements.extend([expanded(table, tables, replacements) for table in tables])
+    expandedTable = expanded(charSetTable, tables, replacements)
+    assert tag(text, TagTable(expandedTable)) == tag(text, TagTable(charSetTable))
+    print('%-10s %12s %12s %8s' % ('input', 'AllIn (s)', 'CharSet (s)', 'speedup'))
+    for name, factory, value in (
+        ('str', TagTable, text),
+        ('utf-8', lambda table: EncodedTagTable(table, 'utf-8'), data),
+    ):
+        old = factory(expandedTable)
+        new = factory(charSetTable)
+        oldTime = timeit(lambda: tag(value, old), repeats)
+        newTime = timeit(lambda: tag(value, new), repeats)
+        print('%-10s %12.4f %12.4f %7.2fx' % (name, oldTime, newTime, oldTime / newTime))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
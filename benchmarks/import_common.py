@@ -0,0 +1,61 @@
+"""Measure the import time of the simpleparse.common library modules
+
+Each measurement runs in a fresh interpreter, simpleparse.parser is
+imported before the clock starts.  The time of building a parser which
+uses one library definition is reported separately, as the library
+grammars are only processed once a parser refers to them.  The last
+line adds building every library definition, for comparison with
+processing all of the library grammars up front as importing the
+modules used to.
+
+    python benchmarks/import_common.py [repeats]
+"""
+import subprocess
+import sys
+
+MODULES = [
+    "numbers",
+    "strings",
+    "iso_date",
+    "iso_date_loose",
+    "timezone_names",
+    "calendar_names",
+    "comments",
+]
+SCRIPT = """
+import time
+import simpleparse.parser
+t = time.perf_counter()
+import %(modules)s
+imported = time.perf_counter()
+simpleparse.parser.Parser("value := int", "value")
+built = time.perf_counter()
+for module in (%(modules)s):
+    list(module.c.values())
+print(imported - t, built - imported, time.perf_counter() - built)
+"""
+
+
+def measure(repeats):
+    script = SCRIPT % {
+        "modules": ", ".join(["simpleparse.common." + name for name in MODULES])
+    }
+    imports, builds, eager = [], [], []
+    for i in range(repeats):
+        output = subprocess.check_output([sys.executable, "-c", script])
+        imported, built, rest = [float(value) for value in output.split()]
+        imports.append(imported)
+        builds.append(built)
+        eager.append(imported + built + rest)
+    return min(imports), min(builds), min(eager)
+
+
+def main(repeats=10):
+    imported, built, eager = measure(repeats)
+    print("import %s: %.1f ms" % (", ".join(MODULES), imported * 1000))
+    print("first parser using int: %.1f ms" % (built * 1000))
+    print("import and build every definition: %.1f ms" % (eager * 1000))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,67 @@
+"""Compare incremental parsing with re-parsing a growing text
+
+Feeds a generated message of header lines in pieces to an incremental()
+parse, and against that parses the whole text received so far after
+every piece, as a caller without incremental() would.  The incremental
+time should stay close to that of a single parse of the message.
+
+    python benchmarks/incremental.py [repeats] [headers] [piece size]
+"""
+import sys
+import time
+from simpleparse.parser import Parser
+
+DECLARATION = r'''
+message := header*, '\r\n'
+header := name, ':', ' '?, value, '\r\n'
+name := [A-Za-z-]+
+value := -'\r\n'*
+'''
+
+
+def timeit(function, repeats):
+    best = None
+    for i in range(repeats):
+        t = time.perf_counter()
+        function()
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def main(repeats=5, headers=1000, size=64):
+    parser = Parser(DECLARATION, "message")
+    text = "".join(
+        "X-Header-%s: value %d\r\n" % ("abc"[: i % 3 + 1], i) for i in range(headers)
+    ) + "\r\n"
+    pieces = [text[i:i + size] for i in range(0, len(text), size)]
+
+    def whole():
+        parser.parse(text)
+
+    def incremental():
+        parse = parser.incremental()
+        for piece in pieces:
+            parse.feed(piece)
+        assert parse.done
+
+    def reparse():
+        received = ""
+        for piece in pieces:
+            received += piece
+            # the last header may be cut short, its outcome is unknown
+            parser.parse(received)
+
+    print("%d bytes in %d pieces" % (len(text), len(pieces)))
+    print("%-12s %10s" % ("method", "seconds"))
+    for name, function in (
+        ("parse", whole),
+        ("incremental", incremental),
+        ("reparse", reparse),
+    ):
+        print("%-12s %10.4f" % (name, timeit(function, repeats)))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,66 @@
+"""Compare iterparse with parsing a whole file at once
+
+Parses a generated file of key=value lines as a whole with parse() and
+record by record with iterparse(), reporting the best time and the peak
+memory (traced by tracemalloc) of each.  The peak of iterparse should
+stay flat as the number of lines grows.
+
+    python benchmarks/iterparse.py [repeats] [lines]
+"""
+import io
+import sys
+import time
+import tracemalloc
+from simpleparse.parser import Parser
+
+DECLARATION = r'''
+file := line*
+line := key, '=', value, '\n'
+key := [a-z]+
+value := [0-9]+
+'''
+
+
+def timeit(function, repeats):
+    best = None
+    for i in range(repeats):
+        t = time.perf_counter()
+        function()
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def peak(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main(repeats=5, lines=100000):
+    parser = Parser(DECLARATION, "file")
+    text = "".join("key%s=%d\n" % ("abc"[: i % 3 + 1], i) for i in range(lines))
+    file = io.StringIO(text)
+
+    def whole():
+        file.seek(0)
+        parser.parse(file.read())
+
+    def records():
+        file.seek(0)
+        for record in parser.iterparse(file, record="line"):
+            pass
+
+    print("%-10s %10s %14s" % ("method", "seconds", "peak bytes"))
+    for name, function in (("parse", whole), ("iterparse", records)):
+        print(
+            "%-10s %10.4f %14d" % (name, timeit(function, repeats), peak(function))
+        )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
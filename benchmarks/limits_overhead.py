@@ -0,0 +1,55 @@
+"""Measure the cost of max_steps and deadline
+
+Parses a nested list grammar without limits, with a step budget and
+with a deadline (which also counts steps and reads the clock every
+1024 of them), with both engines.  Limits which are not set cost one
+test per table entry.
+
+    python benchmarks/limits_overhead.py [repeats] [items]
+"""
+import sys
+import time
+from simpleparse.parser import Parser
+from simpleparse.stt.TextTools import set_release_gil
+
+DECLARATION = r'''
+list := item, (',', item)*
+item := ('[', list, ']') / number / word
+number := [0-9]+
+word := [a-z]+
+'''
+
+
+def timeit(function, repeats):
+    best = None
+    for i in range(repeats):
+        t = time.perf_counter()
+        function()
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def main(repeats=5, items=20000):
+    parser = Parser(DECLARATION, "list")
+    text = ",".join(
+        "[%d,[abc,%d]]" % (i, i) if i % 3 else "word" for i in range(items)
+    )
+    assert parser.parse(text)[-1] == len(text)
+    print("%-16s %10s %12s %12s" % ("engine", "no limits", "max_steps", "deadline"))
+    for release, engine in ((0, "holding the GIL"), (1, "GIL-free")):
+        set_release_gil(release)
+        try:
+            plain = timeit(lambda: parser.parse(text), repeats)
+            steps = timeit(lambda: parser.parse(text, max_steps=10**9), repeats)
+            deadline = timeit(
+                lambda: parser.parse(text, deadline=time.monotonic() + 60), repeats
+            )
+        finally:
+            set_release_gil(1)
+        print("%-16s %10.6f %12.6f %12.6f" % (engine, plain, steps, deadline))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
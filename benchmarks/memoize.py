@@ -0,0 +1,80 @@
+"""Measure memoized (packrat) parsing of an ambiguous grammar
+
+The expression grammar below tries every operator alternative of a
+production before falling back to the bare operand, so without
+memoization each alternative re-parses the operand from scratch:
+every level of parentheses multiplies the work by nine.  With
+Parser(..., memoize=True) the engine replays the outcome of a
+production it already tried at a position, and the time grows
+linearly with the nesting depth and with the length of the text.
+
+The GIL-free engine (the default for these callback-free tables)
+keeps the results as flat records; a replayed production refers to
+its stored records instead of copying them, as the engine holding
+the GIL shares its stored list, so both stay linear in the depth.
+The last line shows the deepest text holding the GIL.
+
+    python benchmarks/memoize.py [repeats] [plain depth limit]
+"""
+import sys
+import time
+from simpleparse.parser import Parser
+from simpleparse.stt.TextTools import set_release_gil
+
+DECLARATION = r'''
+expr := (term, '+', expr) / (term, '-', expr) / term
+term := (factor, '*', term) / (factor, '/', term) / factor
+factor := ('(', expr, ')') / number
+number := [0-9]+
+'''
+
+
+def nested(depth):
+    return "(" * depth + "1" + ")" * depth + "+2*3"
+
+
+def flat(count):
+    return "+".join("(%d*%d)" % (i, i + 1) for i in range(count))
+
+
+def timeit(function, repeats):
+    best = None
+    for i in range(repeats):
+        t = time.perf_counter()
+        function()
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def main(repeats=5, plainLimit=6):
+    memoized = Parser(DECLARATION, "expr", memoize=True)
+    plain = Parser(DECLARATION, "expr")
+    cases = [("depth %d" % depth, nested(depth)) for depth in (1, 2, 4, 6, 8, 16, 64, 256, 1024)]
+    cases += [("%d terms" % count, flat(count)) for count in (10, 100, 1000, 10000)]
+    print("%-12s %8s %12s %12s %12s" % ("text", "length", "plain", "memo", "memo/char"))
+    for description, text in cases:
+        result = memoized.parse(text)
+        assert result[-1] == len(text), (description, result[-1])
+        memo = timeit(lambda: memoized.parse(text), repeats)
+        depth = text.count("(") if text.startswith("((") else 0
+        if depth <= plainLimit and len(text) <= 1000:
+            assert plain.parse(text) == result, description
+            plainTime = "%12.6f" % timeit(lambda: plain.parse(text), repeats)
+        else:
+            plainTime = "%12s" % "-"
+        print("%-12s %8d %s %12.6f %12.3g" % (
+            description, len(text), plainTime, memo, memo / len(text)))
+    # the GIL-free engine uses its own memo of result records
+    set_release_gil(0)
+    try:
+        text = nested(1024)
+        held = timeit(lambda: memoized.parse(text), repeats)
+    finally:
+        set_release_gil(1)
+    print("depth 1024 holding the GIL: %.6f" % (held,))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,92 @@
+"""Measure repeating negative FirstOf groups of literals
+
+Parses a generated template, in which the text between the "{{",
+"{%" and "{#" tags is matched by a repeating negative group of the
+three tag starts, with tables moving through that text a character
+at a time (FirstOfGroup.minSearchSize = 10**9) and with a single
+MultiTextSearch per run of text (the default).  Also times
+TextTools.findall with the list of the tag starts against a
+regular expression alternation.
+
+    python benchmarks/multi_search.py [repeats]
+"""
+import re
+import sys
+import time
+from simpleparse.parser import Parser
+from simpleparse.objectgenerator import FirstOfGroup
+from simpleparse.stt.TextTools import tag, TagTable, BytesTagTable
+from simpleparse.stt.TextTools.TextTools import findall
+
+declaration = r'''
+template := (text / variable / block / comment)*
+text := -("{{" / "{%" / "{#")+
+variable := "{{", -"}}"*, "}}"
+block := "{%", -"%}"*, "%}"
+comment := "{#", -"#}"*, "#}"
+'''
+
+STARTS = ["{{", "{%", "{#"]
+
+
+def makeTemplate(count):
+    items = []
+    for i in range(count):
+        items.append(
+            "<p class='item'>Dear {{ name_%d }}, your order of %d items "
+            "{%% if shipped %%}has shipped{%% endif %%} -- {# note %d #}"
+            "see the {braces} and 100%% {details} below.</p>\n" % (i, i, i)
+        )
+    return "".join(items)
+
+
+def buildTable(factory, size):
+    previous = FirstOfGroup.minSearchSize
+    FirstOfGroup.minSearchSize = size
+    try:
+        return factory(Parser(declaration, "template")._generator.buildParser("template"))
+    finally:
+        FirstOfGroup.minSearchSize = previous
+
+
+def timeit(function, repeats):
+    best = None
+    for i in range(repeats):
+        t = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - t
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main(repeats=5):
+    template = makeTemplate(20000)
+    print("%-10s %10s %12s %12s %8s" % ("text", "size", "chain (s)", "search (s)", "speedup"))
+    for name, factory, text in (
+        ("str", TagTable, template),
+        ("bytes", BytesTagTable, template.encode("utf-8")),
+    ):
+        old = buildTable(factory, 10**9)
+        new = buildTable(factory, FirstOfGroup.minSearchSize)
+        result = tag(text, new)
+        assert result[0] and result[-1] == len(text) and result == tag(text, old)
+        oldTime = timeit(lambda: tag(text, old), repeats)
+        newTime = timeit(lambda: tag(text, new), repeats)
+        print(
+            "%-10s %10d %12.4f %12.4f %7.2fx"
+            % (name, len(text), oldTime, newTime, oldTime / newTime)
+        )
+
+    pattern = re.compile("|".join(re.escape(start) for start in STARTS))
+    expected = [match.span() for match in pattern.finditer(template)]
+    assert findall(template, STARTS) == expected
+    reTime = timeit(lambda: [match.span() for match in pattern.finditer(template)], repeats)
+    searchTime = timeit(lambda: findall(template, STARTS), repeats)
+    print(
+        "findall: re %.4f s, MultiTextSearch %.4f s (%.2fx)"
+        % (reTime, searchTime, reTime / searchTime)
+    )
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
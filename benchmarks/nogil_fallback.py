@@ -0,0 +1,87 @@
+"""Measure the cost of the GIL-free engine falling back to the standard one
+
+The GIL-free engine stops if it meets a child table it can't run, which
+is only possible if a TableInList list was changed after the table was
+checked (TagTable.releases_gil()).  The standard engine then re-runs the
+whole parse, so the worst case, a changed table at the end of the text,
+adds the GIL-free matching of the whole text to the standard run (the
+records are only converted to result tuples after a completed run, so
+this is the smaller part of a GIL-free parse; about a fifth of a parse
+holding the GIL for the text used here).  The tables are checked again
+after a fallback, so the later parses of that table go to the standard
+engine directly; the last column shows such a parse.  Errors are raised
+by the GIL-free engine itself and cost no re-run.
+
+    python benchmarks/nogil_fallback.py [repeats] [items]
+"""
+import sys
+import time
+from simpleparse.parser import Parser
+from simpleparse.stt.TextTools import (
+    tag, set_release_gil, TagTable, Table, TableInList, AllIn, Call,
+)
+
+DECLARATION = r'''
+list := item, (',', item)*
+item := ('[', list, ']') / number / word
+number := [0-9]+
+word := [a-z]+
+'''
+
+
+def skip(text, start, stop):
+    return stop
+
+
+def timeit(function, repeats, setup=None):
+    best = None
+    for i in range(repeats):
+        if setup is not None:
+            setup()
+        t = time.perf_counter()
+        function()
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def main(repeats=5, items=20000):
+    body = Parser(DECLARATION, "list").getTagger(None, None, TagTable)
+    text = ",".join(
+        "[%d,[abc,%d]]" % (i, i) if i % 3 else "word" for i in range(items)
+    ) + ";"
+    tables = []
+    state = {}
+
+    def arm():
+        # a fresh root table, checked while its tail is callback-free
+        tables[:] = [TagTable((("tail", AllIn, ";"),))]
+        state["root"] = root = TagTable((
+            ("list", Table, body),
+            ("tail", TableInList, (tables, 0)),
+        ))
+        assert root.releases_gil()
+        tables[0] = TagTable((("tail", Call, skip),))
+
+    def parse():
+        assert tag(text, state["root"])[-1] == len(text)
+
+    arm()
+    released = timeit(lambda: tag(text, body), repeats)
+    set_release_gil(0)
+    try:
+        held = timeit(lambda: tag(text, body), repeats)
+    finally:
+        set_release_gil(1)
+    fallback = timeit(parse, repeats, arm)
+    after = timeit(parse, repeats)
+    print("%10s %12s %12s %12s %12s" % (
+        "length", "GIL-free", "GIL held", "fallback", "after it"))
+    print("%10d %10.2fms %10.2fms %10.2fms %10.2fms" % (
+        len(text), released * 1e3, held * 1e3, fallback * 1e3, after * 1e3,
+    ))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
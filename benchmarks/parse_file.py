@@ -0,0 +1,76 @@
+"""Compare reading a file and parsing it with parse_file()
+
+Writes a generated file of key=value lines, then parses it after
+reading it as text, after reading it as bytes and with parse_file(),
+which maps the file and parses it in place.  Reports the best time and
+the peak of memory allocated through Python (tracemalloc) for each,
+not counting the result; parse_file() should stay close to nothing
+while the others hold one or two copies of the file.
+
+    python benchmarks/parse_file.py [repeats] [lines]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from simpleparse.parser import Parser
+
+
+def timeit(function, repeats):
+    best = None
+    for i in range(repeats):
+        t = time.perf_counter()
+        function()
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def peak(function):
+    """Peak memory allocated by function() beyond its result"""
+    tracemalloc.start()
+    try:
+        # hold the result while measuring, so that size counts it
+        result = function()
+        size, highest = tracemalloc.get_traced_memory()
+        del result
+        return highest - size
+    finally:
+        tracemalloc.stop()
+
+
+def main(repeats=5, lines=200000):
+    # the root production only, to keep the result small
+    parser = Parser("file := [a-z=0-9\n]*\n", "file")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "data.txt")
+        with open(path, "w") as file:
+            for i in range(lines):
+                file.write("key%s=%d\n" % ("abc"[: i % 3 + 1], i))
+
+        def text():
+            with open(path) as file:
+                return parser.parse(file.read())
+
+        def data():
+            with open(path, "rb") as file:
+                return parser.parse(file.read(), encoding="utf-8")
+
+        def mapped():
+            return parser.parse_file(path, encoding="utf-8")
+
+        print("file size %d bytes" % os.path.getsize(path))
+        print("%-10s %10s %14s" % ("method", "seconds", "peak bytes"))
+        for name, function in (
+            ("read text", text),
+            ("read bytes", data),
+            ("parse_file", mapped),
+        ):
+            seconds = timeit(function, repeats)
+            print("%-10s %10.4f %14d" % (name, seconds, peak(function)))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
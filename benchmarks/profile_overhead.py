@@ -0,0 +1,57 @@
+"""Measure the cost of the per-production profiling counters
+
+Parses a nested list grammar without profiling (the engine only
+checks for a profile once per table call) and with profile=True,
+which holds the GIL and reads the clock around every table call.
+The GIL-free engine is switched off for the first column so that
+all columns run the same engine.
+
+    python benchmarks/profile_overhead.py [repeats] [items]
+"""
+import sys
+import time
+from simpleparse.parser import Parser
+from simpleparse.stt.TextTools import set_release_gil
+
+DECLARATION = r'''
+list := item, (',', item)*
+item := ('[', list, ']') / number / word
+number := [0-9]+
+word := [a-z]+
+'''
+
+
+def timeit(function, repeats):
+    best = None
+    for i in range(repeats):
+        t = time.perf_counter()
+        function()
+        t = time.perf_counter() - t
+        if best is None or t < best:
+            best = t
+    return best
+
+
+def main(repeats=5, items=20000):
+    parser = Parser(DECLARATION, "list")
+    text = ",".join(
+        "[%d,[abc,%d]]" % (i, i) if i % 3 else "word" for i in range(items)
+    )
+    assert parser.parse(text)[-1] == len(text)
+    set_release_gil(0)
+    try:
+        plain = timeit(lambda: parser.parse(text), repeats)
+    finally:
+        set_release_gil(1)
+    released = timeit(lambda: parser.parse(text), repeats)
+    profiled = timeit(lambda: parser.parse(text, profile=True), repeats)
+    summary = timeit(lambda: parser.lastProfile.stats(), repeats)
+    print("%-28s %10s" % ("characters", len(text)))
+    print("%-28s %10.6f" % ("holding the GIL", plain))
+    print("%-28s %10.6f" % ("GIL-free engine", released))
+    print("%-28s %10.6f %5.2fx" % ("profile=True", profiled, profiled / plain))
+    print("%-28s %10.6f" % ("Profile.stats()", summary))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
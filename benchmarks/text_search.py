@@ -0,0 +1,144 @@
+"""Measure the TextSearch algorithms and the AUTO choice
+
+Scans texts for a match string which only occurs at the very end,
+with each search algorithm usable for the text, through tag() and
+sWordStart (as generated parsers do).  The cases cover short, medium
+and long match strings, bytes and the three str kinds, and the
+repetitive texts which make the character-by-character algorithms go
+quadratic.  For each case the table shows the time of every
+algorithm, the one AUTO picks and how far it is from the fastest.
+
+    python benchmarks/text_search.py [repeats] [--json FILE]
+
+--json writes the results in the format of the
+intensive_benchmark_*.json snapshots.
+"""
+import datetime
+import json
+import random
+import statistics
+import sys
+import time
+from simpleparse.stt.TextTools import (
+    tag, TagTable, BytesTagTable, sWordStart, TextSearch,
+    BOYERMOORE, BOYERMOORE_MODERN, TRIVIAL, TWOWAY, AUTO,
+)
+
+NAMES = {
+    BOYERMOORE: "bm", BOYERMOORE_MODERN: "bm-modern",
+    TRIVIAL: "trivial", TWOWAY: "two-way",
+}
+BYTES_ALGORITHMS = [BOYERMOORE, BOYERMOORE_MODERN, TRIVIAL, TWOWAY]
+STR_ALGORITHMS = [TRIVIAL, TWOWAY]
+SIZE = 1000000
+
+
+def words(alphabet, count):
+    random.seed(0)
+    return " ".join(
+        "".join(random.choice(alphabet) for i in range(random.randint(1, 9)))
+        for j in range(count)
+    )
+
+
+def makeCases():
+    english = words("etaoinshrdlucmfwyp", SIZE // 6)[:SIZE]
+    greek = words("αβγδεζηθ", SIZE // 6)[:SIZE]
+    cases = []
+    for label, text in (("latin-1", english), ("ucs-2", greek)):
+        for length in (2, 4, 8, 16, 64):
+            cases.append(("%s len %d" % (label, length), text, text[:length - 1] + "!"))
+    cases.append(("ucs-4 len 8", english + "\U0001f600", "etaoin\U0001f600!"))
+    # periodic match strings and repetitive text
+    cases.append(("'a'*n, 'a'*7+'b'", "a" * SIZE, "a" * 7 + "b"))
+    cases.append(("'a'*n, 'a'*63+'b'", "a" * SIZE, "a" * 63 + "b"))
+    cases.append(("'a'*n, 'b'+'a'*63", "a" * SIZE, "b" + "a" * 63))
+    cases.append(("'ab'*n, 'ab'*8+'b'", "ab" * (SIZE // 2), "ab" * 8 + "b"))
+    cases.append(("'α'*n, 'α'*15+'b'", "α" * SIZE, "α" * 15 + "b"))
+    result = []
+    for description, text, match in cases:
+        text = text + match
+        result.append((description + " (str)", text, match))
+        if max(text) < "\x80":
+            result.append((description + " (bytes)", text.encode("ascii"), match.encode("ascii")))
+    return result
+
+
+def timings(function, repeats):
+    result = []
+    for i in range(repeats):
+        t = time.perf_counter()
+        function()
+        result.append(time.perf_counter() - t)
+    return result
+
+
+def timeit(function, repeats):
+    return min(timings(function, repeats))
+
+
+def searchTable(text, match, algorithm):
+    factory = BytesTagTable if isinstance(text, bytes) else TagTable
+    return factory(((None, sWordStart, TextSearch(match, algorithm=algorithm)),))
+
+
+def main(repeats=5, jsonFile=None):
+    results = []
+    print("%-34s %10s %10s %10s %10s %10s %6s" % (
+        "case", "bm", "bm-modern", "trivial", "two-way", "auto", "/best"))
+    for description, text, match in makeCases():
+        expected = len(text) - len(match)
+        algorithms = BYTES_ALGORITHMS if isinstance(text, bytes) else STR_ALGORITHMS
+        times = {}
+        for algorithm in algorithms:
+            table = searchTable(text, match, algorithm)
+            assert tag(text, table)[-1] == expected, (description, algorithm)
+            times[algorithm] = timeit(lambda: tag(text, table), repeats)
+        chosen = TextSearch(match).algorithm
+        table = searchTable(text, match, AUTO)
+        samples = timings(lambda: tag(text, table), repeats)
+        best = min(times.values())
+        print("%-34s %s %10s %5.2fx" % (
+            description,
+            " ".join(
+                "%10.5f" % times[algorithm] if algorithm in times else "%10s" % "-"
+                for algorithm in (BOYERMOORE, BOYERMOORE_MODERN, TRIVIAL, TWOWAY)
+            ),
+            NAMES[chosen], times[chosen] / best,
+        ))
+        results.append({
+            "description": description,
+            "pattern": match if isinstance(match, str) else match.decode("ascii"),
+            "algorithm": NAMES[chosen],
+            "text_length": len(text),
+            "iterations": repeats,
+            "mean_time": statistics.mean(samples),
+            "median_time": statistics.median(samples),
+            "min_time": min(samples),
+            "max_time": max(samples),
+            "std_dev": statistics.pstdev(samples),
+            "total_time": sum(samples),
+            "chars_per_second": len(text) / min(samples),
+            "result": expected,
+            "algorithm_times": dict((NAMES[a], t) for a, t in times.items()),
+        })
+    if jsonFile:
+        with open(jsonFile, "w") as stream:
+            json.dump({
+                "metadata": {
+                    "timestamp": datetime.datetime.now().isoformat(),
+                    "total_time": sum(result["total_time"] for result in results),
+                    "benchmark_type": "text_search",
+                },
+                "results": results,
+            }, stream, indent=2)
+
+
+if __name__ == "__main__":
+    arguments = sys.argv[1:]
+    jsonFile = None
+    if "--json" in arguments:
+        index = arguments.index("--json")
+        jsonFile = arguments[index + 1]
+        del arguments[index:index + 2]
+    main(*[int(arg) for arg in arguments], jsonFile=jsonFile)
@@ -0,0 +1,69 @@
+"""Measure parse throughput against the number of threads
+
+Tables which never call back into Python (no Call/CallArg commands and
+no CallTag/AppendToTagObj flags) are run without holding the GIL, so
+parses on several threads can proceed in parallel.  Run with --gil to
+compare against the engine holding the GIL.
+
+    python benchmarks/threaded_parse.py [--gil] [maxthreads]
+"""
+import sys
+import threading
+import time
+from simpleparse.parser import Parser
+from simpleparse.stt.TextTools import set_release_gil
+
+declaration = r'''
+file := (ws, item)*, ws
+item := number / string / name / list
+list := '[', ws, (item, ws, ','?, ws)*, ']'
+name := [a-zA-Z_], [a-zA-Z0-9_]*
+<ws> := [ \t\n]*
+number := [0-9]+
+string := '"', -'"'*, '"'
+'''
+parser = Parser(declaration, 'file')
+text = 'abc [1, 2, "x y", [foo, 3]] 42 "q"\n' * 1000
+PARSES = 32
+
+
+def run(count):
+    for i in range(count):
+        parser.parse(text)
+
+
+def measure(threadcount):
+    threads = [
+        threading.Thread(target=run, args=(PARSES // threadcount,))
+        for i in range(threadcount)
+    ]
+    t = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - t
+
+
+def main(argv):
+    if '--gil' in argv:
+        argv.remove('--gil')
+        set_release_gil(0)
+    maxthreads = int(argv[0]) if argv else 8
+    parser.parse(text)
+    base = None
+    print('%8s %10s %12s %8s' % ('threads', 'seconds', 'MB/s', 'speedup'))
+    threadcount = 1
+    while threadcount <= maxthreads:
+        elapsed = measure(threadcount)
+        if base is None:
+            base = elapsed
+        size = len(text) * (PARSES // threadcount) * threadcount
+        print('%8d %10.3f %12.2f %8.2f' % (
+            threadcount, elapsed, size / elapsed / 1e6, base / elapsed,
+        ))
+        threadcount *= 2
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,87 @@
+"""Measure the timezone_name production of simpleparse.common
+
+Matches a list of timezone names (and some words which aren't
+timezone names) with tables using the plain chain of Word commands,
+the chain behind a first-character Dispatch, and a single WordInList
+trie lookup (the default).  The "silent" grammar doesn't report the
+names, so that the matching isn't hidden by building the results.
+
+    python benchmarks/timezone_names.py [repeats]
+"""
+import random
+import sys
+import time
+from simpleparse.parser import Parser
+from simpleparse.objectgenerator import FirstOfGroup
+from simpleparse.common import timezone_names
+from simpleparse.stt.TextTools import tag, TagTable
+
+GRAMMARS = [
+    # every name reported
+    ("reported", r'''
+names := ((timezone_name, ' ') / (other, ' '))*
+<other> := [a-zA-Z0-9]+
+'''),
+    # matching only
+    ("silent", r'''
+names := ((tz, ' ') / (other, ' '))*
+<tz> := timezone_name
+<other> := [a-zA-Z0-9]+
+'''),
+]
+
+MODES = [
+    ("chain", {"minWordListSize": 10**9, "maxDispatchGrowth": 0}),
+    ("dispatch", {"minWordListSize": 10**9}),
+    ("trie", {}),
+]
+
+
+def makeText(count):
+    random.seed(0)
+    names = sorted(timezone_names.timezone_mapping) + ["Foo", "Xenon", "Q1", "cat"]
+    return " ".join([random.choice(names) for i in range(count)]) + " "
+
+
+def buildTable(declaration, settings):
+    previous = {}
+    for name, value in settings.items():
+        previous[name] = getattr(FirstOfGroup, name)
+        setattr(FirstOfGroup, name, value)
+    try:
+        # the library grammar is rebuilt with the settings
+        return TagTable(Parser(declaration, "names")._generator.buildParser("names"))
+    finally:
+        for name, value in previous.items():
+            setattr(FirstOfGroup, name, value)
+
+
+def timeit(function, repeats):
+    best = None
+    for i in range(repeats):
+        t = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - t
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main(repeats=5):
+    text = makeText(100000)
+    print("%-10s %-10s %10s %8s" % ("grammar", "table", "time (s)", "speedup"))
+    for grammar, declaration in GRAMMARS:
+        tables = [(name, buildTable(declaration, settings)) for name, settings in MODES]
+        expected = tag(text, tables[0][1])
+        assert expected[-1] == len(text)
+        baseline = None
+        for name, table in tables:
+            assert tag(text, table) == expected
+            elapsed = timeit(lambda: tag(text, table), repeats)
+            if baseline is None:
+                baseline = elapsed
+            print("%-10s %-10s %10.4f %7.2fx" % (grammar, name, elapsed, baseline / elapsed))
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
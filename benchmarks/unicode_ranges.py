@@ -0,0 +1,61 @@
+"""Measure wide Unicode character ranges (CJK, emoji)
+
+Compares the Range tables (CharSet commands over code-point
+intervals) against AllIn with the expanded string of members, which
+is how ranges were matched before, for str and UTF-8 input.
+
+    python benchmarks/unicode_ranges.py [repeats]
+"""
+import sys
+import time
+from simpleparse.objectgenerator import Range
+from simpleparse.stt.TextTools import tag, TagTable, EncodedTagTable, AllIn
+
+RANGES = [
+    ("cjk", ((0x4E00, 0x9FFF),), "漢字文章中国語" * 2000),
+    ("emoji", ((0x1F300, 0x1FAFF),), "🎉🫠🌍🚀" * 4000),
+]
+
+
+def timeit(function, repeats):
+    best = None
+    for i in range(repeats):
+        t = time.perf_counter()
+        function()
+        elapsed = time.perf_counter() - t
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def main(repeats=5):
+    print(
+        "%-8s %-6s %12s %12s %9s %14s"
+        % ("range", "input", "AllIn (s)", "CharSet (s)", "speedup", "members (B)")
+    )
+    for name, ranges, text in RANGES:
+        members = "".join(
+            [chr(code) for low, high in ranges for code in range(low, high + 1)]
+        )
+        charSetTable = tuple(Range(ranges=ranges, repeating=1).toParser())
+        expandedTable = ((None, AllIn, members),)
+        for inputName, factory, value in (
+            ("str", TagTable, text),
+            ("utf-8", lambda table: EncodedTagTable(table, "utf-8"), text.encode("utf-8")),
+        ):
+            old = factory(expandedTable)
+            new = factory(charSetTable)
+            assert tag(value, old) == tag(value, new)
+            oldTime = timeit(lambda: tag(value, old), repeats)
+            newTime = timeit(lambda: tag(value, new), repeats)
+            print(
+                "%-8s %-6s %12.4f %12.4f %8.0fx %14d"
+                % (
+                    name, inputName, oldTime, newTime, oldTime / newTime,
+                    sys.getsizeof(members),
+                )
+            )
+
+
+if __name__ == "__main__":
+    main(*[int(arg) for arg in sys.argv[1:]])
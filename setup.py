@@ -48,9 +48,11 @@ if __name__ == "__main__":
     sources = [
         'simpleparse/stt/TextTools/mxTextTools/mxTextTools.c',
         'simpleparse/stt/TextTools/mxTextTools/mxte_modern.c',
+        'simpleparse/stt/TextTools/mxTextTools/mxte_nogil.c',
         'simpleparse/stt/TextTools/mxTextTools/mxte_smart.c', 
         'simpleparse/stt/TextTools/mxTextTools/mxbmse.c',
         'simpleparse/stt/TextTools/mxTextTools/mxbm_modern.c',
+        'simpleparse/stt/TextTools/mxTextTools/mxtw.c',
     ]
     
     define_macros = [
@@ -1,7 +1,165 @@
 """Base class for real-world parsers (such as parser.Parser)"""
 
-from simpleparse.stt.TextTools.TextTools import tag
-from simpleparse.generator import Generator
+import codecs
+import itertools
+import mmap
+import os
+from concurrent import futures
+from simpleparse.stt.TextTools.TextTools import (
+    tag,
+    TagTable,
+    TagTableType,
+    BytesTagTable,
+    EncodedTagTable,
+    LimitExceeded,
+)
+from simpleparse.error import ParserSyntaxError
+from simpleparse.generator import Generator, compileTables
+from simpleparse.incremental import IncrementalParse
+from simpleparse.profiling import Profile
+
+# names of the methodSource attributes consulted during table generation,
+# keyed by methodSource class
+_methodSourceNames = {}
+# TagTable constructors for encoded bytes, keyed by encoding name
+_encodedFactories = {}
+
+
+def encodedFactory(encoding):
+    """Get the TagTable constructor compiling tables for bytes in encoding
+
+    The same constructor is returned for every spelling of an
+    encoding ("UTF8", "utf-8", ...) so that it can be used as
+    part of a tag-table cache key.  Raises LookupError for
+    unknown encodings.
+    """
+    factory = _encodedFactories.get(encoding)
+    if factory is None:
+        name = codecs.lookup(encoding).name
+        factory = _encodedFactories.get(name)
+        if factory is None:
+
+            def factory(definition, cacheable=1, encoding=name):
+                return EncodedTagTable(definition, encoding, cacheable)
+
+            factory.encoding = name
+            _encodedFactories[name] = factory
+        _encodedFactories[encoding] = factory
+    return factory
+
+
+def _isBuffer(data):
+    """Whether data supports the buffer protocol (bytearray, mmap, ...)"""
+    try:
+        memoryview(data)
+    except TypeError:
+        return False
+    return True
+
+
+def tagTableFactory(data, encoding=None):
+    """Get the TagTable constructor for tagging data
+
+    Returns TagTable for str, BytesTagTable (or the
+    encodedFactory for encoding) for bytes and other buffers
+    (bytearray, memoryview, mmap, ...) and None for other
+    objects, which are tagged with tag-table tuples.
+    """
+    if isinstance(data, str):
+        return TagTable
+    elif not isinstance(data, bytes) and not _isBuffer(data):
+        return None
+    elif encoding is None:
+        return BytesTagTable
+    return encodedFactory(encoding)
+
+
+def _tagChunk(chunk, taggers, encoding):
+    """Tag each item of chunk with the tagger for its factory"""
+    return [
+        tag(
+            data,
+            taggers[tagTableFactory(data, encoding)],
+            0,
+            len(data),
+            encoding=encoding,
+        )
+        for data in chunk
+    ]
+
+
+def _tagWhole(data, tagger, start, stop, encoding):
+    """Tag data in an aparse worker thread"""
+    return tag(data, tagger, start, stop, encoding=encoding)
+
+
+# per-process state of parse_many worker processes
+_workerTable = None
+_workerTaggers = None
+
+
+def _initWorker(table):
+    """Set up a parse_many worker process to tag with table"""
+    global _workerTable, _workerTaggers
+    _workerTable = table
+    _workerTaggers = {}
+
+
+def _tagChunkInWorker(chunk, encoding):
+    """Tag chunk in a worker process, compiling tables on first use"""
+    for data in chunk:
+        factory = tagTableFactory(data, encoding)
+        if factory not in _workerTaggers:
+            if factory is None:
+                _workerTaggers[factory] = _workerTable
+            else:
+                _workerTaggers[factory] = compileTables(_workerTable, factory)
+    return _tagChunk(chunk, _workerTaggers, encoding)
+
+
+def methodSourceKey(processor):
+    """Return a hashable key describing how processor customises a tag-table
+
+    Table generation only consults the _m_productionname and
+    _o_productionname attributes of the method source (see
+    simpleparse.processor.MethodSource), so two processors with
+    equal values for those attributes produce identical tables.
+    Values which are not hashable are keyed by identity (the
+    cached table holds a reference to them, so the identity
+    cannot be re-used while the cache entry is alive).
+
+    Only values which compare equal across instances (TextTools
+    command constants, strings and other plain class attributes)
+    give two processor instances the same key.  Methods defined on
+    the processor class are bound to the instance, and callable
+    objects stored on the instance are distinct objects, so each
+    new instance using them gets a key (and a table) of its own.
+    """
+    if processor is None:
+        return None
+    cls = processor.__class__
+    names = _methodSourceNames.get(cls)
+    if names is None:
+        names = _methodSourceNames[cls] = tuple(
+            [name for name in dir(cls) if name[:3] in ("_m_", "_o_")]
+        )
+    instanceNames = getattr(processor, "__dict__", None)
+    if instanceNames:
+        instanceNames = [name for name in instanceNames if name[:3] in ("_m_", "_o_")]
+        if instanceNames:
+            names = tuple(sorted(set(names + tuple(instanceNames))))
+    key = [cls]
+    for name in names:
+        value = getattr(processor, name, None)
+        try:
+            hash(value)
+        except TypeError:
+            value = (
+                id(getattr(value, "__self__", value)),
+                getattr(value, "__func__", None),
+            )
+        key.append((name, value))
+    return tuple(key)
 
 
 class BaseParser:
@@ -12,14 +170,80 @@ class BaseParser:
     """
 
     _rootProduction = ""
+    # maximum number of (production, processor) tag-tables to retain
+    taggerCacheSize = 64
+    _taggerCache = None
+    # version of the format written by __getstate__
+    pickleVersion = 1
+
+    def __getstate__(self):
+        """Get the state for pickling, including the cached tag-tables
+
+        Cached tables built without a processor are stored along
+        with the parser (compiled tables as TagTables with their
+        TableInList references linked), so that an unpickled
+        parser can start parsing without rebuilding them.  Tables
+        for processors are rebuilt on demand.
+        """
+        state = self.__dict__.copy()
+        cache = state.pop("_taggerCache", None)
+        taggers = []
+        if cache is not None:
+            for (production, processorKey, factory), tagger in cache[1].items():
+                if processorKey is None:
+                    # encoded factories are closures, store the encoding
+                    taggers.append(
+                        (production, getattr(factory, "encoding", factory), tagger)
+                    )
+        state["_taggers"] = taggers
+        state["_pickleVersion"] = self.pickleVersion
+        return state
+
+    def __setstate__(self, state):
+        """Restore the parser and its cached tag-tables from a pickle"""
+        state = state.copy()
+        # pickles written before versioning hold the plain __dict__
+        version = state.pop("_pickleVersion", 0)
+        if version > self.pickleVersion:
+            raise ValueError(
+                "Cannot unpickle %s from pickle format version %r (newest known is %r)"
+                % (self.__class__.__name__, version, self.pickleVersion)
+            )
+        taggers = state.pop("_taggers", ())
+        self.__dict__.update(state)
+        token = self.taggerCacheToken()
+        if token is not None and taggers:
+            self._taggerCache = (
+                token,
+                {
+                    (
+                        production,
+                        None,
+                        encodedFactory(factory) if isinstance(factory, str) else factory,
+                    ): tagger
+                    for production, factory, tagger in taggers
+                },
+            )
 
     # primary API...
     def parse(
-        self, data, production=None, processor=None, start=0, stop=None, encoding=None
+        self,
+        data,
+        production=None,
+        processor=None,
+        start=0,
+        stop=None,
+        encoding=None,
+        profile=None,
+        max_steps=None,
+        deadline=None,
+        compact=False,
     ):
         """Parse data with production "production" of this parser
 
-        data -- data to be parsed, a Python string or bytes
+        data -- data to be parsed, a Python string, bytes or another
+            C-contiguous buffer of bytes (bytearray, memoryview, mmap),
+            which is parsed in place; callbacks see a memoryview of it
         production -- optional string specifying a non-default production to use
             for parsing data
         processor -- optional pointer to a Processor or MethodSource object for
@@ -33,19 +257,438 @@ class BaseParser:
             - Single-byte: latin-1, iso-8859-*, windows-1252, ascii, etc.
             - Multi-byte: utf-8 only (other multi-byte encodings not supported)
             Positions in the result are byte positions when encoding is used.
+        profile -- optional simpleparse.profiling.Profile collecting the
+            per-production counters of the parse, or True to collect
+            them in a new Profile stored as the parser's lastProfile
+            attribute; the tables are named with profileNames
+        max_steps -- optional maximum number of tag-table entries the
+            engine may run for this parse
+        deadline -- optional time.monotonic() value by which the parse
+            has to be done
+        compact -- if true, the children are returned as a TagTree
+            (simpleparse.stt.TextTools.TagTreeType), which keeps the
+            nodes in flat arrays and creates the result tuples as
+            they are accessed instead of holding them all
+
+        Raises simpleparse.stt.TextTools.LimitExceeded if the parse
+        runs into max_steps or deadline; its production attribute
+        names the innermost production being parsed (see
+        profileNames) and its position attribute where.
         """
         self.resetBeforeParse()
         if processor is None:
             processor = self.buildProcessor()
         if stop is None:
             stop = len(data)
-        value = tag(
-            data,
-            self.buildTagger(production, processor),
-            start,
-            stop,
-            encoding=encoding,
+        tagger = self.getTagger(production, processor, tagTableFactory(data, encoding))
+        if profile is True:
+            profile = self.lastProfile = Profile()
+        if profile is not None:
+            profile.names.update(self.profileNames(tagger, production))
+        try:
+            value = tag(
+                data,
+                tagger,
+                start,
+                stop,
+                encoding=encoding,
+                profile=profile,
+                max_steps=max_steps,
+                deadline=deadline,
+                compact=compact,
+            )
+        except LimitExceeded as error:
+            self._nameLimitExceeded(error, tagger, production)
+            raise
+        if processor and callable(processor):
+            return processor(value, data)
+        else:
+            return value
+
+    def parse_file(
+        self,
+        path,
+        production=None,
+        processor=None,
+        encoding=None,
+        profile=None,
+        max_steps=None,
+        deadline=None,
+        compact=False,
+    ):
+        """Parse the contents of the file at path
+
+        path -- name of the file to be parsed
+        production, processor, encoding, profile, max_steps,
+            deadline, compact -- as for parse
+
+        The file is memory-mapped and parsed in place rather than
+        read into memory, so the file's pages are loaded by the
+        operating system as they are parsed and can be dropped
+        again.  Positions in the result are byte offsets; the
+        processor (if callable) is passed the mapping as buffer,
+        which is closed once parse_file returns unless views of it
+        are still held.
+        """
+        with open(path, "rb") as file:
+            if os.fstat(file.fileno()).st_size:
+                data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                # empty files can't be mapped
+                data = b""
+        try:
+            return self.parse(
+                data,
+                production,
+                processor,
+                encoding=encoding,
+                profile=profile,
+                max_steps=max_steps,
+                deadline=deadline,
+                compact=compact,
+            )
+        finally:
+            if isinstance(data, mmap.mmap):
+                try:
+                    data.close()
+                except BufferError:
+                    # the processor kept a view of the mapping
+                    pass
+
+    def parse_many(
+        self,
+        iterable,
+        production=None,
+        processor=None,
+        workers=None,
+        executor="thread",
+        chunksize=64,
+        ordered=True,
+        encoding=None,
+    ):
+        """Parse each item of iterable, distributing the work over a pool
+
+        iterable -- the data items to be parsed, each a Python string
+            or bytes; consumed lazily, so it can be a generator
+        production, processor, encoding -- as for parse, the same
+            values are used for every item
+        workers -- number of workers, default os.cpu_count()
+        executor -- "thread" for a thread pool or "process" for a
+            process pool
+        chunksize -- number of items handed to a worker at once
+        ordered -- if true, results are produced in the order of
+            iterable, otherwise (index, result) pairs are produced
+            as soon as their chunk has been parsed
+
+        Returns an iterator over the results.  The tag-tables are
+        built once; thread pools share the compiled tables, process
+        pools receive the table once per worker process (it has to
+        be picklable unless processes are forked) and compile it
+        there.  Tables without callbacks release the GIL while
+        tagging, so thread pools run in parallel for them.  The
+        processor's result handling (if it is callable) runs in the
+        calling thread as results are produced.
+        """
+        if executor not in ("thread", "process"):
+            raise ValueError(
+                "executor must be 'thread' or 'process', not %r" % (executor,)
+            )
+        if chunksize < 1:
+            raise ValueError("chunksize must be >= 1, not %r" % (chunksize,))
+        self.resetBeforeParse()
+        if processor is None:
+            processor = self.buildProcessor()
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if executor == "thread":
+            taggers = {}
+
+            def submit(pool, chunk):
+                for data in chunk:
+                    factory = tagTableFactory(data, encoding)
+                    if factory not in taggers:
+                        taggers[factory] = self.getTagger(
+                            production, processor, factory
+                        )
+                return pool.submit(_tagChunk, chunk, taggers, encoding)
+
+            def makePool():
+                return futures.ThreadPoolExecutor(workers)
+
+        else:
+            tagger = self.getTagger(production, processor)
+
+            def submit(pool, chunk):
+                return pool.submit(_tagChunkInWorker, chunk, encoding)
+
+            def makePool():
+                return futures.ProcessPoolExecutor(
+                    workers, initializer=_initWorker, initargs=(tagger,)
+                )
+
+        if not (processor and callable(processor)):
+            processor = None
+        return self._parseChunks(
+            makePool, submit, iter(iterable), processor, workers * 2, chunksize, ordered
         )
+
+    def _parseChunks(
+        self, makePool, submit, iterator, processor, window, chunksize, ordered
+    ):
+        """Generator producing the results for parse_many
+
+        At most window chunks are pending at any time, so that
+        the iterator is consumed no faster than it is parsed.  The
+        pool is only created once the generator starts, so results
+        which are never iterated don't leave workers behind.
+        """
+        pool = makePool()
+        pending = {}
+        position = 0
+        try:
+            while True:
+                while len(pending) < window:
+                    chunk = list(itertools.islice(iterator, chunksize))
+                    if not chunk:
+                        break
+                    pending[submit(pool, chunk)] = (position, chunk)
+                    position += len(chunk)
+                if not pending:
+                    break
+                if ordered:
+                    future = next(iter(pending))
+                else:
+                    done, _ = futures.wait(pending, return_when=futures.FIRST_COMPLETED)
+                    future = next(iter(done))
+                index, chunk = pending.pop(future)
+                values = future.result()
+                if processor is not None:
+                    values = [
+                        processor(value, data) for value, data in zip(values, chunk)
+                    ]
+                if ordered:
+                    yield from values
+                else:
+                    yield from enumerate(values, index)
+        finally:
+            # shutdown(cancel_futures=True) needs Python 3.9
+            for future in pending:
+                future.cancel()
+            pool.shutdown()
+
+    def iterparse(
+        self,
+        file,
+        production=None,
+        record=None,
+        processor=None,
+        chunkSize=65536,
+        encoding=None,
+        maxRecordSize=None,
+    ):
+        """Parse the records of a file one at a time
+
+        file -- object with a read(size) method returning str (or
+            bytes, see encoding), such as an open file
+        production -- production matching one record, default the
+            root production
+        record -- name of the record production, for grammars whose
+            root production is the repetition of the records; if
+            given it takes the place of production
+        processor -- as for parse, applied to every record
+        chunkSize -- number of characters (or bytes) read at once
+        encoding -- as for parse, for files returning bytes
+        maxRecordSize -- if given, a record which can't be matched
+            within this many characters raises ParserSyntaxError
+            instead of reading on (a record can't be told apart
+            from a syntax error until it has been matched)
+
+        The record production is tagged at the current offset
+        over and over until the end of the file.  Text is read in
+        chunks, at least chunkSize characters ahead of the offset
+        are held, and the text of records already produced is
+        discarded, so the memory used depends on the size of the
+        records rather than that of the file.  A record whose match
+        depends on text past that read so far is resumed (see
+        TextTools.tag's partial argument) once more has been read,
+        so records are only produced once they are certain.
+
+        Produces processor((1, children, next), buffer) for each
+        record if processor is callable, otherwise
+        ((record, start, next, children), buffer) pairs, where
+        buffer is the text held when the record was matched and
+        start, next and the positions of the children are indices
+        into buffer (not offsets in the file).  Raises
+        ParserSyntaxError if text which is not a record is found,
+        with position as the index into the error's buffer.
+        """
+        if record is None:
+            record = production or self._rootProduction
+        self.resetBeforeParse()
+        if processor is None:
+            processor = self.buildProcessor()
+        if not (processor and callable(processor)):
+            processor = None
+        return self._iterRecords(
+            file, record, processor, chunkSize, encoding, maxRecordSize
+        )
+
+    def _iterRecords(self, file, record, processor, chunkSize, encoding, maxRecordSize):
+        """Generator producing the records for iterparse"""
+        taggers = {}
+        buffer = file.read(chunkSize)
+        position = 0
+        # offset of buffer in the file
+        offset = 0
+        end = not buffer
+        while True:
+            while not end and len(buffer) - position < chunkSize:
+                more = file.read(chunkSize)
+                if not more:
+                    end = True
+                else:
+                    offset += position
+                    buffer = buffer[position:] + more
+                    position = 0
+            if end and position >= len(buffer):
+                return
+            factory = tagTableFactory(buffer, encoding)
+            tagger = taggers.get(factory)
+            if tagger is None:
+                tagger = taggers[factory] = self.getTagger(record, processor, factory)
+            # a partial run stops (success None) whenever its outcome
+            # depends on text past the buffer, and is resumed on the
+            # longer buffer once more has been read
+            state = None
+            while True:
+                success, children, next = tag(
+                    buffer,
+                    tagger,
+                    position,
+                    len(buffer),
+                    encoding=encoding,
+                    partial=not end,
+                    resume=state,
+                )
+                undecided = success is None
+                if not undecided or (
+                    maxRecordSize is not None
+                    and len(buffer) - position >= maxRecordSize
+                ):
+                    break
+                state = next
+                more = file.read(chunkSize)
+                if more:
+                    buffer = buffer + more
+                else:
+                    end = True
+            if success and next > position:
+                if processor is not None:
+                    yield processor((1, children, next), buffer)
+                else:
+                    yield (record, position, next, children), buffer
+                position = next
+                continue
+            if undecided:
+                message = "%s record longer than %d characters" % (record, maxRecordSize)
+            elif success:
+                message = "%s record matched no text" % (record,)
+            else:
+                message = "no %s record" % (record,)
+            error = ParserSyntaxError(message)
+            error.error_message = "%s at offset %d" % (message, offset + position)
+            error.production = record
+            error.buffer = buffer
+            error.position = position
+            raise error
+
+    def incremental(self, production=None, processor=None, encoding=None, batch=False):
+        """Start a parse of a text which arrives in pieces
+
+        production, processor, encoding -- as for parse
+        batch -- let feed() put off parsing long str text until
+            enough has arrived, see IncrementalParse.feed
+
+        Returns a simpleparse.incremental.IncrementalParse: feed()
+        it the pieces as they arrive and close() it at the end of
+        the text; both return the result of parse once the text
+        received decides it (None before).  Every piece continues
+        the parse where the previous one left it instead of
+        starting over.
+        """
+        self.resetBeforeParse()
+        if processor is None:
+            processor = self.buildProcessor()
+        if not (processor and callable(processor)):
+            processor = None
+
+        def taggerFor(data):
+            return self.getTagger(production, processor, tagTableFactory(data, encoding))
+
+        return IncrementalParse(taggerFor, processor, encoding, batch)
+
+    async def aparse(
+        self,
+        data,
+        production=None,
+        processor=None,
+        start=0,
+        stop=None,
+        encoding=None,
+        sliceSteps=4096,
+        executor=None,
+    ):
+        """Parse data without blocking the running asyncio event loop
+
+        data, production, processor, start, stop, encoding -- as for
+            parse
+        sliceSteps -- number of tag-table entries run between giving
+            the event loop the chance to run other tasks
+        executor -- concurrent.futures executor for tables which are
+            tagged without holding the GIL, default the loop's
+            default executor
+
+        Tables which release the GIL while tagging (see
+        TagTable.releases_gil) are tagged in a worker thread of
+        executor, the others in slices of sliceSteps table entries
+        on the event loop's thread, each suspending the tagging
+        engine until the loop has run what else was ready.  The
+        result is that of parse.  Cancelling the task stops a sliced
+        parse at the end of the current slice; a parse running in a
+        worker thread runs to its end.
+        """
+        import asyncio
+
+        if sliceSteps < 1:
+            raise ValueError("sliceSteps must be >= 1, not %r" % (sliceSteps,))
+        self.resetBeforeParse()
+        if processor is None:
+            processor = self.buildProcessor()
+        if stop is None:
+            stop = len(data)
+        factory = tagTableFactory(data, encoding)
+        tagger = self.getTagger(production, processor, factory)
+        if not isinstance(tagger, TagTableType) and factory is not None:
+            # uncached parsers return the tag-table tuple; compile it
+            # once rather than on every slice
+            tagger = compileTables(tagger, factory)
+        if isinstance(tagger, TagTableType) and tagger.releases_gil():
+            value = await asyncio.get_running_loop().run_in_executor(
+                executor, _tagWhole, data, tagger, start, stop, encoding
+            )
+        else:
+            value = tag(data, tagger, start, stop, encoding=encoding, slice_steps=sliceSteps)
+            while value[0] is None:
+                await asyncio.sleep(0)
+                value = tag(
+                    data,
+                    tagger,
+                    start,
+                    stop,
+                    encoding=encoding,
+                    slice_steps=sliceSteps,
+                    resume=value[2],
+                )
         if processor and callable(processor):
             return processor(value, data)
         else:
@@ -81,6 +724,98 @@ class BaseParser:
             % (self.__class__.__name__)
         )
 
+    def getTagger(self, production=None, processor=None, factory=None):
+        """Get the (cached) tag-table for production and processor
+
+        factory -- if not None, a TagTable constructor (TagTable,
+            BytesTagTable or encodedFactory(encoding)), the table
+            is returned compiled by
+            generator.compileTables with that factory instead of
+            as a tag-table tuple
+
+        Tables returned by buildTagger are cached, keyed by the
+        production and the methodSourceKey of the processor, so
+        that repeated parse calls do not regenerate the table.
+        A new processor instance re-uses the table only when its
+        _m_ and _o_ values compare equal to the previous one's;
+        bound methods and per-instance callables force a rebuild.
+        The cache is discarded whenever taggerCacheToken changes;
+        if the token is None (the default) no caching is done,
+        and factory is ignored.
+        """
+        token = self.taggerCacheToken()
+        if token is None:
+            return self.buildTagger(production, processor)
+        if production is None:
+            production = self._rootProduction
+        cache = self._taggerCache
+        if cache is None or cache[0] != token:
+            cache = self._taggerCache = (token, {})
+        taggers = cache[1]
+        key = (production, methodSourceKey(processor), factory)
+        tagger = taggers.get(key)
+        if tagger is None:
+            if factory is None:
+                tagger = self.buildTagger(production, processor)
+            else:
+                tagger = compileTables(
+                    self.getTagger(production, processor), factory
+                )
+            if len(taggers) >= self.taggerCacheSize:
+                # discard the oldest entry
+                del taggers[next(iter(taggers))]
+            taggers[key] = tagger
+        return tagger
+
+    def profileNames(self, tagger, production=None):
+        """Return the names of the tables of tagger for profiling
+
+        tagger -- the tag-table production is parsed with
+
+        Returns a dictionary mapping tables to the names Profile
+        reports them under.  The base implementation only names
+        a compiled tagger after production.
+        """
+        if isinstance(tagger, TagTableType):
+            return {tagger: production or self._rootProduction or Profile.rootName}
+        return {}
+
+    def _nameLimitExceeded(self, error, tagger, production):
+        """Report the innermost named production of error's stack"""
+        names = self.profileNames(tagger, production)
+        for tagobj, table in reversed(error.stack):
+            name = names.get(table)
+            if name is None and isinstance(tagobj, str):
+                name = tagobj
+            if name is not None:
+                break
+        else:
+            return
+        if name != error.production:
+            error.production = name
+            if error.limit == "deadline":
+                limit = "deadline"
+            else:
+                limit = "step limit of %d" % (error.steps,)
+            error.args = (
+                "%s exceeded at position %d in production %r"
+                % (limit, error.position, name),
+            )
+
+    def taggerCacheToken(self):
+        """Return a token identifying the current state of the grammar
+
+        Cached tag-tables (see getTagger) are discarded whenever
+        the token changes.  The base implementation returns None,
+        which disables caching, as buildTagger is free to return
+        a different table on each call.
+        """
+        return None
+
+    def clearTaggerCache(self):
+        """Discard all cached tag-tables (see getTagger)"""
+        self._taggerCache = None
+
     def resetBeforeParse(self):
         """Called just before the parser's parse method starts working,
 
@@ -10,10 +10,111 @@ make the element tokens available under those string
 names in default parsers.  Note: a Parser can override
 this by specifying an explicit definitionSources
 parameter in its initialiser.
+
+The values in a shared dictionary can also be
+LazyDefinition instances, which build their element
+token the first time a grammar refers to the name
+(see resolve).  The library modules use LazyLibrary
+so that their grammars are only processed when used.
+Their dictionaries (the modules' c attributes) are
+LazyDict instances, so looking a name up in them
+still gives the element token.
 """
+import threading
+
+_lock = threading.RLock()
 
 def share( dictionary ):
     SOURCES.append( dictionary)
 
+def resolve( source, name ):
+    """Get the element token for name from source
+
+    Lazy definitions are built and replaced by their
+    element token in source.  Raises KeyError if name
+    isn't in source.
+    """
+    value = source[name]
+    if isinstance( value, LazyDefinition ):
+        value = source[name] = value.resolve()
+    return value
+
+class LazyDefinition:
+    """Shared definition whose element token is built on first use
+
+    factory -- callable returning the element token, called
+        with arguments
+    """
+    def __init__( self, factory, *arguments ):
+        self.factory = factory
+        self.arguments = arguments
+        self.element = None
+    def resolve( self ):
+        """Build (once) and return the element token"""
+        if self.element is None:
+            with _lock:
+                if self.element is None:
+                    self.element = self.factory( *self.arguments )
+        return self.element
+    def __repr__( self ):
+        return '<%s for %r>'%( self.__class__.__name__, self.arguments or self.factory )
+
+class LazyDict( dict ):
+    """Shared dictionary building LazyDefinition values on access
+
+    Looking a name up (d[name], get, values, items) returns
+    the element token, building it if necessary, just as for a
+    dictionary of element tokens.  Membership tests, len and
+    iterating over the names build nothing.  Copies made with
+    dict() or copy() keep the LazyDefinition values, which
+    definition sources resolve as well.
+    """
+    def __getitem__( self, name ):
+        value = dict.__getitem__( self, name )
+        if isinstance( value, LazyDefinition ):
+            value = value.resolve()
+            dict.__setitem__( self, name, value )
+        return value
+    def get( self, name, default=None ):
+        if name in self:
+            return self[name]
+        return default
+    def values( self ):
+        self._resolveAll()
+        return dict.values( self )
+    def items( self ):
+        self._resolveAll()
+        return dict.items( self )
+    def _resolveAll( self ):
+        for name in list( self ):
+            self[name]
+
+class LazyLibrary:
+    """Library grammar whose declaration is processed on first use
+
+    The declaration is parsed (with the default definition
+    sources) when the first of its elements is resolved.
+    """
+    def __init__( self, declaration ):
+        self.declaration = declaration
+        self.generator = None
+    def getGenerator( self ):
+        """Get the generator for the declaration, building it if necessary"""
+        if self.generator is None:
+            with _lock:
+                if self.generator is None:
+                    from simpleparse.parser import Parser
+                    self.generator = Parser( self.declaration )._generator
+        return self.generator
+    def element( self, production ):
+        """Get a LazyDefinition for a LibraryElement referring to production"""
+        return LazyDefinition( self.buildElement, production )
+    def buildElement( self, production ):
+        from simpleparse.objectgenerator import LibraryElement
+        return LibraryElement(
+            generator = self.getGenerator(),
+            production = production,
+        )
+
 SOURCES = [
-]
\ No newline at end of file
+]
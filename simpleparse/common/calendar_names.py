@@ -35,7 +35,7 @@ Interpreters:
 import calendar
 from simpleparse import objectgenerator, common
 
-c = {}
+c = common.LazyDict()
 
 da = calendar.day_abbr[:]
 dn = calendar.day_name[:]
@@ -47,14 +47,15 @@ def _build( name, set ):
     set = set[:]
     set.sort()
     set.reverse()
-    l,u,r = [],[],[]
-    for item in set:
-        l.append( objectgenerator.Literal( value = item.lower() ))
-        u.append( objectgenerator.Literal( value = item.upper() ))
-        r.append( objectgenerator.Literal( value = item ))
-    c[ name + '_lc' ] = objectgenerator.FirstOfGroup( children = l )
-    c[ name + '_uc' ] = objectgenerator.FirstOfGroup( children = u )
-    c[ name ] = objectgenerator.FirstOfGroup( children = r )
+    c[ name + '_lc' ] = common.LazyDefinition( _group, [item.lower() for item in set] )
+    c[ name + '_uc' ] = common.LazyDefinition( _group, [item.upper() for item in set] )
+    c[ name ] = common.LazyDefinition( _group, set )
+
+def _group( values ):
+    """Build the FirstOfGroup matching one of values"""
+    return objectgenerator.FirstOfGroup(
+        children = [objectgenerator.Literal( value = item ) for item in values]
+    )
 
 _build( 'locale_day_names', dn )
 _build( 'locale_day_abbrs', da )
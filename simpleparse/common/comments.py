@@ -18,11 +18,12 @@ returned for processing).
     c_nest_comment
         nesting /* /* */ */ comments
 """
-from simpleparse.parser import Parser
-from simpleparse import common, objectgenerator
+from simpleparse import common
+# imported for its side effect: registers digit, EOF, etc. in common
 from simpleparse.common import chartypes
+assert chartypes
 
-c = {}
+c = common.LazyDict()
 
 eolcomments = r"""
 ### comment formats where the comment goes
@@ -36,24 +37,18 @@ comment   := -'\012'*
 >slashslash_comment< := '//', comment, EOL
 """
 
-_p = Parser( eolcomments )
+_library = common.LazyLibrary( eolcomments )
 for name in ["hash_comment", "semicolon_comment", "slashslash_comment"]:
-    c[ name ] = objectgenerator.LibraryElement(
-        generator = _p._generator,
-        production = name,
-    )
+    c[ name ] = _library.element( name )
 
 ccomments = r"""
 ### comments in format /* comment */ with no recursion allowed
 comment := -"*/"*
 >slashbang_comment< := '/*', comment, '*/'
 """
-_p = Parser( ccomments )
+_library = common.LazyLibrary( ccomments )
 for name in ["c_comment","slashbang_comment"]:
-    c[ name ] = objectgenerator.LibraryElement(
-        generator = _p._generator,
-        production = "slashbang_comment",
-    )
+    c[ name ] = _library.element( "slashbang_comment" )
 
 nccomments = r"""
 ### nestable C comments of form /* comment /* innercomment */ back to previous */
@@ -62,11 +57,8 @@ nccomments = r"""
 comment                  := (-(comment_stop/comment_start)+/slashbang_nest_comment)*
 >slashbang_nest_comment< := comment_start, comment, comment_stop
 """
-_p = Parser( nccomments )
+_library = common.LazyLibrary( nccomments )
 for name in ["c_nest_comment","slashbang_nest_comment"]:
-    c[ name ] = objectgenerator.LibraryElement(
-        generator = _p._generator,
-        production = "slashbang_nest_comment",
-    )
+    c[ name ] = _library.element( "slashbang_nest_comment" )
 
 common.share(c)
@@ -28,12 +28,14 @@ try:
     haveMX = 1
 except ImportError:
     haveMX = 0
-from simpleparse.parser import Parser
-from simpleparse import common, objectgenerator
-from simpleparse.common import chartypes, numbers
+from simpleparse import common
+from simpleparse.common import numbers
+# imported for its side effect: registers digit, EOF, etc. in common
+from simpleparse.common import chartypes
+assert chartypes
 from simpleparse.dispatchprocessor import *
 
-c = {}
+c = common.LazyDict()
 
 declaration ="""
 year      := digit,digit,digit,digit
@@ -57,12 +59,9 @@ ISO_date_time  := ISO_date, ([T], ISO_time)?, offset?
 
 
 
-_p = Parser( declaration )
+_library = common.LazyLibrary( declaration )
 for name in ["ISO_time","ISO_date", "ISO_date_time"]:
-    c[ name ] = objectgenerator.LibraryElement(
-        generator = _p._generator,
-        production = name,
-    )
+    c[ name ] = _library.element( name )
 common.share( c )
 
 if haveMX:
@@ -19,12 +19,14 @@ try:
     haveMX = 1
 except ImportError:
     haveMX = 0
-from simpleparse.parser import Parser
-from simpleparse import common, objectgenerator
-from simpleparse.common import chartypes, numbers
+from simpleparse import common
+from simpleparse.common import numbers
+# imported for its side effect: registers digit, EOF, etc. in common
+from simpleparse.common import chartypes
+assert chartypes
 from simpleparse.dispatchprocessor import *
 
-c = {}
+c = common.LazyDict()
 declaration = """
 <date_separator> := [-]
 <time_separator> := ':'
@@ -45,12 +47,9 @@ offset_minute := digit, digit
 ISO_date_time_loose  := ISO_date_loose, ([T ], ISO_time_loose)?, [ ]?, offset?
 """
 
-_p = Parser( declaration )
+_library = common.LazyLibrary( declaration )
 for name in ["ISO_time_loose","ISO_date_time_loose", "ISO_date_loose"]:
-    c[ name ] = objectgenerator.LibraryElement(
-        generator = _p._generator,
-        production = name,
-    )
+    c[ name ] = _library.element( name )
 common.share( c )
 
 if haveMX:
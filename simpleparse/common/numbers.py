@@ -44,12 +44,13 @@ Interpreters:
         imaginary_number
     
 """
-from simpleparse.parser import Parser
-from simpleparse import common, objectgenerator
+from simpleparse import common
+# imported for its side effect: registers digit, EOF, etc. in common
 from simpleparse.common import chartypes
+assert chartypes
 from simpleparse.dispatchprocessor import *
 
-c = {}
+c = common.LazyDict()
 
 declaration = r"""
 # sample for parsing integer and float numbers
@@ -84,12 +85,9 @@ number              := hex/float/int
 number_full         := binary_number/imaginary_number/hex/float/int
 """
 
-_p = Parser( declaration )
+_library = common.LazyLibrary( declaration )
 for name in ["int","hex", "int_unsigned", "number", "float", "binary_number", "float_floatexp", "imaginary_number", "number_full"]:
-    c[ name ] = objectgenerator.LibraryElement(
-        generator = _p._generator,
-        production = name,
-    )
+    c[ name ] = _library.element( name )
 
 if __name__ == "__main__":
     test()
@@ -35,14 +35,14 @@ Interpreters:
         to your processor class.
 """
 
-from simpleparse.parser import Parser
-from simpleparse import common, objectgenerator
+from simpleparse import common
+# imported for its side effect: registers digit, EOF, etc. in common
 from simpleparse.common import chartypes
 assert chartypes
 from simpleparse.dispatchprocessor import *
 from simpleparse.common.escapeutils import SPECIAL_ESCAPED_MAP
 
-c = {}
+c = common.LazyDict()
 
 stringDeclaration = r"""
 # note that non-delimiter can never be hit by non-triple strings
@@ -84,19 +84,11 @@ string_special_escapes     := [\\\\abfnrtv"]
 ]
 
 for name, partial in _stringTypeData:
-    _p = Parser( stringDeclaration + partial )
-    c[ name ] = objectgenerator.LibraryElement(
-        generator = _p._generator,
-        production = "str",
-    )
+    c[ name ] = common.LazyLibrary( stringDeclaration + partial ).element( "str" )
 common.share( c )
-_p = Parser( """
+c[ "string"] = common.LazyLibrary( """
 string :=  string_triple_double/string_triple_single/string_double_quote/string_single_quote
-""" )
-c[ "string"] = objectgenerator.LibraryElement(
-    generator = _p._generator,
-    production = "string",
-)
+""" ).element( "string" )
 
 class StringInterpreter(DispatchProcessor):
     """Processor for converting parsed string values to their "intended" value
@@ -33,7 +33,7 @@ from simpleparse import objectgenerator, common
 from simpleparse.common import phonetics
 import time
 
-c = {}
+c = common.LazyDict()
 
 timezone_data = []
 civilian_data = [
@@ -156,30 +156,36 @@ del tztemp
 timezone_data = timezone_data + zulu_data
 # the rules are really big, but oh well...
 def _build( data ):
-    """Build the name:time map and match rule for each dataset"""
+    """Build the name:time map and (lazy) match rule for each dataset"""
     data = data[:]
     data.sort() # get shortest and least values first forcefully...
     # then reverse that, to get longest first...
     data.reverse()
-    names = []
     mapping = {}
     for key,value in data:
-        names.append( objectgenerator.Literal(value=key))
         mapping[key] = value
-    rule = objectgenerator.FirstOfGroup(
-        children = names
+    return mapping, common.LazyDefinition( _buildRule, data )
+def _buildRule( data ):
+    """Build the match rule for the (sorted) dataset"""
+    return objectgenerator.FirstOfGroup(
+        children = [objectgenerator.Literal(value=key) for key,value in data]
     )
-    return mapping, rule
-zulu_mapping, zulu_rule          = _build( zulu_data )
-civilian_mapping, civilian_rule  = _build( civilian_data )
-timezone_mapping, timezone_rule  = _build( timezone_data )
+zulu_mapping, _zulu_rule          = _build( zulu_data )
+civilian_mapping, _civilian_rule  = _build( civilian_data )
+timezone_mapping, _timezone_rule  = _build( timezone_data )
 
-c[ "military_timezone_name" ] = zulu_rule
-c[ "civilian_timezone_name" ] = civilian_rule
-c[ "timezone_name" ] = timezone_rule
+c[ "military_timezone_name" ] = _zulu_rule
+c[ "civilian_timezone_name" ] = _civilian_rule
+c[ "timezone_name" ] = _timezone_rule
 
 common.share(c)
 
+def __getattr__( name ):
+    """The match rules (zulu_rule, civilian_rule, timezone_rule) are built on first use"""
+    if name in ('zulu_rule', 'civilian_rule', 'timezone_rule'):
+        return globals()['_'+name].resolve()
+    raise AttributeError( 'module %r has no attribute %r'%( __name__, name ))
+
 import time
 if time.daylight:
     LOCAL_ZONE = time.altzone
@@ -0,0 +1,412 @@
+"""Compile grammars ahead of time into importable Python modules
+
+    python -m simpleparse.compile grammar.def -o grammar_tables.py
+
+processes the EBNF declaration in grammar.def and writes a module
+holding the finished tag-table tuples (and the list their TableInList
+references point into) as module constants, together with a Parser
+class derived from CompiledParser.  Importing the module does not
+involve the EBNF parser or the element tokens, so precompiled grammars
+start up in the time it takes to load the module.
+
+The tables are built without a processor.  Processors which customise
+table generation (_m_productionname or _o_productionname attributes,
+see simpleparse.processor.MethodSource) make the compiled parser build
+a regular parser from the declaration stored in the module.
+
+The tag-table format belongs to the SimpleParse release the module
+was compiled with; regenerate compiled modules when upgrading.
+"""
+import importlib
+import sys
+
+import simpleparse
+from simpleparse import common
+from simpleparse.baseparser import BaseParser, methodSourceKey
+from simpleparse.generator import _TABLE_COMMANDS, _LIST_COMMANDS
+from simpleparse.stt.TextTools.TextTools import (
+    CharSetType, TextSearchType, MultiTextSearchType,
+)
+
+# version of the generated module layout, checked by CompiledParser
+FORMAT = 1
+
+_HEAD = '''"""Tag-tables for %(source)s
+
+Generated by simpleparse.compile (SimpleParse %(version)s),
+regenerate the module instead of editing it.
+"""
+%(imports)s
+
+# tables of the productions, targets of the TableInList references
+TABLES = []
+'''
+_TAIL = '''
+PRODUCTIONS = %(productions)s
+
+DECLARATION = %(declaration)s
+
+# modules providing the library definitions used by the declaration
+LIBRARIES = %(libraries)s
+
+
+class %(className)s(CompiledParser):
+    """Parser for %(source)s"""
+
+    format = %(format)r
+    tables = TABLES
+    productions = PRODUCTIONS
+    declaration = DECLARATION
+    libraries = LIBRARIES
+    _rootProduction = %(root)r
+'''
+
+
+class CompiledParser(BaseParser):
+    """Parser using tag-tables compiled by simpleparse.compile
+
+    Sub-classes (written by compileGrammar) provide the class
+    attributes:
+
+        tables -- list of the production tag-tables
+        productions -- mapping from production name to index in tables
+        declaration -- the EBNF declaration the tables were built from
+        libraries -- names of the modules to import before building
+            a parser from the declaration
+    """
+
+    format = FORMAT
+    tables = ()
+    productions = {}
+    declaration = None
+    libraries = ()
+    _fallback = None
+
+    def __init__(self, root=None):
+        """Initialise the parser
+
+        root -- root production used for parsing if none explicitly
+            specified, defaults to the root the module was compiled with
+        """
+        if self.format != FORMAT:
+            raise ValueError(
+                "%s was compiled by a different SimpleParse release, regenerate it"
+                % (self.__class__.__name__,)
+            )
+        if root is not None:
+            self._rootProduction = root
+
+    def buildTagger(self, production=None, processor=None):
+        """Get the compiled table for production"""
+        if production is None:
+            production = self._rootProduction
+        if processor is None:
+            processor = self.buildProcessor()
+        key = methodSourceKey(processor)
+        if key is not None and len(key) > 1:
+            # the processor customises the tables
+            return self.fallbackParser().buildTagger(production, processor)
+        try:
+            return self.tables[self.productions[production]]
+        except KeyError:
+            raise NameError(
+                """The name %s is not defined within this parser""" % (repr(production),)
+            )
+
+    def taggerCacheToken(self):
+        """The compiled tables never change"""
+        return self.__class__
+
+    def fallbackParser(self):
+        """Get a simpleparse.parser.Parser built from the declaration"""
+        if self._fallback is None:
+            from simpleparse.parser import Parser
+
+            for name in self.libraries:
+                importlib.import_module(name)
+            self._fallback = Parser(self.declaration, self._rootProduction)
+        return self._fallback
+
+
+class _ModuleWriter:
+    """Formats the tables of a generator as Python source"""
+
+    def __init__(self, parserList):
+        self.parserList = parserList
+        self.counts = {}
+        self.shared = {}
+        self.definitions = []
+        self.imports = set()
+        # the lists referenced by TableInList entries, prebuilt
+        # library tables bring lists of their own
+        self.lists = [parserList]
+        self.listNames = {id(parserList): "TABLES"}
+        for table in parserList:
+            self.count(table)
+
+    def count(self, table):
+        """Count the references to each nested table, collecting lists"""
+        for entry in table:
+            argument = self.tableArgument(entry)
+            if argument is not None:
+                seen = self.counts.get(id(argument), 0)
+                self.counts[id(argument)] = seen + 1
+                if not seen:
+                    self.count(argument)
+            elif self.listArgument(entry) is not None:
+                target = entry[2][0]
+                if id(target) not in self.listNames:
+                    self.listNames[id(target)] = "_l%d" % (len(self.lists),)
+                    self.lists.append(target)
+                    for item in target:
+                        if isinstance(item, tuple):
+                            self.count(item)
+
+    def tableArgument(self, entry):
+        """Return the nested table of entry or None"""
+        if isinstance(entry, tuple) and len(entry) >= 3:
+            command, argument = entry[1], entry[2]
+            if (
+                isinstance(command, int)
+                and (command & 0xFF) in _TABLE_COMMANDS
+                and isinstance(argument, (tuple, list))
+            ):
+                return argument
+        return None
+
+    def listArgument(self, entry):
+        """Return the (list, index) reference of entry or None"""
+        if isinstance(entry, tuple) and len(entry) >= 3:
+            command, argument = entry[1], entry[2]
+            if (
+                isinstance(command, int)
+                and (command & 0xFF) in _LIST_COMMANDS
+                and isinstance(argument, tuple)
+                and len(argument) == 2
+            ):
+                return argument
+        return None
+
+    def formatTable(self, table):
+        """Return source for the entries of table"""
+        lines = ["("]
+        for entry in table:
+            lines.append("    %s," % (self.formatEntry(entry).replace("\n", "\n    "),))
+        lines.append(")")
+        return "\n".join(lines)
+
+    def formatEntry(self, entry):
+        if not isinstance(entry, tuple) or len(entry) < 3:
+            raise ValueError("""Can't compile tag-table entry %r""" % (entry,))
+        items = [self.formatValue(entry[0]), self.formatValue(entry[1])]
+        argument = self.tableArgument(entry)
+        if argument is not None:
+            items.append(self.formatNested(argument))
+        elif self.listArgument(entry) is not None:
+            target, index = entry[2]
+            items.append("(%s, %d)" % (self.listNames[id(target)], index))
+        else:
+            items.append(self.formatValue(entry[2]))
+        items.extend([self.formatValue(value) for value in entry[3:]])
+        return "(%s)" % (", ".join(items),)
+
+    def formatNested(self, table):
+        """Return source (or the constant name) for a nested table"""
+        key = id(table)
+        if key in self.shared:
+            return self.shared[key]
+        source = self.formatTable(table)
+        if self.counts.get(key, 0) > 1:
+            name = "_t%d" % (len(self.shared),)
+            self.definitions.append("%s = %s\n" % (name, source))
+            self.shared[key] = name
+            return name
+        return source
+
+    def formatValue(self, value):
+        from simpleparse.objectgenerator import ElementToken
+
+        if value is None or isinstance(value, (int, str, bytes)):
+            return repr(value)
+        elif isinstance(value, TextSearchType):
+            self.imports.add(
+                "from simpleparse.stt.TextTools.TextTools import TextSearch"
+            )
+            return "TextSearch(%r, %r, %r)" % (
+                value.match,
+                value.translate,
+                value.algorithm,
+            )
+        elif isinstance(value, MultiTextSearchType):
+            self.imports.add(
+                "from simpleparse.stt.TextTools.TextTools import MultiTextSearch"
+            )
+            return "MultiTextSearch(%r)" % (value.match,)
+        elif isinstance(value, tuple):
+            # e.g. the (CharSet, jump) pairs of Dispatch entries
+            return "(%s)" % ("".join(["%s, " % (self.formatValue(item),) for item in value]),)
+        elif isinstance(value, CharSetType):
+            self.imports.add("from simpleparse.stt.TextTools.TextTools import CharSet")
+            return "CharSet(%r)" % (value.definition,)
+        elif isinstance(value, ElementToken) and value.__class__.__module__ == (
+            "simpleparse.objectgenerator"
+        ):
+            # e.g. the ErrorOnFail objects reporting failed "!" checks
+            name = value.__class__.__name__
+            self.imports.add("from simpleparse.objectgenerator import %s" % (name,))
+            return "%s(%s)" % (
+                name,
+                ", ".join(
+                    [
+                        "%s=%s" % (key, self.formatValue(item))
+                        for key, item in sorted(value.__dict__.items())
+                    ]
+                ),
+            )
+        raise ValueError("""Can't compile tag-table value %r""" % (value,))
+
+    def formatTables(self, names):
+        """Return source filling TABLES and the library lists"""
+        fills = []
+        for target in self.lists:
+            items = []
+            for index, item in enumerate(target):
+                if target is self.parserList:
+                    items.append("    # %d: %s\n" % (index, names[index]))
+                if isinstance(item, tuple):
+                    item = self.formatNested(item)
+                else:
+                    item = self.formatValue(item)
+                items.append("    %s,\n" % (item.replace("\n", "\n    "),))
+            fills.append(
+                "%s.extend([\n%s])\n" % (self.listNames[id(target)], "".join(items))
+            )
+        return "%s%s\n%s" % (
+            "".join(["%s = []\n" % (self.listNames[id(target)],) for target in self.lists[1:]]),
+            "\n".join(self.definitions),
+            "\n".join(fills),
+        )
+
+
+def _libraries(generator, definitionSources):
+    """Names of the modules whose shared definitions generator uses"""
+    used = []
+    for name, element in zip(generator.getNames(), generator.getRootObjects()):
+        for source in definitionSources:
+            if source.get(name) is element:
+                used.append(source)
+    libraries = []
+    for module in list(sys.modules.values()):
+        source = getattr(module, "c", None)
+        if any([source is item for item in used]):
+            libraries.append(module.__name__)
+    return tuple(sorted(libraries))
+
+
+def compileGrammar(
+    declaration,
+    root=None,
+    className="Parser",
+    source="a SimpleParse grammar",
+    definitionSources=common.SOURCES,
+):
+    """Return the source of a module holding the compiled tables
+
+    declaration -- simpleparse ebnf declaration of the language
+    root -- default root production of the generated parser,
+        defaults to the first production of the declaration
+    className -- name of the generated CompiledParser sub-class
+    source -- description of the grammar for the module docstrings
+    definitionSources -- dictionaries of common constructs for use
+        in building the grammar
+
+    Raises ValueError if the tables hold objects which can't be
+    written as Python source.
+    """
+    from simpleparse.parser import Parser
+
+    parser = Parser(declaration, root, definitionSources=definitionSources)
+    generator = parser._generator
+    names = generator.getNames()
+    if root is None:
+        root = names[0]
+    generator.buildParser(root)
+    writer = _ModuleWriter(generator.getParserList())
+    tables = writer.formatTables(names)
+    imports = sorted(writer.imports) + [
+        "from simpleparse.compile import CompiledParser"
+    ]
+    return (
+        _HEAD
+        % {
+            "source": source,
+            "version": simpleparse.__version__,
+            "imports": "\n".join(imports),
+        }
+        + tables
+        + _TAIL
+        % {
+            "productions": "{%s}"
+            % (
+                ", ".join(
+                    ["%r: %d" % (name, index) for index, name in enumerate(names)]
+                ),
+            ),
+            "declaration": repr(declaration),
+            "libraries": repr(_libraries(generator, definitionSources)),
+            "className": className,
+            "source": source,
+            "format": FORMAT,
+            "root": root,
+        }
+    )
+
+
+def main(argv=None):
+    """Command-line entry point, see the module docstring"""
+    import argparse
+    import pkgutil
+
+    argumentParser = argparse.ArgumentParser(
+        prog="python -m simpleparse.compile",
+        description="Compile a SimpleParse EBNF grammar to a Python module",
+    )
+    argumentParser.add_argument("grammar", help="file holding the EBNF declaration")
+    argumentParser.add_argument(
+        "-o", "--output", help="module file to write, default standard output"
+    )
+    argumentParser.add_argument(
+        "-r", "--root", help="default root production, default the first one"
+    )
+    argumentParser.add_argument(
+        "-n", "--name", default="Parser", help="name of the generated parser class"
+    )
+    argumentParser.add_argument(
+        "-l",
+        "--library",
+        action="append",
+        default=[],
+        help="module sharing definitions (see simpleparse.common.share) to "
+        "import, may be repeated; the simpleparse.common modules are "
+        "always available",
+    )
+    options = argumentParser.parse_args(argv)
+    for info in pkgutil.iter_modules(common.__path__):
+        importlib.import_module("simpleparse.common." + info.name)
+    for name in options.library:
+        importlib.import_module(name)
+    with open(options.grammar, encoding="utf-8") as file:
+        declaration = file.read()
+    result = compileGrammar(
+        declaration, options.root, options.name, source=options.grammar
+    )
+    if options.output:
+        with open(options.output, "w", encoding="utf-8") as file:
+            file.write(result)
+    else:
+        sys.stdout.write(result)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
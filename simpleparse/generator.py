@@ -1,5 +1,6 @@
 """Abstract representation of an in-memory grammar that generates parsers"""
 from simpleparse.stt.TextTools import TextTools
+from simpleparse import common
 
 class Generator:
     '''Abstract representation of an in-memory grammar that generates parsers
@@ -10,13 +11,29 @@ class Generator:
     particular parser associated with any particular EBNF
     grammar.  In fact, it is possible to create entire grammars
     using only the generator objects as a python API.
+
+    The generation attribute is incremented whenever a new
+    definition or definition source is added, so that parsers
+    can tell when their cached tag-tables are out of date.
+
+    The memoize attribute selects the productions whose references
+    are memoized by the tagging engine (see setMemoize).
     '''
+    memoize = ()
     def __init__( self ):
         """Initialise the Generator"""
         self.names = []
         self.rootObjects = []
         self.methodSource = None
         self.definitionSources = []
+        self.generation = 0
+    def __getstate__( self ):
+        """Pickle the grammar, not the state of the last buildParser call"""
+        state = self.__dict__.copy()
+        state.pop( 'parserList', None )
+        state.pop( 'terminalParserCache', None )
+        state['methodSource'] = None
+        return state
     def getNameIndex( self, name ):
         '''Return the index into the main list for the given name'''
         try:
@@ -25,7 +42,7 @@ class Generator:
             
             for source in self.definitionSources:
                 if name in source:
-                    return self.addDefinition( name, source[name])
+                    return self.addDefinition( name, common.resolve( source, name ))
 ##			import pdb
 ##			pdb.set_trace()
             raise NameError( '''The name %s is not defined within this generator'''%(repr(name)), self )
@@ -47,6 +64,7 @@ class Generator:
         except ValueError:
             self.names.append( name )
             self.rootObjects.append( rootElement )
+            self.generation += 1
             return self.getNameIndex( name )
     def buildParser( self, name, methodSource=None ):
         '''Build the given parser definition, returning a TextTools parsing tuple'''
@@ -69,6 +87,12 @@ class Generator:
             i = i + 1
         assert None not in self.parserList, str( self.parserList)
         return self.parserList [self.getNameIndex (name)]
+    def buildTagTable( self, name, methodSource=None, factory=TextTools.TagTable ):
+        """Build the given parser definition as a compiled TagTable
+
+        See compileTables for the meaning of factory.
+        """
+        return compileTables( self.buildParser( name, methodSource ), factory )
     def setTerminalParser( self, index, parser ):
         """Explicitly set the parser value for given name"""
         while index >= len(self.parserList):
@@ -119,12 +143,96 @@ class Generator:
         if obj is not None:
             return obj
         return name
+    def setMemoize( self, memoize ):
+        """Select the productions to memoize (packrat parsing)
+
+        memoize -- True to memoize every production, a collection
+            of production names, or a false value to memoize none
+
+        References to a memoized production carry the Memoize flag,
+        so the engine remembers, per tag() call, the outcome of the
+        production at each position and replays it when a FirstOf
+        alternative calls the production at the same position again.
+        """
+        if memoize is not True:
+            memoize = frozenset( memoize or () )
+        if memoize != self.memoize:
+            self.memoize = memoize
+            self.generation += 1
+    def memoizes( self, name ):
+        """Determine whether references to the given production are memoized"""
+        return self.memoize is True or name in self.memoize
     def addDefinitionSource( self, item ):
         """Add a source for definitions when the current grammar doesn't supply
         a particular rule (effectively common/shared items for the grammar)."""
         self.definitionSources.append( item )
+        self.generation += 1
 
 
+_TABLE_COMMANDS = (TextTools.Table, TextTools.SubTable)
+_LIST_COMMANDS = (TextTools.TableInList, TextTools.SubTableInList)
+
+def compileTables( table, factory=TextTools.TagTable ):
+    """Compile table and every table it references into linked TagTables
+
+    table -- a TextTools tag-table tuple, normally the result
+        of Generator.buildParser
+    factory -- TagTable constructor determining the table type,
+        TextTools.TagTable (Unicode text), TextTools.BytesTagTable
+        (bytes) or a callable wrapping TextTools.EncodedTagTable
+        (bytes in a given encoding)
+
+    The TableInList/SubTableInList references in the tables
+    point into the generator's parser list, which holds table
+    tuples.  The engine would compile (or look up in the global
+    TagTable cache) the target of such a reference each time
+    it recurses into it.  Here each parser list reachable from
+    table is copied into a new list of compiled TagTable objects
+    of the requested type, and the references are re-pointed at
+    the new lists, so recursing is a simple list look-up.
+
+    returns the compiled TagTable for table
+    """
+    lists = {}
+    rewritten = {}
+    pending = []
+    def relink( definition ):
+        """Return definition with list references re-pointed at compiled lists"""
+        key = id(definition)
+        if key in rewritten:
+            return rewritten[key][1]
+        entries = []
+        for entry in definition:
+            if isinstance( entry, (tuple,list)) and len(entry) >= 3:
+                command = entry[1]
+                argument = entry[2]
+                if isinstance( command, int ):
+                    if (command & 0xFF) in _TABLE_COMMANDS and isinstance( argument, (tuple,list)):
+                        entry = (entry[0], command, relink( argument )) + tuple(entry[3:])
+                    elif (command & 0xFF) in _LIST_COMMANDS and isinstance( argument, tuple) and len(argument) == 2:
+                        entry = (entry[0], command, (target( argument[0] ), argument[1])) + tuple(entry[3:])
+            entries.append( entry )
+        result = tuple( entries )
+        # keep definition alive so that its id can't be re-used
+        rewritten[key] = (definition, result)
+        return result
+    def target( source ):
+        """Get the compiled list which will stand in for source"""
+        key = id(source)
+        if key not in lists:
+            lists[key] = (source, [None]*len(source))
+            pending.append( source )
+        return lists[key][1]
+    root = factory( relink( table ), 0 )
+    while pending:
+        source = pending.pop()
+        compiled = lists[id(source)][1]
+        for index, item in enumerate( source ):
+            if isinstance( item, (tuple,list)):
+                item = factory( relink( item ), 0 )
+            compiled[index] = item
+    return root
+
 ### Compatability API
 ##  This API exists to allow much of the code written with SimpleParse 1.0
 ##  to work with SimpleParse 2.0
@@ -0,0 +1,191 @@
+"""On-disk cache of built parsers, keyed by a fingerprint of the grammar
+
+Parsers constructed with a cache directory (see parser.Parser) store
+their generator and tag-tables in a file named after the fingerprint
+of the declaration, root production, prebuilts, the names in the
+definition sources and the SimpleParse version.  Later constructions
+with the same inputs load the file instead of processing the EBNF.
+
+Definitions from the definition sources (simpleparse.common and
+anything shared through common.share) are not written to the cache,
+the file refers to them by name and they are looked up in the live
+sources when the file is loaded.  Sources are identified by the names
+they define; clear the cache directory after changing a shared
+definition without renaming it.
+
+Cache files are pickles, so loading one runs whatever code its author
+chose: anybody who can write to the cache directory can run code in
+every process using it.  The directory is therefore only used if it
+is owned by the current user and not writable by the group or by
+others (see trusted); it is created with mode 0700 if missing.  Don't
+point the cache (or SIMPLEPARSE_CACHE_DIR) at a directory shared with
+users you don't trust in any case, e.g. one below a parent directory
+they can rename entries in.
+"""
+import hashlib
+import io
+import os
+import pickle
+import stat
+import tempfile
+
+import simpleparse
+from simpleparse import common
+from simpleparse.objectgenerator import ElementToken
+
+# version of the cache file format, part of every fingerprint
+FORMAT = 1
+SUFFIX = ".spcache"
+
+
+class _SourcePickler(pickle.Pickler):
+    """Pickler referring to definition sources and their entries by name"""
+
+    def __init__(self, file, definitionSources):
+        super().__init__(file, pickle.HIGHEST_PROTOCOL)
+        self.references = {}
+        for index, source in enumerate(definitionSources):
+            self.references[id(source)] = (index, None)
+            # dict.items doesn't build the lazy entries of a LazyDict
+            items = dict.items(source) if isinstance(source, dict) else source.items()
+            for name, value in items:
+                if isinstance(value, ElementToken):
+                    self.references.setdefault(id(value), (index, name))
+
+    def persistent_id(self, obj):
+        return self.references.get(id(obj))
+
+
+class _SourceUnpickler(pickle.Unpickler):
+    """Unpickler resolving references written by _SourcePickler"""
+
+    def __init__(self, file, definitionSources):
+        super().__init__(file)
+        self.definitionSources = definitionSources
+
+    def persistent_load(self, pid):
+        index, name = pid
+        source = self.definitionSources[index]
+        if name is None:
+            return source
+        return common.resolve(source, name)
+
+
+def _dumps(obj, definitionSources):
+    file = io.BytesIO()
+    _SourcePickler(file, definitionSources).dump(obj)
+    return file.getvalue()
+
+
+def fingerprint(declaration, root, prebuilts, definitionSources):
+    """Return the cache key for a parser or None if it can't be cached
+
+    Returns None if the prebuilts can't be pickled.
+    """
+    definitionSources = list(definitionSources)
+    names = [sorted(source) for source in definitionSources]
+    try:
+        data = _dumps(
+            (FORMAT, simpleparse.__version__, declaration, root, prebuilts, names),
+            definitionSources,
+        )
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return None
+    return hashlib.sha256(data).hexdigest()
+
+
+def filename(directory, key):
+    """Return the name of the cache file for key"""
+    return os.path.join(directory, key + SUFFIX)
+
+
+def _private(info):
+    """Return true if info (an os.stat result) is ours and not shared"""
+    if info.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+        return False
+    getuid = getattr(os, "getuid", None)
+    # no POSIX ownership to check on Windows
+    return getuid is None or info.st_uid == getuid()
+
+
+def trusted(directory):
+    """Return true if cache files in directory may be loaded
+
+    The directory must exist, be owned by the current user and not
+    be writable by the group or by others.
+    """
+    try:
+        info = os.stat(directory)
+    except OSError:
+        return False
+    return stat.S_ISDIR(info.st_mode) and _private(info)
+
+
+def prepare(directory):
+    """Create directory (mode 0700) if missing, return trusted(directory)"""
+    try:
+        os.makedirs(directory, mode=0o700, exist_ok=True)
+    except OSError:
+        return False
+    return trusted(directory)
+
+
+def load(parser, directory, key, definitionSources):
+    """Restore parser from the cache file for key
+
+    Returns true if the file existed and was valid.  Unreadable,
+    truncated or foreign files are ignored (and replaced by the
+    next store).  Nothing is loaded from a directory which isn't
+    trusted, or from a file which isn't owned by the current user
+    or is writable by the group or by others.
+    """
+    if not trusted(directory):
+        return False
+    try:
+        with open(filename(directory, key), "rb") as file:
+            if not _private(os.fstat(file.fileno())):
+                return False
+            data = file.read()
+    except OSError:
+        return False
+    try:
+        fileFormat, fileKey, state = _SourceUnpickler(
+            io.BytesIO(data), list(definitionSources)
+        ).load()
+        if fileFormat != FORMAT or fileKey != key:
+            return False
+        parser.__setstate__(state)
+    except Exception:
+        # anything from a truncated file to a renamed class
+        return False
+    return True
+
+
+def store(parser, directory, key, definitionSources):
+    """Write parser to the cache file for key
+
+    The file is written to a temporary name and renamed, so that
+    concurrent processes never see a partial file.  Returns true
+    on success; failures (unwritable or untrusted directory,
+    unpicklable grammar) are not reported otherwise.
+    """
+    if not prepare(directory):
+        return False
+    try:
+        data = _dumps((FORMAT, key, parser.__getstate__()), list(definitionSources))
+    except (pickle.PicklingError, TypeError, AttributeError):
+        return False
+    try:
+        handle, temporary = tempfile.mkstemp(
+            prefix=key, suffix=".tmp", dir=directory
+        )
+        try:
+            with os.fdopen(handle, "wb") as file:
+                file.write(data)
+            os.replace(temporary, filename(directory, key))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+    except OSError:
+        return False
+    return True
@@ -0,0 +1,133 @@
+"""Parsing text which arrives in pieces
+
+IncrementalParse tags a text fed to it piece by piece, e.g. a message
+read from a socket.  Each piece resumes the tagging engine where it
+stopped for lack of text (see the partial and resume arguments of
+TextTools.tag()), so the work done for the whole text is that of a
+single parse however many pieces it arrives in.
+
+The result is known as soon as the text seen so far decides it: feed()
+returns it then, and close() once the text is complete.  Callbacks
+(Call, CallArg) are assumed to look at the text up to the position
+they return only; when they fail the parse waits for more text.
+"""
+from simpleparse.stt.TextTools.TextTools import tag
+
+
+class IncrementalParse:
+    """Parse of a text fed piece by piece
+
+    Usually created by BaseParser.incremental.
+
+    taggerFor -- callable returning the tag-table to parse its
+        argument (the text received by the first run) with
+    processor -- optional callable post-processing the result
+        as for BaseParser.parse
+    encoding -- as for BaseParser.parse, for bytes
+    batch -- for str text, whether feed() may put off parsing (see
+        feed)
+    """
+
+    def __init__(self, taggerFor, processor=None, encoding=None, batch=False):
+        self.taggerFor = taggerFor
+        self.tagger = None
+        self.processor = processor
+        self.encoding = encoding
+        self.batch = batch
+        # text received so far, None before the first piece: a
+        # bytearray growing in place for bytes; for str the text
+        # joined so far and the pieces received since
+        self._text = None
+        self._pieces = []
+        self._pending = 0
+        self.result = None
+        self._state = None
+        self._done = False
+
+    @property
+    def done(self):
+        """Whether the result is known"""
+        return self._done
+
+    @property
+    def buffer(self):
+        """The text received so far, None before the first piece"""
+        text = self._join()
+        if isinstance(text, bytearray):
+            return bytes(text)
+        return text
+
+    def feed(self, data):
+        """Add the next piece of the text
+
+        Returns the result once the text received decides it,
+        None while it doesn't.  Text fed after that is kept in
+        buffer but not parsed.
+
+        Bytes are collected in a bytearray which is tagged in
+        place.  A str can't grow, so every piece copies the text
+        received so far.  With batch set, past the first 16 KiB
+        of text the pieces are only joined (and tagged) once they
+        add up to an eighth of the text, keeping the copying
+        linear; the result may then come a few pieces after the
+        one deciding it, and at the latest from close().
+        """
+        if self._text is None:
+            self._text = data if isinstance(data, str) else bytearray(data)
+        elif isinstance(self._text, bytearray):
+            self._text += data
+        else:
+            self._pieces.append(data)
+            self._pending += len(data)
+        if self._done:
+            return self.result
+        size = len(self._text)
+        if (
+            self.batch
+            and self._pending
+            and size >= 16384
+            and self._pending < size >> 3
+        ):
+            return None
+        return self._run(True)
+
+    def close(self):
+        """Declare the text complete and return the result"""
+        if self._text is None:
+            self._text = "" if self.encoding is None else bytearray()
+        if self._done:
+            return self.result
+        return self._run(False)
+
+    def _join(self):
+        """Join the pieces of str text received since the last run"""
+        if self._pieces:
+            self._text = self._text + "".join(self._pieces)
+            self._pieces = []
+            self._pending = 0
+        return self._text
+
+    def _run(self, partial):
+        """Resume (or start) tagging the text"""
+        text = self._join()
+        if self.tagger is None:
+            self.tagger = self.taggerFor(text)
+        success, children, next = tag(
+            text,
+            self.tagger,
+            0,
+            len(text),
+            encoding=self.encoding,
+            partial=partial,
+            resume=self._state,
+        )
+        if success is None:
+            self._state = next
+            return None
+        self._state = None
+        self._done = True
+        result = (success, children, next)
+        if self.processor is not None:
+            result = self.processor(result, self.buffer)
+        self.result = result
+        return result
@@ -21,6 +21,7 @@ except NameError:
     TextSearch = BMS
 
 from simpleparse.error import ParserSyntaxError
+import bisect
 import copy
 
 class ElementToken:
@@ -170,7 +171,19 @@ class ElementToken:
     def terminal (self, generator):
         """Determine if this element is terminal for the generator"""
         return 0
-        
+    def firstCharacters( self, generator ):
+        """Get the characters with which a match can start
+
+        Returns a sorted tuple of (low, high) ordinal intervals
+        (as returned by mergeRanges) or None if the set is not
+        known, e.g. because the element may match without
+        consuming a character.  Used by FirstOfGroup to skip
+        the children which can't match the current character.
+        """
+        return None
+    def firstFlagsUnknown( self ):
+        """Whether our flags hide the first characters of the base element"""
+        return self.negative or self.optional or self.errorOnFail
 
 class Literal( ElementToken ):
     """Literal string value to be matched
@@ -269,6 +282,11 @@ class Literal( ElementToken ):
     def terminal (self, generator):
         """Determine if this element is terminal for the generator"""
         return 1
+    def firstCharacters( self, generator ):
+        """Get the characters with which a match can start"""
+        if self.firstFlagsUnknown() or not self.value or not isinstance( self.value, str ):
+            return None
+        return ((ord(self.value[0]),ord(self.value[0])),)
 
 class _Range( ElementToken ):
     """Range of character values where any one of the characters may match
@@ -293,12 +311,15 @@ class _Range( ElementToken ):
     literal ']' character (or the beginning of the range) or as the
     last character in the range.
 
-    Note: The expansion from the mini-grammar occurs before the
-    Range token is created (the simpleparse grammar does the
-    expansion), so the value attribute of the token is actually
-    the expanded string of characters.
+    Note: The mini-grammar is processed before the Range token
+    is created (by the simpleparse grammar), the token holds the
+    members either as a sorted tuple of (low, high) ordinal
+    intervals in the ranges attribute (as created by the
+    simpleparse grammar), or as the expanded string of characters
+    in the value attribute.
     """
     value = ""
+    ranges = ()
     requiresExpandedSet = 1
     def toParser( self, generator=None, noReport=0 ):
         """Create the parser for the element token"""
@@ -313,89 +334,117 @@ class _Range( ElementToken ):
                 return [(None, SubTable+flags, tuple(base))]
         else:
             return base
+    def getRanges( self ):
+        """Get the members as a sorted tuple of (low, high) intervals"""
+        if self.ranges:
+            return self.ranges
+        return mergeRanges([(ord(char),ord(char)) for char in self.value])
+    def firstCharacters( self, generator ):
+        """Get the characters with which a match can start"""
+        if self.firstFlagsUnknown() or isinstance( self.value, bytes ) and not self.ranges:
+            return None
+        return self.getRanges() or None
+
+def mergeRanges( ranges ):
+    """Sort (low, high) ordinal intervals, merging overlapping and adjacent ones
+
+    returns a tuple of (low, high) tuples
+    """
+    merged = []
+    for low, high in sorted( ranges ):
+        if merged and low <= merged[-1][1]+1:
+            if high > merged[-1][1]:
+                merged[-1] = (merged[-1][0], high)
+        else:
+            merged.append( (low, high) )
+    return tuple( merged )
+
+def charSetDefinition( ranges, negative=0 ):
+    """Get a CharSet definition for a sorted tuple of (low, high) intervals
+
+    ranges -- the members, as returned by mergeRanges
+    negative -- if true the definition is for the complement of
+        the set
+
+    The definition is bytes if all members are ASCII, otherwise
+    it's a string (which the engine encodes for bytes tag-tables).
+    The characters with special meaning in CharSet definitions
+    (a leading '^', '\\' and '-') are escaped.
+    """
+    parts = []
+    for low, high in ranges:
+        if low == 0x5C:
+            # a backslash can't start a range, "\\" is a backslash
+            parts.append( '\\\\' )
+            low += 1
+            if low > high:
+                continue
+        if low == high:
+            part = chr(low)
+        else:
+            part = '%s-%s'%(chr(low),chr(high))
+        if low in (0x2D, 0x5E):
+            # "\" keeps a "-" from ending a range and a leading "^"
+            # from negating the set
+            part = '\\' + part
+        parts.append( part )
+    definition = ''.join( parts )
+    if negative:
+        definition = '^' + definition
+    if not ranges or ranges[-1][1] < 0x80:
+        definition = definition.encode( 'ascii' )
+    return definition
+
+# CharSet objects by definition, shared between tables
+_charSets = {}
+
+def sharedCharSet( ranges, negative=0 ):
+    """Get the CharSet for a sorted tuple of (low, high) intervals
+
+    Equal sets share one CharSet object (see charSetDefinition).
+    """
+    definition = charSetDefinition( ranges, negative )
+    charSet = _charSets.get( definition )
+    if charSet is None:
+        charSet = _charSets[definition] = CharSet( definition )
+    return charSet
 
-# this should be a faster and more generic character set
-# approach, but there's a bug with mxTextTools b3 which makes
-# it non-functional, so for now I'm using the old version.
-# Eventually this should also support the Unicode character sets
-##try:
-##	CharSet
-##	class Range( _Range ):
-##		"""Range type using the CharSet feature of mx.TextTools 2.1.0
-##
-##		The CharSet type allows for both Unicode and 256-char strings,
-##		so we can use it as our 2.1.0 primary parsing mechanism.
-##		It also allows for simpler definitions (doesn't require that
-##		we pre-exand the character set).  That's going to require support
-##		in the SimpleParse grammar, of course.
-##		"""
-##		requiresExpandedSet = 0
-##		def baseToParser( self, generator=None ):
-##			"""Parser generation without considering flag settings"""
-##			svalue = self.value
-##			print 'generating range for ', repr(svalue)
-##			if not svalue:
-##				raise ValueError( '''Range defined with no member values, would cause infinite loop %s'''%(self))
-##			if self.negative:
-##				svalue = '^' + svalue
-##			print '  generated', repr(svalue)
-##			svalue = CharSet(svalue)
-##			if self.repeating:
-##				if self.optional:
-##					return [ (None, AllInCharSet, svalue, 1 ) ]
-##				else: # not optional
-##					#return [ (None, AllInSet, svalue ) ]
-##					return [ (None, AllInCharSet, svalue ) ]
-##			else: # not repeating
-##				if self.optional:
-##					#return [ (None, IsInSet, svalue, 1 ) ]
-##					return [ (None, IsInCharSet, svalue, 1 ) ]
-##				else: # not optional
-##					#return [ (None, IsInSet, svalue ) ]
-##					return [ (None, IsInCharSet, svalue ) ]
-##except NameError:
 class Range( _Range ):
-    """Range type which doesn't use the CharSet features in mx.TextTools
+    """Range type using the CharSet feature of mx.TextTools
+
+    Ranges are matched with the CharSet commands (AllInCharSet,
+    IsInCharSet), a bitmap lookup per character (a binary search
+    of the intervals beyond the Basic Multilingual Plane).  The
+    CharSet for a range of ASCII characters is shared by all
+    tag-table types, the engine encodes other sets for bytes
+    tag-tables (see charSetDefinition).
 
-    This is likely to be much slower than the CharSet version (below), and
-    is unable to handle unicode character sets.  However, it will work with
-    TextTools 2.0.3, which may be needed in some cases.
+    Ranges with a bytes value use the AllIn/IsIn family of commands.
     """
+    requiresExpandedSet = 0
     def baseToParser( self, generator=None ):
         """Parser generation without considering flag settings"""
         svalue = self.value
-        if not svalue:
-            raise ValueError( '''Range defined with no member values, would cause infinite loop %s'''%(self))
-        if self.negative:
-            if self.repeating:
-                if self.optional:
-                    #return [ (None, AllInSet, svalue, 1 ) ]
-                    return [ (None, AllNotIn, svalue, 1 ) ]
-                else: # not optional
-                    #return [ (None, AllInSet, svalue ) ]
-                    return [ (None, AllNotIn, svalue ) ]
-            else: # not repeating
-                if self.optional:
-                    #return [ (None, IsInSet, svalue, 1 ) ]
-                    return [ (None, IsNotIn, svalue, 1 ) ]
-                else: # not optional
-                    #return [ (None, IsInSet, svalue ) ]
-                    return [ (None, IsNotIn, svalue ) ]
+        if isinstance( svalue, bytes ) and not self.ranges:
+            if not svalue:
+                raise ValueError( '''Range defined with no member values, would cause infinite loop %s'''%(self))
+            if self.negative:
+                command = self.repeating and AllNotIn or IsNotIn
+            else:
+                command = self.repeating and AllIn or IsIn
         else:
+            ranges = self.getRanges()
+            if not ranges:
+                raise ValueError( '''Range defined with no member values, would cause infinite loop %s'''%(self))
+            svalue = sharedCharSet( ranges, self.negative )
             if self.repeating:
-                if self.optional:
-                    #return [ (None, AllInSet, svalue, 1 ) ]
-                    return [ (None, AllIn, svalue, 1 ) ]
-                else: # not optional
-                    #return [ (None, AllInSet, svalue ) ]
-                    return [ (None, AllIn, svalue ) ]
-            else: # not repeating
-                if self.optional:
-                    #return [ (None, IsInSet, svalue, 1 ) ]
-                    return [ (None, IsIn, svalue, 1 ) ]
-                else: # not optional
-                    #return [ (None, IsInSet, svalue ) ]
-                    return [ (None, IsIn, svalue ) ]
+                command = AllInCharSet
+            else:
+                command = IsInCharSet
+        if self.optional:
+            return [ (None, command, svalue, 1 ) ]
+        else:
+            return [ (None, command, svalue ) ]
     def terminal (self, generator):
         """Determine if this element is terminal for the generator"""
         return 1
@@ -441,6 +490,11 @@ class SequentialGroup( Group ):
             if len(first) == 3 and first[0] is None and first[1] == SubTable:
                 return tuple(first[2])
         return basic
+    def firstCharacters( self, generator ):
+        """Get the characters with which a match can start"""
+        if self.firstFlagsUnknown() or not self.children:
+            return None
+        return self.children[0].firstCharacters( generator )
             
 class CILiteral( SequentialGroup ):
     """Case-insensitive Literal values
@@ -480,6 +534,14 @@ class CILiteral( SequentialGroup ):
             if len(first) == 3 and first[0] is None and first[1] == SubTable:
                 return tuple(first[2])
         return basic
+    def firstCharacters( self, generator ):
+        """Get the characters with which a match can start"""
+        if self.firstFlagsUnknown() or not self.value or not isinstance( self.value, str ):
+            return None
+        return mergeRanges([
+            (ord(char),ord(char))
+            for char in (self.value.upper()[0], self.value.lower()[0])
+        ])
     def ciParse( self, value ):
         """Break value into set of case-dependent groups..."""
         def equalPrefix( a,b ):
@@ -552,6 +614,13 @@ class FirstOfGroup( Group ):
     i.e. a series of slash-separated element token definitions.
     """
     def toParser( self, generator=None, noReport=0 ):
+        words = self.wordList()
+        if words is not None:
+            if self.negative and self.repeating:
+                search = self.searchTable( words )
+                if search is not None:
+                    return search
+            return self.permute( (None, WordInList, words) )
         elset = []
         # should catch condition where a child is optional
         # and we are repeating (which causes a crash during
@@ -565,14 +634,163 @@ class FirstOfGroup( Group ):
             else: # for now I'm eating the inefficiency and doing an extra SubTable for all elements to allow for easy calculation of jumps within the FO group
                 elset.append(  (None, SubTable, tuple( dataset ))  )
 
+        procset = self.dispatchTable( elset, generator )
+        if procset is None:
+            procset = self.chainTable( elset )
+
+        basetable = (None, SubTable, tuple(procset) )
+        return self.permute( basetable )
+    # groups of at least this many literals use WordInList
+    minWordListSize = 2
+    def wordList( self ):
+        """Get the WordInList argument matching the same as the group or None
+
+        Groups of literals and (ASCII) case-insensitive literals
+        without flags are matched by a single WordInList command,
+        a trie lookup taking the first literal in the group which
+        matches the text.
+        """
+        words = []
+        for child in self.children:
+            if (
+                child.negative or child.optional or child.repeating or
+                child.lookahead or child.errorOnFail
+            ):
+                return None
+            if isinstance( child, Literal ) and child.value:
+                words.append( child.value )
+            elif (
+                isinstance( child, CILiteral ) and child.value and
+                isinstance( child.value, str ) and child.value.isascii()
+            ):
+                words.append( (child.value, 1) )
+            else:
+                return None
+        if len(words) < self.minWordListSize:
+            return None
+        return tuple( words )
+    # repeating negative groups of at least this many (case-sensitive)
+    # literals skip to the next of them with a MultiTextSearch
+    minSearchSize = 2
+    def searchTable( self, words ):
+        """Get the table for a repeating negative group of literals or None
+
+        As for a repeating negative Literal, the table moves to the
+        leftmost occurrence of any of the words (or to the end of
+        the text) with a single search instead of testing the words
+        at each position.
+        """
+        if len(words) < self.minSearchSize:
+            return None
+        if len({type( word ) for word in words}) != 1 or isinstance( words[0], tuple ):
+            return None
+        search = MultiTextSearch( words )
+        if self.optional:
+            base = [ (None, sWordStart, search,1,2), (None, Move, ToEOF ) ]
+        else: # must first check that we're not at the end or at one of the words
+            base = [
+                (None, EOF, Here, 1,2),
+                (None, WordInList+LookAhead, words, 2,1),
+                (None, Fail, Here),
+                (None, sWordStart, search,1,2),
+                (None, Move, ToEOF ),
+            ]
+        flags = 0
+        if self.lookahead:
+            flags = flags + LookAhead
+        if self.errorOnFail:
+            return [(None, SubTable+flags, tuple(base),1,2),(None, Call, self.errorOnFail)]
+        elif flags:
+            return [(None, SubTable+flags, tuple(base))]
+        return base
+    def chainTable( self, elset ):
+        """Try each child table in turn, the first match ends the table"""
         procset = []
         for i in range( len( elset) -1): # note that we have to treat last el specially
             procset.append( elset[i] + (1,len(elset)-i) ) # if success, jump past end
         procset.append( elset[-1] ) # will cause a failure if last element doesn't match
-        procset = tuple(procset)
+        return procset
+    # the chains of a dispatch table may hold at most this many
+    # times the entries of the plain chain
+    maxDispatchGrowth = 4
+    def dispatchTable( self, elset, generator ):
+        """Try only the children which can match the current character
+
+        The characters are split into classes by the set of
+        children whose firstCharacters include them; children
+        with unknown first characters belong to every class.
+        A Dispatch entry jumps to the chain of candidates for
+        the class of the current character, which keeps the
+        order of the children.  At the end of the text, and
+        where the engine can't classify a character (invalid
+        UTF-8, CharSets overlapping once encoded for a bytes
+        tag-table), the whole chainTable is tried.
+
+        Returns None if fewer than two children have known
+        first characters or the chains would be too large.
+        """
+        firsts = [child.firstCharacters( generator ) for child in self.children]
+        known = [i for i in range(len(firsts)) if firsts[i] is not None]
+        if len(known) < 2:
+            return None
+        unknown = tuple([i for i in range(len(firsts)) if firsts[i] is None])
+        bounds = sorted({
+            bound
+            for i in known
+            for low, high in firsts[i]
+            for bound in (low, high+1)
+        })
+        classes = {}
+        for low, next in zip( bounds, bounds[1:] ):
+            members = tuple([i for i in known if rangesContain( firsts[i], low )])
+            if members:
+                classes.setdefault( members, [] ).append( (low, next-1) )
+        chains = [
+            (sharedCharSet( mergeRanges( ranges )), tuple(sorted( members + unknown )))
+            for members, ranges in classes.items()
+        ]
+        # the characters no known child can start with
+        chains.append( (
+            sharedCharSet( mergeRanges( [
+                interval for i in known for interval in firsts[i]
+            ] ), 1 ),
+            unknown,
+        ) )
+        size = sum([len(chain) or 1 for charSet, chain in chains])
+        if size > self.maxDispatchGrowth * len(elset):
+            return None
+        end = 1 + size + len(elset)
+        pairs = []
+        procset = [None]
+        for charSet, chain in chains:
+            pairs.append( (charSet, len(procset)) )
+            if not chain:
+                procset.append( (None, Fail, Here) )
+            for i, index in enumerate( chain ):
+                # the last candidate failing fails the group
+                procset.append( elset[index] + (
+                    i < len(chain)-1 and 1 or 0,
+                    end - len(procset),
+                ) )
+        procset[0] = (None, Dispatch, tuple(pairs), len(procset))
+        procset.extend( self.chainTable( elset ) )
+        return procset
+    def firstCharacters( self, generator ):
+        """Get the characters with which a match can start"""
+        if self.firstFlagsUnknown():
+            return None
+        ranges = []
+        for child in self.children:
+            first = child.firstCharacters( generator )
+            if first is None:
+                return None
+            ranges.extend( first )
+        return mergeRanges( ranges ) or None
 
-        basetable = (None, SubTable, procset )
-        return self.permute( basetable )
+def rangesContain( ranges, ordinal ):
+    """Whether the sorted (low, high) intervals include ordinal"""
+    index = bisect.bisect_right( ranges, (ordinal, 0x110000) ) - 1
+    return index >= 0 and ranges[index][1] >= ordinal
 
 class Prebuilt( ElementToken ):
     """Holder for pre-built TextTools tag tables
@@ -607,6 +825,11 @@ class LibraryElement( ElementToken ):
         except:
             print(basetable)
             raise
+    def firstCharacters( self, generator ):
+        """Get the characters with which a match can start"""
+        if self.firstFlagsUnknown():
+            return None
+        return self.generator.getRootObject( self.production ).firstCharacters( self.generator )
 
 class Name( ElementToken ):
     """Reference to another rule in the grammar
@@ -711,6 +934,10 @@ class Name( ElementToken ):
                     ))
                     generator.setTerminalParser( sindex, partial)
                     return partial
+        if generator.memoizes( self.value ):
+            memoize = Memoize
+        else:
+            memoize = 0
         # base, required, positive table...
         if (
             self.terminal( generator ) and
@@ -731,16 +958,27 @@ class Name( ElementToken ):
                 # it doesn't report anything, or we don't
                 partial = (partial[0][0] or tagobject,)+ partial[0][1:]
             else:
-                partial = (tagobject, Table, tuple(partial))
+                partial = (tagobject, Table|memoize, tuple(partial))
             return self.permute( partial )
         basetable = (
             tagobject,
-            command, (
+            command|memoize, (
                 generator.getParserList (),
                 sindex,
             )
         )
         return self.permute( basetable )
+    # () until computed, None while being computed (a left-recursive
+    # reference) or if unknown
+    firstValue = ()
+    def firstCharacters( self, generator ):
+        """Get the characters with which a match can start"""
+        if self.firstFlagsUnknown():
+            return None
+        if self.firstValue == ():
+            self.firstValue = None
+            self.firstValue = generator.getRootObject( self.value ).firstCharacters( generator )
+        return self.firstValue
     terminalValue = None
     def terminal (self, generator):
         """Determine if this element is terminal for the generator"""
@@ -1,5 +1,7 @@
 """Real-world parsers using the SimpleParse EBNF"""
-from simpleparse import baseparser, simpleparsegrammar, common
+import os
+from simpleparse import baseparser, simpleparsegrammar, common, grammarcache
+from simpleparse.stt.TextTools import TextTools
 
 class Parser( baseparser.BaseParser ):
     """EBNF-generated Parsers with results-handling
@@ -19,6 +21,8 @@ class Parser( baseparser.BaseParser ):
         self, declaration, root='root',
         prebuilts=(), 
         definitionSources=common.SOURCES,
+        cacheDirectory=None,
+        memoize=None,
     ):
         """Initialise the parser, creating the tagging table for it
 
@@ -29,13 +33,48 @@ class Parser( baseparser.BaseParser ):
             tables
         definitionSources -- dictionaries of common constructs for use
             in building your grammar
+        cacheDirectory -- optional directory in which the built parser
+            is cached (see simpleparse.grammarcache), defaults to the
+            SIMPLEPARSE_CACHE_DIR environment variable; no caching is
+            done if neither is set, or if the directory is not owned
+            by the current user or is writable by others (cache files
+            are pickles, whoever can write them can run code in this
+            process)
+        memoize -- True to memoize every production, or a collection
+            of production names to memoize, see
+            simpleparse.generator.Generator.setMemoize; memoization
+            keeps grammars whose alternatives start with the same
+            productions from re-parsing them, at the cost of some
+            memory per parse
         """
+        if cacheDirectory is None:
+            cacheDirectory = os.environ.get('SIMPLEPARSE_CACHE_DIR')
+        key = None
+        if cacheDirectory:
+            cacheDirectory = os.path.expanduser(cacheDirectory)
+        if cacheDirectory and grammarcache.prepare(cacheDirectory):
+            key = grammarcache.fingerprint(
+                declaration, root, prebuilts, definitionSources,
+            )
+            if key is not None and grammarcache.load(
+                self, cacheDirectory, key, definitionSources,
+            ):
+                self._generator.setMemoize( memoize )
+                return
         self._rootProduction = root
         self._declaration = declaration
         self._generator = simpleparsegrammar.Parser(
             declaration, prebuilts,
             definitionSources = definitionSources,
         ).generator
+        if key is not None:
+            try:
+                self.getTagger(None, None, TextTools.TagTable)
+            except NameError:
+                # root isn't defined (yet), store the generator only
+                pass
+            grammarcache.store(self, cacheDirectory, key, definitionSources)
+        self._generator.setMemoize( memoize )
     def buildTagger( self, production=None, processor=None):
         """Get a particular parsing table for a particular production"""
         if production is None:
@@ -46,4 +85,36 @@ class Parser( baseparser.BaseParser ):
             production,
             methodSource=processor,
         )
+    def profileNames( self, tagger, production=None ):
+        """Name the tables of tagger after the productions of the grammar
+
+        The tables reached through TableInList/SubTableInList
+        references are the generator's tables for its names, in
+        the order of generator.getNames().
+        """
+        names = super().profileNames( tagger, production )
+        productions = self._generator.getNames()
+        seen = set()
+        pending = [ table for table in names ]
+        while pending:
+            table = pending.pop()
+            if id(table) in seen:
+                continue
+            seen.add( id(table) )
+            for entry in table.compiled():
+                command, argument = entry[1] & 0xFF, entry[2]
+                if command in (TextTools.TableInList, TextTools.SubTableInList):
+                    tables, index = argument
+                    child = tables[index]
+                    if isinstance( child, TextTools.TagTableType ):
+                        names.setdefault( child, productions[index] )
+                        pending.append( child )
+                elif command in (TextTools.Table, TextTools.SubTable) and isinstance(
+                    argument, TextTools.TagTableType
+                ):
+                    pending.append( argument )
+        return names
+    def taggerCacheToken( self ):
+        """Cached tag-tables are valid until the generator changes"""
+        return (self._generator, self._generator.generation)
     
\ No newline at end of file
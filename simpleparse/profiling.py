@@ -0,0 +1,166 @@
+"""Per-production counters collected by the tagging engine
+
+Passing a list (or any object with an append method) as the profile
+argument of TextTools.tag() makes the engine count, for every table
+it calls, how often it was entered, how often it matched or failed,
+the number of characters the matches consumed and the time spent in
+it.  The counters are appended as a call tree of tuples
+
+    (tagobj, table, entries, successes, failures, consumed, seconds, children)
+
+where children is a tuple of such trees for the tables called from
+table with the tag object tagobj.  Tables replayed from the memo (see
+the Memoize flag) are counted as calls taking no time.  Profiling
+runs with the GIL held, and costs nothing when it is off.
+
+Profile collects the trees of any number of tag() calls, names the
+tables and reports the totals per production (stats()) or as
+collapsed stacks for flamegraph tools (collapsed()).
+BaseParser.parse(..., profile=...) fills in a Profile, naming the
+tables after the productions of the grammar.
+"""
+
+
+class Profile:
+    """Call tree of the tables called by one or more tag() calls
+
+    names -- optional mapping from tables to the names reported
+        for them; tables without a name are named after their
+        tag object if that is a string, tables with neither are
+        anonymous groups and are counted as part of the table
+        calling them
+    """
+
+    rootName = "<root>"
+
+    def __init__(self, names=None):
+        self.names = dict(names or ())
+        self.calls = 0
+        self._root = None
+
+    def append(self, tree):
+        """Merge the tree of counters reported by a tag() call"""
+        if tree is None:
+            return
+        self.calls += 1
+        if self._root is None:
+            self._root = self._newNode(tree)
+        pending = [(self._root, tree)]
+        while pending:
+            node, tree = pending.pop()
+            for index in range(4):
+                node[2 + index] += tree[2 + index]
+            node[6] += tree[6]
+            children = node[7]
+            for child in tree[7]:
+                key = (id(child[1]), id(child[0]))
+                target = children.get(key)
+                if target is None:
+                    target = children[key] = self._newNode(child)
+                pending.append((target, child))
+
+    def _newNode(self, tree):
+        """Create an empty merged node for the table and tag object of tree
+
+        The node holds references to both, so that their ids
+        (the keys of the children) can't be re-used.
+        """
+        return [tree[0], tree[1], 0, 0, 0, 0, 0.0, {}]
+
+    def clear(self):
+        """Discard the counters collected so far"""
+        self.calls = 0
+        self._root = None
+
+    def nameOf(self, table, tagobj):
+        """Return the name reported for table or None if it is anonymous"""
+        try:
+            name = self.names.get(table)
+        except TypeError:
+            name = None
+        if name is None and isinstance(tagobj, str):
+            name = tagobj
+        return name
+
+    def _walk(self):
+        """Yield (node, stack) for every node, parents before children
+
+        stack is the tuple of names of the node and the named
+        tables calling it; anonymous nodes have the stack of the
+        table calling them.
+        """
+        if self._root is None:
+            return
+        root = self._root
+        pending = [
+            (root, (self.nameOf(root[1], root[0]) or self.rootName,))
+        ]
+        while pending:
+            node, stack = pending.pop()
+            yield node, stack
+            for child in node[7].values():
+                name = self.nameOf(child[1], child[0])
+                pending.append((child, stack + (name,) if name else stack))
+
+    def stats(self):
+        """Return the totals per name as a dictionary
+
+        Every name maps to a dictionary with the keys entries,
+        successes, failures, consumed (characters) and time
+        (seconds spent in the production including the
+        productions it called; recursive calls are counted once).
+        """
+        result = {}
+        if self._root is None:
+            return result
+        # names of the productions being walked, with their depth
+        active = {}
+        root = self._root
+        pending = [(root, self.nameOf(root[1], root[0]) or self.rootName, False)]
+        while pending:
+            node, name, leaving = pending.pop()
+            if leaving:
+                active[name] -= 1
+                continue
+            if name is not None:
+                totals = result.get(name)
+                if totals is None:
+                    totals = result[name] = {
+                        "entries": 0,
+                        "successes": 0,
+                        "failures": 0,
+                        "consumed": 0,
+                        "time": 0.0,
+                    }
+                totals["entries"] += node[2]
+                totals["successes"] += node[3]
+                totals["failures"] += node[4]
+                totals["consumed"] += node[5]
+                if not active.get(name):
+                    totals["time"] += node[6]
+                active[name] = active.get(name, 0) + 1
+                pending.append((node, name, True))
+            for child in node[7].values():
+                pending.append((child, self.nameOf(child[1], child[0]), False))
+        return result
+
+    def collapsed(self, unit=1e-6):
+        """Return the self-times as collapsed stacks for flamegraph tools
+
+        Each line is "production;production;... count", where
+        count is the time spent in the last production of the
+        stack itself (not in the named productions it called) in
+        multiples of unit (default microseconds).  Lines are
+        sorted by stack, stacks with a count of 0 are left out.
+        """
+        totals = {}
+        for node, stack in self._walk():
+            # anonymous children add their own time to the same stack
+            own = node[6] - sum([child[6] for child in node[7].values()])
+            totals[stack] = totals.get(stack, 0.0) + own
+        lines = []
+        for stack, seconds in sorted(totals.items()):
+            count = int(round(seconds / unit))
+            if count > 0:
+                lines.append("%s %d" % (";".join(stack), count))
+        return "".join(line + "\n" for line in lines)
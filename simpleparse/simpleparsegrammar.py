@@ -637,19 +637,17 @@ class SPGrammarProcessor(DispatchProcessor):
         return classObject(value="".join(elements))
 
     def range(self, info, buffer):
-        ##		if hasattr( Range, 'requiresExpandedSet') and Range.requiresExpandedSet:
         (tag, left, right, sublist) = info
+        ranges = []
+        for item in dispatchList(self, sublist, buffer):
+            if isinstance(item, tuple):
+                ranges.append(item)
+            else:
+                ranges.extend([(ord(char), ord(char)) for char in item])
         return Range(
-            value="".join(dispatchList(self, sublist, buffer)),
+            ranges=mergeRanges(ranges),
         )
 
-    ##		else:
-    ##			# need to build up a new-syntax version of the range...
-    ##			# escape ^ to \^
-    ##			# escape \ to \\
-    ##			# escape - to \-
-    ##			# make sure range-sets are in proper order...
-    ##			raise NotImplementedError( """Haven't got the new CharSet version implemented yet""")
     def name(self, tup, buffer):
         return Name(
             value=getString(tup, buffer),
@@ -727,20 +725,12 @@ class SPGrammarProcessor(DispatchProcessor):
         return "".join(dispatchList(self, sublist, buffer))
 
     def CHARRANGE(self, info, buffer):
-        """Create a string from first to second item"""
+        """Create a (low, high) ordinal interval from first to second item"""
         (tag, left, right, sublist) = info
         first, second = dispatchList(self, sublist, buffer)
         if second < first:
             second, first = first, second
-        _chr = _unichr
-        # if isinstance( first, _unicode ) or isinstance( second, _unicode ):
-        #     _chr = _unichr
-        #     if not (isinstance( second, _unicode ) and isinstance( first, _unicode )):
-        #         raise ValueError( 'Range %s uses one unicode and one string escape, cannot mix'%(buffer[left:right]) )
-        # else:
-        #     _chr = chr
-        first, second = list(map(ord, (first, second)))
-        return "".join([_chr(u) for u in range(first, second + 1)])
+        return (ord(first), ord(second))
 
     def CHARDASH(self, tup, buffer):
         return "-"
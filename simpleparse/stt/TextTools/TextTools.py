@@ -86,6 +86,20 @@ def print_tags(text,tags,indent=0):
             print(' '+indent*' |',tagname,': ',target,(l,r))
             print_tags(text,subtags,indent+1)
 
+def to_numpy(tags):
+
+    """ Return the columns of to_arrays(tags) as NumPy int64 arrays
+
+        The result is (tag, start, stop, depth, tagobjects); the
+        arrays share the memory of the array('q') objects returned
+        by to_arrays().  Needs NumPy, which is an optional
+        dependency.
+    """
+    import numpy
+    columns = to_arrays(tags)
+    return tuple([numpy.frombuffer(column,dtype=numpy.int64)
+                  for column in columns[:4]]) + columns[4:]
+
 def print_joinlist(joins,indent=0,
                    
                    StringType=str):
@@ -296,8 +310,13 @@ def find(text,what,start=0,stop=None,
         Uses a search object for the task. Returns the position of the
         first occurance of what in text[start:stop]. stop defaults to
         len(text).  Returns -1 in case no occurance was found.
+
+        what may also be a list or tuple of strings, which are
+        searched for at once using a MultiTextSearch object.
         
     """
+    if isinstance(what,(list,tuple)):
+        SearchObject = MultiTextSearch
     if stop is not None:
         return SearchObject(what).find(text,start,stop)
     else:
@@ -313,8 +332,15 @@ def findall(text,what,start=0,stop=None,
         tuples (l,r) marking the all occurances in
         text[start:stop]. stop defaults to len(text).  Returns an
         empty list in case no occurance was found.
+
+        what may also be a list or tuple of strings, the slices then
+        mark the non-overlapping occurances of any of them, found from
+        left to right (taking the first string given where several
+        start at the same position).
         
     """
+    if isinstance(what,(list,tuple)):
+        SearchObject = MultiTextSearch
     if stop is not None:
         return SearchObject(what).findall(text,start,stop)
     else:
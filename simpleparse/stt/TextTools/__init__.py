@@ -19,8 +19,18 @@ def _CS(definition):
     return CharSet(definition)
 def _TT(definition):
     return TagTable(definition)
+def _TT2(definition,tabletype,encoding):
+    # Version 2 of the TagTable pickle format: keeps the table type
+    # and encoding; tables are not entered into the TagTable cache
+    if encoding is not None:
+        return EncodedTagTable(definition,encoding,0)
+    elif tabletype == 0:
+        return BytesTagTable(definition,0)
+    return TagTable(definition,0)
 def _TS(match,translate,algorithm):
     return TextSearch(match,translate,algorithm)
+def _MTS(match):
+    return MultiTextSearch(match)
 # Needed for backward compatibility:
 def _BMS(match,translate):
     return BMS(match,translate)
@@ -35,18 +45,23 @@ class modinit:
     def pickle_CharSet(cs):
         return _CS,(cs.definition,)
     def pickle_TagTable(tt):
-        return _TT,(tt.compiled(),)
+        return _TT2,(tt.compiled(),tt.tabletype,tt.encoding)
     def pickle_TextSearch(ts):
         return _TS,(ts.match, ts.translate, ts.algorithm)
+    def pickle_MultiTextSearch(ts):
+        return _MTS,(ts.match,)
     copyreg.pickle(CharSetType,
                     pickle_CharSet,
                     _CS)
     copyreg.pickle(TagTableType,
                     pickle_TagTable,
-                    _TT)
+                    _TT2)
     copyreg.pickle(TextSearchType,
                     pickle_TextSearch,
                     _TS)
+    copyreg.pickle(MultiTextSearchType,
+                    pickle_MultiTextSearch,
+                    _MTS)
     if 0:
         def pickle_BMS(so):
             return _BMS,(so.match,so.translate)
@@ -4,7 +4,8 @@
 
 	The commands may alter any of the tag-specific variables
 
-	errors may be indicated if encountered in childReturnCode and the error* variables
+	errors may be indicated if encountered in childReturnCode and TE_SET_ERROR()
+	(see recursecommands.h)
 
 */
 
@@ -22,18 +23,27 @@ case MATCH_SFINDWORD:
 			" in string   = '%.40s'\n",
 			text + childPosition);
 	childStart = childPosition;
-	returnCode = TE_SEARCHAPI(
-		match,
-		text,
-		childStart,
-		sliceright,
-		&wordstart,
-		&wordend);
+	if (mxMultiTextSearch_Check(match))
+		returnCode = mxMultiTextSearch_SearchBuffer(
+			match,
+			text,
+			sizeof(TE_CHAR),
+			childStart,
+			sliceright,
+			&wordstart,
+			&wordend);
+	else
+		returnCode = TE_SEARCHAPI(
+			match,
+			text,
+			childStart,
+			sliceright,
+			&wordstart,
+			&wordend);
 	if (returnCode < 0)
 	{
 		childReturnCode = ERROR_CODE;
-		errorType = PyExc_SystemError;
-		errorMessage = PyString_FromFormat(
+		TE_SET_ERROR(PyExc_SystemError,
 			"Search-object search returned value < 0 (%i): probable bug in text processing engine",
 			returnCode);
 	}
@@ -89,8 +99,7 @@ else if (loopcount < 0)
 	else
 	{
 		childReturnCode = ERROR_CODE;
-		errorType = PyExc_TypeError;
-		errorMessage = PyString_FromFormat(
+		TE_SET_ERROR(PyExc_TypeError,
 			"Tag Table entry %d: expected an integer (command=Loop) got a %.50s",
 			(unsigned int)index,
 			Py_TYPE(match)->tp_name);
@@ -134,7 +143,12 @@ break;
 case MATCH_CALL:
 case MATCH_CALLARG:
 /* call and callarg actually follow the low-level contract */
-
+#ifdef TE_NOGIL
+/* never part of a callback-free table; calling Python needs the GIL,
+   the standard engine re-runs the parse */
+childReturnCode = ERROR_CODE;
+break;
+#else
 {
 	PyObject *fct = NULL;
 	int argc = -1;
@@ -151,8 +165,7 @@ case MATCH_CALLARG:
 		{
 			/* how is this even possible? */
 			childReturnCode = ERROR_CODE;
-			errorType = PyExc_TypeError;
-			errorMessage = PyString_FromFormat(
+			TE_SET_ERROR(PyExc_TypeError,
 				"Tag Table entry %d: "
 				"expected a tuple (fct,arg0,arg1,...)"
 				"(command=CallArg)",
@@ -179,8 +192,7 @@ case MATCH_CALLARG:
 		if (!args)
 		{
 			childReturnCode = ERROR_CODE;
-			errorType = PyExc_SystemError;
-			errorMessage = PyString_FromFormat(
+			TE_SET_ERROR(PyExc_SystemError,
 				"Unable to create argument tuple for CallArgs command at index %d",
 				(unsigned int)index);
 		}
@@ -192,8 +204,7 @@ case MATCH_CALLARG:
 			if (!w)
 			{
 				childReturnCode = ERROR_CODE;
-				errorType = PyExc_SystemError;
-				errorMessage = PyString_FromFormat(
+				TE_SET_ERROR(PyExc_SystemError,
 					"Unable to convert an integer %d to a Python Integer",
 					(unsigned int)childStart);
 			}
@@ -204,8 +215,7 @@ case MATCH_CALLARG:
 				if (!w)
 				{
 					childReturnCode = ERROR_CODE;
-					errorType = PyExc_SystemError;
-					errorMessage = PyString_FromFormat(
+					TE_SET_ERROR(PyExc_SystemError,
 						"Unable to convert an integer %d to a Python Integer",
 						(unsigned int)sliceright);
 				}
@@ -229,8 +239,7 @@ case MATCH_CALLARG:
 					else if (!PyInt_Check(w))
 					{
 						childReturnCode = ERROR_CODE;
-						errorType = PyExc_TypeError;
-						errorMessage = PyString_FromFormat(
+						TE_SET_ERROR(PyExc_TypeError,
 							"Tag Table entry %d: matching function has to return an integer, returned a %.50s",
 							(unsigned int)index,
 							Py_TYPE(w)->tp_name);
@@ -254,8 +263,7 @@ case MATCH_CALLARG:
 	else
 	{
 		childReturnCode = ERROR_CODE;
-		errorType = PyExc_TypeError;
-		errorMessage = PyString_FromFormat(
+		TE_SET_ERROR(PyExc_TypeError,
 			"Tag Table entry %d: "
 			"expected a callable object, got a %.50s"
 			"(command=Call[Arg])",
@@ -264,3 +272,4 @@ case MATCH_CALLARG:
 	}
 	break;
 }
+#endif
@@ -32,14 +32,14 @@
 /* Only convert to string for commands that actually expect string arguments */
 {
 	TE_CHAR *m = NULL;
-	if (command != MATCH_ALLINCHARSET && command != MATCH_ISINCHARSET)
+	if (command != MATCH_ALLINCHARSET && command != MATCH_ISINCHARSET &&
+	    command != MATCH_WORDINLIST)
 	{
 		m = TE_STRING_AS_STRING(match);
 		if (m == NULL)
 		{
 			childReturnCode = ERROR_CODE;
-			errorType = PyExc_TypeError;
-			errorMessage = PyString_FromFormat(
+			TE_SET_ERROR(PyExc_TypeError,
 				"Low-level command (%i) argument in entry %d couldn't be converted to a %s object, is a %.50s",
 				command,
 				(unsigned int)index,
@@ -619,9 +619,56 @@
 
 #endif
 
+		case MATCH_WORDINLIST:
+
+		{
+			/* Walk the tries of the case-sensitive and of the
+			   case-insensitive words, the first word in the list
+			   which matches wins */
+			mxWordTrie *tries = (mxWordTrie *)table->entry[index].data;
+			Py_ssize_t best = -1, bestPosition = childPosition;
+			int t;
+
+			DPRINTF("\nWordInList :\n"
+					" in string     = '%.40s'\n",
+					&text[childPosition]);
+
+			for (t = 0; t < 2; t++) {
+				mxWordTrie *trie = &tries[t];
+				Py_ssize_t node = 0, x = childPosition;
+
+				if (trie->nnodes == 1)
+					continue;
+				while (1) {
+					Py_UCS4 key;
+
+					/* empty words don't match, as for Word */
+					if (trie->word[node] >= 0 && x > childPosition &&
+						(best < 0 || trie->word[node] < best)) {
+						best = trie->word[node];
+						bestPosition = x;
+					}
+					if (x >= sliceright)
+						break;
+					key = (Py_UCS4)text[x];
+					if (t && key >= 'A' && key <= 'Z')
+						key += 'a' - 'A';
+					node = mxWordTrie_Child(trie, node, key);
+					if (node < 0)
+						break;
+					x++;
+				}
+			}
+			if (best >= 0)
+				childPosition = bestPosition;
+			break;
+		}
+
 		case MATCH_ALLINCHARSET:
 
 		{
+			mxCharSetObject *charset = (mxCharSetObject *)match;
+
 			DPRINTF("\nAllInCharSet :\n"
 					" looking for   = CharSet at 0x%lx\n"
 					" in string     = '%.40s'\n",
@@ -640,92 +687,38 @@
 						sliceright - childPosition,
 						&codepoint);
 
-					if (utf8_len <= 0)
-					{
-						/* Invalid UTF-8 sequence - stop matching */
-						break;
-					}
-
-					int test = mxCharSet_ContainsUnicodeChar(match, codepoint);
-					if (test < 0)
+					if (utf8_len <= 0 || !mxCharSet_Lookup(charset, codepoint))
 					{
-						childReturnCode = ERROR_CODE;
-						errorType = PyExc_SystemError;
-						errorMessage = PyString_FromFormat(
-							"Character set match returned value < 0 (%d): probable bug in text processing engine",
-							test);
-						break;
-					}
-					else if (test)
-					{
-						childPosition += utf8_len;  /* Advance by UTF-8 sequence length */
-					}
-					else
-					{
-						/* Character not in set - stop matching */
+						/* Invalid UTF-8 sequence or character not in set - stop matching */
 						break;
 					}
+					childPosition += utf8_len;  /* Advance by UTF-8 sequence length */
 				}
 			}
 			else
-			{
-				/* Single-byte mode: use original mxCharSet_Match */
-				Py_ssize_t matching = mxCharSet_Match(match,
-													  textobj,
-													  childPosition,
-													  sliceright,
-													  1);
-				if (matching < 0)
-				{
-					childReturnCode = ERROR_CODE;
-					errorType = PyExc_SystemError;
-					errorMessage = PyString_FromFormat(
-						"Character set match returned value < 0 (%d): probable bug in text processing engine",
-						(unsigned int)matching);
-				}
-				else
-				{
-					childPosition += matching;
-				}
-			}
-#else
-			/* Unicode mode: use original mxCharSet_Match */
-			{
-				Py_ssize_t matching = mxCharSet_Match(match,
-													  textobj,
-													  childPosition,
-													  sliceright,
-													  1);
-				if (matching < 0)
-				{
-					childReturnCode = ERROR_CODE;
-					errorType = PyExc_SystemError;
-					errorMessage = PyString_FromFormat(
-						"Character set match returned value < 0 (%d): probable bug in text processing engine",
-						(unsigned int)matching);
-				}
-				else
-				{
-					childPosition += matching;
-				}
-			}
 #endif
+			/* One character at a time, a plain bitmap lookup */
+			while (childPosition < sliceright &&
+				   mxCharSet_Lookup(charset, (Py_UCS4)text[childPosition]))
+				childPosition++;
 			break;
 		}
 
 		case MATCH_ISINCHARSET:
 
 		{
-			int test;
+			mxCharSetObject *charset = (mxCharSetObject *)match;
 
 			DPRINTF("\nIsInCharSet :\n"
 					" looking for   = CharSet at 0x%lx\n"
 					" in string     = '%.40s'\n",
 					(long)match, &text[childPosition]);
 
+			if (childPosition >= sliceright)
+				break;
 #if (TE_TABLETYPE == MXTAGTABLE_STRINGTYPE)
 			/* Check if we're in UTF-8 encoded mode */
-			if (table->is_multibyte && childPosition < sliceright)
+			if (table->is_multibyte)
 			{
 				/* UTF-8 mode: decode the UTF-8 sequence and test the codepoint */
 				Py_UCS4 codepoint;
@@ -734,63 +727,20 @@
 					sliceright - childPosition,
 					&codepoint);
 
-				if (utf8_len > 0)
-				{
-					test = mxCharSet_ContainsUnicodeChar(match, codepoint);
-					if (test < 0)
-					{
-						childReturnCode = ERROR_CODE;
-						errorType = PyExc_SystemError;
-						errorMessage = PyString_FromFormat(
-							"Character set match returned value < 0 (%i): probable bug in text processing engine",
-							test);
-					}
-					else if (test)
-					{
-						childPosition += utf8_len;  /* Advance by UTF-8 sequence length */
-					}
-				}
 				/* If utf8_len == 0, invalid UTF-8 - no match, childPosition unchanged */
+				if (utf8_len > 0 && mxCharSet_Lookup(charset, codepoint))
+					childPosition += utf8_len;  /* Advance by UTF-8 sequence length */
 			}
 			else
-			{
-				/* Single-byte mode: test byte directly */
-				test = mxCharSet_ContainsChar(match, text[childPosition]);
-				if (test < 0)
-				{
-					childReturnCode = ERROR_CODE;
-					errorType = PyExc_SystemError;
-					errorMessage = PyString_FromFormat(
-						"Character set match returned value < 0 (%i): probable bug in text processing engine",
-						test);
-				}
-				else if (test)
-				{
-					childPosition++;
-				}
-			}
-#else
-			test = mxCharSet_ContainsUnicodeChar(match, text[childPosition]);
-			if (test < 0)
-			{
-				childReturnCode = ERROR_CODE;
-				errorType = PyExc_SystemError;
-				errorMessage = PyString_FromFormat(
-					"Character set match returned value < 0 (%i): probable bug in text processing engine",
-					test);
-			}
-			else if (test)
-			{
-				childPosition++;
-			}
 #endif
+			if (mxCharSet_Lookup(charset, (Py_UCS4)text[childPosition]))
+				childPosition++;
 			break;
 		}
 		default:
 		{
 			childReturnCode = ERROR_CODE;
-			errorType = PyExc_ValueError;
-			errorMessage = PyString_FromFormat(
+			TE_SET_ERROR(PyExc_ValueError,
 				"Unrecognised Low-Level command code %i, maximum low-level code is %i",
 				command,
 				MATCH_MAX_LOWLEVEL);
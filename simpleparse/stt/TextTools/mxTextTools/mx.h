@@ -482,6 +482,36 @@ static void mx_Py_PRINT_REFCOUNT(PyObject *v,
       if (!PyArg_ParseTupleAndKeywords(args, kws, format, kwslist, &a1, &a2, &a3, &a4, &a5, &a6, &a7, &a8)) \
          goto onError;                                                                                      \
    }
+#define Py_KeywordsGet10Args(format, a1, a2, a3, a4, a5, a6, a7, a8, a9, a10)                                           \
+   {                                                                                                                     \
+      static char *kwslist[] = {#a1, #a2, #a3, #a4, #a5, #a6, #a7, #a8, #a9, #a10, NULL};                               \
+      if (!PyArg_ParseTupleAndKeywords(args, kws, format, kwslist, &a1, &a2, &a3, &a4, &a5, &a6, &a7, &a8, &a9, &a10)) \
+         goto onError;                                                                                                   \
+   }
+#define Py_KeywordsGet12Args(format, a1, a2, a3, a4, a5, a6, a7, a8, a9, a10, a11, a12)                        \
+   {                                                                                                          \
+      static char *kwslist[] = {#a1, #a2, #a3, #a4, #a5, #a6, #a7, #a8, #a9, #a10, #a11, #a12, NULL};         \
+      if (!PyArg_ParseTupleAndKeywords(args, kws, format, kwslist, &a1, &a2, &a3, &a4, &a5, &a6, &a7, &a8, &a9, \
+                                       &a10, &a11, &a12))                                                     \
+         goto onError;                                                                                        \
+   }
+
+#define Py_KeywordsGet13Args(format, a1, a2, a3, a4, a5, a6, a7, a8, a9, a10, a11, a12, a13)                   \
+   {                                                                                                          \
+      static char *kwslist[] = {#a1, #a2, #a3, #a4, #a5, #a6, #a7, #a8, #a9, #a10, #a11, #a12, #a13, NULL};   \
+      if (!PyArg_ParseTupleAndKeywords(args, kws, format, kwslist, &a1, &a2, &a3, &a4, &a5, &a6, &a7, &a8, &a9, \
+                                       &a10, &a11, &a12, &a13))                                               \
+         goto onError;                                                                                        \
+   }
+
+#define Py_KeywordsGet14Args(format, a1, a2, a3, a4, a5, a6, a7, a8, a9, a10, a11, a12, a13, a14)              \
+   {                                                                                                          \
+      static char *kwslist[] = {#a1, #a2, #a3, #a4, #a5, #a6, #a7, #a8, #a9, #a10, #a11, #a12, #a13, #a14,    \
+                                NULL};                                                                        \
+      if (!PyArg_ParseTupleAndKeywords(args, kws, format, kwslist, &a1, &a2, &a3, &a4, &a5, &a6, &a7, &a8, &a9, \
+                                       &a10, &a11, &a12, &a13, &a14))                                         \
+         goto onError;                                                                                        \
+   }
 
 /* --- Returning values to Python ----------------------------------------- */
 
@@ -19,6 +19,9 @@
 #include "mxTextTools.h"
 #include "mxte_modern.h"  /* Modern Unicode engine implementation - Python 3.3+ */
 #include "mxbm_modern.h"  /* Modern Boyer-Moore search implementation */
+#include "mxte_profile.h"  /* Profiling counters of the Tagging Engine */
+#include "mxte_limits.h"  /* Step budget and deadline of the Tagging Engine */
+#include "mxte_partial.h"  /* Suspending and resuming the Tagging Engine */
 #include "structmember.h"
 #include <ctype.h>
 
@@ -30,10 +33,15 @@
 /* Initial list size used by e.g. setsplit(), setsplitx(),... */
 #define INITIAL_LIST_SIZE 64
 
-/* Maximum TagTable cache size. If this limit is reached, the cache
-   is cleared to make room for new compile TagTables. */
+/* Default maximum TagTable cache size. If this limit is reached, the
+   least recently used TagTables are evicted to make room for new
+   compiled TagTables. The limit can be changed at runtime using
+   set_tagtable_cache_size(). */
 #define MAX_TAGTABLES_CACHE_SIZE 100
 
+/* Default number of memo slots per tag() call (see set_memo_size()) */
+#define MEMO_SIZE 65536
+
 /* Define this to enable the copy-protocol (__copy__, __deepcopy__) */
 #define COPY_PROTOCOL
 
@@ -67,12 +75,39 @@ static PyObject *mx_ToUpper;
 static PyObject *mx_ToLower;
 
 static PyObject *mxTextTools_Error;	/* mxTextTools specific error */
+static PyObject *mxTextTools_LimitExceeded; /* tag() ran out of steps or time */
 
 static PyObject *mxTextTools_TagTables;	/* TagTable cache dictionary */
 
+/* Maps encoding names to normalized codec names */
+static PyObject *mxTextTools_EncodingNames = NULL;
+
 /* Thread safety for TagTable cache */
 static PyThread_type_lock mxTextTools_TagTables_lock = NULL;
 
+/* TagTable cache size limit and statistics; protected by
+   mxTextTools_TagTables_lock */
+static Py_ssize_t mxTextTools_TagTables_MaxSize = MAX_TAGTABLES_CACHE_SIZE;
+static Py_ssize_t mxTextTools_TagTables_Hits = 0;
+static Py_ssize_t mxTextTools_TagTables_Misses = 0;
+static Py_ssize_t mxTextTools_TagTables_Evictions = 0;
+
+/* Release the GIL while tagging with callback-free TagTables; see
+   set_release_gil() */
+int mxTextTools_ReleaseGIL = 1;
+
+/* Memo budget of the engines, see set_memo_size() */
+Py_ssize_t mxTextTools_MemoSize = MEMO_SIZE;
+
+/* Profile of the running tag() call, see mxte_profile.h */
+Py_tss_t mxTextTools_ProfileKey = Py_tss_NEEDS_INIT;
+
+/* Limits of the running tag() call, see mxte_limits.h */
+Py_tss_t mxTextTools_LimitsKey = Py_tss_NEEDS_INIT;
+
+/* Partial or resumed run of the running tag() call, see mxte_partial.h */
+Py_tss_t mxTextTools_PartialKey = Py_tss_NEEDS_INIT;
+
 /* Thread safety for module initialization (protects against concurrent init) */
 static PyThread_type_lock mxTextTools_Init_lock = NULL;
 
@@ -109,9 +144,67 @@ PyObject *mxTextTools_ToLower(void)
     return PyString_FromStringAndSize(tr,sizeof(tr));
 }
 
+PyObject *mxTextTools_AsText(PyObject *text)
+{
+    PyObject *view;
+    Py_buffer *buffer;
+
+    if (PyBytes_Check(text) || PyUnicode_Check(text) ||
+	!PyObject_CheckBuffer(text)) {
+	Py_INCREF(text);
+	return text;
+    }
+    /* a view of our own, which its owner can't release */
+    view = PyMemoryView_FromObject(text);
+    if (view == NULL)
+	return NULL;
+    buffer = PyMemoryView_GET_BUFFER(view);
+    if (buffer->itemsize != 1 || !PyBuffer_IsContiguous(buffer, 'C')) {
+	Py_DECREF(view);
+	PyErr_Format(PyExc_TypeError,
+		     "expected a C-contiguous buffer of bytes, found %.50s",
+		     Py_TYPE(text)->tp_name);
+	return NULL;
+    }
+    return view;
+}
+
 /* --- Thread-safe TagTable cache helpers ---------------------------------- */
 
-/* Thread-safe cache lookup - returns borrowed reference or NULL */
+/* The cache dictionary is kept in least-recently-used order: a hit
+   moves the entry to the end of the dictionary and insertions evict
+   entries from the front once the size limit is reached. */
+
+/* Remove the oldest entries until at most maxsize entries are left.
+   The evicted tables are appended to graveyard, so that they can be
+   released after the cache lock has been dropped (deallocating a
+   table may run arbitrary Python code). Must be called with the lock
+   held. Returns 0 on success, -1 on error. */
+static int mxTextTools_TagTables_Evict(Py_ssize_t maxsize,
+				       PyObject *graveyard)
+{
+    Py_ssize_t pos;
+    PyObject *key, *value;
+
+    while (PyDict_Size(mxTextTools_TagTables) > maxsize) {
+	pos = 0;
+	if (!PyDict_Next(mxTextTools_TagTables, &pos, &key, &value))
+	    break;
+	if (PyList_Append(graveyard, value))
+	    return -1;
+	Py_INCREF(key);
+	if (PyDict_DelItem(mxTextTools_TagTables, key)) {
+	    Py_DECREF(key);
+	    return -1;
+	}
+	Py_DECREF(key);
+	mxTextTools_TagTables_Evictions++;
+    }
+    return 0;
+}
+
+/* Thread-safe cache lookup - returns a new reference or NULL; an
+   exception is only set in case of an error */
 static PyObject *mxTextTools_TagTables_GetItem(PyObject *key)
 {
     PyObject *result = NULL;
@@ -126,7 +219,20 @@ static PyObject *mxTextTools_TagTables_GetItem(PyObject *key)
         
     PyThread_acquire_lock(mxTextTools_TagTables_lock, WAIT_LOCK);
     if (mxTextTools_TagTables) {
-        result = PyDict_GetItem(mxTextTools_TagTables, key);
+        result = PyDict_GetItemWithError(mxTextTools_TagTables, key);
+	if (result != NULL) {
+	    /* Move the entry to the most-recently-used end */
+	    Py_INCREF(result);
+	    if (PyDict_DelItem(mxTextTools_TagTables, key) ||
+		PyDict_SetItem(mxTextTools_TagTables, key, result)) {
+		Py_DECREF(result);
+		result = NULL;
+	    }
+	    else
+		mxTextTools_TagTables_Hits++;
+	}
+	else if (!PyErr_Occurred())
+	    mxTextTools_TagTables_Misses++;
     }
     PyThread_release_lock(mxTextTools_TagTables_lock);
     
@@ -137,6 +243,7 @@ static PyObject *mxTextTools_TagTables_GetItem(PyObject *key)
 static int mxTextTools_TagTables_SetItem(PyObject *key, PyObject *value)
 {
     int result = -1;
+    PyObject *graveyard;
     
     if (!key || !value) {
         PyErr_BadInternalCall();
@@ -145,17 +252,24 @@ static int mxTextTools_TagTables_SetItem(PyObject *key, PyObject *value)
     
     if (!mxTextTools_TagTables_lock)
         return -1;  /* Cache not initialized */
+
+    graveyard = PyList_New(0);
+    if (graveyard == NULL)
+	return -1;
         
     PyThread_acquire_lock(mxTextTools_TagTables_lock, WAIT_LOCK);
     if (mxTextTools_TagTables) {
-        /* Hard-limit the cache size */
-        if (PyDict_Size(mxTextTools_TagTables) >= MAX_TAGTABLES_CACHE_SIZE)
-            PyDict_Clear(mxTextTools_TagTables);
-        
-        result = PyDict_SetItem(mxTextTools_TagTables, key, value);
+	if (mxTextTools_TagTables_MaxSize <= 0)
+	    /* Caching disabled */
+	    result = 0;
+	/* Make room for the new entry by evicting the LRU entries */
+	else if (!mxTextTools_TagTables_Evict(mxTextTools_TagTables_MaxSize - 1,
+					      graveyard))
+	    result = PyDict_SetItem(mxTextTools_TagTables, key, value);
     }
     PyThread_release_lock(mxTextTools_TagTables_lock);
-    
+
+    Py_DECREF(graveyard);
     return result;
 }
 
@@ -248,6 +362,22 @@ PyObject *mxTextSearch_New(PyObject *match,
 		  "trivial search algorithm does not support translate");
 	break;
 
+    case MXTEXTSEARCH_TWOWAY:
+	Py_Assert(so->translate == NULL,
+		  PyExc_TypeError,
+		  "Two-Way search algorithm does not support translate");
+	so->data = PyMem_Malloc(sizeof(mxtw_context));
+	if (so->data == NULL) {
+	    PyErr_NoMemory();
+	    goto onError;
+	}
+	if (mxtw_init((mxtw_context *)so->data, match) < 0) {
+	    PyMem_Free(so->data);
+	    so->data = NULL;
+	    goto onError;
+	}
+	break;
+
     default:
 	Py_Error(PyExc_ValueError,
 		 "unknown or unsupported algorithm");
@@ -260,45 +390,79 @@ PyObject *mxTextSearch_New(PyObject *match,
     return NULL;
 }
 
+/* Choose the algorithm for algorithm=AUTO from the match string
+   (see benchmarks/text_search.py):
+
+   - Boyer-Moore when a translate string is given
+   - the trivial search for single characters (memchr) and empty or
+     unsupported matches
+   - Two-Way for str matches, which the trivial search reads a
+     character at a time
+   - Two-Way for long bytes matches and bytes matches made of few
+     distinct characters: Boyer-Moore goes quadratic on these
+   - otherwise Boyer-Moore for bytes
+
+*/
+
+#define MXTEXTSEARCH_AUTO_LONG		32	/* Long match length */
+#define MXTEXTSEARCH_AUTO_ALPHABET	4	/* Few distinct characters */
+
+static
+int mxTextSearch_AutoAlgorithm(PyObject *match,
+			       PyObject *translate)
+{
+    Py_ssize_t match_len, i;
+    unsigned char seen[256];
+    Py_ssize_t distinct = 0;
+
+    if (translate != NULL && translate != Py_None)
+	return MXTEXTSEARCH_BOYERMOORE;
+    if (PyUnicode_Check(match)) {
+	if (PyUnicode_READY(match) < 0) {
+	    PyErr_Clear();
+	    return MXTEXTSEARCH_TRIVIAL;
+	}
+	return PyUnicode_GET_LENGTH(match) < 2 ?
+	    MXTEXTSEARCH_TRIVIAL : MXTEXTSEARCH_TWOWAY;
+    }
+    if (!PyBytes_Check(match))
+	return MXTEXTSEARCH_TRIVIAL;
+    match_len = PyBytes_GET_SIZE(match);
+    if (match_len < 2)
+	return MXTEXTSEARCH_BOYERMOORE;
+    if (match_len >= MXTEXTSEARCH_AUTO_LONG)
+	return MXTEXTSEARCH_TWOWAY;
+    memset(seen, 0, sizeof(seen));
+    for (i = 0; i < match_len; i++) {
+	unsigned char c = (unsigned char)PyBytes_AS_STRING(match)[i];
+
+	if (!seen[c]) {
+	    seen[c] = 1;
+	    distinct++;
+	}
+    }
+    if (distinct * MXTEXTSEARCH_AUTO_ALPHABET <= match_len)
+	return MXTEXTSEARCH_TWOWAY;
+    return MXTEXTSEARCH_BOYERMOORE;
+}
+
 Py_C_Function_WithKeywords(
                 mxTextSearch_TextSearch,
-	       "TextSearch(match[,translate=None,algorithm=default_algorithm])\n\n"
+	       "TextSearch(match[,translate=None,algorithm=AUTO])\n\n"
 	       "Create a substring search object for the string match;\n"
 	       "translate is an optional translate-string like the one used\n"
-	       "in the module re."
+	       "in the module re. algorithm=AUTO chooses the algorithm\n"
+	       "from the match string."
 		)
 {
     PyObject *match = 0;
     PyObject *translate = 0;
-    int algorithm = -424242;
+    int algorithm = MXTEXTSEARCH_AUTO;
 
     Py_KeywordsGet3Args("O|Oi:TextSearch",match,translate,algorithm);
 
-    if (algorithm == -424242) {
-	/* Auto-select algorithm based on pattern characteristics */
-	Py_ssize_t pattern_len = 0;
-	if (PyUnicode_Check(match)) {
-	    if (PyUnicode_READY(match) == 0) {
-		pattern_len = PyUnicode_GET_LENGTH(match);
-	    }
-	    /* Use modern Boyer-Moore for longer Unicode patterns */
-	    if (pattern_len >= MXBM_MIN_PATTERN_LEN) {
-		algorithm = MXTEXTSEARCH_BOYERMOORE_MODERN;
-	    } else {
-		algorithm = MXTEXTSEARCH_TRIVIAL;
-	    }
-	} else if (PyBytes_Check(match)) {
-	    pattern_len = PyBytes_GET_SIZE(match);
-	    /* Use modern Boyer-Moore for longer byte patterns */
-	    if (pattern_len >= MXBM_MIN_PATTERN_LEN) {
-		algorithm = MXTEXTSEARCH_BOYERMOORE_MODERN;
-	    } else {
-		algorithm = MXTEXTSEARCH_BOYERMOORE;  /* Keep old for bytes < 2 */
-	    }
-	} else {
-	    algorithm = MXTEXTSEARCH_TRIVIAL;
-	}
-    }
+    if (algorithm == MXTEXTSEARCH_AUTO)
+	algorithm = mxTextSearch_AutoAlgorithm(match, translate);
     return mxTextSearch_New(match, translate, algorithm);
 
  onError:
@@ -322,6 +486,11 @@ void mxTextSearch_Free(mxTextSearchObject *so)
 	    }
 	    break;
 
+	case MXTEXTSEARCH_TWOWAY:
+	    mxtw_cleanup((mxtw_context *)so->data);
+	    PyMem_Free(so->data);
+	    break;
+
 	case MXTEXTSEARCH_TRIVIAL:
 	    break;
 	    
@@ -351,6 +520,10 @@ Py_ssize_t mxTextSearch_MatchLength(PyObject *self)
 	return BM_MATCH_LEN(so->data);
 	break;
 
+    case MXTEXTSEARCH_TWOWAY:
+	return ((mxtw_context *)so->data)->pattern_len;
+
+    case MXTEXTSEARCH_BOYERMOORE_MODERN:
     case MXTEXTSEARCH_TRIVIAL:
 	if (PyString_Check(so->match))
 	    return PyString_GET_SIZE(so->match);
@@ -526,6 +699,14 @@ Py_ssize_t mxTextSearch_SearchBuffer(PyObject *self,
 	}
 	break;
 
+    case MXTEXTSEARCH_TWOWAY:
+	match_len = ((mxtw_context *)so->data)->pattern_len;
+	nextpos = mxtw_search((mxtw_context *)so->data, text, 1, start, stop);
+	if (nextpos < 0)
+	    return 0;
+	nextpos += match_len;
+	break;
+
     case MXTEXTSEARCH_BOYERMOORE_MODERN:
 	{
 	    mxbm_context_unicode *bm_ctx = (mxbm_context_unicode *)so->data;
@@ -635,6 +816,14 @@ Py_ssize_t mxTextSearch_SearchUnicode(PyObject *self,
 	}
 	break;
 
+    case MXTEXTSEARCH_TWOWAY:
+	match_len = ((mxtw_context *)so->data)->pattern_len;
+	nextpos = mxtw_search((mxtw_context *)so->data, text, 4, start, stop);
+	if (nextpos < 0)
+	    return 0;
+	nextpos += match_len;
+	break;
+
     default:
 	Py_Error(mxTextTools_Error,
 		 "unknown algorithm type in mxTextSearch_SearchUnicode");
@@ -750,6 +939,13 @@ Py_ssize_t mxTextSearch_SearchUnicode_Modern(PyObject *self,
         }
         break;
 
+    case MXTEXTSEARCH_TWOWAY:
+        nextpos = mxtw_search((mxtw_context *)so->data,
+                              PyUnicode_DATA(text),
+                              PyUnicode_KIND(text),
+                              start, stop);
+        break;
+
     default:
         Py_Error(mxTextTools_Error,
                  "unknown algorithm type in mxTextSearch_SearchUnicode");
@@ -782,18 +978,23 @@ Py_C_Function( mxTextSearch_search,
 	       "where the substring was found, (start,start) otherwise.")
 {
     PyObject *text;
+    PyObject *view = NULL;
     Py_ssize_t start = 0;
-    Py_ssize_t stop = INT_MAX;
+    Py_ssize_t stop = PY_SSIZE_T_MAX;
     Py_ssize_t sliceleft, sliceright;
     int rc;
 
-    Py_Get3Args("O|ii:TextSearch.search",
+    Py_Get3Args("O|nn:TextSearch.search",
 		text,start,stop);
 
-    if (PyString_Check(text)) {
-	Py_CheckStringSlice(text, start, stop);
+    view = mxTextTools_AsText(text);
+    if (view == NULL)
+	goto onError;
+    text = view;
+    if (mxTextTools_IsByteText(text)) {
+	Py_CheckBufferSlice(mxTextTools_ByteTextSize(text), start, stop);
 	rc = mxTextSearch_SearchBuffer(self,
-				       PyString_AS_STRING(text),
+				       mxTextTools_ByteTextData(text),
 				       start, 
 				       stop, 
 				       &sliceleft, 
@@ -812,11 +1013,13 @@ Py_C_Function( mxTextSearch_search,
 	sliceleft = start;
 	sliceright = start;
     }
+    Py_DECREF(view);
 
     /* Return the slice */
-    Py_Return2("ii", sliceleft, sliceright);
+    Py_Return2("nn", sliceleft, sliceright);
 
  onError:
+    Py_XDECREF(view);
     return NULL;
 }
 
@@ -827,18 +1030,23 @@ Py_C_Function( mxTextSearch_find,
 	       "where the substring was found, -1 otherwise.")
 {
     PyObject *text;
+    PyObject *view = NULL;
     Py_ssize_t start = 0;
-    Py_ssize_t stop = INT_MAX;
+    Py_ssize_t stop = PY_SSIZE_T_MAX;
     Py_ssize_t sliceleft, sliceright;
     int rc;
 
-    Py_Get3Args("O|ii:TextSearch.find",
+    Py_Get3Args("O|nn:TextSearch.find",
 		text,start,stop);
 
-    if (PyString_Check(text)) {
-	Py_CheckStringSlice(text, start, stop);
+    view = mxTextTools_AsText(text);
+    if (view == NULL)
+	goto onError;
+    text = view;
+    if (mxTextTools_IsByteText(text)) {
+	Py_CheckBufferSlice(mxTextTools_ByteTextSize(text), start, stop);
 	rc = mxTextSearch_SearchBuffer(self,
-				       PyString_AS_STRING(text),
+				       mxTextTools_ByteTextData(text),
 				       start, 
 				       stop, 
 				       &sliceleft, 
@@ -855,9 +1063,11 @@ Py_C_Function( mxTextSearch_find,
 	goto onError;
     if (rc == 0)
 	sliceleft = -1;
-    return PyInt_FromLong(sliceleft);
+    Py_DECREF(view);
+    return PyLong_FromSsize_t(sliceleft);
 
  onError:
+    Py_XDECREF(view);
     return NULL;
 }
 
@@ -869,19 +1079,24 @@ Py_C_Function( mxTextSearch_findall,
 	       "string can be found.")
 {
     PyObject *text;
+    PyObject *view = NULL;
     PyObject *list = 0;
     Py_ssize_t start = 0;
-    Py_ssize_t stop = INT_MAX;
+    Py_ssize_t stop = PY_SSIZE_T_MAX;
     Py_ssize_t stop_index;
     Py_ssize_t match_len;
     Py_ssize_t listsize = INITIAL_LIST_SIZE;
     Py_ssize_t listitem = 0;
 
-    Py_Get3Args("O|ii:TextSearch.findall",
+    Py_Get3Args("O|nn:TextSearch.findall",
 		text,start,stop);
 
-    if (PyString_Check(text)) {
-	Py_CheckStringSlice(text, start, stop);
+    view = mxTextTools_AsText(text);
+    if (view == NULL)
+	goto onError;
+    text = view;
+    if (mxTextTools_IsByteText(text)) {
+	Py_CheckBufferSlice(mxTextTools_ByteTextSize(text), start, stop);
     }
     else if (PyUnicode_Check(text)) {
 	Py_CheckUnicodeSlice(text, start, stop);
@@ -905,9 +1120,9 @@ Py_C_Function( mxTextSearch_findall,
 	Py_ssize_t sliceleft, sliceright;
 
 	/* exact search */
-	if (PyString_Check(text))
+	if (mxTextTools_IsByteText(text))
 	    rc = mxTextSearch_SearchBuffer(self,
-					   PyString_AS_STRING(text),
+					   mxTextTools_ByteTextData(text),
 					   start, 
 					   stop, 
 					   &sliceleft, 
@@ -949,10 +1164,12 @@ Py_C_Function( mxTextSearch_findall,
     if (listitem < listsize)
 	PyList_SetSlice(list, listitem, listsize, (PyObject*)NULL);
 
+    Py_DECREF(view);
     return list;
 
  onError:
     Py_XDECREF(list);
+    Py_XDECREF(view);
     return NULL;
 }
 
@@ -987,9 +1204,11 @@ PyObject *mxTextSearch_Repr(mxTextSearchObject *self)
     v = PyObject_Repr(self->match);
     if (v == NULL)
 	return NULL;
-    reprstr = PyString_AsString(v);
-    if (reprstr == NULL)
+    reprstr = (char *)PyUnicode_AsUTF8(v);
+    if (reprstr == NULL) {
+	Py_DECREF(v);
 	return NULL;
+    }
 
     switch (self->algorithm) {
     case MXTEXTSEARCH_BOYERMOORE:
@@ -998,6 +1217,12 @@ PyObject *mxTextSearch_Repr(mxTextSearchObject *self)
     case MXTEXTSEARCH_TRIVIAL:
 	algoname = "Trivial";
 	break;
+    case MXTEXTSEARCH_BOYERMOORE_MODERN:
+	algoname = "Modern Boyer-Moore";
+	break;
+    case MXTEXTSEARCH_TWOWAY:
+	algoname = "Two-Way";
+	break;
     default:
 	algoname = "";
     }
@@ -1005,7 +1230,7 @@ PyObject *mxTextSearch_Repr(mxTextSearchObject *self)
     snprintf(t, sizeof(t), "<%.50s TextSearch object for %.400s at 0x%lx>",
 	    algoname, reprstr, (long)self);
     Py_DECREF(v);
-    return PyString_FromString(t);
+    return PyUnicode_FromString(t);
 }
 
 /* Python Method Table */
@@ -1073,1271 +1298,2328 @@ PyTypeObject mxTextSearch_Type = {
     mxTextSearch_members,               /*tp_members*/
 };
 
-/* --- Character Set Object --------------------------------------------*/
-
-/* internal */
-
-/* 8-bit character sets are implemented using a simple 32-byte
-   long bitmap with one bit per character.
-
-   Addressing is done as follows:
-
-      def char_is_set(ordinal):
-          return bitmap[ordinal >> 3]  & (1 << (ordinal & 7))
-
-*/
+/* --- Multi Text Search Object ----------------------------------------*/
 
-#define STRING_CHARSET_SIZE 		256
-#define STRING_CHARSET_BITMAP_SIZE 	(STRING_CHARSET_SIZE / 8)
+static
+int tc_build_word_trie(mxWordTrie *trie,
+		       PyObject *words,
+		       int folded);
 
-typedef struct {
-    unsigned char bitmap[STRING_CHARSET_BITMAP_SIZE];
-    						/* character bitmap */
-} string_charset;
+/* allocation */
 
 static
-int init_string_charset(mxCharSetObject *cs,
-			PyObject *definition)
+PyObject *mxMultiTextSearch_New(PyObject *match)
 {
-    register Py_ssize_t i, j;
-    char *def = PyString_AS_STRING(definition);
-    const Py_ssize_t len = PyString_GET_SIZE(definition);
-    string_charset *lookup = 0;
-    register unsigned char *bitmap;
-    int logic = 1;
+    mxMultiTextSearchObject *so = NULL;
+    mxWordTrie *trie;
+    Py_ssize_t i, node, child, state;
+    int bytes;
 
-    /* Handle logic change (first char is '^' for negative matching) */
-    if (len > 0 && def[0] == '^') {
-	logic = 0;
-	i = 1;
+    Py_Assert(PyTuple_Check(match) && PyTuple_GET_SIZE(match) > 0,
+	      PyExc_TypeError,
+	      "match must be a non-empty tuple of words");
+    bytes = PyString_Check(PyTuple_GET_ITEM(match, 0));
+    for (i = 0; i < PyTuple_GET_SIZE(match); i++) {
+	PyObject *word = PyTuple_GET_ITEM(match, i);
+
+	Py_Assert(bytes ? PyString_Check(word) : PyUnicode_Check(word),
+		  PyExc_TypeError,
+		  "words must be all strings or all bytes");
+	Py_Assert((bytes ? PyString_GET_SIZE(word) :
+		   PyUnicode_GET_LENGTH(word)) > 0,
+		  PyExc_ValueError,
+		  "words must not be empty");
     }
-    else
-	i = 0;
-    
-    /* Build 32-byte lookup bitmap (one bit per character) */
-    lookup = (string_charset *)PyMem_Malloc(sizeof(string_charset));
-    if (lookup == NULL) {
+
+    so = PyObject_NEW(mxMultiTextSearchObject, &mxMultiTextSearch_Type);
+    if (so == NULL)
+	return NULL;
+    memset(&so->trie, 0, sizeof(so->trie));
+    so->fail = so->depth = so->longest = NULL;
+    Py_INCREF(match);
+    so->match = match;
+
+    trie = &so->trie;
+    if (tc_build_word_trie(trie, match, 0))
+	goto onError;
+    so->fail = (Py_ssize_t *)PyMem_Malloc(trie->nnodes * sizeof(Py_ssize_t));
+    so->depth = (Py_ssize_t *)PyMem_Malloc(trie->nnodes * sizeof(Py_ssize_t));
+    so->longest = (Py_ssize_t *)PyMem_Malloc(trie->nnodes * sizeof(Py_ssize_t));
+    if (so->fail == NULL || so->depth == NULL || so->longest == NULL) {
 	PyErr_NoMemory();
 	goto onError;
     }
-    memset(lookup, 0, sizeof(string_charset));
-    cs->mode = MXCHARSET_8BITMODE;
-    cs->lookup = (void *)lookup;
-    bitmap = lookup->bitmap;
 
-    for (; i < len; i++) {
+    /* The nodes are laid out breadth-first, so the failure link of a
+       node is known before its children are reached */
+    so->fail[0] = so->depth[0] = so->longest[0] = 0;
+    for (i = 0; i < 256; i++)
+	so->root[i] = 0;
+    for (node = 0; node < trie->nnodes; node++) {
+	for (child = trie->first[node];
+	     child < trie->first[node] + trie->count[node];
+	     child++) {
+	    Py_UCS4 key = trie->keys[child];
+
+	    so->depth[child] = so->depth[node] + 1;
+	    if (node == 0) {
+		so->fail[child] = 0;
+		if (key < 256)
+		    so->root[key] = child;
+	    }
+	    else {
+		for (state = so->fail[node];; state = so->fail[state]) {
+		    Py_ssize_t next = mxWordTrie_Child(trie, state, key);
 
-	/* Handle escapes: "b\-d", "\\" */
-	if (def[i] == '\\') {
-	    if (i < len - 1 && def[i+1] == '\\') {
-		j = (unsigned char)'\\';
-		bitmap[j >> 3] |= 1 << (j & 7);
-		i++;
+		    if (next >= 0) {
+			state = next;
+			break;
+		    }
+		    if (state == 0)
+			break;
+		}
+		so->fail[child] = state;
 	    }
-	    continue;
+	    if (trie->word[child] >= 0)
+		so->longest[child] = so->depth[child];
+	    else
+		so->longest[child] = so->longest[so->fail[child]];
 	}
+    }
+    return (PyObject *)so;
 
-	/* Handle ranges: "b-d", "\\-z", "\--z" */
-	if (i < len - 2 && def[i+1] == '-') {
-	    unsigned char range_left = def[i];
-	    unsigned char range_right = def[i+2];
-	    for (j = range_left; j <= range_right; j++)
-		bitmap[j >> 3] |= 1 << (j & 7);
-	    i++;
-	    continue;
-	}
+ onError:
+    Py_XDECREF(so);
+    return NULL;
+}
 
-	/* Normal processing */
-	j = (unsigned char)def[i];
-	bitmap[j >> 3] |= 1 << (j & 7);
-    }
+Py_C_Function( mxMultiTextSearch_MultiTextSearch,
+	       "MultiTextSearch(words)\n\n"
+	       "Create a search object finding the leftmost occurrence\n"
+	       "of any of the words (a sequence of strings or of bytes)\n"
+	       "in a single pass over the text.")
+{
+    PyObject *words, *match;
 
-    /* Invert bitmap if negative matching is requested */
-    if (!logic) {
-	DPRINTF("init_string_charset: inverting bitmap\n");
-	for (i = 0; i < STRING_CHARSET_BITMAP_SIZE; i++)
-	    bitmap[i] ^= 0xFF;
-    }
+    Py_GetArg("O:MultiTextSearch", words);
 
-    return 0;
+    match = PySequence_Tuple(words);
+    if (match == NULL)
+	goto onError;
+    words = mxMultiTextSearch_New(match);
+    Py_DECREF(match);
+    return words;
 
  onError:
-    if (lookup)
-	PyMem_Free((void *)lookup);
-    cs->lookup = 0;
-    return -1;
+    return NULL;
 }
 
+static
+void mxMultiTextSearch_Free(mxMultiTextSearchObject *so)
+{
+    PyMem_Free(so->trie.keys);
+    PyMem_Free(so->trie.first);
+    PyMem_Free(so->trie.count);
+    PyMem_Free(so->trie.word);
+    PyMem_Free(so->fail);
+    PyMem_Free(so->depth);
+    PyMem_Free(so->longest);
+    Py_XDECREF(so->match);
+    PyObject_Del(so);
+}
 
-/* Unicode character sets are implemented using two step indexing
-   which is a good compromise between lookup speed and memory usage.
-
-   Lookup is done using a variable length array of 32-byte bitmap
-   blocks. There can be 256 such blocks. Identical blocks are
-   collapsed into a single copy.
-   
-   Addressing is done as follows:
+/* C APIs */
 
-      def char_is_set(ordinal):
-          index = bitmapindex[ordinal >> 8]
-	  bitmap = bitmaps[index]
-          return bitmap[(ordinal >> 3) & 31]  & (1 << (ordinal & 7))
+#define so ((mxMultiTextSearchObject *)self)
+
+/* The automaton is run until the leftmost start of a word is known:
+   once a word starting at best has been seen, only the words which
+   extend the path of the current node can still start further left,
+   and those start at position - depth. The first declared word found
+   at best is then looked up in the trie. */
+
+#define MXMULTITEXTSEARCH_SCAN(TEXT)					\
+    for (x = start; x < stop; x++) {					\
+	Py_UCS4 key = (TEXT)[x];					\
+									\
+	for (;;) {							\
+	    if (node == 0) {						\
+		node = key < 256 ? so->root[key] :			\
+		    mxWordTrie_Child(trie, 0, key);			\
+		if (node < 0)						\
+		    node = 0;						\
+		break;							\
+	    }								\
+	    next = mxWordTrie_Child(trie, node, key);			\
+	    if (next >= 0) {						\
+		node = next;						\
+		break;							\
+	    }								\
+	    node = so->fail[node];					\
+	}								\
+	if (so->longest[node] &&					\
+	    (best < 0 || x + 1 - so->longest[node] < best))		\
+	    best = x + 1 - so->longest[node];				\
+	if (best >= 0 && x + 1 - so->depth[node] >= best)		\
+	    break;							\
+    }
+
+#define MXMULTITEXTSEARCH_WORD(TEXT)					\
+    for (x = best, node = 0; x < stop; x++) {				\
+	node = mxWordTrie_Child(trie, node, (TEXT)[x]);			\
+	if (node < 0)							\
+	    break;							\
+	if (trie->word[node] >= 0 &&					\
+	    (word < 0 || trie->word[node] < word)) {			\
+	    word = trie->word[node];					\
+	    end = x + 1;						\
+	}								\
+    }
+
+Py_ssize_t mxMultiTextSearch_SearchBuffer(PyObject *self,
+					  const void *text,
+					  int charsize,
+					  Py_ssize_t start,
+					  Py_ssize_t stop,
+					  Py_ssize_t *sliceleft,
+					  Py_ssize_t *sliceright)
+{
+    mxWordTrie *trie = &so->trie;
+    Py_ssize_t x, node = 0, next, best = -1, word = -1, end = -1;
 
-   The technique used here is very similar to what is done in Python's
-   SRE (see the BIGCHARSET patch by Martin von Loewis). Compression
-   should be reasonably good since character sets in practice usually
-   only contains a few single characters or longer ranges of Unicode
-   characters.
+    switch (charsize) {
+    case 1:
+	MXMULTITEXTSEARCH_SCAN((const Py_UCS1 *)text);
+	break;
+    case 2:
+	MXMULTITEXTSEARCH_SCAN((const Py_UCS2 *)text);
+	break;
+    default:
+	MXMULTITEXTSEARCH_SCAN((const Py_UCS4 *)text);
+    }
+    if (best < 0)
+	return 0;
 
-*/
+    switch (charsize) {
+    case 1:
+	MXMULTITEXTSEARCH_WORD((const Py_UCS1 *)text);
+	break;
+    case 2:
+	MXMULTITEXTSEARCH_WORD((const Py_UCS2 *)text);
+	break;
+    default:
+	MXMULTITEXTSEARCH_WORD((const Py_UCS4 *)text);
+    }
+    if (sliceleft)
+	*sliceleft = best;
+    if (sliceright)
+	*sliceright = end;
+    return 1;
+}
 
-#define UNICODE_CHARSET_SIZE 		65536
-#define UNICODE_CHARSET_BITMAP_SIZE 	32
-#define UNICODE_CHARSET_BITMAPS 	(UNICODE_CHARSET_SIZE / (UNICODE_CHARSET_BITMAP_SIZE * 8))
-#define UNICODE_CHARSET_BIGMAP_SIZE	(UNICODE_CHARSET_SIZE / 8)
+#undef MXMULTITEXTSEARCH_SCAN
+#undef MXMULTITEXTSEARCH_WORD
 
-typedef struct {
-    unsigned char bitmapindex[UNICODE_CHARSET_BITMAPS];	
-    					/* Index to char bitmaps */
-    unsigned char bitmaps[UNICODE_CHARSET_BITMAPS][UNICODE_CHARSET_BITMAP_SIZE];
-    					/* Variable length bitmap array */
-} unicode_charset;
+/* Search text[start:stop] for the Python methods; returns 1, 0 or -1
+   in case of an error */
 
 static
-int init_unicode_charset(mxCharSetObject *cs,
-			 PyObject *definition)
+int mxMultiTextSearch_SearchObject(PyObject *self,
+				   PyObject *text,
+				   Py_ssize_t start,
+				   Py_ssize_t stop,
+				   Py_ssize_t *sliceleft,
+				   Py_ssize_t *sliceright)
 {
-    register Py_ssize_t i, j;
-    const Py_ssize_t len = PyUnicode_GET_LENGTH(definition);
-    unicode_charset *lookup = 0;
-    unsigned char bigmap[UNICODE_CHARSET_BIGMAP_SIZE];
-    Py_ssize_t blocks;
-    int logic = 1;
+    int bytes = PyString_Check(PyTuple_GET_ITEM(so->match, 0));
 
-    /* Ensure Unicode object is ready for reading */
-    if (PyUnicode_READY(definition) < 0)
-        return -1;
+    if (mxTextTools_IsByteText(text)) {
+	Py_Assert(bytes,
+		  PyExc_TypeError,
+		  "can't search bytes for strings");
+	return mxMultiTextSearch_SearchBuffer(self,
+					      mxTextTools_ByteTextData(text), 1,
+					      start, stop,
+					      sliceleft, sliceright);
+    }
+    else if (PyUnicode_Check(text)) {
+	Py_Assert(!bytes,
+		  PyExc_TypeError,
+		  "can't search a string for bytes");
+	if (PyUnicode_READY(text) < 0)
+	    goto onError;
+	return mxMultiTextSearch_SearchBuffer(self,
+					      PyUnicode_DATA(text),
+					      PyUnicode_KIND(text),
+					      start, stop,
+					      sliceleft, sliceright);
+    }
+    Py_Error(PyExc_TypeError,
+	     "expected string or bytes");
 
-    /* Handle logic change (first char is '^' for negative matching) */
-    if (len > 0 && PyUnicode_READ(PyUnicode_KIND(definition), PyUnicode_DATA(definition), 0) == '^') {
-	logic = 0;
-	i = 1;
+ onError:
+    return -1;
+}
+
+/* Check the slice text[start:stop] as the TextSearch methods do */
+
+static
+int mxMultiTextSearch_CheckSlice(PyObject *text,
+				 Py_ssize_t *start,
+				 Py_ssize_t *stop)
+{
+    Py_ssize_t start_ = *start, stop_ = *stop;
+
+    if (mxTextTools_IsByteText(text)) {
+	Py_CheckBufferSlice(mxTextTools_ByteTextSize(text), start_, stop_);
+    }
+    else if (PyUnicode_Check(text)) {
+	Py_CheckUnicodeSlice(text, start_, stop_);
     }
     else
-	i = 0;
-    
-    /* Build bigmap */
-    memset(bigmap, 0, sizeof(bigmap));
-    for (; i < len; i++) {
-        Py_UCS4 ch = PyUnicode_READ(PyUnicode_KIND(definition), PyUnicode_DATA(definition), i);
-
-	/* Handle escapes: "b\-d", "\\" */
-	if (ch == '\\') {
-	    if (i < len - 1) {
-                Py_UCS4 next_ch = PyUnicode_READ(PyUnicode_KIND(definition), PyUnicode_DATA(definition), i+1);
-                if (next_ch == '\\') {
-                    j = (int)'\\';
-                    bigmap[j >> 3] |= 1 << (j & 7);
-                    i++;
-                }
-            }
-	    continue;
-	}
-
-	/* Handle ranges: "b-d", "\\-z", "\--z" */
-	if (i < len - 2) {
-            Py_UCS4 next_ch = PyUnicode_READ(PyUnicode_KIND(definition), PyUnicode_DATA(definition), i+1);
-            if (next_ch == '-') {
-                Py_UCS4 range_left = ch;
-                Py_UCS4 range_right = PyUnicode_READ(PyUnicode_KIND(definition), PyUnicode_DATA(definition), i+2);
-	    if (range_right >= UNICODE_CHARSET_SIZE) {
-		Py_Error(PyExc_ValueError,
-			 "unicode ordinal out of supported range");
-	    }
-	    for (j = (Py_ssize_t)range_left; j <= (Py_ssize_t)range_right; j++)
-		bigmap[j >> 3] |= 1 << (j & 7);
-	    i += 2; /* Skip the '-' and range_right character */
-	    continue;
-            }
-	}
-
-	/* Normal processing */
-	j = ch;
-	if (j >= UNICODE_CHARSET_SIZE) {
-	    Py_Error(PyExc_ValueError,
-		     "unicode ordinal out of supported range");
-	}
-	bigmap[j >> 3] |= 1 << (j & 7);
-    }
-
-    /* Build lookup table
-
-       XXX Could add dynamic resizing here... probably not worth it
-           though, since sizeof(unicode_charset) isn't all that large.
-
-    */
-    lookup = (unicode_charset *)PyMem_Malloc(sizeof(unicode_charset));
-    if (lookup == NULL) {
-	PyErr_NoMemory();
-	goto onError;
-    }
-    blocks = 0;
-    for (i = UNICODE_CHARSET_BITMAPS - 1; i >= 0; i--) {
-	unsigned char *block = &bigmap[i << 5];
-	for (j = blocks - 1; j >= 0; j--)
-	    if (memcmp(lookup->bitmaps[j], block, 
-		       UNICODE_CHARSET_BITMAP_SIZE) == 0)
-		break;
-	if (j < 0) {
-	    j = blocks;
-	    DPRINTF("init_unicode_charset: Creating new block %i for %i\n", 
-		    j, i);
-	    memcpy(lookup->bitmaps[j], block, UNICODE_CHARSET_BITMAP_SIZE);
-	    blocks++;
-	}
-	else
-	    DPRINTF("init_unicode_charset: Reusing block %i for %i\n", j, i);
-	lookup->bitmapindex[i] = j;
-    }
-    DPRINTF("init_unicode_charset: Map size: %i block(s) = %i bytes\n", 
-	    blocks, UNICODE_CHARSET_BITMAPS + 
-	    blocks * UNICODE_CHARSET_BITMAP_SIZE);
-    lookup = (unicode_charset *)PyMem_Realloc(lookup, 
-				 UNICODE_CHARSET_BITMAPS 
-				 + blocks * UNICODE_CHARSET_BITMAP_SIZE);
-    if (lookup == NULL) {
-	PyErr_NoMemory();
-	goto onError;
-    }
-
-    /* Invert bitmaps if negative matching is requested */
-    if (!logic) {
-	register unsigned char *bitmap = &lookup->bitmaps[0][0];
-	DPRINTF("init_unicode_charset: inverting bitmaps\n");
-	for (i = 0; i < blocks * UNICODE_CHARSET_BITMAP_SIZE; i++)
-	    bitmap[i] ^= 0xFF;
-    }
-
-    cs->mode = MXCHARSET_UCS2MODE;
-    cs->lookup = (void *)lookup;
+	Py_Error(PyExc_TypeError,
+		 "expected string or bytes");
+    *start = start_;
+    *stop = stop_;
     return 0;
 
  onError:
-    if (lookup)
-	PyMem_Free((void *)lookup);
-    cs->lookup = 0;
     return -1;
 }
 
+/* methods */
 
-/* allocation */
-
-static
-PyObject *mxCharSet_New(PyObject *definition)
+Py_C_Function( mxMultiTextSearch_search,
+	       "MultiTextSearch.search(text,start=0,stop=len(text))\n\n"
+	       "Search for the words in text, looking only at the\n"
+	       "slice [start:stop] and return the slice (l,r) of the\n"
+	       "leftmost occurrence (the first word given if several\n"
+	       "start there), (start,start) otherwise.")
 {
-    mxCharSetObject *cs;
+    PyObject *text;
+    PyObject *view = NULL;
+    Py_ssize_t start = 0;
+    Py_ssize_t stop = PY_SSIZE_T_MAX;
+    Py_ssize_t sliceleft, sliceright;
+    int rc;
 
-    cs = PyObject_NEW(mxCharSetObject, &mxCharSet_Type);
-    if (cs == NULL) 
-	return NULL;
-    Py_INCREF(definition);
-    cs->definition = definition;
-    cs->lookup = NULL;
-    cs->mode = -1;
+    Py_Get3Args("O|nn:MultiTextSearch.search",
+		text,start,stop);
 
-    if (PyString_Check(definition)) {
-	if (init_string_charset(cs, definition))
-	    goto onError;
-    }
-    else if (PyUnicode_Check(definition)) {
-	if (init_unicode_charset(cs, definition))
-	    goto onError;
+    view = mxTextTools_AsText(text);
+    if (view == NULL)
+	goto onError;
+    text = view;
+    if (mxMultiTextSearch_CheckSlice(text, &start, &stop))
+	goto onError;
+    rc = mxMultiTextSearch_SearchObject(self, text, start, stop,
+					&sliceleft, &sliceright);
+    if (rc < 0)
+	goto onError;
+    if (rc == 0) {
+	sliceleft = start;
+	sliceright = start;
     }
-    else
-	Py_Error(PyExc_TypeError,
-		 "character set definition must be string or unicode");
+    Py_DECREF(view);
 
-    return (PyObject *)cs;
+    /* Return the slice */
+    Py_Return2("nn", sliceleft, sliceright);
 
  onError:
-    Py_DECREF(cs);
+    Py_XDECREF(view);
     return NULL;
 }
 
-Py_C_Function( mxCharSet_CharSet,
-	       "CharSet(definition)\n\n"
-	       "Create a character set matching object from the string"
-	       )
+Py_C_Function( mxMultiTextSearch_find,
+	       "MultiTextSearch.find(text,start=0,stop=len(text))\n\n"
+	       "Search for the words in text, looking only at the\n"
+	       "slice [start:stop] and return the index of the\n"
+	       "leftmost occurrence, -1 otherwise.")
 {
-    PyObject *definition;
+    PyObject *text;
+    PyObject *view = NULL;
+    Py_ssize_t start = 0;
+    Py_ssize_t stop = PY_SSIZE_T_MAX;
+    Py_ssize_t sliceleft;
+    int rc;
 
-    Py_GetArg("O:CharSet", definition);
-    return mxCharSet_New(definition);
+    Py_Get3Args("O|nn:MultiTextSearch.find",
+		text,start,stop);
+
+    view = mxTextTools_AsText(text);
+    if (view == NULL)
+	goto onError;
+    text = view;
+    if (mxMultiTextSearch_CheckSlice(text, &start, &stop))
+	goto onError;
+    rc = mxMultiTextSearch_SearchObject(self, text, start, stop,
+					&sliceleft, NULL);
+    if (rc < 0)
+	goto onError;
+    if (rc == 0)
+	sliceleft = -1;
+    Py_DECREF(view);
+    return PyLong_FromSsize_t(sliceleft);
 
  onError:
+    Py_XDECREF(view);
     return NULL;
 }
 
-static 
-void mxCharSet_Free(mxCharSetObject *cs)
+Py_C_Function( mxMultiTextSearch_findall,
+	       "MultiTextSearch.findall(text,start=0,stop=len(text))\n\n"
+	       "Search for the words in text, looking only at the\n"
+	       "slice [start:stop] and return a list of all\n"
+	       "non overlapping slices (l,r) in text where one of\n"
+	       "the words can be found, scanning from left to right.")
 {
-    Py_XDECREF(cs->definition);
-    if (cs->lookup)
-	PyMem_Free(cs->lookup);
-    PyObject_Del(cs);
-}
+    PyObject *text;
+    PyObject *view = NULL;
+    PyObject *list = 0;
+    Py_ssize_t start = 0;
+    Py_ssize_t stop = PY_SSIZE_T_MAX;
 
-/* C APIs */
+    Py_Get3Args("O|nn:MultiTextSearch.findall",
+		text,start,stop);
 
-#define cs ((mxCharSetObject *)self)
+    view = mxTextTools_AsText(text);
+    if (view == NULL)
+	goto onError;
+    text = view;
+    if (mxMultiTextSearch_CheckSlice(text, &start, &stop))
+	goto onError;
 
-int mxCharSet_ContainsChar(PyObject *self,
-			   register unsigned char ch)
-{
-    if (!mxCharSet_Check(self)) {
-	PyErr_BadInternalCall();
+    list = PyList_New(0);
+    if (!list)
 	goto onError;
-    }
-    
-    if (cs->mode == MXCHARSET_8BITMODE) {
-	unsigned char *bitmap = ((string_charset *)cs->lookup)->bitmap;
-	return ((bitmap[ch >> 3] & (1 << (ch & 7))) != 0);
-    }
-    else if (cs->mode == MXCHARSET_UCS2MODE) {
-	unicode_charset *lookup = (unicode_charset *)cs->lookup;
-	unsigned char *bitmap = lookup->bitmaps[lookup->bitmapindex[0]];
-	return ((bitmap[ch >> 3] & (1 << (ch & 7))) != 0);
-    }
-    else {
-	Py_Error(mxTextTools_Error,
-		 "unsupported character set mode");
-    }
 
- onError:
-    return -1;
-}
+    while (start < stop) {
+	PyObject *t;
+	int rc;
+	Py_ssize_t sliceleft, sliceright;
+
+	rc = mxMultiTextSearch_SearchObject(self, text, start, stop,
+					    &sliceleft, &sliceright);
+	if (rc < 0)
+	    goto onError;
+	if (rc == 0)
+	    break;
 
+	t = Py_BuildValue("nn", sliceleft, sliceright);
+	if (t == NULL)
+	    goto onError;
+	if (PyList_Append(list, t)) {
+	    Py_DECREF(t);
+	    goto onError;
+	}
+	Py_DECREF(t);
 
-int mxCharSet_ContainsUnicodeChar(PyObject *self,
-				  register Py_UCS4 ch)
-{
-    if (!mxCharSet_Check(self)) {
-	PyErr_BadInternalCall();
-	goto onError;
-    }
-    
-    if (cs->mode == MXCHARSET_8BITMODE) {
-	unsigned char *bitmap = ((string_charset *)cs->lookup)->bitmap;
-	if (ch >= 256)
-	    return 0;
-	return ((bitmap[ch >> 3] & (1 << (ch & 7))) != 0);
-    }
-    else if (cs->mode == MXCHARSET_UCS2MODE) {
-	unicode_charset *lookup = (unicode_charset *)cs->lookup;
-	/* Bounds check: UCS2 mode only supports characters 0-65535 */
-	if (ch > 0xFFFF)
-	    return 0;
-	unsigned char *bitmap = lookup->bitmaps[lookup->bitmapindex[ch >> 8]];
-	return ((bitmap[(ch >> 3) & 31] & (1 << (ch & 7))) != 0);
-    }
-    else {
-	Py_Error(mxTextTools_Error,
-		 "unsupported character set mode");
+	start = sliceright;
     }
+    Py_DECREF(view);
+    return list;
 
  onError:
-    return -1;
+    Py_XDECREF(view);
+    Py_XDECREF(list);
+    return NULL;
 }
 
-
-static
-int mxCharSet_Contains(PyObject *self,
-		       PyObject *other)
+#ifdef COPY_PROTOCOL
+Py_C_Function( mxMultiTextSearch_copy,
+	       "copy([memo])\n\n"
+	       "Return a new reference for the instance. This function\n"
+	       "is used for the copy-protocol. Real copying doesn't take\n"
+	       "place, since the instances are immutable.")
 {
-    if (PyString_Check(other)) {
-	Py_Assert(PyString_GET_SIZE(other) == 1,
-		  PyExc_TypeError,
-		  "expected a single character");
-	return mxCharSet_ContainsChar(self, PyString_AS_STRING(other)[0]);
-    }
-    else if (PyUnicode_Check(other)) {
-	Py_Assert(PyUnicode_GET_LENGTH(other) == 1,
-		  PyExc_TypeError,
-		  "expected a single unicode character");
-	return mxCharSet_ContainsUnicodeChar(self, 
-					     mxte_get_unicode_char(other, 0));
-    }
-    else
-	Py_Error(PyExc_TypeError,
-		 "expected string or unicode character");
+    PyObject *memo;
 
+    Py_GetArg("|O",memo);
+    Py_INCREF(so);
+    return (PyObject *)so;
  onError:
-    return -1;
+    return NULL;
 }
+#endif
 
-/* In mode 1, find the position of the first character in text
-   belonging to set. This may also be stop or start-1 in case no such
-   character is found during the search (depending on the direction).
+#undef so
 
-   In mode 0, find the first character not in set. This may also be
-   stop or start-1 in case no such character is found during the
-   search (depending on the direction).
+/* --- slots --- */
 
-   The search is done in the slice start:stop.
+static
+PyObject *mxMultiTextSearch_Repr(mxMultiTextSearchObject *self)
+{
+    return PyUnicode_FromFormat("<MultiTextSearch object for %R at %p>",
+				self->match, self);
+}
 
-   -2 is returned in case of an error.
+/* Python Method Table */
+
+static
+PyMethodDef mxMultiTextSearch_Methods[] =
+{
+    Py_MethodListEntry("search",mxMultiTextSearch_search),
+    Py_MethodListEntry("find",mxMultiTextSearch_find),
+    Py_MethodListEntry("findall",mxMultiTextSearch_findall),
+#ifdef COPY_PROTOCOL
+    Py_MethodListEntry("__deepcopy__",mxMultiTextSearch_copy),
+    Py_MethodListEntry("__copy__",mxMultiTextSearch_copy),
+#endif
+    {NULL,NULL} /* end of list */
+};
+
+static PyMemberDef mxMultiTextSearch_members[] = {
+    {"match",T_OBJECT_EX,offsetof(mxMultiTextSearchObject,match),READONLY,"Words that this search matches"},
+    {NULL}
+};
+
+/* Python Type Table */
+
+PyTypeObject mxMultiTextSearch_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)      /* init at startup ! */
+    "MultiTextSearch",                  /*tp_name*/
+    sizeof(mxMultiTextSearchObject),    /*tp_basicsize*/
+    0,                                  /*tp_itemsize*/
+    /* methods */
+    (destructor)mxMultiTextSearch_Free, /*tp_dealloc*/
+#if PY_VERSION_HEX >= 0x03080000
+    0,                                  /*tp_vectorcall_offset*/
+#else
+    (printfunc)0,                       /*tp_print*/
+#endif
+    (getattrfunc)0,                     /*tp_getattr*/
+    (setattrfunc)0,                     /*tp_setattr*/
+#if PY_VERSION_HEX >= 0x03050000
+    0,                                  /*tp_as_async*/
+#else
+    0,                                  /*tp_reserved*/
+#endif
+    (reprfunc)mxMultiTextSearch_Repr,   /*tp_repr*/
+    0,                                  /*tp_as_number*/
+    0,                                  /*tp_as_sequence*/
+    0,                                  /*tp_as_mapping*/
+    (hashfunc)0,                        /*tp_hash*/
+    (ternaryfunc)0,                     /*tp_call*/
+    (reprfunc)0,                        /*tp_str*/
+    (getattrofunc)0,                    /*tp_getattro*/
+    (setattrofunc)0,                    /*tp_setattro*/
+    0,                                  /*tp_as_buffer*/
+    Py_TPFLAGS_DEFAULT,                 /*tp_flags*/
+    "mxTextTools multi-word text-search object", /*tp_doc*/
+    0,                                  /*tp_traverse*/
+    0,                                  /*tp_clear*/
+    0,                                  /*tp_richcompare*/
+    0,                                  /*tp_weaklistoffset*/
+    0,                                  /*tp_iter*/
+    0,                                  /*tp_iternext*/
+    mxMultiTextSearch_Methods,          /*tp_methods*/
+    mxMultiTextSearch_members,          /*tp_members*/
+};
+
+/* --- Character Set Object --------------------------------------------*/
+
+/* internal */
+
+/* 8-bit character sets are implemented using a simple 32-byte
+   long bitmap with one bit per character.
+
+   Addressing is done as follows:
+
+      def char_is_set(ordinal):
+          return bitmap[ordinal >> 3]  & (1 << (ordinal & 7))
 
 */
 
+/* string_charset is defined in mxTextTools.h */
+
 static
-int mxCharSet_FindChar(PyObject *self,
-		       unsigned char *text,
-		       Py_ssize_t start,
-		       Py_ssize_t stop,
-		       const int mode,
-		       const int direction)
+int init_string_charset(mxCharSetObject *cs,
+			PyObject *definition)
 {
-    register Py_ssize_t i;
-    register unsigned int c;
-    register unsigned int block;
-    unsigned char *bitmap;
+    register Py_ssize_t i, j;
+    char *def = PyString_AS_STRING(definition);
+    const Py_ssize_t len = PyString_GET_SIZE(definition);
+    string_charset *lookup = 0;
+    register unsigned char *bitmap;
+    int logic = 1;
 
-    if (!mxCharSet_Check(self)) {
-	PyErr_BadInternalCall();
-	goto onError;
+    /* Handle logic change (first char is '^' for negative matching) */
+    if (len > 0 && def[0] == '^') {
+	logic = 0;
+	i = 1;
     }
+    else
+	i = 0;
     
-    if (cs->mode == MXCHARSET_8BITMODE)
-	bitmap = ((string_charset *)cs->lookup)->bitmap;
-    else if (cs->mode == MXCHARSET_UCS2MODE) {
-	unicode_charset *lookup = (unicode_charset *)cs->lookup;
-	bitmap = lookup->bitmaps[lookup->bitmapindex[0]];
-    }
-    else {
-	Py_Error(mxTextTools_Error,
-		 "unsupported character set mode");
+    /* Build 32-byte lookup bitmap (one bit per character) */
+    lookup = (string_charset *)PyMem_Malloc(sizeof(string_charset));
+    if (lookup == NULL) {
+	PyErr_NoMemory();
+	goto onError;
     }
+    memset(lookup, 0, sizeof(string_charset));
+    cs->mode = MXCHARSET_8BITMODE;
+    cs->lookup = (void *)lookup;
+    bitmap = lookup->bitmap;
 
-    if (direction > 0) {
-	if (mode)
-	    /* Find first char in set */
-	    for (i = start; i < stop; i++) {
-		c = text[i];
-		block = bitmap[c >> 3];
-		if (block && ((block & (1 << (c & 7))) != 0))
-		    break;
-	    }
-	else
-	    /* Find first char not in set */
-	    for (i = start; i < stop; i++) {
-		c = text[i];
-		block = bitmap[c >> 3];
-		if (!block || ((block & (1 << (c & 7))) == 0))
-		    break;
+    for (; i < len; i++) {
+
+	/* Handle escapes: "b\-d", "\\" */
+	if (def[i] == '\\') {
+	    if (i < len - 1 && def[i+1] == '\\') {
+		j = (unsigned char)'\\';
+		bitmap[j >> 3] |= 1 << (j & 7);
+		i++;
 	    }
+	    continue;
+	}
+
+	/* Handle ranges: "b-d", "\\-z", "\--z" */
+	if (i < len - 2 && def[i+1] == '-') {
+	    unsigned char range_left = def[i];
+	    unsigned char range_right = def[i+2];
+	    for (j = range_left; j <= range_right; j++)
+		bitmap[j >> 3] |= 1 << (j & 7);
+	    i++;
+	    continue;
+	}
+
+	/* Normal processing */
+	j = (unsigned char)def[i];
+	bitmap[j >> 3] |= 1 << (j & 7);
     }
-    else {
-	if (mode)
-	    /* Find first char in set, searching from the end */
-	    for (i = stop - 1; i >= start; i--) {
-		c = text[i];
-		block = bitmap[c >> 3];
-		if (block && ((block & (1 << (c & 7))) != 0))
-		    break;
-	    }
-	else
-	    /* Find first char not in set, searching from the end */
-	    for (i = stop - 1; i >= start; i--) {
-		c = text[i];
-		block = bitmap[c >> 3];
-		if (!block || ((block & (1 << (c & 7))) == 0))
-		    break;
-	    }
+
+    /* Invert bitmap if negative matching is requested */
+    cs->negative = !logic;
+    if (!logic) {
+	DPRINTF("init_string_charset: inverting bitmap\n");
+	for (i = 0; i < STRING_CHARSET_BITMAP_SIZE; i++)
+	    bitmap[i] ^= 0xFF;
     }
-    return i;
+
+    return 0;
 
  onError:
-    return -2;
+    if (lookup)
+	PyMem_Free((void *)lookup);
+    cs->lookup = 0;
+    return -1;
 }
 
 
-/* Return the position of the first character in text[start:stop]
-   occurring in set or -1 in case no such character exists.
+/* Unicode character sets are implemented using two step indexing
+   which is a good compromise between lookup speed and memory usage.
+
+   Lookup is done using a variable length array of 32-byte bitmap
+   blocks. There can be 256 such blocks. Identical blocks are
+   collapsed into a single copy.
+   
+   Addressing is done as follows:
+
+      def char_is_set(ordinal):
+          index = bitmapindex[ordinal >> 8]
+	  bitmap = bitmaps[index]
+          return bitmap[(ordinal >> 3) & 31]  & (1 << (ordinal & 7))
+
+   The technique used here is very similar to what is done in Python's
+   SRE (see the BIGCHARSET patch by Martin von Loewis). Compression
+   should be reasonably good since character sets in practice usually
+   only contains a few single characters or longer ranges of Unicode
+   characters.
 
 */
 
+/* unicode_charset is defined in mxTextTools.h */
+
+/* Characters beyond the BMP are kept as a sorted array of intervals
+   (cs->ranges), searched by mxCharSet_Lookup(). */
+
+/* Add the characters left to right to bigmap resp. cs->ranges;
+   allocated is the capacity of cs->ranges in intervals */
+
 static
-int mxCharSet_Search(PyObject *self,
-		     PyObject *text,
-		     Py_ssize_t start,
-		     Py_ssize_t stop,
-		     int direction)
+int cs_add_range(mxCharSetObject *cs,
+		 unsigned char *bigmap,
+		 Py_ssize_t *allocated,
+		 Py_UCS4 left,
+		 Py_UCS4 right)
 {
-    Py_ssize_t position;
-    
-    if (PyString_Check(text)) {
-	Py_CheckStringSlice(text, start, stop);
-	position = mxCharSet_FindChar(self, 
-				      (unsigned char *)PyString_AS_STRING(text),
-				      start,
-				      stop,
-				      1,
-				      direction);
-    }
-    else if (PyUnicode_Check(text)) {
-	Py_CheckUnicodeSlice(text, start, stop);
-	position = mxte_charset_find_char(self, text, start, stop, 1, direction);
+    Py_UCS4 j;
+
+    for (j = left; j <= right && j < UNICODE_CHARSET_SIZE; j++)
+	bigmap[j >> 3] |= 1 << (j & 7);
+    if (right < UNICODE_CHARSET_SIZE || right < left)
+	return 0;
+    if (left < UNICODE_CHARSET_SIZE)
+	left = UNICODE_CHARSET_SIZE;
+    if (cs->nranges == *allocated) {
+	Py_ssize_t size = *allocated ? 2 * *allocated : 8;
+	Py_UCS4 *ranges = (Py_UCS4 *)PyMem_Realloc(cs->ranges,
+						  2 * size * sizeof(Py_UCS4));
+	if (ranges == NULL) {
+	    PyErr_NoMemory();
+	    return -1;
+	}
+	cs->ranges = ranges;
+	*allocated = size;
     }
-    else
-	Py_Error(PyExc_TypeError,
-		 "expected string or unicode");
+    cs->ranges[2 * cs->nranges] = left;
+    cs->ranges[2 * cs->nranges + 1] = right;
+    cs->nranges++;
+    return 0;
+}
 
-    if ((direction > 0 && position >= stop) ||
-	(direction <= 0 && position < start))
-	position = -1;
-    return position;
+static
+int cs_compare_ranges(const void *a,
+		      const void *b)
+{
+    Py_UCS4 x = *(const Py_UCS4 *)a;
+    Py_UCS4 y = *(const Py_UCS4 *)b;
 
- onError:
-    return -2;
+    return (x > y) - (x < y);
 }
 
-/* Return the longest match of characters from set in
-   text[start:stop]. 
+/* Sort cs->ranges and merge overlapping or adjacent intervals */
 
-   If direction is positive, the search is done from the left (longest
-   prefix), otherwise it is started from the right (longest suffix).
+static
+void cs_merge_ranges(mxCharSetObject *cs)
+{
+    Py_ssize_t i, n = 0;
+    Py_UCS4 *ranges = cs->ranges;
+
+    if (cs->nranges == 0)
+	return;
+    qsort(ranges, cs->nranges, 2 * sizeof(Py_UCS4), cs_compare_ranges);
+    for (i = 0; i < cs->nranges; i++) {
+	if (n > 0 && ranges[2*i] <= ranges[2*n - 1] + 1) {
+	    if (ranges[2*i + 1] > ranges[2*n - 1])
+		ranges[2*n - 1] = ranges[2*i + 1];
+	}
+	else {
+	    ranges[2*n] = ranges[2*i];
+	    ranges[2*n + 1] = ranges[2*i + 1];
+	    n++;
+	}
+    }
+    cs->nranges = n;
+}
 
-   -1 is returned in case of an error.
+static
+int init_unicode_charset(mxCharSetObject *cs,
+			 PyObject *definition)
+{
+    register Py_ssize_t i, j;
+    const Py_ssize_t len = PyUnicode_GET_LENGTH(definition);
+    unicode_charset *lookup = 0;
+    unsigned char bigmap[UNICODE_CHARSET_BIGMAP_SIZE];
+    Py_ssize_t blocks;
+    Py_ssize_t allocated = 0;
+    int logic = 1;
 
-*/
+    /* Ensure Unicode object is ready for reading */
+    if (PyUnicode_READY(definition) < 0)
+        return -1;
 
-Py_ssize_t mxCharSet_Match(PyObject *self,
-		    PyObject *text,
-		    Py_ssize_t start,
-		    Py_ssize_t stop,
-		    int direction)
-{
-    Py_ssize_t position;
-    
-    if (PyString_Check(text)) {
-	Py_CheckStringSlice(text, start, stop);
-	position = mxCharSet_FindChar(self, 
-				      (unsigned char *)PyString_AS_STRING(text),
-				      start,
-				      stop,
-				      0,
-				      direction);
-    }
-    else if (PyUnicode_Check(text)) {
-	Py_CheckUnicodeSlice(text, start, stop);
-	
-	/* Simple fallback: convert to legacy format and use string search when possible */
-	if (PyUnicode_KIND(text) == PyUnicode_1BYTE_KIND && 
-	    PyUnicode_MAX_CHAR_VALUE(text) < 256) {
-	    /* 1-byte Unicode can be processed as string */
-	    position = mxCharSet_FindChar(self, 
-					  (unsigned char *)PyUnicode_DATA(text),
-					  start, stop, 0, direction);
-	} else {
-	    /* Use modern Unicode processing */
-	    position = mxte_charset_find_char(self, text, start, stop, 0, direction);
-	}
+    /* Handle logic change (first char is '^' for negative matching) */
+    if (len > 0 && PyUnicode_READ(PyUnicode_KIND(definition), PyUnicode_DATA(definition), 0) == '^') {
+	logic = 0;
+	i = 1;
     }
     else
-	Py_Error(PyExc_TypeError,
-		 "expected string or unicode");
+	i = 0;
+    
+    /* Build bigmap */
+    memset(bigmap, 0, sizeof(bigmap));
+    for (; i < len; i++) {
+        Py_UCS4 ch = PyUnicode_READ(PyUnicode_KIND(definition), PyUnicode_DATA(definition), i);
 
-    if (position < -1)
-	goto onError;
-    if (direction > 0) {
-	Py_ssize_t result = position - start;
-	/* Debug: catch negative results */
-	if (result < 0) {
-	    /* This shouldn't happen - convert to error */
-	    goto onError;
+	/* Handle escapes: "b\-d", "\\" */
+	if (ch == '\\') {
+	    if (i < len - 1) {
+                Py_UCS4 next_ch = PyUnicode_READ(PyUnicode_KIND(definition), PyUnicode_DATA(definition), i+1);
+                if (next_ch == '\\') {
+                    j = (int)'\\';
+                    bigmap[j >> 3] |= 1 << (j & 7);
+                    i++;
+                }
+            }
+	    continue;
 	}
-	return result;
-    } else {
-	Py_ssize_t result = stop-1 - position;
-	/* Debug: catch negative results */
-	if (result < 0) {
-	    /* This shouldn't happen - convert to error */
+
+	/* Handle ranges: "b-d", "\\-z", "\--z" */
+	if (i < len - 2) {
+            Py_UCS4 next_ch = PyUnicode_READ(PyUnicode_KIND(definition), PyUnicode_DATA(definition), i+1);
+            if (next_ch == '-') {
+                Py_UCS4 range_left = ch;
+                Py_UCS4 range_right = PyUnicode_READ(PyUnicode_KIND(definition), PyUnicode_DATA(definition), i+2);
+		if (cs_add_range(cs, bigmap, &allocated,
+				 range_left, range_right))
+		    goto onError;
+		i += 2; /* Skip the '-' and range_right character */
+		continue;
+            }
+	}
+
+	/* Normal processing */
+	if (cs_add_range(cs, bigmap, &allocated, ch, ch))
 	    goto onError;
+    }
+    cs_merge_ranges(cs);
+
+    /* Build lookup table
+
+       XXX Could add dynamic resizing here... probably not worth it
+           though, since sizeof(unicode_charset) isn't all that large.
+
+    */
+    lookup = (unicode_charset *)PyMem_Malloc(sizeof(unicode_charset));
+    if (lookup == NULL) {
+	PyErr_NoMemory();
+	goto onError;
+    }
+    blocks = 0;
+    for (i = UNICODE_CHARSET_BITMAPS - 1; i >= 0; i--) {
+	unsigned char *block = &bigmap[i << 5];
+	for (j = blocks - 1; j >= 0; j--)
+	    if (memcmp(lookup->bitmaps[j], block, 
+		       UNICODE_CHARSET_BITMAP_SIZE) == 0)
+		break;
+	if (j < 0) {
+	    j = blocks;
+	    DPRINTF("init_unicode_charset: Creating new block %i for %i\n", 
+		    j, i);
+	    memcpy(lookup->bitmaps[j], block, UNICODE_CHARSET_BITMAP_SIZE);
+	    blocks++;
 	}
-	return result;
+	else
+	    DPRINTF("init_unicode_charset: Reusing block %i for %i\n", j, i);
+	lookup->bitmapindex[i] = j;
+    }
+    DPRINTF("init_unicode_charset: Map size: %i block(s) = %i bytes\n", 
+	    blocks, UNICODE_CHARSET_BITMAPS + 
+	    blocks * UNICODE_CHARSET_BITMAP_SIZE);
+    lookup = (unicode_charset *)PyMem_Realloc(lookup, 
+				 UNICODE_CHARSET_BITMAPS 
+				 + blocks * UNICODE_CHARSET_BITMAP_SIZE);
+    if (lookup == NULL) {
+	PyErr_NoMemory();
+	goto onError;
+    }
+
+    /* Invert bitmaps if negative matching is requested */
+    cs->negative = !logic;
+    if (!logic) {
+	register unsigned char *bitmap = &lookup->bitmaps[0][0];
+	DPRINTF("init_unicode_charset: inverting bitmaps\n");
+	for (i = 0; i < blocks * UNICODE_CHARSET_BITMAP_SIZE; i++)
+	    bitmap[i] ^= 0xFF;
     }
 
+    cs->mode = MXCHARSET_UCS2MODE;
+    cs->lookup = (void *)lookup;
+    return 0;
+
  onError:
+    if (lookup)
+	PyMem_Free((void *)lookup);
+    cs->lookup = 0;
     return -1;
 }
 
-/* Stips off characters appearing in the character set from text[start:stop]
-   and returns the result as Python string object.
 
-   where indicates the mode:
-   where < 0: strip left only
-   where = 0: strip left and right
-   where > 0: strip right only
+/* allocation */
 
-*/
 static
-PyObject *mxCharSet_Strip(PyObject *self,
-			  PyObject *text,
-			  Py_ssize_t start,
-			  Py_ssize_t stop,
-			  Py_ssize_t where)
+PyObject *mxCharSet_New(PyObject *definition)
 {
-    Py_ssize_t left,right;
-    
-    if (!mxCharSet_Check(self)) {
-	PyErr_BadInternalCall();
-	goto onError;
-    }
-
-    if (PyString_Check(text)) {
-	Py_CheckStringSlice(text, start, stop);
-
-	/* Strip left */
-	if (where <= 0) {
-	    left = mxCharSet_FindChar(self, 
-				      (unsigned char *)PyString_AS_STRING(text),
-				      start,
-				      stop,
-				      0,
-				      1);
-	    if (left < 0)
-		goto onError;
-	}
-	else
-	    left = start;
+    mxCharSetObject *cs;
 
-	/* Strip right */
-	if (where >= 0) {
-	    right = mxCharSet_FindChar(self, 
-				       (unsigned char *)PyString_AS_STRING(text),
-				       left,
-				       stop,
-				       0,
-				       -1) + 1;
-	    if (right < 0)
-		goto onError;
-	}
-	else
-	    right = stop;
+    cs = PyObject_NEW(mxCharSetObject, &mxCharSet_Type);
+    if (cs == NULL) 
+	return NULL;
+    Py_INCREF(definition);
+    cs->definition = definition;
+    cs->lookup = NULL;
+    cs->mode = -1;
+    cs->negative = 0;
+    cs->ranges = NULL;
+    cs->nranges = 0;
 
-	return PyString_FromStringAndSize(PyString_AS_STRING(text) + left, 
-					  max(right - left, 0));
+    if (PyString_Check(definition)) {
+	if (init_string_charset(cs, definition))
+	    goto onError;
     }
-    else if (PyUnicode_Check(text)) {
-        Py_CheckUnicodeSlice(text, start, stop);
-
-	/* Strip left */
-	if (where <= 0) {
-	    left = mxte_charset_find_char(self, text, start, stop, 0, 1);
-	    if (left < 0)
-		goto onError;
-	}
-	else
-	    left = start;
-
-	/* Strip right */
-	if (where >= 0) {
-	    right = mxte_charset_find_char(self, text, start, stop, 0, -1) + 1;
-	    if (right < 0)
-		goto onError;
-	}
-	else
-	    right = stop;
-	
-	return mxte_unicode_slice(text, left, max(right - left, 0));
+    else if (PyUnicode_Check(definition)) {
+	if (init_unicode_charset(cs, definition))
+	    goto onError;
     }
     else
 	Py_Error(PyExc_TypeError,
-		 "expected string or unicode");
+		 "character set definition must be string or unicode");
+
+    return (PyObject *)cs;
 
  onError:
+    Py_DECREF(cs);
     return NULL;
 }
 
-static 
-PyObject *mxCharSet_Split(PyObject *self,
-			  PyObject *text,
-			  Py_ssize_t start,
-			  Py_ssize_t text_len,
-			  int include_splits)
+Py_C_Function( mxCharSet_CharSet,
+	       "CharSet(definition)\n\n"
+	       "Create a character set matching object from the string"
+	       )
 {
-    PyObject *list = NULL;
-    PyObject *s;
-    register Py_ssize_t x;
-    Py_ssize_t listitem = 0;
-    Py_ssize_t listsize = INITIAL_LIST_SIZE;
+    PyObject *definition;
 
-    if (!mxCharSet_Check(self)) {
-	PyErr_BadInternalCall();
-	goto onError;
-    }
-    
-    list = PyList_New(listsize);
-    if (!list)
-	goto onError;
-
-    if (PyString_Check(text)) {
-	unsigned char *tx = (unsigned char *)PyString_AS_STRING(text);
-
-	Py_CheckStringSlice(text, start, text_len);
-
-	x = start;
-	while (x < text_len) {
-	    Py_ssize_t z;
-
-	    /* Skip all text in set (include_splits == 0), not in set
-    	       (include_splits == 1) */
-	    z = x;
-	    x = mxCharSet_FindChar(self, tx, x, text_len, include_splits, 1);
-
-	    /* Append the slice to list */
-	    if (include_splits) {
-		s = PyString_FromStringAndSize((char *)&tx[z], x - z);
-		if (!s)
-		    goto onError;
-		if (listitem < listsize)
-		    PyList_SET_ITEM(list,listitem,s);
-		else {
-		    PyList_Append(list,s);
-		    Py_DECREF(s);
-		}
-		listitem++;
-
-		if (x >= text_len)
-		    break;
-	    }
-	    
-	    /* Skip all text in set (include_splits == 1), not in set
-    	       (include_splits == 0) */
-	    z = x;
-	    x = mxCharSet_FindChar(self, tx, x, text_len, !include_splits, 1);
-
-	    /* Append the slice to list if it is not empty */
-	    if (x > z) {
-		s = PyString_FromStringAndSize((char *)&tx[z], x - z);
-		if (!s)
-		    goto onError;
-		if (listitem < listsize)
-		    PyList_SET_ITEM(list,listitem,s);
-		else {
-		    PyList_Append(list,s);
-		    Py_DECREF(s);
-		}
-		listitem++;
-	    }
-	}
-	
-    }
-    else if (PyUnicode_Check(text)) {
-	/* tx variable eliminated - using modern Unicode operations directly */
-
-	Py_CheckUnicodeSlice(text, start, text_len);
-
-	x = start;
-	while (x < text_len) {
-	    Py_ssize_t z;
-
-	    /* Skip all text in set (include_splits == 0), not in set
-    	       (include_splits == 1) */
-	    z = x;
-	    x = mxte_charset_find_char(self, text, x, text_len, include_splits, 1);
-
-	    /* Append the slice to list */
-	    if (include_splits) {
-		s = mxte_unicode_slice(text, z, x - z);
-		if (!s)
-		    goto onError;
-		if (listitem < listsize)
-		    PyList_SET_ITEM(list,listitem,s);
-		else {
-		    PyList_Append(list,s);
-		    Py_DECREF(s);
-		}
-		listitem++;
-
-		if (x >= text_len)
-		    break;
-	    }
-	    
-	    /* Skip all text in set (include_splits == 1), not in set
-    	       (include_splits == 0) */
-	    z = x;
-	    x = mxte_charset_find_char(self, text, x, text_len, !include_splits, 1);
-
-	    /* Append the slice to list if it is not empty */
-	    if (x > z) {
-		s = mxte_unicode_slice(text, z, x - z);
-		if (!s)
-		    goto onError;
-		if (listitem < listsize)
-		    PyList_SET_ITEM(list,listitem,s);
-		else {
-		    PyList_Append(list,s);
-		    Py_DECREF(s);
-		}
-		listitem++;
-	    }
-	}
-    }
-    else
-	Py_Error(PyExc_TypeError,
-		 "expected string or unicode");
-    
-    /* Resize list if necessary */
-    if (listitem < listsize)
-	PyList_SetSlice(list, listitem, listsize, (PyObject*)NULL);
+    Py_GetArg("O:CharSet", definition);
+    return mxCharSet_New(definition);
 
-    return list;
-    
  onError:
-    Py_XDECREF(list);
     return NULL;
 }
 
-/* methods */
-
-Py_C_Function( mxCharSet_contains,
-	       ".contains(char)\n\n"
-	       )
+static 
+void mxCharSet_Free(mxCharSetObject *cs)
 {
-    PyObject *chr;
-    int rc;
+    Py_XDECREF(cs->definition);
+    if (cs->lookup)
+	PyMem_Free(cs->lookup);
+    if (cs->ranges)
+	PyMem_Free(cs->ranges);
+    PyObject_Del(cs);
+}
 
-    Py_GetArg("O:CharSet.contains", chr);
-    
-    rc = mxCharSet_Contains(self, chr);
-    if (rc < 0)
-	goto onError;
-    return PyInt_FromLong(rc);
+/* C APIs */
 
- onError:
-    return NULL;
-}
+#define cs ((mxCharSetObject *)self)
 
-Py_C_Function( mxCharSet_search,
-	       ".search(text[, direction=1, start=0, stop=len(text)])\n\n"
-	       )
+int mxCharSet_ContainsChar(PyObject *self,
+			   register unsigned char ch)
 {
-    PyObject *text;
-    int direction = 1;
-    Py_ssize_t start = 0, stop = INT_MAX;
-    int rc;
-
-    Py_Get4Args("O|iii:CharSet.search", text, direction, start, stop);
-    
-    rc = mxCharSet_Search(self, text, start, stop, direction);
-    if (rc == -1)
-	Py_ReturnNone();
-    if (rc < -1)
+    if (!mxCharSet_Check(self)) {
+	PyErr_BadInternalCall();
 	goto onError;
-    return PyInt_FromLong(rc);
+    }
+    
+    if (cs->mode == MXCHARSET_8BITMODE) {
+	unsigned char *bitmap = ((string_charset *)cs->lookup)->bitmap;
+	return ((bitmap[ch >> 3] & (1 << (ch & 7))) != 0);
+    }
+    else if (cs->mode == MXCHARSET_UCS2MODE) {
+	unicode_charset *lookup = (unicode_charset *)cs->lookup;
+	unsigned char *bitmap = lookup->bitmaps[lookup->bitmapindex[0]];
+	return ((bitmap[ch >> 3] & (1 << (ch & 7))) != 0);
+    }
+    else {
+	Py_Error(mxTextTools_Error,
+		 "unsupported character set mode");
+    }
 
  onError:
-    return NULL;
+    return -1;
 }
 
-Py_C_Function( mxCharSet_match,
-	       ".match(text[, direction=1, start=0, stop=len(text)])\n\n"
-	       )
-{
-    PyObject *text;
-    int direction = 1;
-    Py_ssize_t start = 0, stop = INT_MAX;
-    int rc;
 
-    Py_Get4Args("O|iii:CharSet.match", text, direction, start, stop);
-    
-    rc = mxCharSet_Match(self, text, start, stop, direction);
-    if (rc < 0)
+int mxCharSet_ContainsUnicodeChar(PyObject *self,
+				  register Py_UCS4 ch)
+{
+    if (!mxCharSet_Check(self)) {
+	PyErr_BadInternalCall();
 	goto onError;
-    return PyInt_FromLong(rc);
+    }
+    
+    if (cs->mode == MXCHARSET_8BITMODE) {
+	return mxCharSet_Lookup(cs, ch);
+    }
+    else if (cs->mode == MXCHARSET_UCS2MODE) {
+	return mxCharSet_Lookup(cs, ch);
+    }
+    else {
+	Py_Error(mxTextTools_Error,
+		 "unsupported character set mode");
+    }
 
  onError:
-    return NULL;
+    return -1;
 }
 
-Py_C_Function( mxCharSet_split,
-	       ".split(text[, start=0, stop=len(text)])\n\n"
-	       )
-{
-    PyObject *text;
-    Py_ssize_t start = 0, stop = INT_MAX;
 
-    Py_Get3Args("O|ii:CharSet.split", text, start, stop);
-    
-    return mxCharSet_Split(self, text, start, stop, 0);
+static
+int mxCharSet_Contains(PyObject *self,
+		       PyObject *other)
+{
+    if (PyString_Check(other)) {
+	Py_Assert(PyString_GET_SIZE(other) == 1,
+		  PyExc_TypeError,
+		  "expected a single character");
+	return mxCharSet_ContainsChar(self, PyString_AS_STRING(other)[0]);
+    }
+    else if (PyUnicode_Check(other)) {
+	Py_Assert(PyUnicode_GET_LENGTH(other) == 1,
+		  PyExc_TypeError,
+		  "expected a single unicode character");
+	return mxCharSet_ContainsUnicodeChar(self, 
+					     mxte_get_unicode_char(other, 0));
+    }
+    else
+	Py_Error(PyExc_TypeError,
+		 "expected string or unicode character");
 
  onError:
-    return NULL;
+    return -1;
 }
 
-Py_C_Function( mxCharSet_splitx,
-	       ".splitx(text[, start=0, stop=len(text)])\n\n"
-	       )
-{
-    PyObject *text;
-    Py_ssize_t start = 0, stop = INT_MAX;
+/* In mode 1, find the position of the first character in text
+   belonging to set. This may also be stop or start-1 in case no such
+   character is found during the search (depending on the direction).
 
-    Py_Get3Args("O|ii:CharSet.splitx", text, start, stop);
-    
-    return mxCharSet_Split(self, text, start, stop, 1);
+   In mode 0, find the first character not in set. This may also be
+   stop or start-1 in case no such character is found during the
+   search (depending on the direction).
 
- onError:
-    return NULL;
-}
+   The search is done in the slice start:stop.
 
-Py_C_Function( mxCharSet_strip,
-	       ".strip(text[, where=0, start=0, stop=len(text)])\n\n"
-	       )
-{
-    PyObject *text;
-    Py_ssize_t where = 0;
-    Py_ssize_t start = 0, stop = INT_MAX;
+   -2 is returned in case of an error.
 
-    Py_Get4Args("O|iii:CharSet.strip", text, where, start, stop);
-    
-    return mxCharSet_Strip(self, text, start, stop, where);
-
- onError:
-    return NULL;
-}
+*/
 
-#ifdef COPY_PROTOCOL
-Py_C_Function( mxCharSet_copy,
-	       "copy([memo])\n\n"
-	       "Return a new reference for the instance. This function\n"
-	       "is used for the copy-protocol. Real copying doesn't take\n"
-	       "place, since the instances are immutable.")
+static
+Py_ssize_t mxCharSet_FindChar(PyObject *self,
+		       unsigned char *text,
+		       Py_ssize_t start,
+		       Py_ssize_t stop,
+		       const int mode,
+		       const int direction)
 {
-    PyObject *memo;
-    
-    Py_GetArg("|O",memo);
-    Py_INCREF(cs);
-    return (PyObject *)cs;
- onError:
-    return NULL;
-}
-#endif
-
-#undef cs
+    register Py_ssize_t i;
+    register unsigned int c;
+    register unsigned int block;
+    unsigned char *bitmap;
 
-/* --- slots --- */
+    if (!mxCharSet_Check(self)) {
+	PyErr_BadInternalCall();
+	goto onError;
+    }
+    
+    if (cs->mode == MXCHARSET_8BITMODE)
+	bitmap = ((string_charset *)cs->lookup)->bitmap;
+    else if (cs->mode == MXCHARSET_UCS2MODE) {
+	unicode_charset *lookup = (unicode_charset *)cs->lookup;
+	bitmap = lookup->bitmaps[lookup->bitmapindex[0]];
+    }
+    else {
+	Py_Error(mxTextTools_Error,
+		 "unsupported character set mode");
+    }
 
-static
-PyObject *mxCharSet_Repr(mxCharSetObject *self)
-{
-    PyObject *v;
-    char t[500], *reprstr;
+    if (direction > 0) {
+	if (mode)
+	    /* Find first char in set */
+	    for (i = start; i < stop; i++) {
+		c = text[i];
+		block = bitmap[c >> 3];
+		if (block && ((block & (1 << (c & 7))) != 0))
+		    break;
+	    }
+	else
+	    /* Find first char not in set */
+	    for (i = start; i < stop; i++) {
+		c = text[i];
+		block = bitmap[c >> 3];
+		if (!block || ((block & (1 << (c & 7))) == 0))
+		    break;
+	    }
+    }
+    else {
+	if (mode)
+	    /* Find first char in set, searching from the end */
+	    for (i = stop - 1; i >= start; i--) {
+		c = text[i];
+		block = bitmap[c >> 3];
+		if (block && ((block & (1 << (c & 7))) != 0))
+		    break;
+	    }
+	else
+	    /* Find first char not in set, searching from the end */
+	    for (i = stop - 1; i >= start; i--) {
+		c = text[i];
+		block = bitmap[c >> 3];
+		if (!block || ((block & (1 << (c & 7))) == 0))
+		    break;
+	    }
+    }
+    return i;
 
-    v = PyObject_Repr(self->definition);
-    if (v == NULL)
-	return NULL;
-    reprstr = PyString_AsString(v);
-    if (reprstr == NULL)
-	return NULL;
-    snprintf(t, sizeof(t), "<Character Set object for %.400s at 0x%lx>",
-	    reprstr, (long)self);
-    Py_DECREF(v);
-    return PyString_FromString(t);
+ onError:
+    return -2;
 }
 
-/* Python Type Tables */
 
-static
-PySequenceMethods mxCharSet_TypeAsSequence = {
-    (lenfunc)0,                         /*sq_length*/
-    (binaryfunc)0,                      /*sq_concat*/
-    (ssizeargfunc)0,                    /*sq_repeat*/
-    (ssizeargfunc)0,                    /*sq_item*/
-    (ssizessizeargfunc)0,               /*sq_slice*/
-    (ssizeobjargproc)0,                 /*sq_ass_item*/
-    (ssizessizeobjargproc)0,            /*sq_ass_slice*/
-    (objobjproc)mxCharSet_Contains,     /*sq_contains*/
-};
+/* Return the position of the first character in text[start:stop]
+   occurring in set or -1 in case no such character exists.
 
-static
-PyMemberDef mxCharSet_Members[] = {
-    {"definition",T_OBJECT_EX,offsetof(mxCharSetObject,definition),READONLY,"Definition"},
-    {NULL}
-};
+*/
 
 static
-PyMethodDef mxCharSet_Methods[] =
-{   
-    Py_MethodListEntry("contains",mxCharSet_contains),
-    Py_MethodListEntry("search",mxCharSet_search),
-    Py_MethodListEntry("match",mxCharSet_match),
-    Py_MethodListEntry("strip",mxCharSet_strip),
-    Py_MethodListEntry("split",mxCharSet_split),
-    Py_MethodListEntry("splitx",mxCharSet_splitx),
-#ifdef COPY_PROTOCOL
-    Py_MethodListEntry("__deepcopy__",mxCharSet_copy),
-    Py_MethodListEntry("__copy__",mxCharSet_copy),
-#endif
-    {NULL,NULL} /* end of list */
-};
+Py_ssize_t mxCharSet_Search(PyObject *self,
+		     PyObject *text,
+		     Py_ssize_t start,
+		     Py_ssize_t stop,
+		     int direction)
+{
+    Py_ssize_t position;
+    
+    if (mxTextTools_IsByteText(text)) {
+	Py_CheckBufferSlice(mxTextTools_ByteTextSize(text), start, stop);
+	position = mxCharSet_FindChar(self, 
+				      (unsigned char *)mxTextTools_ByteTextData(text),
+				      start,
+				      stop,
+				      1,
+				      direction);
+    }
+    else if (PyUnicode_Check(text)) {
+	Py_CheckUnicodeSlice(text, start, stop);
+	position = mxte_charset_find_char(self, text, start, stop, 1, direction);
+    }
+    else
+	Py_Error(PyExc_TypeError,
+		 "expected string or unicode");
 
-PyTypeObject mxCharSet_Type = {
-    PyVarObject_HEAD_INIT(NULL, 0)      /* init at startup ! */
-    "Character Set",                    /* tp_name */
-    sizeof(mxCharSetObject),            /* tp_basicsize */
-    0,                                  /* tp_itemsize */
-    /* methods */
-    (destructor)mxCharSet_Free,         /* tp_dealloc */
-#if PY_VERSION_HEX >= 0x03080000
-    0,                                  /* tp_vectorcall_offset */
-#else
-    (printfunc)0,                       /* tp_print */
-#endif
-    (getattrfunc)0,                     /* tp_getattr */
-    (setattrfunc)0,                     /* tp_setattr */
-#if PY_VERSION_HEX >= 0x03050000
-    0,                                  /* tp_as_async */
-#else
-    0,                                  /* tp_reserved */
-#endif
-    (reprfunc)mxCharSet_Repr,           /* tp_repr */
-    0,                                  /* tp_as_number */
-    &mxCharSet_TypeAsSequence,          /* tp_as_sequence */
-    0,                                  /* tp_as_mapping */
-    (hashfunc)0,                        /* tp_hash */
-    (ternaryfunc)0,                     /* tp_call */
-    (reprfunc)0,                        /* tp_str */
-    (getattrofunc)0,                    /* tp_getattro */
-    (setattrofunc)0,                    /* tp_setattro */
-    0,                                  /* tp_as_buffer */
-    Py_TPFLAGS_DEFAULT,                 /* tp_flags */
-    (char*) 0,                          /* tp_doc */
-    0,                                  /* tp_traverse */
-    0,                                  /* tp_clear */
-    0,                                  /* tp_richcompare */
-    0,                                  /* tp_weaklistoffset */
-    0,                                  /* tp_iter */
-    0,                                  /* tp_iternext */
-    mxCharSet_Methods,                  /* tp_methods */
-    mxCharSet_Members,                  /* tp_members */
-};
+    if ((direction > 0 && position >= stop) ||
+	(direction <= 0 && position < start))
+	position = -1;
+    return position;
 
-/* --- Tag Table Object ------------------------------------------------*/
+ onError:
+    return -2;
+}
 
-PyObject *mxTagTable_New(PyObject *definition,
-			 int tabletype,
-			 int cacheable);
+/* Return the longest match of characters from set in
+   text[start:stop]. 
 
-PyObject *mxTagTable_NewEncoded(PyObject *definition,
-				const char *encoding,
-				int is_multibyte,
-				int cacheable);
+   If direction is positive, the search is done from the left (longest
+   prefix), otherwise it is started from the right (longest suffix).
 
-/* internal APIs */
+   -1 is returned in case of an error.
 
-static
-PyObject *tc_get_item(register PyObject *obj,
-		      register Py_ssize_t i)
+*/
+
+Py_ssize_t mxCharSet_Match(PyObject *self,
+		    PyObject *text,
+		    Py_ssize_t start,
+		    Py_ssize_t stop,
+		    int direction)
 {
-    if (PyTuple_Check(obj)) {
-	if (i < 0 || i >= PyTuple_GET_SIZE(obj))
-	    return NULL;
-	return PyTuple_GET_ITEM(obj, i);
+    Py_ssize_t position;
+    
+    if (mxTextTools_IsByteText(text)) {
+	Py_CheckBufferSlice(mxTextTools_ByteTextSize(text), start, stop);
+	position = mxCharSet_FindChar(self, 
+				      (unsigned char *)mxTextTools_ByteTextData(text),
+				      start,
+				      stop,
+				      0,
+				      direction);
     }
-    else if (PyList_Check(obj)) {
-	if (i < 0 || i >= PyList_GET_SIZE(obj))
-	    return NULL;
-	return PyList_GET_ITEM(obj, i);
+    else if (PyUnicode_Check(text)) {
+	Py_CheckUnicodeSlice(text, start, stop);
+	
+	/* Simple fallback: convert to legacy format and use string search when possible */
+	if (PyUnicode_KIND(text) == PyUnicode_1BYTE_KIND && 
+	    PyUnicode_MAX_CHAR_VALUE(text) < 256) {
+	    /* 1-byte Unicode can be processed as string */
+	    position = mxCharSet_FindChar(self, 
+					  (unsigned char *)PyUnicode_DATA(text),
+					  start, stop, 0, direction);
+	} else {
+	    /* Use modern Unicode processing */
+	    position = mxte_charset_find_char(self, text, start, stop, 0, direction);
+	}
     }
     else
-	return NULL;
-}
+	Py_Error(PyExc_TypeError,
+		 "expected string or unicode");
 
-static
-Py_ssize_t tc_length(register PyObject *obj)
-{
-    if (obj == NULL)
-	return -1;
-    else if (PyTuple_Check(obj))
-	return PyTuple_GET_SIZE(obj);
-    else if (PyList_Check(obj))
-	return PyList_GET_SIZE(obj);
-    else 
-	return -1;
-}
-
-/* Add a jump target to the jump dictionary */
-
-static
-Py_ssize_t tc_add_jumptarget(PyObject *jumpdict,
-		      PyObject *targetname,
-		      Py_ssize_t index)
-{
-    PyObject *v;
-    
-    v = PyDict_GetItem(jumpdict, targetname);
-    if (v != NULL)
-	Py_ErrorWithArg(PyExc_TypeError,
-			"tag table entry %d: "
-			"jump target already defined", (unsigned int) index);
-    v = PyInt_FromLong(index);
-    if (v == NULL)
-	goto onError;
-    if (PyDict_SetItem(jumpdict, targetname, v))
+    if (position < -1)
 	goto onError;
-    Py_DECREF(v);
-    return 0;
-    
+    if (direction > 0) {
+	Py_ssize_t result = position - start;
+	/* Debug: catch negative results */
+	if (result < 0) {
+	    /* This shouldn't happen - convert to error */
+	    goto onError;
+	}
+	return result;
+    } else {
+	Py_ssize_t result = stop-1 - position;
+	/* Debug: catch negative results */
+	if (result < 0) {
+	    /* This shouldn't happen - convert to error */
+	    goto onError;
+	}
+	return result;
+    }
+
  onError:
     return -1;
 }
 
-/* Convert a string command argument to either an 8-bit string or
-   Unicode depending on the tabletype.
+/* Stips off characters appearing in the character set from text[start:stop]
+   and returns the result as Python string object.
 
-   For encoded tables (encoding != NULL), Unicode patterns are encoded
-   to bytes using the specified encoding. */
+   where indicates the mode:
+   where < 0: strip left only
+   where = 0: strip left and right
+   where > 0: strip right only
 
+*/
 static
-PyObject *tc_convert_string_arg(PyObject *arg,
-				Py_ssize_t tableposition,
-				int tabletype,
-				const char *encoding)
+PyObject *mxCharSet_Strip(PyObject *self,
+			  PyObject *text,
+			  Py_ssize_t start,
+			  Py_ssize_t stop,
+			  Py_ssize_t where)
 {
-    /* Encoded mode: convert Unicode to bytes using specified encoding */
-    if (encoding != NULL) {
-	if (PyString_Check(arg)) {
-	    /* Bytes - keep as-is. Assume they're already in the right encoding
-	       or the user knows what they're doing. */
-	    return arg;
-	}
-	else if (PyUnicode_Check(arg)) {
-	    /* Encode Unicode to bytes using the specified encoding */
-	    PyObject *encoded = PyUnicode_AsEncodedString(arg, encoding, "strict");
-	    if (encoded == NULL) {
-		/* PyUnicode_AsEncodedString already set the exception.
-		   Note: we don't DECREF arg here - the caller owns it and will
-		   clean up. If we DECREF'd here and returned NULL, the caller's
-		   error handler would try to DECREF again causing a double-free. */
+    Py_ssize_t left,right;
+    
+    if (!mxCharSet_Check(self)) {
+	PyErr_BadInternalCall();
+	goto onError;
+    }
+
+    if (mxTextTools_IsByteText(text)) {
+	Py_CheckBufferSlice(mxTextTools_ByteTextSize(text), start, stop);
+
+	/* Strip left */
+	if (where <= 0) {
+	    left = mxCharSet_FindChar(self, 
+				      (unsigned char *)mxTextTools_ByteTextData(text),
+				      start,
+				      stop,
+				      0,
+				      1);
+	    if (left < 0)
 		goto onError;
-	    }
-	    Py_DECREF(arg);  /* Release the original Unicode object */
-	    return encoded;
 	}
-	else {
-	    Py_ErrorWithArg(PyExc_TypeError,
-			    "tag table entry %d: "
-			    "command argument must be a "
-			    "string or unicode", (unsigned int)tableposition);
+	else
+	    left = start;
+
+	/* Strip right */
+	if (where >= 0) {
+	    right = mxCharSet_FindChar(self, 
+				       (unsigned char *)mxTextTools_ByteTextData(text),
+				       left,
+				       stop,
+				       0,
+				       -1) + 1;
+	    if (right < 0)
+		goto onError;
 	}
+	else
+	    right = stop;
+
+	return PyString_FromStringAndSize(mxTextTools_ByteTextData(text) + left, 
+					  max(right - left, 0));
     }
+    else if (PyUnicode_Check(text)) {
+        Py_CheckUnicodeSlice(text, start, stop);
 
-    /* Convert to strings (original STRINGTYPE behavior) */
-    else if (tabletype == MXTAGTABLE_STRINGTYPE) {
-	if (PyString_Check(arg))
-	    return arg;
-	else if (PyUnicode_Check(arg)) {
-	    Py_DECREF(arg);
-	    arg = PyUnicode_AsEncodedString(arg,
-					    NULL,
-					    NULL);
-	    if (arg == NULL)
-		Py_ErrorWithArg(PyExc_TypeError,
-				"tag table entry %d: "
-				"conversion from Unicode to "
-				"string failed", (unsigned int)tableposition);
+	/* Strip left */
+	if (where <= 0) {
+	    left = mxte_charset_find_char(self, text, start, stop, 0, 1);
+	    if (left < 0)
+		goto onError;
 	}
 	else
-	    Py_ErrorWithArg(PyExc_TypeError,
-			    "tag table entry %d: "
-			    "command argument must be a "
-			    "string or unicode", (unsigned int)tableposition);
-    }
+	    left = start;
 
-    /* Convert to Unicode */
-    else if (tabletype == MXTAGTABLE_UNICODETYPE) {
-	if (PyUnicode_Check(arg))
-	    return arg;
-	else if (PyString_Check(arg)) {
-	    Py_DECREF(arg);
-	    arg = PyUnicode_Decode(PyString_AS_STRING(arg),
-				    PyString_GET_SIZE(arg),
-				    NULL,
-				    NULL);
-	    if (arg == NULL)
-		Py_ErrorWithArg(PyExc_TypeError,
-				"tag table entry %d: "
-				"conversion from string to "
-				"Unicode failed", (unsigned int)tableposition);
+	/* Strip right */
+	if (where >= 0) {
+	    right = mxte_charset_find_char(self, text, start, stop, 0, -1) + 1;
+	    if (right < 0)
+		goto onError;
 	}
 	else
-	    Py_ErrorWithArg(PyExc_TypeError,
-			    "tag table entry %d: "
-			    "command argument must be a "
-			    "string or unicode", (unsigned int)tableposition);
+	    right = stop;
+	
+	return mxte_unicode_slice(text, left, max(right - left, 0));
     }
-
     else
-	Py_Error(mxTextTools_Error,
-		 "unsupported table type");
-
-    return arg;
+	Py_Error(PyExc_TypeError,
+		 "expected string or unicode");
 
  onError:
     return NULL;
 }
 
-/* Cleanup any references in the tag table. */
-
-static
-int tc_cleanup(mxTagTableObject *tagtable)
+static 
+PyObject *mxCharSet_Split(PyObject *self,
+			  PyObject *text,
+			  Py_ssize_t start,
+			  Py_ssize_t text_len,
+			  int include_splits)
 {
-    Py_ssize_t i;
-    for (i = 0; i < tagtable->numentries; i++) {
-	mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+    PyObject *list = NULL;
+    PyObject *s;
+    register Py_ssize_t x;
+    Py_ssize_t listitem = 0;
+    Py_ssize_t listsize = INITIAL_LIST_SIZE;
 
-	Py_XDECREF(tagtableentry->tagobj);
-	tagtableentry->tagobj = NULL;
-	Py_XDECREF(tagtableentry->args);
-	tagtableentry->args = NULL;
+    if (!mxCharSet_Check(self)) {
+	PyErr_BadInternalCall();
+	goto onError;
     }
-    return 0;
-}
-
-/* Initialize the tag table (this is the actual Tag Table compiler)
+    
+    list = PyList_New(listsize);
+    if (!list)
+	goto onError;
 
-   encoding: if not NULL, encode Unicode patterns to this encoding */
+    if (mxTextTools_IsByteText(text)) {
+	unsigned char *tx = (unsigned char *)mxTextTools_ByteTextData(text);
 
-static
-int init_tag_table(mxTagTableObject *tagtable,
-		   PyObject *table,
-		   Py_ssize_t size,
-		   int tabletype,
-		   int cacheable,
-		   const char *encoding)
-{
-    Py_ssize_t i;
-    PyObject *entry;
-    Py_ssize_t entry_len;
-    PyObject *tagobj, *command, *args = 0, *je, *jne;
-    PyObject *jumpdict, *v;
-    int secondpass, own_args = 0;
+	Py_CheckBufferSlice(mxTextTools_ByteTextSize(text), start, text_len);
 
-    jumpdict = PyDict_New();
-    if (jumpdict == NULL)
-	return -1;
+	x = start;
+	while (x < text_len) {
+	    Py_ssize_t z;
 
-    /* Reset to all fields to 0 */
-    memset(&tagtable->entry[0], 0, size * sizeof(mxTagTableEntry));
-    
-    /* First pass */
-    secondpass = 0;
-    tagtable->numentries = size;
-    for (i = 0; i < size; i++) {
-	mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+	    /* Skip all text in set (include_splits == 0), not in set
+    	       (include_splits == 1) */
+	    z = x;
+	    x = mxCharSet_FindChar(self, tx, x, text_len, include_splits, 1);
 
-	/* Get table entry i and parse it */
+	    /* Append the slice to list */
+	    if (include_splits) {
+		s = PyString_FromStringAndSize((char *)&tx[z], x - z);
+		if (!s)
+		    goto onError;
+		if (listitem < listsize)
+		    PyList_SET_ITEM(list,listitem,s);
+		else {
+		    PyList_Append(list,s);
+		    Py_DECREF(s);
+		}
+		listitem++;
+
+		if (x >= text_len)
+		    break;
+	    }
+	    
+	    /* Skip all text in set (include_splits == 1), not in set
+    	       (include_splits == 0) */
+	    z = x;
+	    x = mxCharSet_FindChar(self, tx, x, text_len, !include_splits, 1);
+
+	    /* Append the slice to list if it is not empty */
+	    if (x > z) {
+		s = PyString_FromStringAndSize((char *)&tx[z], x - z);
+		if (!s)
+		    goto onError;
+		if (listitem < listsize)
+		    PyList_SET_ITEM(list,listitem,s);
+		else {
+		    PyList_Append(list,s);
+		    Py_DECREF(s);
+		}
+		listitem++;
+	    }
+	}
+	
+    }
+    else if (PyUnicode_Check(text)) {
+	/* tx variable eliminated - using modern Unicode operations directly */
+
+	Py_CheckUnicodeSlice(text, start, text_len);
+
+	x = start;
+	while (x < text_len) {
+	    Py_ssize_t z;
+
+	    /* Skip all text in set (include_splits == 0), not in set
+    	       (include_splits == 1) */
+	    z = x;
+	    x = mxte_charset_find_char(self, text, x, text_len, include_splits, 1);
+
+	    /* Append the slice to list */
+	    if (include_splits) {
+		s = mxte_unicode_slice(text, z, x - z);
+		if (!s)
+		    goto onError;
+		if (listitem < listsize)
+		    PyList_SET_ITEM(list,listitem,s);
+		else {
+		    PyList_Append(list,s);
+		    Py_DECREF(s);
+		}
+		listitem++;
+
+		if (x >= text_len)
+		    break;
+	    }
+	    
+	    /* Skip all text in set (include_splits == 1), not in set
+    	       (include_splits == 0) */
+	    z = x;
+	    x = mxte_charset_find_char(self, text, x, text_len, !include_splits, 1);
+
+	    /* Append the slice to list if it is not empty */
+	    if (x > z) {
+		s = mxte_unicode_slice(text, z, x - z);
+		if (!s)
+		    goto onError;
+		if (listitem < listsize)
+		    PyList_SET_ITEM(list,listitem,s);
+		else {
+		    PyList_Append(list,s);
+		    Py_DECREF(s);
+		}
+		listitem++;
+	    }
+	}
+    }
+    else
+	Py_Error(PyExc_TypeError,
+		 "expected string or unicode");
+    
+    /* Resize list if necessary */
+    if (listitem < listsize)
+	PyList_SetSlice(list, listitem, listsize, (PyObject*)NULL);
+
+    return list;
+    
+ onError:
+    Py_XDECREF(list);
+    return NULL;
+}
+
+/* methods */
+
+Py_C_Function( mxCharSet_contains,
+	       ".contains(char)\n\n"
+	       )
+{
+    PyObject *chr;
+    int rc;
+
+    Py_GetArg("O:CharSet.contains", chr);
+    
+    rc = mxCharSet_Contains(self, chr);
+    if (rc < 0)
+	goto onError;
+    return PyInt_FromLong(rc);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxCharSet_search,
+	       ".search(text[, direction=1, start=0, stop=len(text)])\n\n"
+	       )
+{
+    PyObject *text;
+    PyObject *view = NULL;
+    int direction = 1;
+    Py_ssize_t start = 0, stop = PY_SSIZE_T_MAX;
+    Py_ssize_t rc;
+
+    Py_Get4Args("O|inn:CharSet.search", text, direction, start, stop);
+    
+    view = mxTextTools_AsText(text);
+    if (view == NULL)
+	goto onError;
+    rc = mxCharSet_Search(self, view, start, stop, direction);
+    Py_DECREF(view);
+    if (rc == -1)
+	Py_ReturnNone();
+    if (rc < -1)
+	goto onError;
+    return PyLong_FromSsize_t(rc);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxCharSet_match,
+	       ".match(text[, direction=1, start=0, stop=len(text)])\n\n"
+	       )
+{
+    PyObject *text;
+    PyObject *view = NULL;
+    int direction = 1;
+    Py_ssize_t start = 0, stop = PY_SSIZE_T_MAX;
+    Py_ssize_t rc;
+
+    Py_Get4Args("O|inn:CharSet.match", text, direction, start, stop);
+    
+    view = mxTextTools_AsText(text);
+    if (view == NULL)
+	goto onError;
+    rc = mxCharSet_Match(self, view, start, stop, direction);
+    Py_DECREF(view);
+    if (rc < 0)
+	goto onError;
+    return PyLong_FromSsize_t(rc);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxCharSet_split,
+	       ".split(text[, start=0, stop=len(text)])\n\n"
+	       )
+{
+    PyObject *text;
+    PyObject *view = NULL;
+    PyObject *list;
+    Py_ssize_t start = 0, stop = PY_SSIZE_T_MAX;
+
+    Py_Get3Args("O|nn:CharSet.split", text, start, stop);
+    
+    view = mxTextTools_AsText(text);
+    if (view == NULL)
+	goto onError;
+    list = mxCharSet_Split(self, view, start, stop, 0);
+    Py_DECREF(view);
+    return list;
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxCharSet_splitx,
+	       ".splitx(text[, start=0, stop=len(text)])\n\n"
+	       )
+{
+    PyObject *text;
+    PyObject *view = NULL;
+    PyObject *list;
+    Py_ssize_t start = 0, stop = PY_SSIZE_T_MAX;
+
+    Py_Get3Args("O|nn:CharSet.splitx", text, start, stop);
+    
+    view = mxTextTools_AsText(text);
+    if (view == NULL)
+	goto onError;
+    list = mxCharSet_Split(self, view, start, stop, 1);
+    Py_DECREF(view);
+    return list;
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxCharSet_strip,
+	       ".strip(text[, where=0, start=0, stop=len(text)])\n\n"
+	       )
+{
+    PyObject *text;
+    PyObject *view = NULL;
+    PyObject *stripped;
+    Py_ssize_t where = 0;
+    Py_ssize_t start = 0, stop = PY_SSIZE_T_MAX;
+
+    Py_Get4Args("O|nnn:CharSet.strip", text, where, start, stop);
+    
+    view = mxTextTools_AsText(text);
+    if (view == NULL)
+	goto onError;
+    stripped = mxCharSet_Strip(self, view, start, stop, where);
+    Py_DECREF(view);
+    return stripped;
+
+ onError:
+    return NULL;
+}
+
+#ifdef COPY_PROTOCOL
+Py_C_Function( mxCharSet_copy,
+	       "copy([memo])\n\n"
+	       "Return a new reference for the instance. This function\n"
+	       "is used for the copy-protocol. Real copying doesn't take\n"
+	       "place, since the instances are immutable.")
+{
+    PyObject *memo;
+    
+    Py_GetArg("|O",memo);
+    Py_INCREF(cs);
+    return (PyObject *)cs;
+ onError:
+    return NULL;
+}
+#endif
+
+#undef cs
+
+/* --- slots --- */
+
+static
+PyObject *mxCharSet_Repr(mxCharSetObject *self)
+{
+    PyObject *v;
+    char t[500], *reprstr;
+
+    v = PyObject_Repr(self->definition);
+    if (v == NULL)
+	return NULL;
+    reprstr = (char *)PyUnicode_AsUTF8(v);
+    if (reprstr == NULL) {
+	Py_DECREF(v);
+	return NULL;
+    }
+    snprintf(t, sizeof(t), "<Character Set object for %.400s at 0x%lx>",
+	    reprstr, (long)self);
+    Py_DECREF(v);
+    return PyUnicode_FromString(t);
+}
+
+/* Python Type Tables */
+
+static
+PySequenceMethods mxCharSet_TypeAsSequence = {
+    (lenfunc)0,                         /*sq_length*/
+    (binaryfunc)0,                      /*sq_concat*/
+    (ssizeargfunc)0,                    /*sq_repeat*/
+    (ssizeargfunc)0,                    /*sq_item*/
+    (ssizessizeargfunc)0,               /*sq_slice*/
+    (ssizeobjargproc)0,                 /*sq_ass_item*/
+    (ssizessizeobjargproc)0,            /*sq_ass_slice*/
+    (objobjproc)mxCharSet_Contains,     /*sq_contains*/
+};
+
+static
+PyMemberDef mxCharSet_Members[] = {
+    {"definition",T_OBJECT_EX,offsetof(mxCharSetObject,definition),READONLY,"Definition"},
+    {NULL}
+};
+
+static
+PyMethodDef mxCharSet_Methods[] =
+{   
+    Py_MethodListEntry("contains",mxCharSet_contains),
+    Py_MethodListEntry("search",mxCharSet_search),
+    Py_MethodListEntry("match",mxCharSet_match),
+    Py_MethodListEntry("strip",mxCharSet_strip),
+    Py_MethodListEntry("split",mxCharSet_split),
+    Py_MethodListEntry("splitx",mxCharSet_splitx),
+#ifdef COPY_PROTOCOL
+    Py_MethodListEntry("__deepcopy__",mxCharSet_copy),
+    Py_MethodListEntry("__copy__",mxCharSet_copy),
+#endif
+    {NULL,NULL} /* end of list */
+};
+
+PyTypeObject mxCharSet_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)      /* init at startup ! */
+    "Character Set",                    /* tp_name */
+    sizeof(mxCharSetObject),            /* tp_basicsize */
+    0,                                  /* tp_itemsize */
+    /* methods */
+    (destructor)mxCharSet_Free,         /* tp_dealloc */
+#if PY_VERSION_HEX >= 0x03080000
+    0,                                  /* tp_vectorcall_offset */
+#else
+    (printfunc)0,                       /* tp_print */
+#endif
+    (getattrfunc)0,                     /* tp_getattr */
+    (setattrfunc)0,                     /* tp_setattr */
+#if PY_VERSION_HEX >= 0x03050000
+    0,                                  /* tp_as_async */
+#else
+    0,                                  /* tp_reserved */
+#endif
+    (reprfunc)mxCharSet_Repr,           /* tp_repr */
+    0,                                  /* tp_as_number */
+    &mxCharSet_TypeAsSequence,          /* tp_as_sequence */
+    0,                                  /* tp_as_mapping */
+    (hashfunc)0,                        /* tp_hash */
+    (ternaryfunc)0,                     /* tp_call */
+    (reprfunc)0,                        /* tp_str */
+    (getattrofunc)0,                    /* tp_getattro */
+    (setattrofunc)0,                    /* tp_setattro */
+    0,                                  /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                 /* tp_flags */
+    (char*) 0,                          /* tp_doc */
+    0,                                  /* tp_traverse */
+    0,                                  /* tp_clear */
+    0,                                  /* tp_richcompare */
+    0,                                  /* tp_weaklistoffset */
+    0,                                  /* tp_iter */
+    0,                                  /* tp_iternext */
+    mxCharSet_Methods,                  /* tp_methods */
+    mxCharSet_Members,                  /* tp_members */
+};
+
+/* --- Tag Table Object ------------------------------------------------*/
+
+PyObject *mxTagTable_New(PyObject *definition,
+			 int tabletype,
+			 int cacheable);
+
+PyObject *mxTagTable_NewEncoded(PyObject *definition,
+				PyObject *encoding,
+				int cacheable);
+
+/* internal APIs */
+
+static
+PyObject *tc_get_item(register PyObject *obj,
+		      register Py_ssize_t i)
+{
+    if (PyTuple_Check(obj)) {
+	if (i < 0 || i >= PyTuple_GET_SIZE(obj))
+	    return NULL;
+	return PyTuple_GET_ITEM(obj, i);
+    }
+    else if (PyList_Check(obj)) {
+	if (i < 0 || i >= PyList_GET_SIZE(obj))
+	    return NULL;
+	return PyList_GET_ITEM(obj, i);
+    }
+    else
+	return NULL;
+}
+
+static
+Py_ssize_t tc_length(register PyObject *obj)
+{
+    if (obj == NULL)
+	return -1;
+    else if (PyTuple_Check(obj))
+	return PyTuple_GET_SIZE(obj);
+    else if (PyList_Check(obj))
+	return PyList_GET_SIZE(obj);
+    else 
+	return -1;
+}
+
+/* Add a jump target to the jump dictionary */
+
+static
+Py_ssize_t tc_add_jumptarget(PyObject *jumpdict,
+		      PyObject *targetname,
+		      Py_ssize_t index)
+{
+    PyObject *v;
+    
+    v = PyDict_GetItem(jumpdict, targetname);
+    if (v != NULL)
+	Py_ErrorWithArg(PyExc_TypeError,
+			"tag table entry %d: "
+			"jump target already defined", (unsigned int) index);
+    v = PyInt_FromLong(index);
+    if (v == NULL)
+	goto onError;
+    if (PyDict_SetItem(jumpdict, targetname, v))
+	goto onError;
+    Py_DECREF(v);
+    return 0;
+    
+ onError:
+    return -1;
+}
+
+/* Convert a string command argument to either an 8-bit string or
+   Unicode depending on the tabletype.
+
+   For encoded tables (encoding != NULL), Unicode patterns are encoded
+   to bytes using the specified encoding. */
+
+static
+PyObject *tc_convert_string_arg(PyObject *arg,
+				Py_ssize_t tableposition,
+				int tabletype,
+				const char *encoding)
+{
+    /* Encoded mode: convert Unicode to bytes using specified encoding */
+    if (encoding != NULL) {
+	if (PyString_Check(arg)) {
+	    /* Bytes - keep as-is. Assume they're already in the right encoding
+	       or the user knows what they're doing. */
+	    return arg;
+	}
+	else if (PyUnicode_Check(arg)) {
+	    /* Encode Unicode to bytes using the specified encoding */
+	    PyObject *encoded = PyUnicode_AsEncodedString(arg, encoding, "strict");
+	    if (encoded == NULL) {
+		/* PyUnicode_AsEncodedString already set the exception.
+		   Note: we don't DECREF arg here - the caller owns it and will
+		   clean up. If we DECREF'd here and returned NULL, the caller's
+		   error handler would try to DECREF again causing a double-free. */
+		goto onError;
+	    }
+	    Py_DECREF(arg);  /* Release the original Unicode object */
+	    return encoded;
+	}
+	else {
+	    Py_ErrorWithArg(PyExc_TypeError,
+			    "tag table entry %d: "
+			    "command argument must be a "
+			    "string or unicode", (unsigned int)tableposition);
+	}
+    }
+
+    /* Convert to strings (original STRINGTYPE behavior) */
+    else if (tabletype == MXTAGTABLE_STRINGTYPE) {
+	if (PyString_Check(arg))
+	    return arg;
+	else if (PyUnicode_Check(arg)) {
+	    Py_DECREF(arg);
+	    arg = PyUnicode_AsEncodedString(arg,
+					    NULL,
+					    NULL);
+	    if (arg == NULL)
+		Py_ErrorWithArg(PyExc_TypeError,
+				"tag table entry %d: "
+				"conversion from Unicode to "
+				"string failed", (unsigned int)tableposition);
+	}
+	else
+	    Py_ErrorWithArg(PyExc_TypeError,
+			    "tag table entry %d: "
+			    "command argument must be a "
+			    "string or unicode", (unsigned int)tableposition);
+    }
+
+    /* Convert to Unicode */
+    else if (tabletype == MXTAGTABLE_UNICODETYPE) {
+	if (PyUnicode_Check(arg))
+	    return arg;
+	else if (PyString_Check(arg)) {
+	    Py_DECREF(arg);
+	    arg = PyUnicode_Decode(PyString_AS_STRING(arg),
+				    PyString_GET_SIZE(arg),
+				    NULL,
+				    NULL);
+	    if (arg == NULL)
+		Py_ErrorWithArg(PyExc_TypeError,
+				"tag table entry %d: "
+				"conversion from string to "
+				"Unicode failed", (unsigned int)tableposition);
+	}
+	else
+	    Py_ErrorWithArg(PyExc_TypeError,
+			    "tag table entry %d: "
+			    "command argument must be a "
+			    "string or unicode", (unsigned int)tableposition);
+    }
+
+    else
+	Py_Error(mxTextTools_Error,
+		 "unsupported table type");
+
+    return arg;
+
+ onError:
+    return NULL;
+}
+
+/* Convert a CharSet command argument for the tabletype.
+
+   CharSets defined by a Unicode string hold code points. Bytes tables
+   (other than UTF-8 encoded ones, which decode the text) look up
+   single bytes, so, as for the string arguments of AllIn & Co., the
+   members are encoded -- using the table's encoding, UTF-8 by default
+   -- and a CharSet of the resulting bytes is used instead. */
+
+static
+PyObject *tc_convert_charset_arg(PyObject *arg,
+				 Py_ssize_t tableposition,
+				 int tabletype,
+				 const char *encoding)
+{
+    mxCharSetObject *cs = (mxCharSetObject *)arg;
+    Py_UCS4 *members = NULL;
+    PyObject *text = NULL, *encoded = NULL, *definition = NULL;
+    unsigned char bitmap[STRING_CHARSET_BITMAP_SIZE];
+    char def[1 + 4 * STRING_CHARSET_SIZE], *p;
+    Py_ssize_t size, i, k;
+    Py_UCS4 ch;
+    unsigned char *bytes;
+    int low, high;
+
+    if (tabletype != MXTAGTABLE_STRINGTYPE ||
+	cs->mode != MXCHARSET_UCS2MODE ||
+	(encoding != NULL && strcmp(encoding, "utf-8") == 0))
+	return arg;
+
+    /* Collect the members, ignoring a negation */
+    size = 0;
+    for (ch = 0; ch < UNICODE_CHARSET_SIZE; ch++)
+	if (mxCharSet_Lookup(cs, ch) != cs->negative)
+	    size++;
+    for (k = 0; k < cs->nranges; k++)
+	size += cs->ranges[2*k + 1] - cs->ranges[2*k] + 1;
+    members = (Py_UCS4 *)PyMem_Malloc((size + 1) * sizeof(Py_UCS4));
+    if (members == NULL) {
+	PyErr_NoMemory();
+	goto onError;
+    }
+    i = 0;
+    for (ch = 0; ch < UNICODE_CHARSET_SIZE; ch++)
+	if (mxCharSet_Lookup(cs, ch) != cs->negative)
+	    members[i++] = ch;
+    for (k = 0; k < cs->nranges; k++)
+	for (ch = cs->ranges[2*k]; ch <= cs->ranges[2*k + 1]; ch++)
+	    members[i++] = ch;
+    text = PyUnicode_FromKindAndData(PyUnicode_4BYTE_KIND, members, size);
+    if (text == NULL)
+	goto onError;
+    encoded = PyUnicode_AsEncodedString(text, encoding, "strict");
+    if (encoded == NULL) {
+	if (encoding != NULL)
+	    goto onError;
+	PyErr_Clear();
+	Py_ErrorWithArg(PyExc_TypeError,
+			"tag table entry %d: "
+			"conversion from Unicode to "
+			"string failed", (unsigned int)tableposition);
+    }
+
+    /* Bitmap of the bytes */
+    memset(bitmap, 0, sizeof(bitmap));
+    bytes = (unsigned char *)PyString_AS_STRING(encoded);
+    for (i = 0; i < PyString_GET_SIZE(encoded); i++)
+	bitmap[bytes[i] >> 3] |= 1 << (bytes[i] & 7);
+
+    /* Write it as a definition: runs of bytes become ranges, "\\"
+       is a backslash and "\" keeps a "-" from ending a range and a
+       leading "^" from negating the set */
+    p = def;
+    if (cs->negative)
+	*p++ = '^';
+    for (low = 0; low < STRING_CHARSET_SIZE; low = high + 1) {
+	if (!(bitmap[low >> 3] & (1 << (low & 7)))) {
+	    high = low;
+	    continue;
+	}
+	for (high = low;
+	     high + 1 < STRING_CHARSET_SIZE &&
+		 (bitmap[(high + 1) >> 3] & (1 << ((high + 1) & 7)));
+	     high++)
+	    ;
+	if (low == '\\') {
+	    *p++ = '\\';
+	    *p++ = '\\';
+	    if (low == high)
+		continue;
+	    low++;
+	}
+	if (low == '-' || low == '^')
+	    *p++ = '\\';
+	*p++ = (char)low;
+	if (high > low) {
+	    *p++ = '-';
+	    *p++ = (char)high;
+	}
+    }
+    definition = PyString_FromStringAndSize(def, p - def);
+    if (definition == NULL)
+	goto onError;
+
+    PyMem_Free(members);
+    Py_DECREF(text);
+    Py_DECREF(encoded);
+    Py_DECREF(arg);
+    arg = mxCharSet_New(definition);
+    Py_DECREF(definition);
+    return arg;
+
+ onError:
+    if (members)
+	PyMem_Free(members);
+    Py_XDECREF(text);
+    Py_XDECREF(encoded);
+    return NULL;
+}
+
+/* Check and convert a Dispatch command argument for the tabletype.
+
+   The argument is a tuple of (CharSet, jump) pairs with positive
+   jumps. The CharSets are converted as for the CharSet commands;
+   sets which overlap after encoding are left as they are, the engine
+   treats a character found in more than one set as unclassified. */
+
+static
+PyObject *tc_convert_dispatch_arg(PyObject *arg,
+				  Py_ssize_t tableposition,
+				  int tabletype,
+				  const char *encoding)
+{
+    PyObject *pairs = NULL, *pair, *charset, *jump, *v;
+    Py_ssize_t i, size;
+
+    Py_AssertWithArg(PyTuple_Check(arg),
+		     PyExc_TypeError,
+		     "tag table entry %d: "
+		     "Dispatch command argument must be a tuple "
+		     "of (CharSet, jump) pairs", (unsigned int)tableposition);
+    size = PyTuple_GET_SIZE(arg);
+    pairs = PyTuple_New(size);
+    if (pairs == NULL)
+	goto onError;
+    for (i = 0; i < size; i++) {
+	pair = PyTuple_GET_ITEM(arg, i);
+	Py_AssertWithArg(PyTuple_Check(pair) &&
+			 PyTuple_GET_SIZE(pair) == 2 &&
+			 mxCharSet_Check(PyTuple_GET_ITEM(pair, 0)) &&
+			 PyInt_Check(PyTuple_GET_ITEM(pair, 1)) &&
+			 PyInt_AS_LONG(PyTuple_GET_ITEM(pair, 1)) > 0,
+			 PyExc_TypeError,
+			 "tag table entry %d: "
+			 "Dispatch command argument must be a tuple "
+			 "of (CharSet, jump) pairs", (unsigned int)tableposition);
+	jump = PyTuple_GET_ITEM(pair, 1);
+	charset = PyTuple_GET_ITEM(pair, 0);
+	Py_INCREF(charset);
+	v = tc_convert_charset_arg(charset, tableposition,
+				   tabletype, encoding);
+	if (v == NULL) {
+	    Py_DECREF(charset);
+	    goto onError;
+	}
+	charset = v;
+	Py_INCREF(jump);
+	v = PyTuple_New(2);
+	if (v == NULL) {
+	    Py_DECREF(charset);
+	    Py_DECREF(jump);
+	    goto onError;
+	}
+	PyTuple_SET_ITEM(v, 0, charset);
+	PyTuple_SET_ITEM(v, 1, jump);
+	PyTuple_SET_ITEM(pairs, i, v);
+    }
+    Py_DECREF(arg);
+    return pairs;
+
+ onError:
+    Py_XDECREF(pairs);
+    return NULL;
+}
+
+/* Build trie from the words of a (converted) WordInList argument:
+   the case-sensitive words if folded is 0, the case-insensitive ones
+   with their ASCII letters lowered otherwise. The words are first
+   inserted into a trie of sorted sibling lists, which is then laid
+   out breadth-first so that the children of each node are adjacent. */
+
+static
+int tc_build_word_trie(mxWordTrie *trie,
+		       PyObject *words,
+		       int folded)
+{
+    Py_ssize_t allocated = 16, nnodes = 1, w, j, size;
+    Py_ssize_t node, child, previous, head, tail;
+    Py_UCS4 *keys = NULL, key;
+    Py_ssize_t *children = NULL, *next = NULL, *word = NULL, *queue = NULL;
+
+    keys = (Py_UCS4 *)PyMem_Malloc(allocated * sizeof(Py_UCS4));
+    children = (Py_ssize_t *)PyMem_Malloc(allocated * sizeof(Py_ssize_t));
+    next = (Py_ssize_t *)PyMem_Malloc(allocated * sizeof(Py_ssize_t));
+    word = (Py_ssize_t *)PyMem_Malloc(allocated * sizeof(Py_ssize_t));
+    if (keys == NULL || children == NULL || next == NULL || word == NULL)
+	goto onNoMemory;
+    keys[0] = 0;
+    children[0] = next[0] = word[0] = -1;
+
+    for (w = 0; w < PyTuple_GET_SIZE(words); w++) {
+	PyObject *value = PyTuple_GET_ITEM(words, w);
+
+	if (PyTuple_Check(value) != folded)
+	    continue;
+	if (folded)
+	    value = PyTuple_GET_ITEM(value, 0);
+	if (PyString_Check(value))
+	    size = PyString_GET_SIZE(value);
+	else
+	    size = PyUnicode_GET_LENGTH(value);
+	node = 0;
+	for (j = 0; j < size; j++) {
+	    if (PyString_Check(value))
+		key = ((unsigned char *)PyString_AS_STRING(value))[j];
+	    else
+		key = PyUnicode_READ_CHAR(value, j);
+	    if (folded && key >= 'A' && key <= 'Z')
+		key += 'a' - 'A';
+	    previous = -1;
+	    for (child = children[node];
+		 child >= 0 && keys[child] < key;
+		 child = next[child])
+		previous = child;
+	    if (child < 0 || keys[child] != key) {
+		if (nnodes == allocated) {
+		    allocated *= 2;
+		    if (!PyMem_Resize(keys, Py_UCS4, allocated) ||
+			!PyMem_Resize(children, Py_ssize_t, allocated) ||
+			!PyMem_Resize(next, Py_ssize_t, allocated) ||
+			!PyMem_Resize(word, Py_ssize_t, allocated))
+			goto onNoMemory;
+		}
+		keys[nnodes] = key;
+		children[nnodes] = word[nnodes] = -1;
+		next[nnodes] = child;
+		if (previous < 0)
+		    children[node] = nnodes;
+		else
+		    next[previous] = nnodes;
+		child = nnodes++;
+	    }
+	    node = child;
+	}
+	if (word[node] < 0)
+	    word[node] = w;
+    }
+
+    trie->nnodes = nnodes;
+    trie->keys = (Py_UCS4 *)PyMem_Malloc(nnodes * sizeof(Py_UCS4));
+    trie->first = (Py_ssize_t *)PyMem_Malloc(nnodes * sizeof(Py_ssize_t));
+    trie->count = (Py_ssize_t *)PyMem_Malloc(nnodes * sizeof(Py_ssize_t));
+    trie->word = (Py_ssize_t *)PyMem_Malloc(nnodes * sizeof(Py_ssize_t));
+    if (trie->keys == NULL || trie->first == NULL ||
+	trie->count == NULL || trie->word == NULL)
+	goto onNoMemory;
+
+    /* The breadth-first order, queue holds the original indices */
+    queue = (Py_ssize_t *)PyMem_Malloc(nnodes * sizeof(Py_ssize_t));
+    if (queue == NULL)
+	goto onNoMemory;
+    trie->keys[0] = 0;
+    queue[0] = 0;
+    for (head = 0, tail = 1; head < tail; head++) {
+	node = queue[head];
+	trie->first[head] = tail;
+	trie->count[head] = 0;
+	trie->word[head] = word[node];
+	for (child = children[node]; child >= 0; child = next[child]) {
+	    trie->keys[tail] = keys[child];
+	    queue[tail++] = child;
+	    trie->count[head]++;
+	}
+    }
+
+    PyMem_Free(queue);
+    PyMem_Free(keys);
+    PyMem_Free(children);
+    PyMem_Free(next);
+    PyMem_Free(word);
+    return 0;
+
+ onNoMemory:
+    PyMem_Free(queue);
+    PyMem_Free(keys);
+    PyMem_Free(children);
+    PyMem_Free(next);
+    PyMem_Free(word);
+    PyErr_NoMemory();
+    return -1;
+}
+
+static
+void tc_free_word_tries(mxWordTrie *tries)
+{
+    int i;
+
+    for (i = 0; i < 2; i++) {
+	PyMem_Free(tries[i].keys);
+	PyMem_Free(tries[i].first);
+	PyMem_Free(tries[i].count);
+	PyMem_Free(tries[i].word);
+    }
+    PyMem_Free(tries);
+}
+
+/* Check and convert a WordInList command argument for the tabletype
+   and build the tries used for matching it.
+
+   The argument is a tuple of words, each a string or a (string,
+   ignorecase) tuple; case-insensitive words must be ASCII. The
+   words are converted as for Word. */
+
+static
+PyObject *tc_convert_wordlist_arg(PyObject *arg,
+				  Py_ssize_t tableposition,
+				  int tabletype,
+				  const char *encoding,
+				  void **data)
+{
+    PyObject *words = NULL, *item, *value, *v;
+    mxWordTrie *tries = NULL;
+    Py_ssize_t i, j, size;
+    int ignorecase;
+
+    Py_AssertWithArg(PyTuple_Check(arg),
+		     PyExc_TypeError,
+		     "tag table entry %d: "
+		     "WordInList command argument must be a tuple "
+		     "of words", (unsigned int)tableposition);
+    words = PyTuple_New(PyTuple_GET_SIZE(arg));
+    if (words == NULL)
+	goto onError;
+    for (i = 0; i < PyTuple_GET_SIZE(arg); i++) {
+	item = PyTuple_GET_ITEM(arg, i);
+	ignorecase = PyTuple_Check(item);
+	if (ignorecase) {
+	    Py_AssertWithArg(PyTuple_GET_SIZE(item) == 2 &&
+			     PyInt_Check(PyTuple_GET_ITEM(item, 1)),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "WordInList words must be strings or "
+			     "(string, ignorecase) tuples",
+			     (unsigned int)tableposition);
+	    ignorecase = PyInt_AS_LONG(PyTuple_GET_ITEM(item, 1)) != 0;
+	    value = PyTuple_GET_ITEM(item, 0);
+	}
+	else
+	    value = item;
+	Py_INCREF(value);
+	value = tc_convert_string_arg(value, tableposition,
+				      tabletype, encoding);
+	if (value == NULL)
+	    goto onError;
+	if (ignorecase) {
+	    if (PyString_Check(value))
+		size = PyString_GET_SIZE(value);
+	    else
+		size = PyUnicode_GET_LENGTH(value);
+	    for (j = 0; j < size; j++)
+		if ((PyString_Check(value) ?
+		     ((unsigned char *)PyString_AS_STRING(value))[j] :
+		     PyUnicode_READ_CHAR(value, j)) >= 0x80)
+		    break;
+	    if (j < size) {
+		Py_DECREF(value);
+		Py_ErrorWithArg(PyExc_TypeError,
+				"tag table entry %d: "
+				"case-insensitive WordInList words must "
+				"be ASCII", (unsigned int)tableposition);
+	    }
+	    v = Py_BuildValue("(Ni)", value, 1);
+	    if (v == NULL)
+		goto onError;
+	    value = v;
+	}
+	PyTuple_SET_ITEM(words, i, value);
+    }
+
+    tries = (mxWordTrie *)PyMem_Malloc(2 * sizeof(mxWordTrie));
+    if (tries == NULL) {
+	PyErr_NoMemory();
+	goto onError;
+    }
+    memset(tries, 0, 2 * sizeof(mxWordTrie));
+    if (tc_build_word_trie(&tries[0], words, 0) ||
+	tc_build_word_trie(&tries[1], words, 1))
+	goto onError;
+
+    *data = tries;
+    Py_DECREF(arg);
+    return words;
+
+ onError:
+    if (tries)
+	tc_free_word_tries(tries);
+    Py_XDECREF(words);
+    return NULL;
+}
+
+/* Convert the words of a MultiTextSearch argument of the sWordStart,
+   sWordEnd and sFindWord commands for the tabletype as for Word; a
+   new search object is created if any of them changed. */
+
+static
+PyObject *tc_convert_multisearch_arg(PyObject *arg,
+				     Py_ssize_t tableposition,
+				     int tabletype,
+				     const char *encoding)
+{
+    PyObject *match = ((mxMultiTextSearchObject *)arg)->match;
+    PyObject *words, *value, *so;
+    Py_ssize_t i;
+    int changed = 0;
+
+    words = PyTuple_New(PyTuple_GET_SIZE(match));
+    if (words == NULL)
+	return NULL;
+    for (i = 0; i < PyTuple_GET_SIZE(match); i++) {
+	value = PyTuple_GET_ITEM(match, i);
+	Py_INCREF(value);
+	value = tc_convert_string_arg(value, tableposition,
+				      tabletype, encoding);
+	if (value == NULL) {
+	    Py_DECREF(words);
+	    return NULL;
+	}
+	changed |= value != PyTuple_GET_ITEM(match, i);
+	PyTuple_SET_ITEM(words, i, value);
+    }
+    if (!changed) {
+	Py_DECREF(words);
+	return arg;
+    }
+    so = mxMultiTextSearch_New(words);
+    Py_DECREF(words);
+    if (so == NULL)
+	return NULL;
+    Py_DECREF(arg);
+    return so;
+}
+
+/* Cleanup any references in the tag table. */
+
+static
+int tc_cleanup(mxTagTableObject *tagtable)
+{
+    Py_ssize_t i;
+    for (i = 0; i < tagtable->numentries; i++) {
+	mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+
+	Py_XDECREF(tagtableentry->tagobj);
+	tagtableentry->tagobj = NULL;
+	Py_XDECREF(tagtableentry->args);
+	tagtableentry->args = NULL;
+	if (tagtableentry->data != NULL) {
+	    if (tagtableentry->cmd == MATCH_WORDINLIST)
+		tc_free_word_tries((mxWordTrie *)tagtableentry->data);
+	    tagtableentry->data = NULL;
+	}
+    }
+    return 0;
+}
+
+/* Initialize the tag table (this is the actual Tag Table compiler)
+
+   encoding: if not NULL, encode Unicode patterns to this encoding */
+
+static
+int init_tag_table(mxTagTableObject *tagtable,
+		   PyObject *table,
+		   Py_ssize_t size,
+		   int tabletype,
+		   int cacheable,
+		   const char *encoding)
+{
+    Py_ssize_t i;
+    PyObject *entry;
+    Py_ssize_t entry_len;
+    PyObject *tagobj, *command, *args = 0, *je, *jne;
+    PyObject *jumpdict, *v;
+    int secondpass, own_args = 0;
+
+    jumpdict = PyDict_New();
+    if (jumpdict == NULL)
+	return -1;
+
+    /* Reset to all fields to 0 */
+    memset(&tagtable->entry[0], 0, size * sizeof(mxTagTableEntry));
+    
+    /* First pass */
+    secondpass = 0;
+    tagtable->numentries = size;
+    for (i = 0; i < size; i++) {
+	mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+
+	/* Get table entry i and parse it */
 	entry = tc_get_item(table, i);
 	if (entry == NULL) {
 	    Py_ErrorWithArg(PyExc_TypeError,
@@ -2345,671 +3627,2099 @@ int init_tag_table(mxTagTableObject *tagtable,
 			    "not found or not a supported entry type", (unsigned int)i);
 	}
 
-	/* Special handling for jump marks (args is set to the jump
-	   mark string, jump target index is the next table entry) */
-	if (PyString_Check(entry)) {
-	    if (tc_add_jumptarget(jumpdict, entry, i + 1))
-		goto onError;
-	    tagtableentry->tagobj = NULL;
-	    tagtableentry->cmd = MATCH_JUMPTARGET;
-	    tagtableentry->flags = 0;
-	    Py_INCREF(entry);
-	    tagtableentry->args = entry;
-	    tagtableentry->jne = 0;
-	    tagtableentry->je = 1;
-	    continue;
+	/* Special handling for jump marks (args is set to the jump
+	   mark string, jump target index is the next table entry) */
+	if (PyString_Check(entry)) {
+	    if (tc_add_jumptarget(jumpdict, entry, i + 1))
+		goto onError;
+	    tagtableentry->tagobj = NULL;
+	    tagtableentry->cmd = MATCH_JUMPTARGET;
+	    tagtableentry->flags = 0;
+	    Py_INCREF(entry);
+	    tagtableentry->args = entry;
+	    tagtableentry->jne = 0;
+	    tagtableentry->je = 1;
+	    continue;
+	}
+
+	/* Get entry length */
+	entry_len = tc_length(entry);
+	if (entry_len < 3) {
+	    Py_ErrorWithArg(PyExc_TypeError,
+			    "tag table entry %d: "
+			    "expected an entry of the form "
+			    "(tagobj,command,arg[,jne[,je]])", (unsigned int)i);
+	}
+
+	/* Decode entry parts: (tagobj, command, args[, jne[, je]]) */
+	tagobj = tc_get_item(entry, 0);
+	command = tc_get_item(entry, 1);
+	args = tc_get_item(entry, 2);
+	if (entry_len >= 4)
+	    jne = tc_get_item(entry, 3);
+	else
+	    jne = NULL;
+	if (entry_len >= 5) 
+	    je = tc_get_item(entry, 4);
+	else
+	    je = NULL;
+
+	if (tagobj == NULL ||
+	    command == NULL ||
+	    args == NULL ||
+	    (entry_len >= 4 && jne == NULL) ||
+	    (entry_len >= 5 && je == NULL)) {
+	    Py_ErrorWithArg(PyExc_TypeError,
+			    "tag table entry %d: "
+			    "expected an entry of the form "
+			    "(tagobj,command,arg[,jne[,je]])",(unsigned int) i);
+	}
+
+	/* Store tagobj, None gets converted to NULL */
+	if (tagobj != Py_None)
+	    Py_INCREF(tagobj);
+	else
+	    tagobj = NULL;
+	tagtableentry->tagobj = tagobj;
+
+	/* Decode command and flags */
+	Py_AssertWithArg(PyInt_Check(command),
+			 PyExc_TypeError,
+			 "tag table entry %d: "
+			 "command must be an integer",(unsigned int)i);
+	tagtableentry->cmd = PyInt_AS_LONG(command) & 0xFF;
+	tagtableentry->flags = PyInt_AS_LONG(command) - tagtableentry->cmd;
+
+	/* Check command arguments */
+	Py_INCREF(args);
+	own_args = 1;
+
+	switch (tagtableentry->cmd) {
+
+	case MATCH_JUMP: /* == MATCH_FAIL */
+	case MATCH_EOF:
+	case MATCH_LOOP:
+	    /* args is ignored */
+	    break;
+	
+	case MATCH_SKIP:
+	case MATCH_MOVE:
+	case MATCH_LOOPCONTROL:
+	    Py_AssertWithArg(PyInt_Check(args),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "Skip|Move|LoopControl command argument "
+			     "must be an integer", (unsigned int)i);
+	    break;
+	
+	case MATCH_JUMPTARGET:
+	    Py_AssertWithArg(PyString_Check(args),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "JumpMark command argument must be a string",(unsigned int)i);
+	    if (tc_add_jumptarget(jumpdict, args, i + 1))
+		goto onError;
+	    break;
+
+	case MATCH_ALLIN:
+	case MATCH_ALLNOTIN:
+	case MATCH_IS:
+	case MATCH_ISIN:
+	case MATCH_ISNOTIN:
+	case MATCH_WORD:
+	case MATCH_WORDSTART:
+	case MATCH_WORDEND:
+	    args = tc_convert_string_arg(args, i, tabletype, encoding);
+	    if (args == NULL)
+		goto onError;
+	    break;
+
+	case MATCH_WORDINLIST:
+	    args = tc_convert_wordlist_arg(args, i, tabletype, encoding,
+					   &tagtableentry->data);
+	    if (args == NULL)
+		goto onError;
+	    break;
+
+	case MATCH_ALLINSET:
+	case MATCH_ISINSET:
+	    Py_AssertWithArg(PyString_Check(args) && 
+			     PyString_GET_SIZE(args) == 32,
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "AllInSet|IsInSet command argument must "
+			     "be a set() string",(unsigned int)i);
+	    break;
+
+	case MATCH_ALLINCHARSET:
+	case MATCH_ISINCHARSET:
+	    Py_AssertWithArg(mxCharSet_Check(args),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "AllInCharSet|IsInCharSet command argument must "
+			     "be a CharSet instance",(unsigned int)i);
+	    args = tc_convert_charset_arg(args, i, tabletype, encoding);
+	    if (args == NULL)
+		goto onError;
+	    break;
+
+	case MATCH_DISPATCH:
+	    args = tc_convert_dispatch_arg(args, i, tabletype, encoding);
+	    if (args == NULL)
+		goto onError;
+	    break;
+
+	case MATCH_SWORDSTART: /* == MATCH_NOWORD */
+	case MATCH_SWORDEND:
+	case MATCH_SFINDWORD:
+	    Py_AssertWithArg(mxTextSearch_Check(args) ||
+			     mxMultiTextSearch_Check(args),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "sWordStart|sWordEnd|sFindWord command "
+			     "argument must be a TextSearch or "
+			     "MultiTextSearch search object",(unsigned int)i);
+	    if (mxMultiTextSearch_Check(args)) {
+		args = tc_convert_multisearch_arg(args, i, tabletype,
+						  encoding);
+		if (args == NULL)
+		    goto onError;
+	    }
+	    break;
+	
+	case MATCH_TABLE:
+	case MATCH_SUBTABLE:
+	    Py_AssertWithArg(mxTagTable_Check(args) ||
+			     PyTuple_Check(args) ||
+			     PyList_Check(args) ||
+			     (PyInt_Check(args) && 
+			      PyInt_AS_LONG(args) == MATCH_THISTABLE),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "Table|SubTable command argument "
+			     "must be a tag table tuple/object or "
+			     "ThisTable", (unsigned int)i);
+	    /* XXX We shouldn't recursively compile tag table tuples here
+		   because this will slow down the compile process
+		   too much and it's not clear whether this particular
+		   table will ever be used during tagging.
+	    */
+	    if (!mxTagTable_Check(args) && !PyInt_Check(args)) {
+		Py_DECREF(args);
+		/* Use encoded version if encoding is set, otherwise use standard */
+		if (encoding != NULL) {
+		    args = mxTagTable_NewEncoded(args, tagtable->encodingname,
+						 cacheable);
+		}
+		else {
+		    args = mxTagTable_New(args, tabletype, cacheable);
+		}
+		if (args == NULL)
+		    goto onError;
+	    }
+	    break;
+	
+	case MATCH_TABLEINLIST:
+	case MATCH_SUBTABLEINLIST:
+	    Py_AssertWithArg(PyTuple_Check(args) &&
+			     PyTuple_GET_SIZE(args) == 2 &&
+			     PyList_Check(PyTuple_GET_ITEM(args, 0)) &&
+			     PyInt_Check(PyTuple_GET_ITEM(args, 1)),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "TableInList|SubTableInList command argument "
+			     "must be a 2-tuple (list, integer)",
+			     (unsigned int)i);
+	    break;
+
+	case MATCH_CALL:
+	    Py_AssertWithArg(PyCallable_Check(args),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "Call command argument "
+			     "must be a callable object",
+			     (unsigned int)i);
+	    break;
+
+	case MATCH_CALLARG:
+	    Py_AssertWithArg(PyTuple_Check(args) &&
+			     PyTuple_GET_SIZE(args) > 0 &&
+			     PyCallable_Check(PyTuple_GET_ITEM(args, 0)),
+			     PyExc_TypeError,
+			     "tag table entry %d: "
+			     "CallArg command argument "
+			     "must be a tuple (fct,[arg0,arg1,...])",
+			     (unsigned int)i);
+	    break;
+	    
+	default:
+	    Py_ErrorWith2Args(PyExc_TypeError,
+			      "tag table entry %d: "
+			      "unknown command integer: %i", 
+			      (unsigned int)i, tagtableentry->cmd);
+	
+	}
+
+	/* Store command args */
+	tagtableentry->args = args;
+	own_args = 0;
+
+	/* Decode jump offsets */
+	if (jne) {
+	    if (PyInt_Check(jne))
+		tagtableentry->jne = PyInt_AS_LONG(jne);
+	    else if (PyString_Check(jne)) {
+		/* Mark for back-patching */
+		tagtableentry->jne = -424242;
+		secondpass = 1;
+	    }
+	    else
+		Py_ErrorWithArg(PyExc_TypeError,
+				"tag table entry %d: "
+				"jne must be an integer or string", (unsigned int)i);
+	}
+	else
+	    tagtableentry->jne = 0;
+
+	if (je) {
+	    if (PyInt_Check(je))
+		tagtableentry->je = PyInt_AS_LONG(je);
+	    else if (PyString_Check(je)) {
+		/* Mark for back-patching */
+		tagtableentry->je = -424242;
+		secondpass = 1;
+	    }
+	    else
+		Py_ErrorWithArg(PyExc_TypeError,
+				"tag table entry %d: "
+				"je must be an integer or string", (unsigned int)i);
+	}
+	else
+	    tagtableentry->je = 1;
+    }
+
+    /* Second pass (needed to patch string jump targets) */
+    if (secondpass)
+	for (i = 0; i < size; i++) {
+	    mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+
+	    if (tagtableentry->je != -424242 &&
+		tagtableentry->jne != -424242)
+		continue;
+
+	    /* Entry (most probably) needs back-patching */
+	    entry = tc_get_item(table, i);
+	    if (entry == NULL) {
+		Py_ErrorWithArg(PyExc_TypeError,
+				"tag table entry %d: "
+				"unexpected error (not found)", (unsigned int)i);
+	    }
+
+	    /* Get entry length */
+	    entry_len = tc_length(entry);
+	    if (entry_len < 0) {
+		Py_ErrorWithArg(PyExc_TypeError,
+				"tag table entry %d: "
+				"unexpected error (no length)", (unsigned int)i);
+	    }
+
+	    /* Decode jump offsets */
+	    if (entry_len >= 4)
+		jne = tc_get_item(entry, 3);
+	    else
+		jne = NULL;
+	    if (entry_len >= 5) 
+		je = tc_get_item(entry, 4);
+	    else
+		je = NULL;
+
+	    /* Patch jump offsets */
+	    if (jne && PyString_Check(jne)) {
+		v = PyDict_GetItem(jumpdict, jne);
+		if (v == NULL || !PyInt_Check(v))
+		    Py_ErrorWith2Args(PyExc_TypeError,
+				      "tag table entry %d: "
+				      "jne jump target '%s' not found", 
+				      (unsigned int)i, PyString_AS_STRING(jne));
+		tagtableentry->jne = PyInt_AS_LONG(v) - i;
+	    }
+	    if (je && PyString_Check(je)) {
+		v = PyDict_GetItem(jumpdict, je);
+		if (v == NULL || !PyInt_Check(v))
+		    Py_ErrorWith2Args(PyExc_TypeError,
+				      "tag table entry %d: "
+				      "je jump target '%s' not found", 
+				      (unsigned int)i, PyString_AS_STRING(je));
+		tagtableentry->je = PyInt_AS_LONG(v) - i;
+	    }
+	}
+    
+    Py_DECREF(jumpdict);
+    return 0;
+
+ onError:
+    if (own_args && args != NULL) {
+	Py_DECREF(args);
+    }
+    Py_XDECREF(jumpdict);
+    return -1;
+}
+
+/* Return 1 if the entries of tagtable never call back into Python
+   code, so that the table can be run without the GIL by
+   mxTextTools_TaggingEngine_NoGIL(), 0 otherwise. Child tables are
+   checked by mxTagTable_IsCallbackFree(). */
+
+static
+int tc_callbackfree(mxTagTableObject *tagtable)
+{
+    Py_ssize_t i;
+
+    for (i = 0; i < Py_SIZE(tagtable); i++) {
+	mxTagTableEntry *entry = &tagtable->entry[i];
+
+	if (entry->tagobj != NULL &&
+	    (entry->flags & (MATCH_CALLTAG | MATCH_APPENDTAG)))
+	    return 0;
+	switch (entry->cmd) {
+
+	case MATCH_CALL:
+	case MATCH_CALLARG:
+	    return 0;
+
+	case MATCH_SWORDSTART:
+	case MATCH_SWORDEND:
+	case MATCH_SFINDWORD:
+	    {
+		/* Only the plain C search algorithms qualify */
+		mxTextSearchObject *so = (mxTextSearchObject *)entry->args;
+
+		if (mxMultiTextSearch_Check(entry->args))
+		    break;
+		if (PyUnicode_Check(so->match))
+		    break;
+		if (PyBytes_Check(so->match) &&
+		    (so->algorithm == MXTEXTSEARCH_BOYERMOORE ||
+		     so->algorithm == MXTEXTSEARCH_TRIVIAL ||
+		     so->algorithm == MXTEXTSEARCH_TWOWAY))
+		    break;
+		return 0;
+	    }
+	}
+    }
+    return 1;
+}
+
+/* Build the TagTable cache key for definition: (id(definition),
+   tabletype) or (id(definition), tabletype, encoding) for encoded
+   tables. Returns a new reference or NULL in case of an error. */
+
+static
+PyObject *tagtable_cache_key(PyObject *definition,
+			     int tabletype,
+			     PyObject *encoding)
+{
+    PyObject *v, *key;
+
+    key = PyTuple_New(encoding ? 3 : 2);
+    if (key == NULL)
+	goto onError;
+    v = PyInt_FromLong((long) definition);
+    if (v == NULL)
+	goto onError;
+    PyTuple_SET_ITEM(key, 0, v);
+    v = PyInt_FromLong(tabletype);
+    if (v == NULL)
+	goto onError;
+    PyTuple_SET_ITEM(key, 1, v);
+    if (encoding) {
+	Py_INCREF(encoding);
+	PyTuple_SET_ITEM(key, 2, encoding);
+    }
+    return key;
+
+ onError:
+    Py_XDECREF(key);
+    return NULL;
+}
+
+/* Check the cache for an already compiled TagTable for this
+   definition (and encoding, if not NULL).  Return NULL in case of an
+   error, Py_None without INCREF in case no such table was found or
+   the TagTable object. */
+
+static
+PyObject *consult_tagtable_cache(PyObject *definition,
+				 int tabletype,
+				 PyObject *encoding,
+				 int cacheable)
+{
+    PyObject *key, *tt;
+
+    if (!PyTuple_Check(definition) || !cacheable)
+	return Py_None;
+
+    key = tagtable_cache_key(definition, tabletype, encoding);
+    if (key == NULL)
+	goto onError;
+    tt = mxTextTools_TagTables_GetItem(key);
+    Py_DECREF(key);
+    if (tt != NULL)
+	return tt;
+    if (PyErr_Occurred())
+	goto onError;
+    return Py_None;
+
+ onError:
+    return NULL;
+}
+
+/* Adds the compiled tagtable to the cache. Returns -1 in case of an
+   error, 0 on success. */
+
+static
+int add_to_tagtable_cache(PyObject *definition,
+			  int tabletype,
+			  PyObject *encoding,
+			  int cacheable,
+			  PyObject *tagtable)
+{
+    PyObject *key;
+    int rc;
+
+    if (!PyTuple_Check(definition) || !cacheable)
+	return 0;
+    
+    key = tagtable_cache_key(definition, tabletype, encoding);
+    if (key == NULL)
+	goto onError;
+    rc = mxTextTools_TagTables_SetItem(key, tagtable);
+    Py_DECREF(key);
+    if (rc)
+	goto onError;
+    return 0;
+
+ onError:
+    return -1;
+}
+
+/* Return the normalized (codecs.lookup()) name for encoding as new
+   reference, e.g. "utf-8" for "UTF8". Names are looked up only once
+   per spelling. Returns NULL in case of an error, e.g. LookupError
+   for unknown encodings. */
+
+PyObject *mxTextTools_NormalizeEncoding(const char *encoding)
+{
+    PyObject *codecs = NULL, *info = NULL, *name;
+
+    if (mxTextTools_EncodingNames == NULL) {
+	mxTextTools_EncodingNames = PyDict_New();
+	if (mxTextTools_EncodingNames == NULL)
+	    goto onError;
+    }
+    name = PyDict_GetItemString(mxTextTools_EncodingNames, encoding);
+    if (name != NULL) {
+	Py_INCREF(name);
+	return name;
+    }
+
+    codecs = PyImport_ImportModule("codecs");
+    if (codecs == NULL)
+	goto onError;
+    info = PyObject_CallMethod(codecs, "lookup", "s", encoding);
+    if (info == NULL)
+	goto onError;
+    name = PyObject_GetAttrString(info, "name");
+    if (name == NULL)
+	goto onError;
+    Py_Assert(PyUnicode_Check(name),
+	      PyExc_TypeError,
+	      "codec name must be a string");
+    PyUnicode_InternInPlace(&name);
+    if (PyDict_SetItemString(mxTextTools_EncodingNames, encoding, name)) {
+	Py_DECREF(name);
+	goto onError;
+    }
+    Py_DECREF(codecs);
+    Py_DECREF(info);
+    return name;
+
+ onError:
+    Py_XDECREF(codecs);
+    Py_XDECREF(info);
+    return NULL;
+}
+		       
+/* allocation */
+
+PyObject *mxTagTable_New(PyObject *definition,
+			 int tabletype,
+			 int cacheable)
+{
+    mxTagTableObject *tagtable = 0;
+    PyObject *v;
+    Py_ssize_t size;
+
+    /* First, consult the TagTable cache */
+    v = consult_tagtable_cache(definition, tabletype, NULL, cacheable);
+    if (v == NULL)
+	goto onError;
+    else if (v != Py_None)
+	return v;
+
+    size = tc_length(definition);
+    if (size < 0)
+	Py_Error(PyExc_TypeError,
+		 "tag table definition must be a tuple or a list");
+
+    tagtable = PyObject_NEW_VAR(mxTagTableObject, &mxTagTable_Type, size);
+    if (tagtable == NULL)
+	goto onError;
+    if (cacheable) {
+	Py_INCREF(definition);
+	tagtable->definition = definition;
+    }
+    else
+	tagtable->definition = NULL;
+    tagtable->tabletype = tabletype;
+    tagtable->encoding = NULL;
+    tagtable->encodingname = NULL;
+    tagtable->is_multibyte = 0;
+    tagtable->callbackfree = 0;
+    tagtable->nogil = -1;
+
+    /* Compile table ... */
+    if (init_tag_table(tagtable, definition, size, tabletype, cacheable, NULL))
+	goto onError;
+    tagtable->callbackfree = tc_callbackfree(tagtable);
+    tagtable->nogil = -1;
+
+    /* Cache the compiled table if it is cacheable and derived from a
+       tuple */
+    if (add_to_tagtable_cache(definition, tabletype, NULL, cacheable, 
+			      (PyObject *)tagtable))
+	goto onError;
+
+    return (PyObject *)tagtable;
+
+ onError:
+    Py_XDECREF(tagtable);
+    return NULL;
+}
+
+/* Create an encoded tag table - Unicode patterns are encoded to bytes
+   using the specified encoding. This is used for parsing byte streams
+   with a specified encoding (e.g., UTF-8 bytes with Unicode grammars).
+
+   encoding must be a normalized encoding name as returned by
+   mxTextTools_NormalizeEncoding(). Encoded tables are cached under
+   (id(definition), MXTAGTABLE_ENCODEDTYPE, encoding). */
+
+PyObject *mxTagTable_NewEncoded(PyObject *definition,
+				PyObject *encoding,
+				int cacheable)
+{
+    mxTagTableObject *tagtable = 0;
+    PyObject *v;
+    Py_ssize_t size;
+    const char *name;
+
+    name = PyUnicode_AsUTF8(encoding);
+    if (name == NULL)
+	goto onError;
+
+    /* First, consult the TagTable cache */
+    v = consult_tagtable_cache(definition, MXTAGTABLE_ENCODEDTYPE,
+			       encoding, cacheable);
+    if (v == NULL)
+	goto onError;
+    else if (v != Py_None)
+	return v;
+
+    size = tc_length(definition);
+    if (size < 0)
+	Py_Error(PyExc_TypeError,
+		 "tag table definition must be a tuple or a list");
+
+    tagtable = PyObject_NEW_VAR(mxTagTableObject, &mxTagTable_Type, size);
+    if (tagtable == NULL)
+	goto onError;
+
+    if (cacheable) {
+	Py_INCREF(definition);
+	tagtable->definition = definition;
+    }
+    else
+	tagtable->definition = NULL;
+
+    /* Set table type to STRINGTYPE since we're working with bytes,
+       but mark it as encoded so we know the patterns are encoding-aware;
+       the encoding string is owned by encodingname */
+    tagtable->tabletype = MXTAGTABLE_STRINGTYPE;
+    Py_INCREF(encoding);
+    tagtable->encodingname = encoding;
+    tagtable->encoding = name;
+    tagtable->is_multibyte = (strcmp(name, "utf-8") == 0);
+    tagtable->callbackfree = 0;
+    tagtable->nogil = -1;
+
+    /* Compile table with encoding - this encodes Unicode patterns to bytes */
+    if (init_tag_table(tagtable, definition, size, MXTAGTABLE_STRINGTYPE,
+		       cacheable, name))
+	goto onError;
+    tagtable->callbackfree = tc_callbackfree(tagtable);
+    tagtable->nogil = -1;
+
+    /* Cache the compiled table if it is cacheable and derived from a
+       tuple */
+    if (add_to_tagtable_cache(definition, MXTAGTABLE_ENCODEDTYPE, encoding,
+			      cacheable, (PyObject *)tagtable))
+	goto onError;
+
+    return (PyObject *)tagtable;
+
+ onError:
+    Py_XDECREF(tagtable);
+    return NULL;
+}
+
+/* Depth-first search for mxTagTable_IsCallbackFree(); visited holds the
+   addresses of the tables already checked. *final is cleared if the
+   verdict may change later on, i.e. if a TableInList list contains
+   entries which have not been compiled yet. */
+
+static
+int tc_reachable_callbackfree(mxTagTableObject *tagtable,
+			      PyObject *visited,
+			      int *final)
+{
+    Py_ssize_t i;
+    PyObject *v;
+    int rc;
+
+    if (!tagtable->callbackfree)
+	return 0;
+    if (tagtable->nogil >= 0)
+	return tagtable->nogil;
+    v = PyLong_FromVoidPtr(tagtable);
+    if (v == NULL)
+	return -1;
+    rc = PySet_Contains(visited, v);
+    if (rc == 0)
+	rc = PySet_Add(visited, v);
+    else if (rc > 0)
+	/* Already being checked further up */
+	rc = -2;
+    Py_DECREF(v);
+    if (rc == -2)
+	return 1;
+    if (rc < 0)
+	return -1;
+
+    for (i = 0; i < Py_SIZE(tagtable); i++) {
+	mxTagTableEntry *entry = &tagtable->entry[i];
+	PyObject *child = NULL;
+
+	switch (entry->cmd) {
+
+	case MATCH_TABLE:
+	case MATCH_SUBTABLE:
+	    if (mxTagTable_Check(entry->args))
+		child = entry->args;
+	    break;
+
+	case MATCH_TABLEINLIST:
+	case MATCH_SUBTABLEINLIST:
+	    {
+		PyObject *tables = PyTuple_GET_ITEM(entry->args, 0);
+		Py_ssize_t index = PyInt_AS_LONG(PyTuple_GET_ITEM(entry->args, 1));
+
+		if (index < 0 || index >= PyList_GET_SIZE(tables))
+		    return 0;
+		child = PyList_GET_ITEM(tables, index);
+		if (!mxTagTable_Check(child)) {
+		    /* Compiled on first use by the standard engine */
+		    *final = 0;
+		    return 0;
+		}
+	    }
+	    break;
+	}
+	if (child != NULL) {
+	    rc = tc_reachable_callbackfree((mxTagTableObject *)child,
+					   visited, final);
+	    if (rc <= 0)
+		return rc;
+	}
+    }
+    return 1;
+}
+
+int mxTagTable_IsCallbackFree(mxTagTableObject *tagtable)
+{
+    PyObject *visited;
+    int rc, final = 1;
+
+    if (tagtable->nogil >= 0)
+	return tagtable->nogil;
+    if (!tagtable->callbackfree) {
+	tagtable->nogil = 0;
+	return 0;
+    }
+    visited = PySet_New(NULL);
+    if (visited == NULL)
+	return -1;
+    rc = tc_reachable_callbackfree(tagtable, visited, &final);
+    Py_DECREF(visited);
+    if (rc >= 0 && final)
+	tagtable->nogil = rc;
+    return rc;
+}
+
+Py_C_Function( mxTagTable_TagTable,
+	       "TagTable(definition[,cachable=1])\n\n"
+	       )
+{
+    PyObject *definition;
+    int cacheable = 1;
+
+    Py_Get2Args("O|i:TagTable", definition, cacheable);
+    /* For Python 3.3+, default to Unicode table type since Unicode is the primary string type */
+    return mxTagTable_New(definition, MXTAGTABLE_UNICODETYPE, cacheable);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxTagTable_UnicodeTagTable,
+	       "TagTable(definition[,cachable=1])\n\n"
+	       )
+{
+    PyObject *definition;
+    int cacheable = 1;
+
+    Py_Get2Args("O|i:UnicodeTagTable", definition, cacheable);
+    return mxTagTable_New(definition, 1, cacheable);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxTagTable_BytesTagTable,
+	       "BytesTagTable(definition[,cachable=1])\n\n"
+	       "Compile definition into a Tag Table for parsing bytes."
+	       )
+{
+    PyObject *definition;
+    int cacheable = 1;
+
+    Py_Get2Args("O|i:BytesTagTable", definition, cacheable);
+    return mxTagTable_New(definition, MXTAGTABLE_STRINGTYPE, cacheable);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxTagTable_EncodedTagTable,
+	       "EncodedTagTable(definition,encoding[,cachable=1])\n\n"
+	       "Compile definition into a Tag Table for parsing bytes in the\n"
+	       "given encoding, i.e. for use with tag(...,encoding=encoding)."
+	       )
+{
+    PyObject *definition, *encodingname, *v;
+    const char *encoding;
+    int cacheable = 1;
+
+    Py_Get3Args("Os|i:EncodedTagTable", definition, encoding, cacheable);
+    encodingname = mxTextTools_NormalizeEncoding(encoding);
+    if (encodingname == NULL)
+	goto onError;
+    v = mxTagTable_NewEncoded(definition, encodingname, cacheable);
+    Py_DECREF(encodingname);
+    return v;
+
+ onError:
+    return NULL;
+}
+
+static 
+void mxTagTable_Free(mxTagTableObject *tagtable)
+{
+    tc_cleanup(tagtable);
+    Py_XDECREF(tagtable->definition);
+    Py_XDECREF(tagtable->encodingname);
+    PyObject_Del(tagtable);
+}
+
+/* C APIs */
+
+#define tagtable ((mxTagTableObject *)self)
+
+static
+PyObject *mxTagTable_CompiledDefinition(PyObject *self)
+{
+    PyObject *tuple = 0, *v, *w;
+    Py_ssize_t i;
+    Py_ssize_t size;
+
+    if (!mxTagTable_Check(self)) {
+	PyErr_BadInternalCall();
+	goto onError;
+    }
+
+    size = tagtable->numentries;
+    tuple = PyTuple_New(size);
+    if (tuple == NULL)
+	goto onError;
+    
+    for (i = 0; i < size; i++) {
+	mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+
+	/* Build tuple (tagobj, command, args, jne, je) */
+	v = PyTuple_New(5);
+	if (v == NULL)
+	    goto onError;
+	w = tagtableentry->tagobj;
+	if (w == NULL)
+	    w = Py_None;
+	Py_INCREF(w);
+	PyTuple_SET_ITEM(v, 0, w);
+	PyTuple_SET_ITEM(v, 1, PyInt_FromLong(tagtableentry->cmd |
+					      tagtableentry->flags));
+	w = tagtableentry->args;
+	if (w == NULL)
+	    w = Py_None;
+	Py_INCREF(w);
+	PyTuple_SET_ITEM(v, 2, w);
+	PyTuple_SET_ITEM(v, 3, PyInt_FromLong(tagtableentry->jne));
+	PyTuple_SET_ITEM(v, 4, PyInt_FromLong(tagtableentry->je));
+	if (PyErr_Occurred()) {
+	    Py_DECREF(v);
+	    goto onError;
 	}
+	PyTuple_SET_ITEM(tuple, i, v);
+    }
+    
+    return tuple;
+
+ onError:
+    Py_XDECREF(tuple);
+    return NULL;
+}
+
+
+/* methods */
+
+Py_C_Function( mxTagTable_compiled,
+	       ".compiled()\n\n"
+	       )
+{
+    Py_NoArgsCheck();
+    return mxTagTable_CompiledDefinition(self);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxTagTable_releases_gil,
+	       ".releases_gil()\n\n"
+	       "Return whether tag() runs the table without holding the GIL:\n"
+	       "it and the tables it calls are callback-free and releasing\n"
+	       "the GIL is enabled (see set_release_gil()). Profiled, partial\n"
+	       "and sliced runs hold the GIL all the same."
+	       )
+{
+    int rc;
+
+    Py_NoArgsCheck();
+    if (!mxTextTools_ReleaseGIL)
+	return PyBool_FromLong(0);
+    rc = mxTagTable_IsCallbackFree(tagtable);
+    if (rc < 0)
+	goto onError;
+    return PyBool_FromLong(rc);
+
+ onError:
+    return NULL;
+}
+
+#ifdef COPY_PROTOCOL
+Py_C_Function( mxTagTable_copy,
+	       "copy([memo])\n\n"
+	       "Return a new reference for the instance. This function\n"
+	       "is used for the copy-protocol. Real copying doesn't take\n"
+	       "place, since the instances are immutable.")
+{
+    PyObject *memo;
+    
+    Py_GetArg("|O",memo);
+    Py_INCREF(tagtable);
+    return (PyObject *)tagtable;
+
+ onError:
+    return NULL;
+}
+#endif
 
-	/* Get entry length */
-	entry_len = tc_length(entry);
-	if (entry_len < 3) {
-	    Py_ErrorWithArg(PyExc_TypeError,
-			    "tag table entry %d: "
-			    "expected an entry of the form "
-			    "(tagobj,command,arg[,jne[,je]])", (unsigned int)i);
-	}
+#undef tagtable
 
-	/* Decode entry parts: (tagobj, command, args[, jne[, je]]) */
-	tagobj = tc_get_item(entry, 0);
-	command = tc_get_item(entry, 1);
-	args = tc_get_item(entry, 2);
-	if (entry_len >= 4)
-	    jne = tc_get_item(entry, 3);
-	else
-	    jne = NULL;
-	if (entry_len >= 5) 
-	    je = tc_get_item(entry, 4);
-	else
-	    je = NULL;
+/* --- slots --- */
 
-	if (tagobj == NULL ||
-	    command == NULL ||
-	    args == NULL ||
-	    (entry_len >= 4 && jne == NULL) ||
-	    (entry_len >= 5 && je == NULL)) {
-	    Py_ErrorWithArg(PyExc_TypeError,
-			    "tag table entry %d: "
-			    "expected an entry of the form "
-			    "(tagobj,command,arg[,jne[,je]])",(unsigned int) i);
-	}
+static
+PyObject *mxTagTable_Repr(mxTagTableObject *self)
+{
+    char t[100];
 
-	/* Store tagobj, None gets converted to NULL */
-	if (tagobj != Py_None)
-	    Py_INCREF(tagobj);
-	else
-	    tagobj = NULL;
-	tagtableentry->tagobj = tagobj;
+    if (self->tabletype == MXTAGTABLE_STRINGTYPE)
+	snprintf(t, sizeof(t), "<String Tag Table object at 0x%lx>", (long)self);
+    else if (self->tabletype == MXTAGTABLE_UNICODETYPE)
+	snprintf(t, sizeof(t), "<Unicode Tag Table object at 0x%lx>", (long)self);
+    else
+	snprintf(t, sizeof(t), "<Tag Table object at 0x%lx>", (long)self);
+    return PyUnicode_FromString(t);
+}
 
-	/* Decode command and flags */
-	Py_AssertWithArg(PyInt_Check(command),
-			 PyExc_TypeError,
-			 "tag table entry %d: "
-			 "command must be an integer",(unsigned int)i);
-	tagtableentry->cmd = PyInt_AS_LONG(command) & 0xFF;
-	tagtableentry->flags = PyInt_AS_LONG(command) - tagtableentry->cmd;
+static
+PyMethodDef mxTagTable_Methods[] =
+{   
+    Py_MethodListEntryNoArgs("compiled",mxTagTable_compiled),
+    Py_MethodListEntryNoArgs("releases_gil",mxTagTable_releases_gil),
+#ifdef COPY_PROTOCOL
+    Py_MethodListEntry("__deepcopy__",mxTagTable_copy),
+    Py_MethodListEntry("__copy__",mxTagTable_copy),
+#endif
+    {NULL,NULL} /* end of list */
+};
 
-	/* Check command arguments */
-	Py_INCREF(args);
-	own_args = 1;
+static
+PyMemberDef mxTagTable_Members[] = {
+    {"definition",T_OBJECT_EX,offsetof(mxTagTableObject,definition),READONLY,"Definition"},
+    {"tabletype",T_INT,offsetof(mxTagTableObject,tabletype),READONLY,"Table type: 0 - bytes, 1 - Unicode"},
+    {"encoding",T_OBJECT,offsetof(mxTagTableObject,encodingname),READONLY,"Encoding name or None"},
+    {NULL}
+};
 
-	switch (tagtableentry->cmd) {
+/* Python Type Tables */
 
-	case MATCH_JUMP: /* == MATCH_FAIL */
-	case MATCH_EOF:
-	case MATCH_LOOP:
-	    /* args is ignored */
-	    break;
-	
-	case MATCH_SKIP:
-	case MATCH_MOVE:
-	case MATCH_LOOPCONTROL:
-	    Py_AssertWithArg(PyInt_Check(args),
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "Skip|Move|LoopControl command argument "
-			     "must be an integer", (unsigned int)i);
-	    break;
-	
-	case MATCH_JUMPTARGET:
-	    Py_AssertWithArg(PyString_Check(args),
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "JumpMark command argument must be a string",(unsigned int)i);
-	    if (tc_add_jumptarget(jumpdict, args, i + 1))
-		goto onError;
-	    break;
+PyTypeObject mxTagTable_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)          /* init at startup ! */
+    "Tag Table",                            /* tp_name */
+    sizeof(mxTagTableObject),               /* tp_basicsize */
+    sizeof(mxTagTableEntry),                /* tp_itemsize */
+    /* methods */
+    (destructor)mxTagTable_Free,            /* tp_dealloc */
+#if PY_VERSION_HEX >= 0x03080000
+    0,                                      /* tp_vectorcall_offset */
+#else
+    (printfunc)0,                           /* tp_print */
+#endif
+    (getattrfunc)0,                         /* tp_getattr */
+    (setattrfunc)0,                         /* tp_setattr */
+#if PY_VERSION_HEX >= 0x03050000
+    0,                                      /* tp_as_async */
+#else
+    0,                                      /* tp_reserved */
+#endif
+    (reprfunc)mxTagTable_Repr,              /* tp_repr */
+    0,                                      /* tp_as_number */
+    0,                                      /* tp_as_sequence */
+    0,                                      /* tp_as_mapping */
+    (hashfunc)0,                            /* tp_hash */
+    (ternaryfunc)0,                         /* tp_call */
+    (reprfunc)0,                            /* tp_str */
+    (getattrofunc)0,                        /* tp_getattro */
+    (setattrofunc)0,                        /* tp_setattro */
+    0,                                      /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                     /* tp_flags */
+    (char*) 0,                              /* tp_doc */
+    0,                                      /* tp_traverse */
+    0,                                      /* tp_clear */
+    0,                                      /* tp_richcompare */
+    0,                                      /* tp_weaklistoffset */
+    0,                                      /* tp_iter */
+    0,                                      /* tp_iternext */
+    mxTagTable_Methods,                     /* tp_methods */
+    mxTagTable_Members,                     /* tp_members */
+};
 
-	case MATCH_ALLIN:
-	case MATCH_ALLNOTIN:
-	case MATCH_IS:
-	case MATCH_ISIN:
-	case MATCH_ISNOTIN:
-	case MATCH_WORD:
-	case MATCH_WORDSTART:
-	case MATCH_WORDEND:
-	    args = tc_convert_string_arg(args, i, tabletype, encoding);
-	    if (args == NULL)
-		goto onError;
-	    break;
+/* --- Tag Tree Object -------------------------------------------------*/
 
-	case MATCH_ALLINSET:
-	case MATCH_ISINSET:
-	    Py_AssertWithArg(PyString_Check(args) && 
-			     PyString_GET_SIZE(args) == 32,
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "AllInSet|IsInSet command argument must "
-			     "be a set() string",(unsigned int)i);
-	    break;
+/* Map from tag objects to their index in a list of tags (those of a
+   tree or of to_arrays()), used while nodes are added. Tables made
+   from a grammar have equal tag objects in many places, so equal
+   objects of the same type share an index; the objects seen so far
+   are looked up by identity first. */
 
-	case MATCH_ALLINCHARSET:
-	case MATCH_ISINCHARSET:
-	    Py_AssertWithArg(mxCharSet_Check(args),
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "AllInCharSet|IsInCharSet command argument must "
-			     "be a CharSet instance",(unsigned int)i);
-	    break;
+typedef struct {
+    PyObject **keys;
+    int *ids;
+    Py_ssize_t mask;			/* Size of the table - 1 */
+    Py_ssize_t used;
+    PyObject *byValue;			/* Dict of the hashable tags */
+} mxTagTreeIds;
 
-	case MATCH_SWORDSTART: /* == MATCH_NOWORD */
-	case MATCH_SWORDEND:
-	case MATCH_SFINDWORD:
-	    Py_AssertWithArg(mxTextSearch_Check(args),
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "sWordStart|sWordEnd|sFindWord command "
-			     "argument must be a TextSearch search "
-			     "object",(unsigned int)i);
-	    break;
-	
-	case MATCH_TABLE:
-	case MATCH_SUBTABLE:
-	    Py_AssertWithArg(mxTagTable_Check(args) ||
-			     PyTuple_Check(args) ||
-			     PyList_Check(args) ||
-			     (PyInt_Check(args) && 
-			      PyInt_AS_LONG(args) == MATCH_THISTABLE),
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "Table|SubTable command argument "
-			     "must be a tag table tuple/object or "
-			     "ThisTable", (unsigned int)i);
-	    /* XXX We shouldn't recursively compile tag table tuples here
-		   because this will slow down the compile process
-		   too much and it's not clear whether this particular
-		   table will ever be used during tagging.
-	    */
-	    if (!mxTagTable_Check(args) && !PyInt_Check(args)) {
-		Py_DECREF(args);
-		/* Use encoded version if encoding is set, otherwise use standard */
-		if (encoding != NULL) {
-		    /* is_multibyte is determined by the parent table */
-		    int is_multibyte = (strcasecmp(encoding, "utf-8") == 0 ||
-					strcasecmp(encoding, "utf8") == 0);
-		    args = mxTagTable_NewEncoded(args, encoding, is_multibyte, cacheable);
-		}
-		else {
-		    args = mxTagTable_New(args, tabletype, cacheable);
-		}
-		if (args == NULL)
-		    goto onError;
-	    }
-	    break;
-	
-	case MATCH_TABLEINLIST:
-	case MATCH_SUBTABLEINLIST:
-	    Py_AssertWithArg(PyTuple_Check(args) &&
-			     PyTuple_GET_SIZE(args) == 2 &&
-			     PyList_Check(PyTuple_GET_ITEM(args, 0)) &&
-			     PyInt_Check(PyTuple_GET_ITEM(args, 1)),
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "TableInList|SubTableInList command argument "
-			     "must be a 2-tuple (list, integer)",
-			     (unsigned int)i);
-	    break;
+#define MXTAGTREE_HASH(key) \
+    ((size_t)(key) >> 4) * (size_t)2654435761U
 
-	case MATCH_CALL:
-	    Py_AssertWithArg(PyCallable_Check(args),
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "Call command argument "
-			     "must be a callable object",
-			     (unsigned int)i);
-	    break;
+static
+int mxTagTreeIds_Resize(mxTagTreeIds *ids,
+			Py_ssize_t size)
+{
+    PyObject **keys = ids->keys;
+    int *values = ids->ids;
+    Py_ssize_t oldSize = keys != NULL ? ids->mask + 1 : 0, i;
+
+    ids->keys = (PyObject **)PyMem_Calloc(size, sizeof(PyObject *));
+    ids->ids = (int *)PyMem_Malloc(size * sizeof(int));
+    if (ids->keys == NULL || ids->ids == NULL) {
+	PyMem_Free(ids->keys);
+	PyMem_Free(ids->ids);
+	ids->keys = keys;
+	ids->ids = values;
+	PyErr_NoMemory();
+	return -1;
+    }
+    ids->mask = size - 1;
+    for (i = 0; i < oldSize; i++)
+	if (keys[i] != NULL) {
+	    size_t j = MXTAGTREE_HASH(keys[i]) & ids->mask;
 
-	case MATCH_CALLARG:
-	    Py_AssertWithArg(PyTuple_Check(args) &&
-			     PyTuple_GET_SIZE(args) > 0 &&
-			     PyCallable_Check(PyTuple_GET_ITEM(args, 0)),
-			     PyExc_TypeError,
-			     "tag table entry %d: "
-			     "CallArg command argument "
-			     "must be a tuple (fct,[arg0,arg1,...])",
-			     (unsigned int)i);
-	    break;
-	    
-	default:
-	    Py_ErrorWith2Args(PyExc_TypeError,
-			      "tag table entry %d: "
-			      "unknown command integer: %i", 
-			      (unsigned int)i, tagtableentry->cmd);
-	
+	    while (ids->keys[j] != NULL)
+		j = (j + 1) & ids->mask;
+	    ids->keys[j] = keys[i];
+	    ids->ids[j] = values[i];
 	}
+    PyMem_Free(keys);
+    PyMem_Free(values);
+    return 0;
+}
+
+static
+void mxTagTreeIds_Free(mxTagTreeIds *ids)
+{
+    PyMem_Free(ids->keys);
+    PyMem_Free(ids->ids);
+    Py_XDECREF(ids->byValue);
+}
 
-	/* Store command args */
-	tagtableentry->args = args;
-	own_args = 0;
+/* Enter tagobj with index id; returns 0 on success, -1 in case of an
+   error */
 
-	/* Decode jump offsets */
-	if (jne) {
-	    if (PyInt_Check(jne))
-		tagtableentry->jne = PyInt_AS_LONG(jne);
-	    else if (PyString_Check(jne)) {
-		/* Mark for back-patching */
-		tagtableentry->jne = -424242;
-		secondpass = 1;
-	    }
-	    else
-		Py_ErrorWithArg(PyExc_TypeError,
-				"tag table entry %d: "
-				"jne must be an integer or string", (unsigned int)i);
-	}
-	else
-	    tagtableentry->jne = 0;
+static
+int mxTagTreeIds_Set(mxTagTreeIds *ids,
+		     PyObject *tagobj,
+		     int id)
+{
+    size_t j = MXTAGTREE_HASH(tagobj) & ids->mask;
 
-	if (je) {
-	    if (PyInt_Check(je))
-		tagtableentry->je = PyInt_AS_LONG(je);
-	    else if (PyString_Check(je)) {
-		/* Mark for back-patching */
-		tagtableentry->je = -424242;
-		secondpass = 1;
-	    }
-	    else
-		Py_ErrorWithArg(PyExc_TypeError,
-				"tag table entry %d: "
-				"je must be an integer or string", (unsigned int)i);
-	}
-	else
-	    tagtableentry->je = 1;
+    while (ids->keys[j] != NULL) {
+	if (ids->keys[j] == tagobj)
+	    return 0;
+	j = (j + 1) & ids->mask;
     }
+    ids->keys[j] = tagobj;
+    ids->ids[j] = id;
+    if (++ids->used * 2 > ids->mask + 1 &&
+	mxTagTreeIds_Resize(ids, (ids->mask + 1) * 2))
+	return -1;
+    return 0;
+}
 
-    /* Second pass (needed to patch string jump targets) */
-    if (secondpass)
-	for (i = 0; i < size; i++) {
-	    mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+/* Return the index of tagobj in tags, appending it if it is new; -1
+   in case of an error */
 
-	    if (tagtableentry->je != -424242 &&
-		tagtableentry->jne != -424242)
-		continue;
+static
+int mxTagTreeIds_Get(mxTagTreeIds *ids,
+		     PyObject *tags,
+		     PyObject *tagobj)
+{
+    size_t j = MXTAGTREE_HASH(tagobj) & ids->mask;
+    PyObject *v, *key;
+    Py_ssize_t id;
 
-	    /* Entry (most probably) needs back-patching */
-	    entry = tc_get_item(table, i);
-	    if (entry == NULL) {
-		Py_ErrorWithArg(PyExc_TypeError,
-				"tag table entry %d: "
-				"unexpected error (not found)", (unsigned int)i);
-	    }
+    while (ids->keys[j] != NULL) {
+	if (ids->keys[j] == tagobj)
+	    return ids->ids[j];
+	j = (j + 1) & ids->mask;
+    }
 
-	    /* Get entry length */
-	    entry_len = tc_length(entry);
-	    if (entry_len < 0) {
-		Py_ErrorWithArg(PyExc_TypeError,
-				"tag table entry %d: "
-				"unexpected error (no length)", (unsigned int)i);
-	    }
+    /* an equal tag seen before */
+    key = Py_BuildValue("(OO)", (PyObject *)Py_TYPE(tagobj), tagobj);
+    if (key == NULL)
+	return -1;
+    v = PyDict_GetItemWithError(ids->byValue, key);
+    if (v != NULL) {
+	Py_DECREF(key);
+	id = PyLong_AsSsize_t(v);
+	if (mxTagTreeIds_Set(ids, tagobj, (int)id))
+	    return -1;
+	return (int)id;
+    }
+    if (PyErr_Occurred()) {
+	/* unhashable tags are only looked up by identity */
+	Py_CLEAR(key);
+	if (!PyErr_ExceptionMatches(PyExc_TypeError))
+	    return -1;
+	PyErr_Clear();
+    }
+
+    id = PyList_GET_SIZE(tags);
+    if (id >= INT_MAX) {
+	Py_XDECREF(key);
+	PyErr_SetString(PyExc_OverflowError,
+			"too many tag objects");
+	return -1;
+    }
+    if (PyList_Append(tags, tagobj))
+	goto onError;
+    if (key != NULL) {
+	v = PyLong_FromSsize_t(id);
+	if (v == NULL)
+	    goto onError;
+	if (PyDict_SetItem(ids->byValue, key, v)) {
+	    Py_DECREF(v);
+	    goto onError;
+	}
+	Py_DECREF(v);
+	Py_DECREF(key);
+    }
+    if (mxTagTreeIds_Set(ids, tagobj, (int)id))
+	return -1;
+    return (int)id;
 
-	    /* Decode jump offsets */
-	    if (entry_len >= 4)
-		jne = tc_get_item(entry, 3);
-	    else
-		jne = NULL;
-	    if (entry_len >= 5) 
-		je = tc_get_item(entry, 4);
-	    else
-		je = NULL;
+ onError:
+    Py_XDECREF(key);
+    return -1;
+}
 
-	    /* Patch jump offsets */
-	    if (jne && PyString_Check(jne)) {
-		v = PyDict_GetItem(jumpdict, jne);
-		if (v == NULL || !PyInt_Check(v))
-		    Py_ErrorWith2Args(PyExc_TypeError,
-				      "tag table entry %d: "
-				      "jne jump target '%s' not found", 
-				      (unsigned int)i, PyString_AS_STRING(jne));
-		tagtableentry->jne = PyInt_AS_LONG(v) - i;
-	    }
-	    if (je && PyString_Check(je)) {
-		v = PyDict_GetItem(jumpdict, je);
-		if (v == NULL || !PyInt_Check(v))
-		    Py_ErrorWith2Args(PyExc_TypeError,
-				      "tag table entry %d: "
-				      "je jump target '%s' not found", 
-				      (unsigned int)i, PyString_AS_STRING(je));
-		tagtableentry->je = PyInt_AS_LONG(v) - i;
-	    }
+/* Set up ids for the tags in list tags */
+
+static
+int mxTagTreeIds_Init(mxTagTreeIds *ids,
+		      PyObject *tags)
+{
+    Py_ssize_t i, size = 64;
+
+    while (size < 2 * PyList_GET_SIZE(tags) + 2)
+	size *= 2;
+    ids->keys = NULL;
+    ids->ids = NULL;
+    ids->used = 0;
+    ids->byValue = PyDict_New();
+    if (ids->byValue == NULL)
+	return -1;
+    if (mxTagTreeIds_Resize(ids, size))
+	goto onError;
+    for (i = 0; i < PyList_GET_SIZE(tags); i++) {
+	PyObject *tagobj = PyList_GET_ITEM(tags, i);
+	PyObject *key, *v;
+	int rc = 0;
+
+	if (mxTagTreeIds_Set(ids, tagobj, (int)i))
+	    goto onError;
+	key = Py_BuildValue("(OO)", (PyObject *)Py_TYPE(tagobj), tagobj);
+	v = PyLong_FromSsize_t(i);
+	if (key == NULL || v == NULL)
+	    rc = -1;
+	else if (PyDict_SetDefault(ids->byValue, key, v) == NULL) {
+	    if (PyErr_ExceptionMatches(PyExc_TypeError))
+		PyErr_Clear();
+	    else
+		rc = -1;
 	}
-    
-    Py_DECREF(jumpdict);
+	Py_XDECREF(key);
+	Py_XDECREF(v);
+	if (rc)
+	    goto onError;
+    }
     return 0;
 
  onError:
-    if (own_args && args != NULL) {
-	Py_DECREF(args);
-    }
-    Py_XDECREF(jumpdict);
+    mxTagTreeIds_Free(ids);
     return -1;
 }
 
-/* Check the cache for an already compiled TagTable for this
-   definition.  Return NULL in case of an error, Py_None without
-   INCREF in case no such table was found or the TagTable object. */
+/* Objects which are entries of their own (match strings) are added
+   without looking them up */
 
 static
-PyObject *consult_tagtable_cache(PyObject *definition,
-				 int tabletype,
-				 int cacheable)
+int mxTagTree_AddObject(mxTagTreeObject *tree,
+			PyObject *v)
 {
-    PyObject *v, *key, *tt;
-
-    if (!PyTuple_Check(definition) || !cacheable)
-	return Py_None;
+    Py_ssize_t id = PyList_GET_SIZE(tree->tags);
 
-    key = PyTuple_New(2);
-    if (key == NULL)
-	goto onError;
-    v = PyInt_FromLong((long) definition);
-    if (v == NULL)
-	goto onError;
-    PyTuple_SET_ITEM(key, 0, v);
-    v = PyInt_FromLong(tabletype);
-    if (v == NULL)
-	goto onError;
-    PyTuple_SET_ITEM(key, 1, v);
-    tt = mxTextTools_TagTables_GetItem(key);
-    if (tt != NULL) {
-	Py_INCREF(tt);  /* Convert borrowed reference to owned */
+    if (id >= INT_MAX) {
+	PyErr_SetString(PyExc_OverflowError,
+			"too many tag objects for a TagTree");
+	return -1;
     }
-    Py_DECREF(key);
-    if (tt != NULL) {
-	return tt;
+    if (PyList_Append(tree->tags, v))
+	return -1;
+    return (int)id;
+}
+
+PyObject *mxTagTree_New(void)
+{
+    mxTagTreeObject *tree;
+
+    tree = PyObject_NEW(mxTagTreeObject, &mxTagTree_Type);
+    if (tree == NULL)
+	return NULL;
+    tree->root = NULL;
+    tree->first = 0;
+    tree->stop = 0;
+    tree->length = 0;
+    tree->index = NULL;
+    tree->nodes = 0;
+    tree->allocated = 0;
+    tree->left = NULL;
+    tree->right = NULL;
+    tree->after = NULL;
+    tree->tag = NULL;
+    tree->kind = NULL;
+    tree->tags = PyList_New(0);
+    if (tree->tags == NULL) {
+	Py_DECREF(tree);
+	return NULL;
     }
-    return Py_None;
+    return (PyObject *)tree;
+}
+
+/* The list of the nodes from first up to stop of the tree root */
+
+static
+PyObject *mxTagTree_NewView(mxTagTreeObject *root,
+			    Py_ssize_t first,
+			    Py_ssize_t stop)
+{
+    mxTagTreeObject *tree;
+
+    tree = PyObject_NEW(mxTagTreeObject, &mxTagTree_Type);
+    if (tree == NULL)
+	return NULL;
+    Py_INCREF(root);
+    tree->root = root;
+    tree->first = first;
+    tree->stop = stop;
+    tree->length = first < stop ? -1 : 0;
+    tree->index = NULL;
+    tree->nodes = 0;
+    tree->allocated = 0;
+    tree->left = NULL;
+    tree->right = NULL;
+    tree->after = NULL;
+    tree->tag = NULL;
+    tree->kind = NULL;
+    tree->tags = NULL;
+    return (PyObject *)tree;
+}
+
+static
+void mxTagTree_Free(mxTagTreeObject *tree)
+{
+    Py_XDECREF(tree->root);
+    Py_XDECREF(tree->tags);
+    PyMem_Free(tree->index);
+    PyMem_Free(tree->left);
+    PyMem_Free(tree->right);
+    PyMem_Free(tree->after);
+    PyMem_Free(tree->tag);
+    PyMem_Free(tree->kind);
+    PyObject_Del(tree);
+}
+
+/* Resize the node arrays of the root tree to hold allocated nodes */
+
+static
+int mxTagTree_Resize(mxTagTreeObject *tree,
+		     Py_ssize_t allocated)
+{
+    void *p;
+
+    if ((size_t)allocated > PY_SSIZE_T_MAX / sizeof(Py_ssize_t))
+	goto onError;
+#define MXTAGTREE_RESIZE(array, type)				\
+    p = PyMem_Realloc(tree->array, allocated * sizeof(type));	\
+    if (p == NULL)						\
+	goto onError;						\
+    tree->array = (type *)p;
+    MXTAGTREE_RESIZE(left, Py_ssize_t);
+    MXTAGTREE_RESIZE(right, Py_ssize_t);
+    MXTAGTREE_RESIZE(after, Py_ssize_t);
+    MXTAGTREE_RESIZE(tag, int);
+    MXTAGTREE_RESIZE(kind, unsigned char);
+#undef MXTAGTREE_RESIZE
+    tree->allocated = allocated;
+    return 0;
 
  onError:
-    return NULL;
+    /* arrays which were resized already are large enough too */
+    PyErr_NoMemory();
+    return -1;
 }
 
-/* Adds the compiled tagtable to the cache. Returns -1 in case of an
-   error, 0 on success. */
+/* Make room for count more nodes */
 
 static
-int add_to_tagtable_cache(PyObject *definition,
-			  int tabletype,
-			  int cacheable,
-			  PyObject *tagtable)
+int mxTagTree_Reserve(mxTagTreeObject *tree,
+		      Py_ssize_t count)
 {
-    PyObject *v, *key;
-    int rc;
+    Py_ssize_t allocated;
 
-    if (!PyTuple_Check(definition) || !cacheable)
+    if (tree->allocated - tree->nodes >= count)
 	return 0;
-    
-    key = PyTuple_New(2);
-    if (key == NULL)
-	goto onError;
-    v = PyInt_FromLong((long) definition);
-    if (v == NULL)
-	goto onError;
-    PyTuple_SET_ITEM(key, 0, v);
-    v = PyInt_FromLong(tabletype);
-    if (v == NULL)
-	goto onError;
-    PyTuple_SET_ITEM(key, 1, v);
+    if (count > PY_SSIZE_T_MAX - tree->nodes) {
+	PyErr_NoMemory();
+	return -1;
+    }
+    allocated = tree->allocated < PY_SSIZE_T_MAX / 2 ? tree->allocated * 2 : PY_SSIZE_T_MAX;
+    if (allocated < tree->nodes + count)
+	allocated = tree->nodes + count;
+    if (allocated < 64)
+	allocated = 64;
+    return mxTagTree_Resize(tree, allocated);
+}
 
-    rc = mxTextTools_TagTables_SetItem(key, tagtable);
-    Py_DECREF(key);
-    if (rc)
+/* The root list changes when nodes are added */
+
+static
+void mxTagTree_Changed(mxTagTreeObject *tree)
+{
+    PyMem_Free(tree->index);
+    tree->index = NULL;
+    tree->length = tree->nodes > 0 ? -1 : 0;
+}
+
+/* The GIL-free engine records a node after its children (see
+   mxte_nogil.h): the records of a subtree are a run ending with the
+   record of its top node, whose children field gives the start of the
+   run. Placing the top node first instead shifts every node by the
+   number of its ancestors, so the records are walked backwards,
+   keeping the ancestors of the current record on a stack. */
+
+int mxTagTree_AppendRecords(mxTagTreeObject *tree,
+			    mxTagResultBuffer *results,
+			    PyObject *textobj)
+{
+    Py_ssize_t count = results->length;
+    Py_ssize_t offset = tree->nodes;
+    Py_ssize_t *stack = NULL;
+    Py_ssize_t top = 0, i;
+    mxTagTreeIds ids;
+
+    if (count == 0)
+	return 0;
+    if (mxTagTree_Reserve(tree, count))
+	return -1;
+    if (mxTagTreeIds_Init(&ids, tree->tags))
+	return -1;
+    stack = (Py_ssize_t *)PyMem_Malloc(count * sizeof(Py_ssize_t));
+    if (stack == NULL) {
+	PyErr_NoMemory();
 	goto onError;
+    }
+
+    for (i = count - 1; i >= 0; i--) {
+	mxTagResult *result = &results->items[i];
+	Py_ssize_t start = i, position;
+	int id;
+	unsigned char kind;
+
+	while (top > 0 && results->items[stack[top - 1]].children > i)
+	    top--;
+	if (result->flags & MATCH_APPENDMATCH) {
+	    PyObject *v;
+
+	    if (PyUnicode_Check(textobj))
+		v = PyUnicode_Substring(textobj, result->left, result->right);
+	    else
+		v = PyBytes_FromStringAndSize(mxTextTools_ByteTextData(textobj) +
+					      result->left,
+					      result->right - result->left);
+	    if (v == NULL)
+		goto onError;
+	    id = mxTagTree_AddObject(tree, v);
+	    Py_DECREF(v);
+	    kind = MXTAGTREE_OBJECT;
+	}
+	else if (result->flags & MATCH_APPENDTAGOBJ) {
+	    id = mxTagTreeIds_Get(&ids, tree->tags, result->tagobj);
+	    kind = MXTAGTREE_OBJECT;
+	}
+	else {
+	    id = mxTagTreeIds_Get(&ids, tree->tags, result->tagobj);
+	    if (result->children < 0)
+		kind = MXTAGTREE_LEAF;
+	    else {
+		kind = MXTAGTREE_NODE;
+		start = result->children;
+	    }
+	}
+	if (id < 0)
+	    goto onError;
+	position = offset + start + top;
+	tree->left[position] = result->left;
+	tree->right[position] = result->right;
+	tree->after[position] = position + i - start + 1;
+	tree->tag[position] = id;
+	tree->kind[position] = kind;
+	if (start < i)
+	    stack[top++] = i;
+    }
+    tree->nodes += count;
+    mxTagTree_Changed(tree);
+    PyMem_Free(stack);
+    mxTagTreeIds_Free(&ids);
     return 0;
 
  onError:
+    PyMem_Free(stack);
+    mxTagTreeIds_Free(&ids);
     return -1;
 }
 
-		       
-/* allocation */
+static
+int mxTagTree_AddEntries(mxTagTreeObject *tree,
+			 mxTagTreeIds *ids,
+			 PyObject *taglist)
+{
+    Py_ssize_t i;
 
-PyObject *mxTagTable_New(PyObject *definition,
-			 int tabletype,
-			 int cacheable)
+    for (i = 0; i < PyList_GET_SIZE(taglist); i++) {
+	PyObject *v = PyList_GET_ITEM(taglist, i);
+	PyObject *children = NULL;
+	Py_ssize_t position = tree->nodes, left = 0, right = 0;
+	int id;
+	unsigned char kind = MXTAGTREE_OBJECT;
+
+	if (mxTagTree_Reserve(tree, 1))
+	    return -1;
+	if (PyTuple_Check(v) && PyTuple_GET_SIZE(v) == 4 &&
+	    PyLong_Check(PyTuple_GET_ITEM(v, 1)) &&
+	    PyLong_Check(PyTuple_GET_ITEM(v, 2))) {
+	    children = PyTuple_GET_ITEM(v, 3);
+	    if (children == Py_None)
+		kind = MXTAGTREE_LEAF;
+	    else if (PyList_Check(children))
+		kind = MXTAGTREE_NODE;
+	}
+	if (kind == MXTAGTREE_OBJECT)
+	    id = mxTagTreeIds_Get(ids, tree->tags, v);
+	else {
+	    left = PyLong_AsSsize_t(PyTuple_GET_ITEM(v, 1));
+	    if (left == -1 && PyErr_Occurred())
+		return -1;
+	    right = PyLong_AsSsize_t(PyTuple_GET_ITEM(v, 2));
+	    if (right == -1 && PyErr_Occurred())
+		return -1;
+	    id = mxTagTreeIds_Get(ids, tree->tags, PyTuple_GET_ITEM(v, 0));
+	}
+	if (id < 0)
+	    return -1;
+	tree->left[position] = left;
+	tree->right[position] = right;
+	tree->tag[position] = id;
+	tree->kind[position] = kind;
+	tree->nodes++;
+	if (kind == MXTAGTREE_NODE) {
+	    int rc;
+
+	    if (Py_EnterRecursiveCall(" while building a TagTree"))
+		return -1;
+	    rc = mxTagTree_AddEntries(tree, ids, children);
+	    Py_LeaveRecursiveCall();
+	    if (rc)
+		return -1;
+	}
+	tree->after[position] = tree->nodes;
+    }
+    return 0;
+}
+
+int mxTagTree_AppendList(mxTagTreeObject *tree,
+			 PyObject *taglist)
+{
+    Py_ssize_t nodes = tree->nodes;
+    mxTagTreeIds ids;
+    int rc;
+
+    if (mxTagTreeIds_Init(&ids, tree->tags))
+	return -1;
+    rc = mxTagTree_AddEntries(tree, &ids, taglist);
+    mxTagTreeIds_Free(&ids);
+    if (rc)
+	tree->nodes = nodes;
+    /* the arrays grew in steps, give the spare room back */
+    else if (tree->allocated > tree->nodes && tree->nodes > 0 &&
+	     mxTagTree_Resize(tree, tree->nodes))
+	PyErr_Clear();
+    mxTagTree_Changed(tree);
+    return rc;
+}
+
+/* The entry of the list for the node at position of the tree root */
+
+static
+PyObject *mxTagTree_Entry(mxTagTreeObject *root,
+			  Py_ssize_t position)
 {
-    mxTagTableObject *tagtable = 0;
-    PyObject *v;
-    Py_ssize_t size;
+    PyObject *tagobj = PyList_GET_ITEM(root->tags, root->tag[position]);
+    PyObject *v, *w;
 
-    /* First, consult the TagTable cache */
-    v = consult_tagtable_cache(definition, tabletype, cacheable);
+    if (root->kind[position] == MXTAGTREE_OBJECT) {
+	Py_INCREF(tagobj);
+	return tagobj;
+    }
+    v = PyTuple_New(4);
     if (v == NULL)
+	return NULL;
+    Py_INCREF(tagobj);
+    PyTuple_SET_ITEM(v, 0, tagobj);
+    w = PyLong_FromSsize_t(root->left[position]);
+    if (w == NULL)
 	goto onError;
-    else if (v != Py_None)
-	return v;
-
-    size = tc_length(definition);
-    if (size < 0)
-	Py_Error(PyExc_TypeError,
-		 "tag table definition must be a tuple or a list");
-
-    tagtable = PyObject_NEW_VAR(mxTagTableObject, &mxTagTable_Type, size);
-    if (tagtable == NULL)
+    PyTuple_SET_ITEM(v, 1, w);
+    w = PyLong_FromSsize_t(root->right[position]);
+    if (w == NULL)
 	goto onError;
-    if (cacheable) {
-	Py_INCREF(definition);
-	tagtable->definition = definition;
+    PyTuple_SET_ITEM(v, 2, w);
+    if (root->kind[position] == MXTAGTREE_LEAF) {
+	w = Py_None;
+	Py_INCREF(w);
     }
-    else
-	tagtable->definition = NULL;
-    tagtable->tabletype = tabletype;
-    tagtable->encoding = NULL;
-    tagtable->is_multibyte = 0;
+    else {
+	w = mxTagTree_NewView(root, position + 1, root->after[position]);
+	if (w == NULL)
+	    goto onError;
+    }
+    PyTuple_SET_ITEM(v, 3, w);
+    return v;
 
-    /* Compile table ... */
-    if (init_tag_table(tagtable, definition, size, tabletype, cacheable, NULL))
-	goto onError;
+ onError:
+    Py_DECREF(v);
+    return NULL;
+}
 
-    /* Cache the compiled table if it is cacheable and derived from a
-       tuple */
-    if (add_to_tagtable_cache(definition, tabletype, cacheable, 
-			      (PyObject *)tagtable))
-	goto onError;
+/* The same as a taglist of the standard engine */
 
-    return (PyObject *)tagtable;
+static
+PyObject *mxTagTree_AsList(mxTagTreeObject *root,
+			   Py_ssize_t first,
+			   Py_ssize_t stop)
+{
+    PyObject *list, *v = NULL, *w;
+    Py_ssize_t position;
+
+    list = PyList_New(0);
+    if (list == NULL)
+	return NULL;
+    for (position = first; position < stop; position = root->after[position]) {
+	if (root->kind[position] == MXTAGTREE_NODE) {
+	    if (Py_EnterRecursiveCall(" while converting a TagTree"))
+		goto onError;
+	    w = mxTagTree_AsList(root, position + 1, root->after[position]);
+	    Py_LeaveRecursiveCall();
+	    if (w == NULL)
+		goto onError;
+	    v = Py_BuildValue("(OnnN)",
+			      PyList_GET_ITEM(root->tags, root->tag[position]),
+			      root->left[position],
+			      root->right[position],
+			      w);
+	}
+	else
+	    v = mxTagTree_Entry(root, position);
+	if (v == NULL || PyList_Append(list, v))
+	    goto onError;
+	Py_DECREF(v);
+    }
+    return list;
 
  onError:
-    Py_XDECREF(tagtable);
+    Py_XDECREF(v);
+    Py_DECREF(list);
     return NULL;
 }
 
-/* Create an encoded tag table - Unicode patterns are encoded to bytes
-   using the specified encoding. This is used for parsing byte streams
-   with a specified encoding (e.g., UTF-8 bytes with Unicode grammars). */
+static
+Py_ssize_t mxTagTree_Length(mxTagTreeObject *self)
+{
+    if (self->length < 0) {
+	mxTagTreeObject *root = mxTagTree_Root(self);
+	Py_ssize_t stop = mxTagTree_Stop(self), position, length = 0;
 
-PyObject *mxTagTable_NewEncoded(PyObject *definition,
-				const char *encoding,
-				int is_multibyte,
-				int cacheable)
+	for (position = self->first; position < stop; position = root->after[position])
+	    length++;
+	self->length = length;
+    }
+    return self->length;
+}
+
+static
+PyObject *mxTagTree_Item(mxTagTreeObject *self,
+			 Py_ssize_t i)
 {
-    mxTagTableObject *tagtable = 0;
-    Py_ssize_t size;
+    mxTagTreeObject *root = mxTagTree_Root(self);
+    Py_ssize_t length = mxTagTree_Length(self);
 
-    /* Note: We don't cache encoded tables because they depend on the encoding
-       and caching by (definition, encoding) would require changing the cache key */
+    if (i < 0 || i >= length) {
+	PyErr_SetString(PyExc_IndexError, "TagTree index out of range");
+	return NULL;
+    }
+    /* the positions of the entries are only needed for indexing */
+    if (self->index == NULL) {
+	Py_ssize_t position, j = 0;
 
-    size = tc_length(definition);
-    if (size < 0)
-	Py_Error(PyExc_TypeError,
-		 "tag table definition must be a tuple or a list");
+	self->index = (Py_ssize_t *)PyMem_Malloc(length * sizeof(Py_ssize_t));
+	if (self->index == NULL)
+	    return PyErr_NoMemory();
+	for (position = self->first; j < length; position = root->after[position])
+	    self->index[j++] = position;
+    }
+    return mxTagTree_Entry(root, self->index[i]);
+}
 
-    tagtable = PyObject_NEW_VAR(mxTagTableObject, &mxTagTable_Type, size);
-    if (tagtable == NULL)
-	goto onError;
+static
+PyObject *mxTagTree_Subscript(mxTagTreeObject *self,
+			      PyObject *key)
+{
+    Py_ssize_t start, stop, step, count, i;
+    PyObject *list;
 
-    /* Store definition if cacheable (though we don't cache encoded tables) */
-    if (cacheable) {
-	Py_INCREF(definition);
-	tagtable->definition = definition;
+    if (PyIndex_Check(key)) {
+	i = PyNumber_AsSsize_t(key, PyExc_IndexError);
+	if (i == -1 && PyErr_Occurred())
+	    return NULL;
+	if (i < 0)
+	    i += mxTagTree_Length(self);
+	return mxTagTree_Item(self, i);
+    }
+    if (!PySlice_Check(key)) {
+	PyErr_Format(PyExc_TypeError,
+		     "TagTree indices must be integers or slices, not %.200s",
+		     Py_TYPE(key)->tp_name);
+	return NULL;
     }
-    else
-	tagtable->definition = NULL;
+    if (PySlice_Unpack(key, &start, &stop, &step) < 0)
+	return NULL;
+    count = PySlice_AdjustIndices(mxTagTree_Length(self), &start, &stop, step);
+    list = PyList_New(count);
+    if (list == NULL)
+	return NULL;
+    for (i = 0; i < count; i++, start += step) {
+	PyObject *v = mxTagTree_Item(self, start);
 
-    /* Set table type to STRINGTYPE since we're working with bytes,
-       but mark it as encoded so we know the patterns are encoding-aware */
-    tagtable->tabletype = MXTAGTABLE_STRINGTYPE;
-    tagtable->encoding = encoding;  /* Store encoding name */
-    tagtable->is_multibyte = is_multibyte;
+	if (v == NULL) {
+	    Py_DECREF(list);
+	    return NULL;
+	}
+	PyList_SET_ITEM(list, i, v);
+    }
+    return list;
+}
 
-    /* Compile table with encoding - this encodes Unicode patterns to bytes */
-    if (init_tag_table(tagtable, definition, size, MXTAGTABLE_STRINGTYPE,
-		       cacheable, encoding))
-	goto onError;
+/* Iterator over the entries of a tree */
 
-    return (PyObject *)tagtable;
+typedef struct {
+    PyObject_HEAD
+    mxTagTreeObject *tree;
+    Py_ssize_t position, stop;
+} mxTagTreeIteratorObject;
 
- onError:
-    Py_XDECREF(tagtable);
-    return NULL;
-}
+static PyTypeObject mxTagTreeIterator_Type;
 
-Py_C_Function( mxTagTable_TagTable,
-	       "TagTable(definition[,cachable=1])\n\n"
-	       )
+static
+PyObject *mxTagTree_Iter(mxTagTreeObject *self)
 {
-    PyObject *definition;
-    int cacheable = 1;
+    mxTagTreeIteratorObject *it;
 
-    Py_Get2Args("O|i:TagTable", definition, cacheable);
-    /* For Python 3.3+, default to Unicode table type since Unicode is the primary string type */
-    return mxTagTable_New(definition, MXTAGTABLE_UNICODETYPE, cacheable);
+    it = PyObject_NEW(mxTagTreeIteratorObject, &mxTagTreeIterator_Type);
+    if (it == NULL)
+	return NULL;
+    Py_INCREF(self);
+    it->tree = self;
+    it->position = self->first;
+    it->stop = mxTagTree_Stop(self);
+    return (PyObject *)it;
+}
 
- onError:
-    return NULL;
+static
+void mxTagTreeIterator_Free(mxTagTreeIteratorObject *it)
+{
+    Py_DECREF(it->tree);
+    PyObject_Del(it);
 }
 
-Py_C_Function( mxTagTable_UnicodeTagTable,
-	       "TagTable(definition[,cachable=1])\n\n"
-	       )
+static
+PyObject *mxTagTreeIterator_Next(mxTagTreeIteratorObject *it)
 {
-    PyObject *definition;
-    int cacheable = 1;
+    mxTagTreeObject *root = mxTagTree_Root(it->tree);
+    Py_ssize_t position = it->position;
 
-    Py_Get2Args("O|i:UnicodeTagTable", definition, cacheable);
-    return mxTagTable_New(definition, 1, cacheable);
+    if (position >= it->stop)
+	return NULL;
+    it->position = root->after[position];
+    return mxTagTree_Entry(root, position);
+}
+
+/* Trees compare equal to lists (and trees) with equal entries */
+
+static
+PyObject *mxTagTree_RichCompare(PyObject *self,
+				PyObject *other,
+				int op)
+{
+    PyObject *left = NULL, *right = NULL, *v, *w;
+    int equal = 1;
+
+    if ((op != Py_EQ && op != Py_NE) ||
+	!(mxTagTree_Check(other) || PyList_Check(other)) ||
+	!(mxTagTree_Check(self) || PyList_Check(self)))
+	Py_RETURN_NOTIMPLEMENTED;
+    if (PyObject_Length(self) != PyObject_Length(other))
+	equal = 0;
+    else {
+	left = PyObject_GetIter(self);
+	if (left == NULL)
+	    return NULL;
+	right = PyObject_GetIter(other);
+	if (right == NULL)
+	    goto onError;
+	while (equal && (v = PyIter_Next(left)) != NULL) {
+	    w = PyIter_Next(right);
+	    if (w == NULL) {
+		Py_DECREF(v);
+		if (PyErr_Occurred())
+		    goto onError;
+		equal = 0;
+		break;
+	    }
+	    equal = PyObject_RichCompareBool(v, w, Py_EQ);
+	    Py_DECREF(v);
+	    Py_DECREF(w);
+	    if (equal < 0)
+		goto onError;
+	}
+	if (PyErr_Occurred())
+	    goto onError;
+	Py_DECREF(left);
+	Py_DECREF(right);
+    }
+    return PyBool_FromLong(op == Py_EQ ? equal : !equal);
 
  onError:
+    Py_XDECREF(left);
+    Py_XDECREF(right);
     return NULL;
 }
 
-static 
-void mxTagTable_Free(mxTagTableObject *tagtable)
+/* Columns of to_arrays(), one row per node in the order of a
+   depth-first walk */
+
+typedef struct {
+    long long *tag, *start, *stop, *depth;
+    Py_ssize_t length;
+    Py_ssize_t allocated;
+} mxTagColumns;
+
+static
+void mxTagColumns_Free(mxTagColumns *columns)
 {
-    tc_cleanup(tagtable);
-    Py_XDECREF(tagtable->definition);
-    PyObject_Del(tagtable);
+    PyMem_Free(columns->tag);
+    PyMem_Free(columns->start);
+    PyMem_Free(columns->stop);
+    PyMem_Free(columns->depth);
 }
 
-/* C APIs */
-
-#define tagtable ((mxTagTableObject *)self)
+/* Make room for count more rows */
 
 static
-PyObject *mxTagTable_CompiledDefinition(PyObject *self)
+int mxTagColumns_Reserve(mxTagColumns *columns,
+			 Py_ssize_t count)
 {
-    PyObject *tuple = 0, *v, *w;
-    Py_ssize_t i;
-    Py_ssize_t size;
+    Py_ssize_t allocated;
+    void *p;
 
-    if (!mxTagTable_Check(self)) {
-	PyErr_BadInternalCall();
+    if (columns->allocated - columns->length >= count)
+	return 0;
+    allocated = columns->allocated * 2;
+    if (allocated < columns->length + count)
+	allocated = columns->length + count;
+    if (allocated < 64)
+	allocated = 64;
+    if ((size_t)allocated > PY_SSIZE_T_MAX / sizeof(long long))
 	goto onError;
-    }
+#define MXTAGCOLUMNS_RESIZE(array)					\
+    p = PyMem_Realloc(columns->array, allocated * sizeof(long long));	\
+    if (p == NULL)							\
+	goto onError;							\
+    columns->array = (long long *)p;
+    MXTAGCOLUMNS_RESIZE(tag);
+    MXTAGCOLUMNS_RESIZE(start);
+    MXTAGCOLUMNS_RESIZE(stop);
+    MXTAGCOLUMNS_RESIZE(depth);
+#undef MXTAGCOLUMNS_RESIZE
+    columns->allocated = allocated;
+    return 0;
 
-    size = tagtable->numentries;
-    tuple = PyTuple_New(size);
-    if (tuple == NULL)
+ onError:
+    PyErr_NoMemory();
+    return -1;
+}
+
+/* Add the nodes of tree, whose entries are at depth; the tag objects
+   go into tags. The nodes are rows already, only their depth has to
+   be found: the ends of the subtrees enclosing a node are kept on a
+   stack. */
+
+static
+int mxTagColumns_AddTree(mxTagColumns *columns,
+			 mxTagTreeIds *ids,
+			 PyObject *tags,
+			 mxTagTreeObject *tree,
+			 Py_ssize_t depth)
+{
+    mxTagTreeObject *root = mxTagTree_Root(tree);
+    Py_ssize_t stop = mxTagTree_Stop(tree), position, top = 0, i;
+    Py_ssize_t *stack = NULL;
+    int *remap = NULL;
+    Py_ssize_t count = stop - tree->first;
+    Py_ssize_t tagCount = PyList_GET_SIZE(root->tags);
+
+    if (count == 0)
+	return 0;
+    if (mxTagColumns_Reserve(columns, count))
+	return -1;
+    stack = (Py_ssize_t *)PyMem_Malloc(count * sizeof(Py_ssize_t));
+    remap = (int *)PyMem_Malloc((tagCount > 0 ? tagCount : 1) * sizeof(int));
+    if (stack == NULL || remap == NULL) {
+	PyErr_NoMemory();
 	goto onError;
-    
-    for (i = 0; i < size; i++) {
-	mxTagTableEntry *tagtableentry = &tagtable->entry[i];
+    }
+    /* the tags of the tree are entered in tags when first used */
+    for (i = 0; i < tagCount; i++)
+	remap[i] = -1;
 
-	/* Build tuple (tagobj, command, args, jne, je) */
-	v = PyTuple_New(5);
-	if (v == NULL)
-	    goto onError;
-	w = tagtableentry->tagobj;
-	if (w == NULL)
-	    w = Py_None;
-	Py_INCREF(w);
-	PyTuple_SET_ITEM(v, 0, w);
-	PyTuple_SET_ITEM(v, 1, PyInt_FromLong(tagtableentry->cmd |
-					      tagtableentry->flags));
-	w = tagtableentry->args;
-	if (w == NULL)
-	    w = Py_None;
-	Py_INCREF(w);
-	PyTuple_SET_ITEM(v, 2, w);
-	PyTuple_SET_ITEM(v, 3, PyInt_FromLong(tagtableentry->jne));
-	PyTuple_SET_ITEM(v, 4, PyInt_FromLong(tagtableentry->je));
-	if (PyErr_Occurred()) {
-	    Py_DECREF(v);
-	    goto onError;
+    for (position = tree->first; position < stop; position++) {
+	Py_ssize_t row = columns->length++;
+	int id = root->tag[position];
+
+	while (top > 0 && stack[top - 1] <= position)
+	    top--;
+	if (remap[id] < 0) {
+	    remap[id] = mxTagTreeIds_Get(ids, tags, PyList_GET_ITEM(root->tags, id));
+	    if (remap[id] < 0)
+		goto onError;
 	}
-	PyTuple_SET_ITEM(tuple, i, v);
+	columns->tag[row] = remap[id];
+	columns->depth[row] = depth + top;
+	if (root->kind[position] == MXTAGTREE_OBJECT) {
+	    columns->start[row] = -1;
+	    columns->stop[row] = -1;
+	}
+	else {
+	    columns->start[row] = root->left[position];
+	    columns->stop[row] = root->right[position];
+	}
+	if (root->after[position] > position + 1)
+	    stack[top++] = root->after[position];
     }
-    
-    return tuple;
+    PyMem_Free(stack);
+    PyMem_Free(remap);
+    return 0;
 
  onError:
-    Py_XDECREF(tuple);
-    return NULL;
+    PyMem_Free(stack);
+    PyMem_Free(remap);
+    return -1;
+}
+
+/* Add the entries of taglist, a list or a TagTree, at depth */
+
+static
+int mxTagColumns_AddList(mxTagColumns *columns,
+			 mxTagTreeIds *ids,
+			 PyObject *tags,
+			 PyObject *taglist,
+			 Py_ssize_t depth)
+{
+    Py_ssize_t i;
+
+    if (mxTagTree_Check(taglist))
+	return mxTagColumns_AddTree(columns, ids, tags,
+				    (mxTagTreeObject *)taglist, depth);
+
+    for (i = 0; i < PyList_GET_SIZE(taglist); i++) {
+	PyObject *v = PyList_GET_ITEM(taglist, i);
+	PyObject *children = NULL;
+	Py_ssize_t row, left = -1, right = -1;
+	int id;
+
+	if (PyTuple_Check(v) && PyTuple_GET_SIZE(v) == 4 &&
+	    PyLong_Check(PyTuple_GET_ITEM(v, 1)) &&
+	    PyLong_Check(PyTuple_GET_ITEM(v, 2))) {
+	    left = PyLong_AsSsize_t(PyTuple_GET_ITEM(v, 1));
+	    if (left == -1 && PyErr_Occurred())
+		return -1;
+	    right = PyLong_AsSsize_t(PyTuple_GET_ITEM(v, 2));
+	    if (right == -1 && PyErr_Occurred())
+		return -1;
+	    children = PyTuple_GET_ITEM(v, 3);
+	    v = PyTuple_GET_ITEM(v, 0);
+	}
+	id = mxTagTreeIds_Get(ids, tags, v);
+	if (id < 0 || mxTagColumns_Reserve(columns, 1))
+	    return -1;
+	row = columns->length++;
+	columns->tag[row] = id;
+	columns->start[row] = left;
+	columns->stop[row] = right;
+	columns->depth[row] = depth;
+	if (children != NULL &&
+	    (PyList_Check(children) || mxTagTree_Check(children))) {
+	    int rc;
+
+	    if (Py_EnterRecursiveCall(" in to_arrays()"))
+		return -1;
+	    rc = mxTagColumns_AddList(columns, ids, tags, children, depth + 1);
+	    Py_LeaveRecursiveCall();
+	    if (rc)
+		return -1;
+	}
+    }
+    return 0;
 }
 
+/* New array('q') holding the length values of column */
+
+static
+PyObject *mxTagColumns_AsArray(PyObject *arraytype,
+			       long long *column,
+			       Py_ssize_t length)
+{
+    PyObject *array, *view, *v;
+
+    array = PyObject_CallFunction(arraytype, "s", "q");
+    if (array == NULL || length == 0)
+	return array;
+    view = PyMemoryView_FromMemory((char *)column,
+				   length * sizeof(long long),
+				   PyBUF_READ);
+    if (view == NULL)
+	goto onError;
+    v = PyObject_CallMethod(array, "frombytes", "(O)", view);
+    Py_DECREF(view);
+    if (v == NULL)
+	goto onError;
+    Py_DECREF(v);
+    return array;
+
+ onError:
+    Py_DECREF(array);
+    return NULL;
+}
 
 /* methods */
 
-Py_C_Function( mxTagTable_compiled,
-	       ".compiled()\n\n"
+#define tree ((mxTagTreeObject *)self)
+
+Py_C_Function( mxTagTree_tolist,
+	       ".tolist()\n\n"
+	       "Return the taglist the standard engine would have built,\n"
+	       "made of lists and result tuples."
 	       )
 {
     Py_NoArgsCheck();
-    return mxTagTable_CompiledDefinition(self);
+    return mxTagTree_AsList(mxTagTree_Root(tree), tree->first,
+			    mxTagTree_Stop(tree));
 
  onError:
     return NULL;
 }
 
-#ifdef COPY_PROTOCOL
-Py_C_Function( mxTagTable_copy,
-	       "copy([memo])\n\n"
-	       "Return a new reference for the instance. This function\n"
-	       "is used for the copy-protocol. Real copying doesn't take\n"
-	       "place, since the instances are immutable.")
-{
-    PyObject *memo;
-    
-    Py_GetArg("|O",memo);
-    Py_INCREF(tagtable);
-    return (PyObject *)tagtable;
+Py_C_Function( mxTagTree_sizeof,
+	       ".__sizeof__()\n\n"
+	       "Size of the tree in memory, in bytes."
+	       )
+{
+    Py_ssize_t size = sizeof(mxTagTreeObject);
+
+    Py_NoArgsCheck();
+    if (tree->index != NULL)
+	size += mxTagTree_Length(tree) * sizeof(Py_ssize_t);
+    size += tree->allocated * (3 * sizeof(Py_ssize_t) + sizeof(int) +
+			       sizeof(unsigned char));
+    return PyLong_FromSsize_t(size);
 
  onError:
     return NULL;
 }
-#endif
 
-#undef tagtable
+static
+PyObject *mxTagTree_GetTags(mxTagTreeObject *self,
+			    void *closure)
+{
+    return PyList_AsTuple(mxTagTree_Root(self)->tags);
+}
+
+static
+PyObject *mxTagTree_GetNodes(mxTagTreeObject *self,
+			     void *closure)
+{
+    return PyLong_FromSsize_t(mxTagTree_Stop(self) - self->first);
+}
+
+#undef tree
 
 /* --- slots --- */
 
 static
-PyObject *mxTagTable_Repr(mxTagTableObject *self)
+PyObject *mxTagTree_Repr(mxTagTreeObject *self)
 {
-    char t[100];
-
-    if (self->tabletype == MXTAGTABLE_STRINGTYPE)
-	snprintf(t, sizeof(t), "<String Tag Table object at 0x%lx>", (long)self);
-    else if (self->tabletype == MXTAGTABLE_UNICODETYPE)
-	snprintf(t, sizeof(t), "<Unicode Tag Table object at 0x%lx>", (long)self);
-    else
-	snprintf(t, sizeof(t), "<Tag Table object at 0x%lx>", (long)self);
-    return PyString_FromString(t);
+    return PyUnicode_FromFormat("<TagTree object of %zd entries at %p>",
+				mxTagTree_Length(self), self);
 }
 
 static
-PyMethodDef mxTagTable_Methods[] =
-{   
-    Py_MethodListEntryNoArgs("compiled",mxTagTable_compiled),
-#ifdef COPY_PROTOCOL
-    Py_MethodListEntry("__deepcopy__",mxTagTable_copy),
-    Py_MethodListEntry("__copy__",mxTagTable_copy),
-#endif
+PyMethodDef mxTagTree_Methods[] =
+{
+    Py_MethodListEntryNoArgs("tolist",mxTagTree_tolist),
+    Py_MethodListEntryNoArgs("__sizeof__",mxTagTree_sizeof),
     {NULL,NULL} /* end of list */
 };
 
 static
-PyMemberDef mxTagTable_Members[] = {
-    {"definition",T_OBJECT_EX,offsetof(mxTagTableObject,definition),READONLY,"Definition"},
+PyGetSetDef mxTagTree_GetSet[] = {
+    {"tags", (getter)mxTagTree_GetTags, NULL,
+     "Tag objects referenced by the nodes of the whole tree", NULL},
+    {"nodes", (getter)mxTagTree_GetNodes, NULL,
+     "Number of nodes in the list, children included", NULL},
     {NULL}
 };
 
+static
+PySequenceMethods mxTagTree_AsSequence = {
+    (lenfunc)mxTagTree_Length,              /* sq_length */
+    0,                                      /* sq_concat */
+    0,                                      /* sq_repeat */
+    (ssizeargfunc)mxTagTree_Item,           /* sq_item */
+};
+
+static
+PyMappingMethods mxTagTree_AsMapping = {
+    (lenfunc)mxTagTree_Length,              /* mp_length */
+    (binaryfunc)mxTagTree_Subscript,        /* mp_subscript */
+};
+
 /* Python Type Tables */
 
-PyTypeObject mxTagTable_Type = {
+PyTypeObject mxTagTree_Type = {
     PyVarObject_HEAD_INIT(NULL, 0)          /* init at startup ! */
-    "Tag Table",                            /* tp_name */
-    sizeof(mxTagTableObject),               /* tp_basicsize */
-    sizeof(mxTagTableEntry),                /* tp_itemsize */
+    "TagTree",                              /* tp_name */
+    sizeof(mxTagTreeObject),                /* tp_basicsize */
+    0,                                      /* tp_itemsize */
     /* methods */
-    (destructor)mxTagTable_Free,            /* tp_dealloc */
+    (destructor)mxTagTree_Free,             /* tp_dealloc */
 #if PY_VERSION_HEX >= 0x03080000
     0,                                      /* tp_vectorcall_offset */
 #else
@@ -3022,7 +5732,50 @@ PyTypeObject mxTagTable_Type = {
 #else
     0,                                      /* tp_reserved */
 #endif
-    (reprfunc)mxTagTable_Repr,              /* tp_repr */
+    (reprfunc)mxTagTree_Repr,               /* tp_repr */
+    0,                                      /* tp_as_number */
+    &mxTagTree_AsSequence,                  /* tp_as_sequence */
+    &mxTagTree_AsMapping,                   /* tp_as_mapping */
+    PyObject_HashNotImplemented,            /* tp_hash */
+    (ternaryfunc)0,                         /* tp_call */
+    (reprfunc)0,                            /* tp_str */
+    (getattrofunc)0,                        /* tp_getattro */
+    (setattrofunc)0,                        /* tp_setattro */
+    0,                                      /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                     /* tp_flags */
+    "Compact taglist returned by tag(...,compact=1)", /* tp_doc */
+    0,                                      /* tp_traverse */
+    0,                                      /* tp_clear */
+    mxTagTree_RichCompare,                  /* tp_richcompare */
+    0,                                      /* tp_weaklistoffset */
+    (getiterfunc)mxTagTree_Iter,            /* tp_iter */
+    0,                                      /* tp_iternext */
+    mxTagTree_Methods,                      /* tp_methods */
+    0,                                      /* tp_members */
+    mxTagTree_GetSet,                       /* tp_getset */
+};
+
+static
+PyTypeObject mxTagTreeIterator_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)          /* init at startup ! */
+    "TagTree iterator",                     /* tp_name */
+    sizeof(mxTagTreeIteratorObject),        /* tp_basicsize */
+    0,                                      /* tp_itemsize */
+    /* methods */
+    (destructor)mxTagTreeIterator_Free,     /* tp_dealloc */
+#if PY_VERSION_HEX >= 0x03080000
+    0,                                      /* tp_vectorcall_offset */
+#else
+    (printfunc)0,                           /* tp_print */
+#endif
+    (getattrfunc)0,                         /* tp_getattr */
+    (setattrfunc)0,                         /* tp_setattr */
+#if PY_VERSION_HEX >= 0x03050000
+    0,                                      /* tp_as_async */
+#else
+    0,                                      /* tp_reserved */
+#endif
+    (reprfunc)0,                            /* tp_repr */
     0,                                      /* tp_as_number */
     0,                                      /* tp_as_sequence */
     0,                                      /* tp_as_mapping */
@@ -3038,10 +5791,8 @@ PyTypeObject mxTagTable_Type = {
     0,                                      /* tp_clear */
     0,                                      /* tp_richcompare */
     0,                                      /* tp_weaklistoffset */
-    0,                                      /* tp_iter */
-    0,                                      /* tp_iternext */
-    mxTagTable_Methods,                     /* tp_methods */
-    mxTagTable_Members,                     /* tp_members */
+    PyObject_SelfIter,                      /* tp_iter */
+    (iternextfunc)mxTagTreeIterator_Next,   /* tp_iternext */
 };
 
 /* --- Internal functions ----------------------------------------------*/
@@ -4412,35 +7163,266 @@ PyObject *mxTextTools_SetSplitX(char *tx,
 
 /* --- Module functions ------------------------------------------------*/
 
+/* Raise LimitExceeded for an excess recorded by a tagging engine */
+
+int mxTextTools_RaiseLimitExceeded(mxTagLimits *limits)
+{
+    PyObject *stack = NULL, *production = Py_None, *message = NULL;
+    PyObject *error = NULL, *attributes = NULL, *key, *v;
+    Py_ssize_t i;
+
+    stack = PyTuple_New(limits->depth);
+    if (stack == NULL)
+	goto onError;
+    for (i = 0; i < limits->depth; i++) {
+	PyObject *tagobj = limits->frames[i].tagobj;
+
+	if (tagobj == NULL)
+	    tagobj = Py_None;
+	v = PyTuple_Pack(2, tagobj, limits->frames[i].table);
+	if (v == NULL)
+	    goto onError;
+	PyTuple_SET_ITEM(stack, i, v);
+	/* the innermost table reported under a name */
+	if (PyUnicode_Check(tagobj))
+	    production = tagobj;
+    }
+    if (limits->exceeded == MXTE_LIMIT_DEADLINE)
+	message = PyUnicode_FromFormat("deadline exceeded at position %zd",
+				       limits->position);
+    else
+	message = PyUnicode_FromFormat("step limit of %zd exceeded at position %zd",
+				       limits->steps, limits->position);
+    if (message != NULL && production != Py_None) {
+	v = PyUnicode_FromFormat("%U in production %R", message, production);
+	Py_DECREF(message);
+	message = v;
+    }
+    if (message == NULL)
+	goto onError;
+    error = PyObject_CallFunctionObjArgs(mxTextTools_LimitExceeded, message, NULL);
+    if (error == NULL)
+	goto onError;
+    attributes = Py_BuildValue("{s:s,s:n,s:n,s:O,s:O}",
+			       "limit", (limits->exceeded == MXTE_LIMIT_DEADLINE ?
+					 "deadline" : "steps"),
+			       "position", limits->position,
+			       "steps", limits->steps,
+			       "production", production,
+			       "stack", stack);
+    if (attributes == NULL)
+	goto onError;
+    i = 0;
+    while (PyDict_Next(attributes, &i, &key, &v))
+	if (PyObject_SetAttr(error, key, v))
+	    goto onError;
+    PyErr_SetObject(mxTextTools_LimitExceeded, error);
+
+ onError:
+    Py_XDECREF(stack);
+    Py_XDECREF(message);
+    Py_XDECREF(error);
+    Py_XDECREF(attributes);
+    mxTagLimits_Clear(limits);
+    return 0;
+}
+
+/* Capsule destructor of the states of suspended tag() runs */
+
+static
+void mxTextTools_FreeSuspended(PyObject *capsule)
+{
+    mxTagSuspended_Free((mxTagSuspended *)PyCapsule_GetPointer(capsule,
+							       MXTE_SUSPENDED_NAME));
+}
+
 /* Interface to the tagging engine in mxte.c */
 
 Py_C_Function_WithKeywords(
                mxTextTools_tag,
-	       "tag(text,tagtable,sliceleft=0,sliceright=len(text),taglist=[],context=None,encoding=None)\n"
+	       "tag(text,tagtable,sliceleft=0,sliceright=len(text),taglist=[],context=None,encoding=None,profile=None,\n"
+	       "    max_steps=None,deadline=None,partial=0,resume=None,slice_steps=None,compact=0)\n"
 	       "Produce a tag list for a string, given a tag-table\n"
 	       "- returns a tuple (success, taglist, nextindex)\n"
 	       "- if taglist == None, then no taglist is created\n"
 	       "- encoding: if specified and text is bytes, compile grammar for this encoding\n"
 	       "  Supported: utf-8, latin-1, iso-8859-*, windows-1252, ascii, etc.\n"
 	       "  Multi-byte encodings other than UTF-8 are not supported.\n"
-	       "  Positions in result are byte positions."
+	       "  Positions in result are byte positions.\n"
+	       "- profile: if given, profile.append() is called with the call tree\n"
+	       "  of the tables, each node a tuple (tagobj, table, entries, successes,\n"
+	       "  failures, consumed, seconds, children); see simpleparse.profiling\n"
+	       "- max_steps: maximum number of table entries to run, deadline: time.monotonic()\n"
+	       "  value to stop at; LimitExceeded is raised when either is exceeded\n"
+	       "- partial: the text may go on past sliceright; if the outcome depends on\n"
+	       "  that text, (None, taglist, state) is returned and\n"
+	       "  tag(text,tagtable,resume=state) continues the run on the longer text\n"
+	       "  (which has to start with the text seen so far); partial tells whether\n"
+	       "  it may go on further\n"
+	       "- slice_steps: suspend the run as for partial after that many table\n"
+	       "  entries, whatever the text; resume=state runs the next slice\n"
+	       "- compact: return the taglist as a TagTree, which keeps the result\n"
+	       "  tree in flat arrays and creates the result tuples on access"
 	       )
 {
     PyObject *text;
+    PyObject *textview = NULL;
     PyObject *tagtable;
-    Py_ssize_t sliceright = INT_MAX;
+    Py_ssize_t sliceright = PY_SSIZE_T_MAX;
     Py_ssize_t sliceleft = 0;
     PyObject *taglist = 0;
     Py_ssize_t taglist_len;
     PyObject *context = 0;
     const char *encoding = NULL;  /* NEW: optional encoding parameter */
+    PyObject *profile = 0;
+    mxTagProfile profileData, *previousProfile = NULL;
+    int profiling = 0;
+    PyObject *max_steps = 0;
+    PyObject *deadline = 0;
+    mxTagLimits limitsData, *previousLimits = NULL;
+    int limiting = 0;
+    PyObject *partial = 0;
+    PyObject *resume = 0;
+    PyObject *slice_steps = 0;
+    PyObject *compact = 0;
+    int compacting = 0;
+    mxTagPartial partialData, *previousPartial = NULL;
+    mxTagSuspended *state = NULL;
+    int suspending = 0;
     Py_ssize_t next, result;
     PyObject *res;
 
-    Py_KeywordsGet7Args("OO|nnOOz:tag",
-			text,tagtable,sliceleft,sliceright,taglist,context,encoding);
+    mxTagProfile_Init(&profileData);
+    mxTagLimits_Init(&limitsData);
+    mxTagPartial_Init(&partialData);
+
+    Py_KeywordsGet14Args("OO|nnOOzOOOOOOO:tag",
+			 text,tagtable,sliceleft,sliceright,taglist,context,encoding,profile,
+			 max_steps,deadline,partial,resume,slice_steps,compact);
+
+    /* other buffers than bytes are tagged in place through a
+       memoryview */
+    textview = mxTextTools_AsText(text);
+    if (textview == NULL)
+	goto onError;
+    text = textview;
+
+    /* partial and sliced runs and the runs resuming them; nested
+       tag() calls are none of these unless asked to */
+    if (partial != NULL) {
+	partialData.partial = PyObject_IsTrue(partial);
+	if (partialData.partial < 0)
+	    goto onError;
+    }
+    if (slice_steps != NULL && slice_steps != Py_None) {
+	partialData.slice = PyNumber_AsSsize_t(slice_steps, PyExc_OverflowError);
+	if (partialData.slice == -1 && PyErr_Occurred())
+	    goto onError;
+	Py_Assert(partialData.slice > 0,
+		  PyExc_ValueError,
+		  "slice_steps must be > 0");
+    }
+    if (resume == Py_None)
+	resume = NULL;
+    if (resume != NULL) {
+	Py_Assert(PyCapsule_IsValid(resume, MXTE_SUSPENDED_NAME),
+		  PyExc_TypeError,
+		  "resume must be the state returned by a suspended tag() call");
+	partialData.state = (mxTagSuspended *)PyCapsule_GetPointer(resume,
+								   MXTE_SUSPENDED_NAME);
+	Py_Assert(partialData.state->suspended,
+		  PyExc_ValueError,
+		  "the run was resumed already");
+	if (taglist == NULL)
+	    taglist = partialData.state->rootTaglist;
+	Py_Assert(taglist == partialData.state->rootTaglist,
+		  PyExc_ValueError,
+		  "resume needs the taglist of the suspended run");
+	sliceleft = partialData.state->sliceleft;
+    }
+    else if (partialData.partial || partialData.slice > 0) {
+	state = mxTagSuspended_New();
+	if (state == NULL)
+	    goto onError;
+	partialData.state = state;
+    }
+    Py_Assert(partialData.state == NULL || profile == NULL || profile == Py_None,
+	      PyExc_ValueError,
+	      "partial, sliced and resumed runs can't be profiled");
+    if (compact != NULL) {
+	compacting = PyObject_IsTrue(compact);
+	if (compacting < 0)
+	    goto onError;
+	Py_Assert(!compacting || partialData.state == NULL,
+		  PyExc_ValueError,
+		  "partial, sliced and resumed runs can't be compact");
+	Py_Assert(!compacting || taglist == NULL,
+		  PyExc_ValueError,
+		  "compact runs build their own taglist");
+    }
+    previousPartial = mxTextTools_CurrentPartial();
+    if (partialData.state != NULL || previousPartial != NULL) {
+	if (PyThread_tss_set(&mxTextTools_PartialKey,
+			     partialData.state != NULL ? &partialData : NULL))
+	    Py_Error(PyExc_RuntimeError,
+		     "could not set up the partial run");
+	suspending = 1;
+    }
+
+    if (profile == Py_None)
+	profile = NULL;
+    /* nested tag() calls (from callbacks) only profile if asked to */
+    previousProfile = mxTextTools_CurrentProfile();
+    if (profile != NULL || previousProfile != NULL) {
+	if (PyThread_tss_set(&mxTextTools_ProfileKey,
+			     profile != NULL ? &profileData : NULL))
+	    Py_Error(PyExc_RuntimeError,
+		     "could not set up profiling");
+	profiling = 1;
+    }
+
+    /* nested tag() calls share the limits of their caller unless
+       they set their own */
+    if (max_steps == Py_None)
+	max_steps = NULL;
+    if (deadline == Py_None)
+	deadline = NULL;
+    if (max_steps != NULL || deadline != NULL) {
+	if (max_steps != NULL) {
+	    limitsData.maxSteps = PyNumber_AsSsize_t(max_steps, PyExc_OverflowError);
+	    if (limitsData.maxSteps == -1 && PyErr_Occurred())
+		goto onError;
+	    if (limitsData.maxSteps < 0)
+		Py_Error(PyExc_ValueError,
+			 "max_steps must be >= 0");
+	}
+	if (deadline != NULL) {
+	    double seconds = PyFloat_AsDouble(deadline);
+
+	    if (seconds == -1.0 && PyErr_Occurred())
+		goto onError;
+	    limitsData.hasDeadline = 1;
+	    if (seconds * 1e9 >= (double)LLONG_MAX)
+		limitsData.deadline = LLONG_MAX;
+	    else if (seconds * 1e9 <= (double)LLONG_MIN)
+		limitsData.deadline = LLONG_MIN;
+	    else
+		limitsData.deadline = (long long)(seconds * 1e9);
+	}
+	previousLimits = mxTextTools_CurrentLimits();
+	if (PyThread_tss_set(&mxTextTools_LimitsKey, &limitsData))
+	    Py_Error(PyExc_RuntimeError,
+		     "could not set up the limits");
+	limiting = 1;
+    }
 
-    if (taglist == NULL) { 
+    if (compacting) {
+	taglist = mxTagTree_New();
+	if (taglist == NULL)
+	    goto onError;
+	taglist_len = 0;
+    }
+    else if (taglist == NULL) { 
 	/* not given, so use default: an empty list */
 	taglist = PyList_New(0);
 	if (taglist == NULL)
@@ -4493,7 +7475,7 @@ Py_C_Function_WithKeywords(
            compilation with a clear error message. */
 
         /* Encoding only makes sense with bytes input */
-        if (!PyBytes_Check(text)) {
+        if (!mxTextTools_IsByteText(text)) {
             Py_Error(PyExc_TypeError,
                 "encoding parameter is only valid when text is bytes");
         }
@@ -4501,31 +7483,48 @@ Py_C_Function_WithKeywords(
 
     /* Prepare the argument for the Tagging Engine and let it process
        the request */
-    if (PyString_Check(text)) {
+    if (mxTextTools_IsByteText(text)) {
 
         if (encoding != NULL) {
             /* Phase 2: Compile Unicode patterns to byte sequences and parse bytes directly.
                Positions in results are byte positions. */
-            int is_multibyte = (strcasecmp(encoding, "utf-8") == 0 ||
-                                strcasecmp(encoding, "utf8") == 0);
+            PyObject *encodingname;
+
+            Py_CheckBufferSlice(mxTextTools_ByteTextSize(text), sliceleft, sliceright);
 
-            Py_CheckStringSlice(text, sliceleft, sliceright);
+            encodingname = mxTextTools_NormalizeEncoding(encoding);
+            if (encodingname == NULL)
+                goto onError;
 
             if (!mxTagTable_Check(tagtable)) {
-                /* Create encoded tag table - converts Unicode patterns to bytes */
-                tagtable = mxTagTable_NewEncoded(tagtable, encoding, is_multibyte, 1);
+                /* Create (or fetch the cached) encoded tag table -
+                   converts Unicode patterns to bytes */
+                tagtable = mxTagTable_NewEncoded(tagtable, encodingname, 1);
+                Py_DECREF(encodingname);
                 if (tagtable == NULL)
                     goto onError;
             }
             else {
                 /* Pre-compiled TagTable - check compatibility */
                 mxTagTableObject *tt = (mxTagTableObject *)tagtable;
-                if (tt->encoding == NULL) {
+                int rc;
+
+                if (tt->encodingname == NULL) {
+                    Py_DECREF(encodingname);
                     Py_Error(PyExc_TypeError,
                         "Pre-compiled TagTable was not created with encoding support. "
-                        "Use a tuple/list definition with the encoding parameter.");
+                        "Use EncodedTagTable() or a tuple/list definition with the "
+                        "encoding parameter.");
+                }
+                rc = PyUnicode_Compare(tt->encodingname, encodingname);
+                Py_DECREF(encodingname);
+                if (rc != 0) {
+                    if (!PyErr_Occurred())
+                        PyErr_Format(PyExc_ValueError,
+                            "Pre-compiled TagTable was created for encoding '%s', "
+                            "not '%s'", tt->encoding, encoding);
+                    goto onError;
                 }
-                /* Note: Could also check encoding matches, but for now we trust the user */
                 Py_INCREF(tagtable);
             }
 
@@ -4541,7 +7540,7 @@ Py_C_Function_WithKeywords(
         }
         else {
             /* No encoding - use original bytes parsing */
-            Py_CheckStringSlice(text, sliceleft, sliceright);
+            Py_CheckBufferSlice(mxTextTools_ByteTextSize(text), sliceleft, sliceright);
 
             if (!mxTagTable_Check(tagtable)) {
                 tagtable = mxTagTable_New(tagtable, MXTAGTABLE_STRINGTYPE, 1);
@@ -4598,12 +7597,73 @@ Py_C_Function_WithKeywords(
 	Py_Error(PyExc_TypeError,
 		 "text must be a string or unicode");
 
+    if (profiling) {
+	PyThread_tss_set(&mxTextTools_ProfileKey, previousProfile);
+	profiling = 0;
+    }
+    if (limiting) {
+	PyThread_tss_set(&mxTextTools_LimitsKey, previousLimits);
+	limiting = 0;
+    }
+    if (suspending) {
+	PyThread_tss_set(&mxTextTools_PartialKey, previousPartial);
+	suspending = 0;
+    }
+    mxTagLimits_Clear(&limitsData);
+
     /* Check for exceptions during matching */
     if (result == 0)
 	goto onError;
 
-    /* Undo changes to taglist in case of a match failure (result == 1) */
-    if (result == 1 && taglist != Py_None) {
+    if (result == MXTE_SUSPENDED_CODE) {
+	PyObject *capsule;
+
+	/* the run waits for more text */
+	if (resume != NULL) {
+	    capsule = resume;
+	    Py_INCREF(capsule);
+	}
+	else {
+	    capsule = PyCapsule_New(state, MXTE_SUSPENDED_NAME,
+				    mxTextTools_FreeSuspended);
+	    if (capsule == NULL)
+		goto onError;
+	    state = NULL;
+	}
+	res = PyTuple_New(3);
+	if (!res) {
+	    Py_DECREF(capsule);
+	    goto onError;
+	}
+	Py_INCREF(Py_None);
+	PyTuple_SET_ITEM(res,0,Py_None);
+	PyTuple_SET_ITEM(res,1,taglist);
+	PyTuple_SET_ITEM(res,2,capsule);
+	Py_DECREF(textview);
+	return res;
+    }
+    mxTagSuspended_Free(state);
+    state = NULL;
+
+    if (profile != NULL) {
+	PyObject *tree, *v;
+
+	if (profileData.failed)
+	    Py_Error(PyExc_MemoryError,
+		     "out of memory while profiling");
+	tree = mxTagProfile_AsTuple(&profileData);
+	if (tree == NULL)
+	    goto onError;
+	v = PyObject_CallMethod(profile, "append", "(O)", tree);
+	Py_DECREF(tree);
+	if (v == NULL)
+	    goto onError;
+	Py_DECREF(v);
+    }
+
+    /* Undo changes to taglist in case of a match failure (result == 1);
+       nothing is added to a TagTree then */
+    if (result == 1 && PyList_Check(taglist)) {
 	DPRINTF("  undoing changes: del taglist[%i:%i]\n",
 		taglist_len, PyList_Size(taglist));
 	if (PyList_SetSlice(taglist, 
@@ -4624,13 +7684,24 @@ Py_C_Function_WithKeywords(
     PyTuple_SET_ITEM(res,0,PyInt_FromLong(result));
     PyTuple_SET_ITEM(res,1,taglist);
     PyTuple_SET_ITEM(res,2,PyInt_FromLong(next));
+    Py_DECREF(textview);
     return res;
 
  onError:
+    if (profiling)
+	PyThread_tss_set(&mxTextTools_ProfileKey, previousProfile);
+    if (limiting)
+	PyThread_tss_set(&mxTextTools_LimitsKey, previousLimits);
+    if (suspending)
+	PyThread_tss_set(&mxTextTools_PartialKey, previousPartial);
+    mxTagProfile_Clear(&profileData);
+    mxTagLimits_Clear(&limitsData);
+    mxTagSuspended_Free(state);
     if (!PyErr_Occurred())
 	Py_Error(PyExc_SystemError,
 		 "NULL result without error in builtin tag()");
     Py_XDECREF(taglist);
+    Py_XDECREF(textview);
     return NULL;
 }
 
@@ -5037,6 +8108,216 @@ Py_C_Function( mxTextTools_hex2str,
     return NULL;
 }
 
+Py_C_Function( mxTextTools_tagtable_cache_info,
+	       "tagtable_cache_info()\n\n"
+	       "Return a dictionary with the TagTable cache statistics:\n"
+	       "hits, misses, evictions, size and maxsize.")
+{
+    Py_ssize_t hits, misses, evictions, size, maxsize;
+
+    Py_NoArgsCheck();
+    Py_Assert(mxTextTools_TagTables_lock != NULL,
+	      PyExc_SystemError,
+	      "TagTable cache not initialized");
+
+    PyThread_acquire_lock(mxTextTools_TagTables_lock, WAIT_LOCK);
+    hits = mxTextTools_TagTables_Hits;
+    misses = mxTextTools_TagTables_Misses;
+    evictions = mxTextTools_TagTables_Evictions;
+    size = mxTextTools_TagTables ? PyDict_Size(mxTextTools_TagTables) : 0;
+    maxsize = mxTextTools_TagTables_MaxSize;
+    PyThread_release_lock(mxTextTools_TagTables_lock);
+
+    return Py_BuildValue("{s:n,s:n,s:n,s:n,s:n}",
+			 "hits", hits,
+			 "misses", misses,
+			 "evictions", evictions,
+			 "size", size,
+			 "maxsize", maxsize);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxTextTools_set_tagtable_cache_size,
+	       "set_tagtable_cache_size(maxsize)\n\n"
+	       "Set the maximum number of compiled TagTables kept in the\n"
+	       "cache and return the previous limit. Least recently used\n"
+	       "entries are evicted if the cache is larger than the new\n"
+	       "limit. A limit of 0 disables caching.")
+{
+    Py_ssize_t maxsize, previous;
+    PyObject *graveyard;
+    int rc = 0;
+
+    Py_GetArg("n", maxsize);
+    Py_Assert(maxsize >= 0,
+	      PyExc_ValueError,
+	      "maxsize must be >= 0");
+    Py_Assert(mxTextTools_TagTables_lock != NULL,
+	      PyExc_SystemError,
+	      "TagTable cache not initialized");
+
+    graveyard = PyList_New(0);
+    if (graveyard == NULL)
+	goto onError;
+
+    PyThread_acquire_lock(mxTextTools_TagTables_lock, WAIT_LOCK);
+    previous = mxTextTools_TagTables_MaxSize;
+    mxTextTools_TagTables_MaxSize = maxsize;
+    if (mxTextTools_TagTables)
+	rc = mxTextTools_TagTables_Evict(maxsize, graveyard);
+    PyThread_release_lock(mxTextTools_TagTables_lock);
+
+    Py_DECREF(graveyard);
+    if (rc)
+	goto onError;
+    return PyLong_FromSsize_t(previous);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxTextTools_set_release_gil,
+	       "set_release_gil(flag)\n\n"
+	       "Enable or disable releasing the GIL while tagging with\n"
+	       "callback-free TagTables and return the previous setting.")
+{
+    int flag, previous;
+
+    Py_GetArg("i", flag);
+    previous = mxTextTools_ReleaseGIL;
+    mxTextTools_ReleaseGIL = (flag != 0);
+    return PyBool_FromLong(previous);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxTextTools_set_memo_size,
+	       "set_memo_size(size)\n\n"
+	       "Set the maximum number of outcomes of Memoize-flagged table\n"
+	       "entries the engine remembers during a tag() call (0 disables\n"
+	       "memoization) and return the previous setting.")
+{
+    Py_ssize_t size, previous;
+
+    Py_GetArg("n", size);
+    Py_Assert(size >= 0,
+	      PyExc_ValueError,
+	      "memo size must be >= 0");
+    previous = mxTextTools_MemoSize;
+    mxTextTools_MemoSize = size;
+    return PyLong_FromSsize_t(previous);
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxTextTools_clear_tagtable_cache,
+	       "clear_tagtable_cache()\n\n"
+	       "Remove all compiled TagTables from the cache and reset the\n"
+	       "cache statistics.")
+{
+    PyObject *graveyard;
+    int rc = 0;
+
+    Py_NoArgsCheck();
+    Py_Assert(mxTextTools_TagTables_lock != NULL,
+	      PyExc_SystemError,
+	      "TagTable cache not initialized");
+
+    graveyard = PyList_New(0);
+    if (graveyard == NULL)
+	goto onError;
+
+    PyThread_acquire_lock(mxTextTools_TagTables_lock, WAIT_LOCK);
+    if (mxTextTools_TagTables)
+	rc = mxTextTools_TagTables_Evict(0, graveyard);
+    mxTextTools_TagTables_Hits = 0;
+    mxTextTools_TagTables_Misses = 0;
+    mxTextTools_TagTables_Evictions = 0;
+    PyThread_release_lock(mxTextTools_TagTables_lock);
+
+    Py_DECREF(graveyard);
+    if (rc)
+	goto onError;
+    Py_INCREF(Py_None);
+    return Py_None;
+
+ onError:
+    return NULL;
+}
+
+Py_C_Function( mxTextTools_to_arrays,
+	       "to_arrays(taglist)\n\n"
+	       "Return the nodes of taglist (a list or a TagTree) as columns\n"
+	       "(tag, start, stop, depth, tags): four array('q') with one\n"
+	       "item per node in the order of a depth-first walk, and a tuple\n"
+	       "of the tag objects, which the items of tag index. Entries\n"
+	       "other than result tuples have their object as tag and -1 as\n"
+	       "start and stop.")
+{
+    PyObject *taglist, *tags = NULL, *module = NULL, *arraytype = NULL;
+    PyObject *result = NULL, *v;
+    mxTagColumns columns = {NULL, NULL, NULL, NULL, 0, 0};
+    mxTagTreeIds ids;
+    int rc;
+
+    Py_GetArg("O", taglist);
+    Py_Assert(PyList_Check(taglist) || mxTagTree_Check(taglist),
+	      PyExc_TypeError,
+	      "taglist must be a list or a TagTree");
+
+    tags = PyList_New(0);
+    if (tags == NULL)
+	goto onError;
+    if (mxTagTreeIds_Init(&ids, tags))
+	goto onError;
+    rc = mxTagColumns_AddList(&columns, &ids, tags, taglist, 0);
+    mxTagTreeIds_Free(&ids);
+    if (rc)
+	goto onError;
+
+    module = PyImport_ImportModule("array");
+    if (module == NULL)
+	goto onError;
+    arraytype = PyObject_GetAttrString(module, "array");
+    if (arraytype == NULL)
+	goto onError;
+    result = PyTuple_New(5);
+    if (result == NULL)
+	goto onError;
+#define MXTAGCOLUMNS_SET(i, array)					\
+    v = mxTagColumns_AsArray(arraytype, columns.array, columns.length);\
+    if (v == NULL)							\
+	goto onError;							\
+    PyTuple_SET_ITEM(result, i, v);
+    MXTAGCOLUMNS_SET(0, tag);
+    MXTAGCOLUMNS_SET(1, start);
+    MXTAGCOLUMNS_SET(2, stop);
+    MXTAGCOLUMNS_SET(3, depth);
+#undef MXTAGCOLUMNS_SET
+    v = PyList_AsTuple(tags);
+    if (v == NULL)
+	goto onError;
+    PyTuple_SET_ITEM(result, 4, v);
+
+    mxTagColumns_Free(&columns);
+    Py_DECREF(tags);
+    Py_DECREF(module);
+    Py_DECREF(arraytype);
+    return result;
+
+ onError:
+    mxTagColumns_Free(&columns);
+    Py_XDECREF(tags);
+    Py_XDECREF(module);
+    Py_XDECREF(arraytype);
+    Py_XDECREF(result);
+    return NULL;
+}
+
 
 /* --- module init --------------------------------------------------------- */
 
@@ -5054,9 +8335,12 @@ static PyMethodDef Module_methods[] =
     Py_MethodListEntry("setsplitx",mxTextTools_setsplitx),
     Py_MethodListEntry("setstrip",mxTextTools_setstrip),
     Py_MethodWithKeywordsListEntry("TextSearch",mxTextSearch_TextSearch),
+    Py_MethodListEntry("MultiTextSearch",mxMultiTextSearch_MultiTextSearch),
     Py_MethodListEntry("CharSet",mxCharSet_CharSet),
     Py_MethodListEntry("TagTable",mxTagTable_TagTable),
     Py_MethodListEntry("UnicodeTagTable",mxTagTable_UnicodeTagTable),
+    Py_MethodListEntry("BytesTagTable",mxTagTable_BytesTagTable),
+    Py_MethodListEntry("EncodedTagTable",mxTagTable_EncodedTagTable),
 	// Disabled because we don't actually use these functions
 	// and they are using a hack that tries to avoid the overhead
 	// of the single-value tuple creation/unpacking
@@ -5068,6 +8352,12 @@ static PyMethodDef Module_methods[] =
     Py_MethodListEntry("prefix",mxTextTools_prefix),
     Py_MethodListEntry("hex2str",mxTextTools_hex2str),
     Py_MethodListEntry("str2hex",mxTextTools_str2hex),
+    Py_MethodListEntry("tagtable_cache_info",mxTextTools_tagtable_cache_info),
+    Py_MethodListEntry("set_tagtable_cache_size",mxTextTools_set_tagtable_cache_size),
+    Py_MethodListEntry("clear_tagtable_cache",mxTextTools_clear_tagtable_cache),
+    Py_MethodListEntry("set_release_gil",mxTextTools_set_release_gil),
+    Py_MethodListEntry("set_memo_size",mxTextTools_set_memo_size),
+    Py_MethodListEntry("to_arrays",mxTextTools_to_arrays),
     // Py_MethodListEntrySingleArg("isascii",mxTextTools_isascii),
     {NULL,NULL} /* end of list */
 };
@@ -5077,6 +8367,7 @@ static
 void mxTextToolsModule_Cleanup(void)
 {
     mxTextTools_TagTables = NULL;
+    mxTextTools_EncodingNames = NULL;
     mxTextTools_Module = NULL;
 
     /* Cleanup the TagTable cache lock */
@@ -5153,6 +8444,10 @@ static PyObject* mxTextToolsModule_Initialize(void)
         PyThread_release_lock(mxTextTools_Init_lock);
         return NULL;
     }
+    if (PyType_Ready(&mxMultiTextSearch_Type) < 0) {
+        PyThread_release_lock(mxTextTools_Init_lock);
+        return NULL;
+    }
     if (PyType_Ready(&mxCharSet_Type) < 0) {
         PyThread_release_lock(mxTextTools_Init_lock);
         return NULL;
@@ -5161,6 +8456,14 @@ static PyObject* mxTextToolsModule_Initialize(void)
         PyThread_release_lock(mxTextTools_Init_lock);
         return NULL;
     }
+    if (PyType_Ready(&mxTagTree_Type) < 0) {
+        PyThread_release_lock(mxTextTools_Init_lock);
+        return NULL;
+    }
+    if (PyType_Ready(&mxTagTreeIterator_Type) < 0) {
+        PyThread_release_lock(mxTextTools_Init_lock);
+        return NULL;
+    }
 
     /* create module */
     module = PyModule_Create(&mxTextTools_ModuleDef);
@@ -5187,6 +8490,23 @@ static PyObject* mxTextToolsModule_Initialize(void)
         return NULL;
     }
 
+    /* Thread-local keys for tag(...,profile=...,max_steps=...,deadline=...,
+       partial=...,resume=...) */
+    if ((!PyThread_tss_is_created(&mxTextTools_ProfileKey) &&
+         PyThread_tss_create(&mxTextTools_ProfileKey)) ||
+        (!PyThread_tss_is_created(&mxTextTools_LimitsKey) &&
+         PyThread_tss_create(&mxTextTools_LimitsKey)) ||
+        (!PyThread_tss_is_created(&mxTextTools_PartialKey) &&
+         PyThread_tss_create(&mxTextTools_PartialKey))) {
+        PyThread_free_lock(mxTextTools_TagTables_lock);
+        mxTextTools_TagTables_lock = NULL;
+        Py_DECREF(mxTextTools_TagTables);
+        mxTextTools_TagTables = NULL;
+        Py_DECREF(module);
+        PyThread_release_lock(mxTextTools_Init_lock);
+        return NULL;
+    }
+
     /* Register cleanup function */
     if (Py_AtExit(mxTextToolsModule_Cleanup) < 0) {
         PyThread_free_lock(mxTextTools_TagTables_lock);
@@ -5238,6 +8558,10 @@ static PyObject* mxTextToolsModule_Initialize(void)
         goto error_cleanup;
     if (PyModule_AddIntConstant(module, "TRIVIAL", MXTEXTSEARCH_TRIVIAL) < 0)
         goto error_cleanup;
+    if (PyModule_AddIntConstant(module, "TWOWAY", MXTEXTSEARCH_TWOWAY) < 0)
+        goto error_cleanup;
+    if (PyModule_AddIntConstant(module, "AUTO", MXTEXTSEARCH_AUTO) < 0)
+        goto error_cleanup;
 
     /* Init exceptions */
     mxTextTools_Error = PyErr_NewException("mxTextTools.Error", PyExc_Exception, NULL);
@@ -5247,6 +8571,20 @@ static PyObject* mxTextToolsModule_Initialize(void)
         Py_DECREF(mxTextTools_Error);
         goto error_cleanup;
     }
+    mxTextTools_LimitExceeded = PyErr_NewExceptionWithDoc(
+        "mxTextTools.LimitExceeded",
+        "Raised by tag() when a parse exceeds its max_steps or deadline\n\n"
+        "Attributes: limit ('steps' or 'deadline'), position, steps (the\n"
+        "number of table entries run), production (the innermost table\n"
+        "called with a string tag object or None) and stack (the\n"
+        "(tagobj, table) pairs of the tables being run, outermost first).",
+        mxTextTools_Error, NULL);
+    if (!mxTextTools_LimitExceeded)
+        goto error_cleanup;
+    if (PyModule_AddObject(module, "LimitExceeded", mxTextTools_LimitExceeded) < 0) {
+        Py_DECREF(mxTextTools_LimitExceeded);
+        goto error_cleanup;
+    }
 
     /* Type objects - these are static types, so we INCREF before AddObject.
        On failure, we must DECREF since AddObject didn't steal the ref. */
@@ -5255,6 +8593,11 @@ static PyObject* mxTextToolsModule_Initialize(void)
         Py_DECREF(&mxTextSearch_Type);
         goto error_cleanup;
     }
+    Py_INCREF(&mxMultiTextSearch_Type);
+    if (PyModule_AddObject(module, "MultiTextSearchType", (PyObject*) &mxMultiTextSearch_Type) < 0) {
+        Py_DECREF(&mxMultiTextSearch_Type);
+        goto error_cleanup;
+    }
     Py_INCREF(&mxCharSet_Type);
     if (PyModule_AddObject(module, "CharSetType", (PyObject*) &mxCharSet_Type) < 0) {
         Py_DECREF(&mxCharSet_Type);
@@ -5265,6 +8608,11 @@ static PyObject* mxTextToolsModule_Initialize(void)
         Py_DECREF(&mxTagTable_Type);
         goto error_cleanup;
     }
+    Py_INCREF(&mxTagTree_Type);
+    if (PyModule_AddObject(module, "TagTreeType", (PyObject*) &mxTagTree_Type) < 0) {
+        Py_DECREF(&mxTagTree_Type);
+        goto error_cleanup;
+    }
 
     /* Tag Table command symbols (these will be exposed via
        simpleparse.stt.TextTools.Constants.TagTables) */
@@ -5278,6 +8626,7 @@ static PyObject* mxTextToolsModule_Initialize(void)
     ADD_INT_CONSTANT("_const_Word", MATCH_WORD);
     ADD_INT_CONSTANT("_const_WordStart", MATCH_WORDSTART);
     ADD_INT_CONSTANT("_const_WordEnd", MATCH_WORDEND);
+    ADD_INT_CONSTANT("_const_WordInList", MATCH_WORDINLIST);
 
     ADD_INT_CONSTANT("_const_AllInSet", MATCH_ALLINSET);
     ADD_INT_CONSTANT("_const_IsInSet", MATCH_ISINSET);
@@ -5291,6 +8640,7 @@ static PyObject* mxTextToolsModule_Initialize(void)
     ADD_INT_CONSTANT("_const_Move", MATCH_MOVE);
 
     ADD_INT_CONSTANT("_const_JumpTarget", MATCH_JUMPTARGET);
+    ADD_INT_CONSTANT("_const_Dispatch", MATCH_DISPATCH);
 
     ADD_INT_CONSTANT("_const_sWordStart", MATCH_SWORDSTART);
     ADD_INT_CONSTANT("_const_sWordEnd", MATCH_SWORDEND);
@@ -5314,6 +8664,7 @@ static PyObject* mxTextToolsModule_Initialize(void)
     ADD_INT_CONSTANT("_const_AppendTagobj", MATCH_APPENDTAGOBJ);
     ADD_INT_CONSTANT("_const_AppendMatch", MATCH_APPENDMATCH);
     ADD_INT_CONSTANT("_const_LookAhead", MATCH_LOOKAHEAD);
+    ADD_INT_CONSTANT("_const_Memoize", MATCH_MEMOIZE);
 
     /* Tag Table argument integers */
     ADD_INT_CONSTANT("_const_To", MATCH_JUMP_TO);
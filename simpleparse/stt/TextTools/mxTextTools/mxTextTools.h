@@ -11,6 +11,7 @@
 #define MXTEXTTOOLS_MODULE "mxTextTools"
 
 #include "mxbmse.h"
+#include "mxtw.h"
 #ifdef MXFASTSEARCH
 # include "private/mxfse.h"
 #endif
@@ -35,6 +36,11 @@ extern "C" {
 #define MXTEXTSEARCH_FASTSEARCH		1
 #define MXTEXTSEARCH_TRIVIAL		2
 #define MXTEXTSEARCH_BOYERMOORE_MODERN	3
+#define MXTEXTSEARCH_TWOWAY		4
+
+/* Pseudo algorithm: choose one of the above from the match string
+   when the object is created */
+#define MXTEXTSEARCH_AUTO		-1
 
 typedef struct {
     PyObject_HEAD
@@ -116,9 +122,76 @@ typedef struct {
                                         1 - UCS-2 Unicode lookup
                                         2 - UCS-4 Unicode lookup
                                     */
+    int negative;                   /* Set was defined as "^..." ; it
+				       then contains all characters
+				       beyond the lookup table */
     void *lookup;                   /* Lookup table */
+    Py_UCS4 *ranges;                /* UCS-2 mode: sorted, disjoint
+				       intervals lo, hi of the members
+				       beyond the lookup table (before
+				       applying negative) */
+    Py_ssize_t nranges;             /* Number of intervals in ranges */
 } mxCharSetObject;
 
+/* Lookup tables, see mxTextTools.c for the details */
+
+#define STRING_CHARSET_SIZE 		256
+#define STRING_CHARSET_BITMAP_SIZE 	(STRING_CHARSET_SIZE / 8)
+
+typedef struct {
+    unsigned char bitmap[STRING_CHARSET_BITMAP_SIZE];
+    						/* character bitmap */
+} string_charset;
+
+#define UNICODE_CHARSET_SIZE 		65536
+#define UNICODE_CHARSET_BITMAP_SIZE 	32
+#define UNICODE_CHARSET_BITMAPS 	(UNICODE_CHARSET_SIZE / (UNICODE_CHARSET_BITMAP_SIZE * 8))
+#define UNICODE_CHARSET_BIGMAP_SIZE	(UNICODE_CHARSET_SIZE / 8)
+
+typedef struct {
+    unsigned char bitmapindex[UNICODE_CHARSET_BITMAPS];	
+    					/* Index to char bitmaps */
+    unsigned char bitmaps[UNICODE_CHARSET_BITMAPS][UNICODE_CHARSET_BITMAP_SIZE];
+    					/* Variable length bitmap array */
+} unicode_charset;
+
+/* Test whether ch is in the (initialised) character set cs, a plain
+   bitmap lookup (a binary search for characters beyond the BMP) which
+   doesn't need the GIL. */
+
+static inline
+int mxCharSet_Lookup(mxCharSetObject *cs,
+		     Py_UCS4 ch)
+{
+    if (cs->mode == MXCHARSET_8BITMODE) {
+	if (ch >= STRING_CHARSET_SIZE)
+	    return cs->negative;
+	return (((string_charset *)cs->lookup)->bitmap[ch >> 3] >> (ch & 7)) & 1;
+    }
+    else {
+	unicode_charset *lookup = (unicode_charset *)cs->lookup;
+
+	if (ch >= UNICODE_CHARSET_SIZE) {
+	    /* Binary search of the intervals */
+	    Py_ssize_t low = 0, high = cs->nranges;
+
+	    while (low < high) {
+		Py_ssize_t middle = (low + high) >> 1;
+
+		if (ch > cs->ranges[2*middle + 1])
+		    low = middle + 1;
+		else if (ch < cs->ranges[2*middle])
+		    high = middle;
+		else
+		    return !cs->negative;
+	    }
+	    return cs->negative;
+	}
+	return (lookup->bitmaps[lookup->bitmapindex[ch >> 8]][(ch >> 3) & 31]
+		>> (ch & 7)) & 1;
+    }
+}
+
 MXTEXTTOOLS_EXTERNALIZE(PyTypeObject) mxCharSet_Type;
 
 #define mxCharSet_Check(v) \
@@ -153,8 +226,88 @@ typedef struct {
     PyObject *args;			/* Command arguments */
     int jne;				/* Non-match jump offset */
     int je;				/* Match jump offset */
+    void *data;				/* Data compiled from args by the
+					   commands which need it
+					   (WordInList: mxWordTrie[2]) or
+					   NULL */
 } mxTagTableEntry;
 
+/* Trie of the words of a WordInList command. Node 0 is the root, the
+   children of node i are the nodes first[i] .. first[i]+count[i]-1,
+   sorted by the key of the edge leading to them. */
+
+typedef struct {
+    Py_ssize_t nnodes;
+    Py_UCS4 *keys;			/* Edge key of each node */
+    Py_ssize_t *first;			/* First child of each node */
+    Py_ssize_t *count;			/* Number of children */
+    Py_ssize_t *word;			/* Index of the first word ending
+					   at the node or -1 */
+} mxWordTrie;
+
+/* Return the child of node for key or -1, a binary search which
+   doesn't need the GIL. */
+
+static inline
+Py_ssize_t mxWordTrie_Child(mxWordTrie *trie,
+			    Py_ssize_t node,
+			    Py_UCS4 key)
+{
+    Py_ssize_t low = trie->first[node];
+    Py_ssize_t high = low + trie->count[node];
+
+    while (low < high) {
+	Py_ssize_t middle = (low + high) / 2;
+
+	if (trie->keys[middle] < key)
+	    low = middle + 1;
+	else
+	    high = middle;
+    }
+    if (low < trie->first[node] + trie->count[node] &&
+	trie->keys[low] == key)
+	return low;
+    return -1;
+}
+
+/* --- Multi Text Search Object ---------------------------------*/
+
+/* Aho-Corasick automaton for a tuple of words: the trie of the words
+   extended by the failure link of each node (the node of the longest
+   proper suffix of its path which is also in the trie). */
+
+typedef struct {
+    PyObject_HEAD
+    PyObject *match;			/* Tuple of the words (all strings
+					   or all bytes) */
+    mxWordTrie trie;
+    Py_ssize_t *fail;			/* Failure link of each node */
+    Py_ssize_t *depth;			/* Length of the path of each node */
+    Py_ssize_t *longest;		/* Length of the longest word which
+					   is a suffix of the path or 0 */
+    Py_ssize_t root[256];		/* Child of the root for keys < 256
+					   or 0 */
+} mxMultiTextSearchObject;
+
+MXTEXTTOOLS_EXTERNALIZE(PyTypeObject) mxMultiTextSearch_Type;
+
+#define mxMultiTextSearch_Check(v) \
+        (Py_TYPE((v)) == &mxMultiTextSearch_Type)
+
+/* Search for the leftmost occurrence of any of the words in
+   text[start:stop], text being an array of charsize (1, 2 or 4) byte
+   characters; returns 1 and sets the slice of the first declared word
+   found at that position, 0 if there is none. Doesn't need the GIL. */
+
+extern
+Py_ssize_t mxMultiTextSearch_SearchBuffer(PyObject *self,
+					  const void *text,
+					  int charsize,
+					  Py_ssize_t start,
+					  Py_ssize_t stop,
+					  Py_ssize_t *sliceleft,
+					  Py_ssize_t *sliceright);
+
 #define MXTAGTABLE_STRINGTYPE	0
 #define MXTAGTABLE_UNICODETYPE	1
 #define MXTAGTABLE_ENCODEDTYPE	2  /* Bytes with specified encoding */
@@ -169,7 +322,13 @@ typedef struct {
                                    1 - Unicode args
                                    2 - encoded bytes args */
     const char *encoding;       /* Encoding name (e.g., "utf-8") or NULL */
+    PyObject *encodingname;     /* Normalized encoding name owning the
+                                   encoding buffer or NULL */
     int is_multibyte;           /* 1 for UTF-8, 0 for single-byte encodings */
+    int callbackfree;           /* 1 if the table's own entries never
+                                   call back into Python */
+    int nogil;                  /* Cached mxTagTable_IsCallbackFree()
+                                   result or -1 if not yet known */
     int numentries;             /* number of allocated entries */
     mxTagTableEntry entry[1];   /* Variable length array of
                                    mxTagTableEntry fields */
@@ -194,10 +353,37 @@ PyObject *mxTagTable_New(PyObject *definition,
 /* Create encoded tag table - encodes Unicode patterns to specified encoding */
 extern
 PyObject *mxTagTable_NewEncoded(PyObject *definition,
-				const char *encoding,
-				int is_multibyte,
+				PyObject *encoding,
 				int cacheable);
 
+/* Return 1 if table and all tables reachable from it can be run
+   without the GIL, 0 if not, -1 in case of an error */
+extern
+int mxTagTable_IsCallbackFree(mxTagTableObject *table);
+
+/* Return text ready for tagging and searching (a new reference):
+   bytes and str as they are, other objects supporting the buffer
+   protocol (mmap, bytearray, memoryview, ...) as a memoryview holding
+   their buffer, which has to be C-contiguous with 1-byte items; NULL
+   with TypeError set if it isn't. Objects of other types are returned
+   as they are, for the caller to reject. */
+extern
+PyObject *mxTextTools_AsText(PyObject *text);
+
+/* 1-byte text: bytes or a memoryview returned by mxTextTools_AsText() */
+#define mxTextTools_IsByteText(v) \
+	(PyBytes_Check(v) || PyMemoryView_Check(v))
+#define mxTextTools_ByteTextData(v) \
+	(PyBytes_Check(v) ? PyBytes_AS_STRING(v) : \
+	 (char *)PyMemoryView_GET_BUFFER(v)->buf)
+#define mxTextTools_ByteTextSize(v) \
+	(PyBytes_Check(v) ? PyBytes_GET_SIZE(v) : \
+	 PyMemoryView_GET_BUFFER(v)->len)
+
+/* Return the normalized codec name for encoding */
+extern
+PyObject *mxTextTools_NormalizeEncoding(const char *encoding);
+
 /* --- Tagging Engine -------------------------------------------*/
 
 /* Exporting these APIs for mxTextTools internal use only ! */
@@ -248,6 +434,208 @@ int mxTextTools_TaggingEngine_Modern(PyObject *textobj,
 				     PyObject *context,
 				     Py_ssize_t *next);
 
+/* Result records collected by the GIL-free engine (from
+   mxte_nogil.c); they are converted into taglist entries once the GIL
+   has been re-acquired */
+typedef struct {
+    PyObject *tagobj;			/* Borrowed tag object */
+    Py_ssize_t left, right;		/* Matched slice */
+    Py_ssize_t children;		/* Index of the first record of the
+					   child list or -1 for None */
+    int flags;				/* MATCH_APPENDMATCH,
+					   MATCH_APPENDTAGOBJ or 0 */
+} mxTagResult;
+
+typedef struct {
+    mxTagResult *items;
+    Py_ssize_t length;
+    Py_ssize_t allocated;
+} mxTagResultBuffer;
+
+/* Flag set by set_release_gil() */
+extern
+int mxTextTools_ReleaseGIL;
+
+/* Memo budget set by set_memo_size() (see mxte_memo.h) */
+extern
+Py_ssize_t mxTextTools_MemoSize;
+
+/* Profile collected by the standard engine for tag(...,profile=...);
+   one node per table called from a node with a given tag object, see
+   mxte_profile.h */
+typedef struct {
+    PyObject *table;			/* The called table */
+    PyObject *tagobj;			/* Tag object of the calling entry */
+    Py_ssize_t parent;			/* Index of the calling node or -1 */
+    Py_ssize_t child, lastChild;	/* First and last called node or -1 */
+    Py_ssize_t sibling;			/* Next node called by parent or -1 */
+    Py_ssize_t entries, successes, failures;
+    Py_ssize_t consumed;		/* Characters matched */
+    long long time;			/* Nanoseconds, children included */
+} mxTagProfileNode;
+
+typedef struct {
+    mxTagProfileNode *nodes;
+    Py_ssize_t length;
+    Py_ssize_t allocated;
+    int failed;				/* Ran out of memory */
+} mxTagProfile;
+
+/* Thread-local key holding the mxTagProfile of the running tag()
+   call, if it profiles */
+extern
+Py_tss_t mxTextTools_ProfileKey;
+
+#define mxTextTools_CurrentProfile() \
+    ((mxTagProfile *)PyThread_tss_get(&mxTextTools_ProfileKey))
+
+/* Limits of tag(...,max_steps=...,deadline=...), see mxte_limits.h */
+typedef struct {
+    PyObject *table;			/* A table being run */
+    PyObject *tagobj;			/* Tag object of the entry which
+					   called it or NULL */
+} mxTagLimitsFrame;
+
+typedef struct {
+    Py_ssize_t maxSteps;		/* Table entries which may be started */
+    long long deadline;			/* Monotonic clock in nanoseconds */
+    int hasDeadline;
+    Py_ssize_t steps;			/* Table entries started so far */
+    int exceeded;			/* MXTE_LIMIT_* of an unreported
+					   excess or 0 */
+    Py_ssize_t position;		/* Where the excess was detected */
+    mxTagLimitsFrame *frames;		/* Tables being run then, root
+					   first, or NULL */
+    Py_ssize_t depth;			/* Number of frames */
+} mxTagLimits;
+
+#define MXTE_LIMIT_STEPS	1
+#define MXTE_LIMIT_DEADLINE	2
+
+/* Thread-local key holding the mxTagLimits of the running tag() call,
+   if it is limited; nested tag() calls share the limits of their
+   caller unless they set their own */
+extern
+Py_tss_t mxTextTools_LimitsKey;
+
+#define mxTextTools_CurrentLimits() \
+    ((mxTagLimits *)PyThread_tss_get(&mxTextTools_LimitsKey))
+
+/* Raise LimitExceeded for the excess recorded in limits and free its
+   frames; needs the GIL. Returns 0. */
+extern
+int mxTextTools_RaiseLimitExceeded(mxTagLimits *limits);
+
+/* Suspendable runs of tag(...,partial=...,resume=...), see
+   mxte_partial.h */
+typedef struct mxTagSuspended mxTagSuspended;
+typedef struct mxTagPartial mxTagPartial;
+
+/* Thread-local key holding the mxTagPartial of the running tag() call,
+   if it is partial or resumes a run */
+extern
+Py_tss_t mxTextTools_PartialKey;
+
+#define mxTextTools_CurrentPartial() \
+    ((mxTagPartial *)PyThread_tss_get(&mxTextTools_PartialKey))
+
+/* Tagging engine for tables accepted by mxTagTable_IsCallbackFree();
+   releases the GIL while matching.
+
+   - return codes: 2 and 1 like the other engines; 0: error or a
+     limit of the tag() call was exceeded (exception set); -1: a child
+     table could not be handled without the GIL and the standard
+     engine has to re-run the parse (no exception set)
+*/
+extern
+int mxTextTools_TaggingEngine_NoGIL(PyObject *textobj,
+				    Py_ssize_t text_start,
+				    Py_ssize_t text_stop,
+				    mxTagTableObject *table,
+				    PyObject *taglist,
+				    Py_ssize_t *next);
+
+/* --- Tag Tree Object ------------------------------------------------*/
+
+/* Compact taglist returned by tag(...,compact=1). The nodes of the
+   whole result tree are kept in flat arrays, in the order of a
+   depth-first walk (a node before its children), owned by the root
+   tree. Each list of the tree is a view of the root: the siblings
+   from first up to stop, found by following the after links. The
+   entries of the lists (result tuples) are created when they are
+   accessed. */
+
+/* Node kinds */
+#define MXTAGTREE_LEAF		0	/* (tagobj, left, right, None) */
+#define MXTAGTREE_NODE		1	/* (tagobj, left, right, children) */
+#define MXTAGTREE_OBJECT	2	/* the tag object itself: match
+					   strings, AppendTagobj, ... */
+
+typedef struct mxTagTreeObject {
+    PyObject_HEAD
+    struct mxTagTreeObject *root;	/* Tree owning the nodes; NULL
+					   for the root itself */
+    Py_ssize_t first, stop;		/* Nodes of the list (views only;
+					   the root list has all nodes) */
+    Py_ssize_t length;			/* Number of entries or -1 if
+					   not counted yet */
+    Py_ssize_t *index;			/* Node of each entry or NULL if
+					   not needed yet */
+
+    /* The nodes; used by the root only */
+    Py_ssize_t nodes;			/* Number of nodes */
+    Py_ssize_t allocated;		/* Allocated length of the arrays */
+    Py_ssize_t *left, *right;		/* Matched slices */
+    Py_ssize_t *after;			/* Node following the subtree */
+    int *tag;				/* Index into tags */
+    unsigned char *kind;		/* MXTAGTREE_* */
+    PyObject *tags;			/* List of the tag objects */
+} mxTagTreeObject;
+
+MXTEXTTOOLS_EXTERNALIZE(PyTypeObject) mxTagTree_Type;
+
+#define mxTagTree_Check(v) \
+        (Py_TYPE((v)) == &mxTagTree_Type)
+
+/* The tree owning the nodes of tree v */
+#define mxTagTree_Root(v) \
+        ((v)->root != NULL ? (v)->root : (v))
+
+/* Node following the last node of tree v */
+#define mxTagTree_Stop(v) \
+        ((v)->root != NULL ? (v)->stop : (v)->nodes)
+
+/* New empty tree */
+extern
+PyObject *mxTagTree_New(void);
+
+/* Append the nodes recorded by the GIL-free engine, converting match
+   strings from textobj; returns 0 on success, -1 in case of an
+   error */
+extern
+int mxTagTree_AppendRecords(mxTagTreeObject *tree,
+			    mxTagResultBuffer *results,
+			    PyObject *textobj);
+
+/* Append the entries of taglist; returns 0 on success, -1 in case of
+   an error */
+extern
+int mxTagTree_AppendList(mxTagTreeObject *tree,
+			 PyObject *taglist);
+
+/* Tagging engine for tag(...,compact=1): runs the records of the
+   GIL-free engine into tree if the table allows, the standard engine
+   otherwise. Return codes are those of the standard engine; nothing
+   is appended to tree if the match fails. */
+extern
+int mxTextTools_TaggingEngine_Compact(PyObject *textobj,
+				      Py_ssize_t text_start,
+				      Py_ssize_t text_stop,
+				      mxTagTableObject *table,
+				      mxTagTreeObject *tree,
+				      PyObject *context,
+				      Py_ssize_t *next);
+
 /* Command integers for cmd; see Constants/TagTable.py for details */
 
 /* Low-level string matching, using the same simple logic:
@@ -263,6 +651,7 @@ int mxTextTools_TaggingEngine_Modern(PyObject *textobj,
 #define MATCH_WORD 		21
 #define MATCH_WORDSTART       	22
 #define MATCH_WORDEND		23
+#define MATCH_WORDINLIST	24
 
 #define MATCH_ALLINSET 		31
 #define MATCH_ISINSET		32
@@ -282,6 +671,7 @@ int mxTextTools_TaggingEngine_Modern(PyObject *textobj,
 #define MATCH_MOVE		103
 
 #define MATCH_JUMPTARGET	104
+#define MATCH_DISPATCH		105
 
 #define MATCH_MAX_SPECIALS	199
 
@@ -319,6 +709,7 @@ int mxTextTools_TaggingEngine_Modern(PyObject *textobj,
 #define MATCH_APPENDTAGOBJ	(1 << 10)
 #define MATCH_APPENDMATCH	(1 << 11)
 #define MATCH_LOOKAHEAD		(1 << 12)
+#define MATCH_MEMOIZE		(1 << 13)
 
 /* EOF */
 #ifdef __cplusplus
@@ -32,75 +32,8 @@
 #endif
 
 /* --- UTF-8 Decoding Helper ---------------------------------------------- */
-/* Decodes a UTF-8 sequence starting at 'bytes' with up to 'max_bytes' available.
-   Returns the decoded Unicode codepoint in *codepoint.
-   Returns the number of bytes consumed (1-4), or 0 on error.
-
-   This is used for CharSet matching in UTF-8 encoded mode. */
-
-#ifndef TE_UTF8_DECODE_DEFINED
-#define TE_UTF8_DECODE_DEFINED
-
-static inline int te_utf8_decode(const unsigned char *bytes,
-                                  Py_ssize_t max_bytes,
-                                  Py_UCS4 *codepoint) {
-    unsigned char b0;
-
-    if (max_bytes < 1) return 0;
-
-    b0 = bytes[0];
-
-    /* ASCII (0xxxxxxx) */
-    if (b0 < 0x80) {
-        *codepoint = b0;
-        return 1;
-    }
-
-    /* 2-byte sequence (110xxxxx 10xxxxxx) */
-    if ((b0 & 0xE0) == 0xC0) {
-        if (max_bytes < 2) return 0;
-        if ((bytes[1] & 0xC0) != 0x80) return 0;  /* Invalid continuation */
-        *codepoint = ((b0 & 0x1F) << 6) | (bytes[1] & 0x3F);
-        /* Check for overlong encoding */
-        if (*codepoint < 0x80) return 0;
-        return 2;
-    }
-
-    /* 3-byte sequence (1110xxxx 10xxxxxx 10xxxxxx) */
-    if ((b0 & 0xF0) == 0xE0) {
-        if (max_bytes < 3) return 0;
-        if ((bytes[1] & 0xC0) != 0x80) return 0;
-        if ((bytes[2] & 0xC0) != 0x80) return 0;
-        *codepoint = ((b0 & 0x0F) << 12) |
-                     ((bytes[1] & 0x3F) << 6) |
-                     (bytes[2] & 0x3F);
-        /* Check for overlong encoding and surrogates */
-        if (*codepoint < 0x800) return 0;
-        if (*codepoint >= 0xD800 && *codepoint <= 0xDFFF) return 0;
-        return 3;
-    }
-
-    /* 4-byte sequence (11110xxx 10xxxxxx 10xxxxxx 10xxxxxx) */
-    if ((b0 & 0xF8) == 0xF0) {
-        if (max_bytes < 4) return 0;
-        if ((bytes[1] & 0xC0) != 0x80) return 0;
-        if ((bytes[2] & 0xC0) != 0x80) return 0;
-        if ((bytes[3] & 0xC0) != 0x80) return 0;
-        *codepoint = ((b0 & 0x07) << 18) |
-                     ((bytes[1] & 0x3F) << 12) |
-                     ((bytes[2] & 0x3F) << 6) |
-                     (bytes[3] & 0x3F);
-        /* Check for overlong encoding and valid range */
-        if (*codepoint < 0x10000) return 0;
-        if (*codepoint > 0x10FFFF) return 0;
-        return 4;
-    }
-
-    /* Invalid start byte */
-    return 0;
-}
 
-#endif /* TE_UTF8_DECODE_DEFINED */
+#include "mxte_utf8.h"
 
 /* --- Tagging Engine ----------------------------------------------------- */
 /*  Non-recursive restructuring by Mike Fletcher to support SimpleParse
@@ -166,6 +99,11 @@ while 1:
 #define NULL_CODE -1
 #define PENDING_CODE -2
 
+#include "mxte_memo.h"
+#include "mxte_profile.h"
+#include "mxte_limits.h"
+#include "mxte_partial.h"
+
 typedef struct stack_entry {
 	/* represents data stored for a particular stack recursion
 	
@@ -188,8 +126,41 @@ typedef struct stack_entry {
 	Py_ssize_t childStart; /* text start position for the child table */
 	PyObject * results; /* the result-target of the parent */
 	Py_ssize_t resultsLength; /* the length of the results list before the sub-table is called */
+
+	Py_ssize_t profileNode; /* profile node of the parent table (see mxte_profile.h) */
+	long long profileStart; /* when the child table was entered, if profiling */
 } recursive_stack_entry;
 
+/* Release the engine state held by a suspended run (see mxte_partial.h),
+   unwinding the stack as the engine does after an error */
+static
+void te_release_suspended(mxTagSuspended *state)
+{
+	recursive_stack_entry * entry = (recursive_stack_entry *) state->stack;
+	recursive_stack_entry * parent;
+	PyObject * table = state->table;
+	PyObject * taglist = state->taglist;
+
+	while (entry != NULL) {
+		/* child tables and result lists belong to the entry calling them */
+		if (taglist != entry->results) {
+			Py_DECREF( taglist );
+		}
+		if (table != (PyObject *) entry->table) {
+			Py_DECREF( table );
+		}
+		table = (PyObject *) entry->table;
+		taglist = entry->results;
+		parent = (recursive_stack_entry *) entry->parent;
+		PyMem_Free( entry );
+		entry = parent;
+	}
+	mxTagMemo_Clear(&state->memo);
+	state->stack = NULL;
+	state->table = NULL;
+	state->taglist = NULL;
+}
+
 
 /* Macro to reset table-specific variables 
 
@@ -226,6 +197,35 @@ XXX Not sure if loop vars are table or tag specific
 	if (tagobj == NULL) { tagobj = Py_None;}\
 }
 
+/* Macro to suspend the run before re-running the current entry at
+   position, keeping the engine state in the run's mxTagSuspended (see
+   mxte_partial.h) */
+#define SUSPEND_RUN {\
+	mxTagSuspended * state = partial->state;\
+	\
+	if (state->rootTable == NULL) {\
+		Py_INCREF( rootTable );\
+		Py_INCREF( rootTaglist );\
+		state->rootTable = (PyObject *) rootTable;\
+		state->rootTaglist = rootTaglist;\
+		state->sliceleft = sliceleft;\
+	}\
+	state->table = (PyObject *) table;\
+	state->taglist = taglist;\
+	state->taglistLength = taglist_len;\
+	state->stack = stackParent;\
+	state->position = position;\
+	state->startPosition = startPosition;\
+	state->index = index;\
+	state->loopcount = loopcount;\
+	state->loopstart = loopstart;\
+	state->memo = memo;\
+	state->release = te_release_suspended;\
+	state->suspended = 1;\
+	*next = position;\
+	return EOF_CODE;\
+}
+
 /* macro to push relevant local variables onto the stack and setup for child table
 	newTable becomes table, newResults becomes taglist
 
@@ -248,6 +248,7 @@ XXX Not sure if loop vars are table or tag specific
 	stackTemp->childStart = childStart;\
 	stackTemp->resultsLength = taglist_len;\
 	stackTemp->results = taglist;\
+	stackTemp->profileNode = profileNode;\
 	\
 	stackParent = stackTemp;\
 	childReturnCode = PENDING_CODE;\
@@ -271,6 +272,7 @@ XXX Not sure if loop vars are table or tag specific
 		table = stackParent->table;\
 		table_len = table->numentries;\
 		index = stackParent->index;\
+		profileNode = stackParent->profileNode;\
 		\
 		stackTemp = stackParent->parent;\
 		PyMem_Free( stackParent );\
@@ -282,6 +284,52 @@ XXX Not sure if loop vars are table or tag specific
 	}\
 }
 
+/* Macros used by the command code shared with the GIL-free engine
+   (see recursecommands.h) */
+#define TE_SET_ERROR( type, ... ) {\
+	errorType = (type);\
+	errorMessage = PyString_FromFormat( __VA_ARGS__ );\
+}
+#define TE_INCREF( object ) Py_INCREF( object )
+#define TE_DECREF( object ) Py_DECREF( object )
+#define TE_KEEPS_RESULTS (taglist != Py_None)
+
+/* Macro to replay the results of a memoized outcome: SubTable results
+   go to our list, Table children get a copy of their own */
+#define TE_MEMO_REPLAY( memoEntry ) {\
+	if (command == MATCH_SUBTABLE || command == MATCH_SUBTABLEINLIST) {\
+		if (PyList_SetSlice(taglist, PY_SSIZE_T_MAX, PY_SSIZE_T_MAX,\
+							(memoEntry)->results)) {\
+			childReturnCode = ERROR_CODE;\
+		}\
+		childResults = taglist;\
+	} else {\
+		childResults = PyList_GetSlice((memoEntry)->results, 0, PY_SSIZE_T_MAX);\
+		if (childResults == NULL) {\
+			childReturnCode = ERROR_CODE;\
+		}\
+	}\
+}
+
+/* Macro to push a child table: Table children get a new result list
+   (decref'd by the child-finished clause), SubTable children and
+   children of a table without results use taglist, which isn't
+   incref'd as we check whether it's the same when we go to decref */
+#define TE_PUSH_TABLE( newTable ) {\
+	PyObject * subtags = taglist;\
+	\
+	if (taglist != Py_None &&\
+		command != MATCH_SUBTABLE && command != MATCH_SUBTABLEINLIST) {\
+		subtags = PyList_New(0);\
+		if (subtags == NULL) {\
+			childReturnCode = ERROR_CODE;\
+			Py_DECREF( newTable );\
+			break;\
+		}\
+	}\
+	PUSH_STACK( newTable, subtags );\
+}
+
 
 #endif
 
@@ -343,6 +391,28 @@ int TE_ENGINE_API(
 	PyObject * errorType = NULL;
 	PyObject * errorMessage = NULL;
 
+	/* outcomes of the memoized child tables (see mxte_memo.h) */
+	mxTagMemo memo;
+
+	/* profile of the tag() call or NULL (see mxte_profile.h) */
+	mxTagProfile * profile = mxTextTools_CurrentProfile();
+	Py_ssize_t profileNode = -1;
+	long long profileStart = 0;
+
+	/* step budget and deadline of the tag() call or NULL (see mxte_limits.h) */
+	mxTagLimits * limits = mxTextTools_CurrentLimits();
+
+	/* partial or resumed run of the tag() call or NULL (see mxte_partial.h) */
+	mxTagPartial * partial = mxTextTools_CurrentPartial();
+	mxTagTableObject * rootTable = table;
+	PyObject * rootTaglist = taglist;
+
+	mxTagMemo_Init(&memo);
+	if (profile != NULL) {
+		profileNode = mxTagProfile_Enter(profile, -1, (PyObject *)table, Py_None);
+		profileStart = mxTagProfile_Now();
+	}
+
     /* Initialise the buffer
 	
 	Here is where we will add memory-mapped file support I think...
@@ -367,6 +437,42 @@ int TE_ENGINE_API(
 		}
 	}
 
+	if (returnCode == NULL_CODE && partial != NULL && partial->state->suspended) {
+		/* take over the state of the suspended run, re-running the
+		   entry it stopped at */
+		mxTagSuspended * state = partial->state;
+
+		if ((PyObject *) table != state->rootTable) {
+			returnCode = ERROR_CODE;
+			errorType = PyExc_ValueError;
+			errorMessage = PyString_FromString(
+				"resume needs the tag table of the suspended run"
+			);
+		} else if (sliceright < state->position) {
+			returnCode = ERROR_CODE;
+			errorType = PyExc_ValueError;
+			errorMessage = PyString_FromFormat(
+				"resume needs the text up to position %zd at least",
+				state->position
+			);
+		} else {
+			table = (mxTagTableObject *) state->table;
+			table_len = table->numentries;
+			taglist = state->taglist;
+			taglist_len = state->taglistLength;
+			stackParent = (recursive_stack_entry *) state->stack;
+			position = state->position;
+			startPosition = state->startPosition;
+			index = state->index;
+			loopcount = state->loopcount;
+			loopstart = state->loopstart;
+			memo = state->memo;
+			memset(&state->memo, 0, sizeof(mxTagMemo));
+			state->stack = NULL;
+			state->suspended = 0;
+		}
+	}
+
 	while (1) {
 		/* this loop processes a whole table */
 		while (
@@ -385,6 +491,16 @@ int TE_ENGINE_API(
 				childStart = position;
 				childPosition = position;
 
+				if (partial != NULL && mxTagPartial_Step(partial)) {
+					/* the slice of a sliced run is over */
+					SUSPEND_RUN
+				}
+				if (limits != NULL && mxTagLimits_Step(limits)) {
+					MXTE_LIMITS_RECORD(limits, recursive_stack_entry, stackParent, table, position);
+					mxTextTools_RaiseLimitExceeded(limits);
+					returnCode = ERROR_CODE;
+					break;
+				}
 			}
 			if (command < MATCH_MAX_LOWLEVEL) {
 #include "lowlevelcommands.h"
@@ -399,14 +515,26 @@ int TE_ENGINE_API(
 					default:
 						{
 							childReturnCode = ERROR_CODE;
-							errorType = PyExc_ValueError;
-							errorMessage = PyString_FromFormat(
+							TE_SET_ERROR(PyExc_ValueError,
 								 "Unrecognised command code %i",
 								 command
 							);
 						}
 				}
 			}
+			if (partial != NULL && partial->partial &&
+				(childReturnCode == SUCCESS_CODE ||
+				 childReturnCode == FAILURE_CODE ||
+				 childReturnCode == NULL_CODE) &&
+				mxTagPartial_Undecided(command, match,
+									   childReturnCode != FAILURE_CODE,
+									   childStart, childPosition, sliceright,
+									   table->is_multibyte ?
+									   (const unsigned char *) text : NULL)) {
+				/* the outcome may change once the text goes on, keep
+				   the state to re-run this entry then */
+				SUSPEND_RUN
+			}
 			/* we're done a single tag, process partial results for the current child 
 
 				This is a major re-structuring point.  Previously
@@ -420,8 +548,7 @@ int TE_ENGINE_API(
 			/* sanity check wanted by Marc-André for skip-before-buffer */
 			if (childPosition < 0) {
 				childReturnCode = ERROR_CODE;
-				errorType = PyExc_TypeError;
-				errorMessage = PyString_FromFormat(
+				TE_SET_ERROR(PyExc_TypeError,
 					 "tagobj (type %.50s) table entry %d moved/skipped beyond start of text (to position %d)",
 					 Py_TYPE(tagobj)->tp_name,
 					 (unsigned int)index,
@@ -852,10 +979,41 @@ int TE_ENGINE_API(
 				}
 				childResults = NULL;
 			}
+			mxTagMemo_Clear(&memo);
 			*next = startPosition;
 			return 0;
 		} else {
 			if (stackParent != NULL) {
+				/* remember the outcome of a memoized child table */
+				mxTagTableEntry *caller = &stackParent->table->entry[stackParent->index];
+
+				if ((caller->flags & MATCH_MEMOIZE) &&
+					stackParent->results != Py_None &&
+					mxTagMemo_Holds(caller->cmd, caller->args, (PyObject *)table)) {
+					PyObject *added = NULL;
+					mxTagMemoEntry *memoEntry;
+
+					if (returnCode == SUCCESS_CODE) {
+						added = PyList_GetSlice(taglist, taglist_len, PY_SSIZE_T_MAX);
+						if (added == NULL)
+							PyErr_Clear();
+					}
+					if (returnCode != SUCCESS_CODE || added != NULL) {
+						memoEntry = mxTagMemo_Store(&memo, table, startPosition);
+						if (memoEntry != NULL) {
+							memoEntry->code = returnCode;
+							memoEntry->end = position;
+							memoEntry->results = added;
+						}
+						else
+							Py_XDECREF(added);
+					}
+				}
+				if (profile != NULL)
+					mxTagProfile_Leave(profile, profileNode,
+									   returnCode == SUCCESS_CODE,
+									   position - startPosition,
+									   mxTagProfile_Now() - stackParent->profileStart);
 				/* pop stack also sets the childReturnCode for us... */
 				POP_STACK
 			} else {
@@ -870,6 +1028,12 @@ int TE_ENGINE_API(
 				} else {
 					*next = position;
 				}
+				if (profile != NULL)
+					mxTagProfile_Leave(profile, profileNode,
+									   returnCode == SUCCESS_CODE,
+									   position - startPosition,
+									   mxTagProfile_Now() - profileStart);
+				mxTagMemo_Clear(&memo);
 				return returnCode;
 			}
 		}
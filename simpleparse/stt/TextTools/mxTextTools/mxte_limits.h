@@ -0,0 +1,111 @@
+/*
+  mxte_limits -- Step budget and deadline for the Tagging Engines
+
+  tag(...,max_steps=...,deadline=...) bounds the work of a parse: both
+  engines count every table entry they start (a step) and give up
+  once the count passes max_steps or, checked every
+  MXTE_LIMITS_CLOCK_INTERVAL steps, the monotonic clock passes the
+  deadline. The engine then records the tables it is running
+  (MXTE_LIMITS_RECORD) and stops with ERROR_CODE; the standard engine
+  raises LimitExceeded right away, the GIL-free engine's dispatcher
+  once it holds the GIL again (mxTextTools_RaiseLimitExceeded()).
+
+  The limits of the running tag() call are found through the
+  thread-local mxTextTools_LimitsKey, so steps taken by tag() calls
+  made from callbacks count against the limits of their caller. The
+  key is NULL unless limits were set, which keeps the cost for the
+  engines to one branch per table entry.
+
+  Copyright (c) 2000, Marc-Andre Lemburg; mailto:mal@lemburg.com
+  Copyright (c) 2000-2002, eGenix.com Software GmbH; mailto:info@egenix.com
+  Copyright (c) 2003-2006, Mike Fletcher; mailto:mcfletch@vrplumber.com
+*/
+
+#ifndef MXTE_LIMITS_H
+#define MXTE_LIMITS_H
+
+#define MXTE_LIMITS_CLOCK_INTERVAL	1024	/* Steps between clock reads,
+						   a power of 2 */
+
+/* Monotonic clock in nanoseconds, the clock of time.monotonic();
+   doesn't need the GIL */
+static inline
+long long mxTagLimits_Now(void)
+{
+#if PY_VERSION_HEX >= 0x030D0000
+	PyTime_t t;
+
+	if (PyTime_MonotonicRaw(&t) < 0)
+		return 0;
+	return (long long)t;
+#else
+	return (long long)_PyTime_GetMonotonicClock();
+#endif
+}
+
+static inline
+void mxTagLimits_Init(mxTagLimits *limits)
+{
+	memset(limits, 0, sizeof(mxTagLimits));
+	limits->maxSteps = PY_SSIZE_T_MAX;
+}
+
+/* Count a step; returns 1 if a limit was exceeded (and sets
+   limits->exceeded), 0 otherwise */
+static inline
+int mxTagLimits_Step(mxTagLimits *limits)
+{
+	if (limits->steps >= limits->maxSteps) {
+		limits->exceeded = MXTE_LIMIT_STEPS;
+		return 1;
+	}
+	limits->steps++;
+	/* the first step reads the clock as well */
+	if (limits->hasDeadline &&
+		(limits->steps & (MXTE_LIMITS_CLOCK_INTERVAL - 1)) == 1 &&
+		mxTagLimits_Now() >= limits->deadline) {
+		limits->exceeded = MXTE_LIMIT_DEADLINE;
+		return 1;
+	}
+	return 0;
+}
+
+/* Free the recorded frames; doesn't need the GIL */
+static inline
+void mxTagLimits_Clear(mxTagLimits *limits)
+{
+	PyMem_RawFree(limits->frames);
+	limits->frames = NULL;
+	limits->depth = 0;
+	limits->exceeded = 0;
+}
+
+/* Record the position and the tables being run when a limit was
+   exceeded. The stack entries of both engines link to their parent
+   entry through parent and hold the calling table and entry index in
+   table and index. If there's no memory for the frames, none are
+   recorded. */
+#define MXTE_LIMITS_RECORD(limits, stackType, stackParent, table, position) {\
+	stackType * frame_;\
+	Py_ssize_t depth_ = 1, i_;\
+	\
+	for (frame_ = (stackParent); frame_ != NULL; frame_ = (stackType *)frame_->parent)\
+		depth_++;\
+	PyMem_RawFree((limits)->frames);\
+	(limits)->position = (position);\
+	(limits)->depth = 0;\
+	(limits)->frames = (mxTagLimitsFrame *) PyMem_RawMalloc(depth_ * sizeof(mxTagLimitsFrame));\
+	if ((limits)->frames != NULL) {\
+		(limits)->depth = depth_;\
+		i_ = depth_ - 1;\
+		(limits)->frames[i_].table = (PyObject *)(table);\
+		for (frame_ = (stackParent); frame_ != NULL; frame_ = (stackType *)frame_->parent) {\
+			(limits)->frames[i_].tagobj = frame_->table->entry[frame_->index].tagobj;\
+			i_--;\
+			(limits)->frames[i_].table = (PyObject *)frame_->table;\
+		}\
+		(limits)->frames[0].tagobj = NULL;\
+	}\
+}
+
+#endif /* MXTE_LIMITS_H */
@@ -0,0 +1,323 @@
+/*
+  mxte_memo -- Packrat memoization for the Tagging Engines
+
+  Table, TableInList, SubTable and SubTableInList entries flagged with
+  Memoize (MATCH_MEMOIZE) remember the outcome of their child table at
+  a position: whether it matched, where it stopped and the results it
+  added. When the engine backtracks and calls the same table at the
+  same position again, the outcome is replayed instead of re-running
+  the table, which keeps grammars whose alternatives share long
+  prefixes linear.
+
+  The memo belongs to a single run of the engine (one tag() call). It
+  is a direct-mapped cache: an entry replaces whatever was stored in
+  its slot before, and the number of slots grows up to the budget set
+  by set_memo_size() (mxTextTools_MemoSize), so the memory used is
+  bounded whatever the text.
+
+  The standard engine stores the results as lists (see mxte_impl.h).
+  The GIL-free engine (see mxte_nogil.h) leaves the result records of
+  an entry where they are in the result buffer and only copies them
+  to the memo's arena when the buffer is about to be truncated below
+  them (mxTagMemo_Truncate()), so every record is copied at most once.
+  Outcomes replayed from the arena are recorded as a reference to
+  their arena records, which are only copied into the results when the
+  run has matched.
+  The arena holds at most MXTE_MEMO_RECORDS times the budget records;
+  outcomes which don't fit are forgotten.
+
+  Entries are keyed by the address of the child table, so only tables
+  which stay alive during the run may be memoized (see
+  mxTagMemo_Holds()).
+
+  Copyright (c) 2000, Marc-Andre Lemburg; mailto:mal@lemburg.com
+  Copyright (c) 2000-2002, eGenix.com Software GmbH; mailto:info@egenix.com
+  Copyright (c) 2003-2006, Mike Fletcher; mailto:mcfletch@vrplumber.com
+*/
+
+#ifndef MXTE_MEMO_H
+#define MXTE_MEMO_H
+
+#define MXTE_MEMO_INITIAL_SIZE	256	/* Slots allocated at first */
+#define MXTE_MEMO_RECORDS	16	/* Arena records per slot (GIL-free engine) */
+
+typedef struct {
+	void * table;		/* child table or NULL for an unused slot */
+	Py_ssize_t position;	/* position the child table was called at */
+	Py_ssize_t end;		/* position it stopped at if it matched */
+	short code;		/* SUCCESS_CODE or FAILURE_CODE */
+	PyObject * results;	/* standard engine: list of the added results */
+	Py_ssize_t first;	/* GIL-free engine: buffer position of the
+				   first added record when it was stored */
+	Py_ssize_t count;	/* number of records */
+	Py_ssize_t offset;	/* arena position of the first record or -1
+				   while the records are in the buffer */
+	size_t stamp;		/* number of the store */
+} mxTagMemoEntry;
+
+/* GIL-free engine: an entry whose records are in the buffer */
+typedef struct {
+	void * table;
+	Py_ssize_t position;
+	size_t stamp;
+	Py_ssize_t stop;	/* buffer position after its records */
+} mxTagMemoPending;
+
+typedef struct {
+	mxTagMemoEntry * entries;
+	Py_ssize_t size;	/* number of slots, a power of 2 */
+	Py_ssize_t budget;	/* maximum number of slots */
+	size_t stamp;		/* number of stores so far */
+	mxTagResult * arena;	/* GIL-free engine: records copied from
+				   the buffer */
+	Py_ssize_t arenaLength;
+	Py_ssize_t arenaAllocated;
+	mxTagMemoPending * pending;	/* ordered by stop */
+	Py_ssize_t pendingLength;
+	Py_ssize_t pendingAllocated;
+} mxTagMemo;
+
+/* Initialize memo for a run of the engine */
+static inline
+void mxTagMemo_Init(mxTagMemo *memo)
+{
+	Py_ssize_t budget = mxTextTools_MemoSize;
+
+	memset(memo, 0, sizeof(mxTagMemo));
+	/* round down to a power of 2 */
+	if (budget > 0) {
+		memo->budget = 1;
+		while (memo->budget <= budget / 2)
+			memo->budget *= 2;
+	}
+}
+
+static inline
+Py_ssize_t mxTagMemo_Index(mxTagMemo *memo, void *table, Py_ssize_t position)
+{
+	/* consecutive positions of a table use consecutive slots */
+	return (Py_ssize_t)(((size_t)position +
+						 ((size_t)table >> 4) * (size_t)0x9E3779B1UL) &
+						(size_t)(memo->size - 1));
+}
+
+/* Release the values of entry and mark it unused */
+static inline
+void mxTagMemo_Release(mxTagMemoEntry *entry)
+{
+	Py_XDECREF(entry->results);
+	entry->results = NULL;
+	entry->count = 0;
+	entry->table = NULL;
+}
+
+/* Free the memo; needs the GIL if the standard engine used it */
+static inline
+void mxTagMemo_Clear(mxTagMemo *memo)
+{
+	Py_ssize_t i;
+
+	for (i = 0; i < memo->size; i++)
+		mxTagMemo_Release(&memo->entries[i]);
+	PyMem_RawFree(memo->entries);
+	PyMem_RawFree(memo->arena);
+	PyMem_RawFree(memo->pending);
+	memset(memo, 0, sizeof(mxTagMemo));
+}
+
+/* Return the entry for table at position or NULL */
+static inline
+mxTagMemoEntry *mxTagMemo_Lookup(mxTagMemo *memo, void *table, Py_ssize_t position)
+{
+	mxTagMemoEntry *entry;
+
+	if (memo->size == 0)
+		return NULL;
+	entry = &memo->entries[mxTagMemo_Index(memo, table, position)];
+	if (entry->table == table && entry->position == position)
+		return entry;
+	return NULL;
+}
+
+/* Return an empty entry for table at position, evicting the entry
+   stored in its slot, or NULL if there is no room (budget 0 or out of
+   memory); the caller fills in the outcome */
+static inline
+mxTagMemoEntry *mxTagMemo_Store(mxTagMemo *memo, void *table, Py_ssize_t position)
+{
+	mxTagMemoEntry *entry;
+
+	if (memo->budget == 0)
+		return NULL;
+	if (memo->size < memo->budget &&
+		(memo->size == 0 || memo->entries[mxTagMemo_Index(memo, table, position)].table != NULL)) {
+		/* grow on the first collision, up to the budget */
+		Py_ssize_t size = memo->size ? memo->size * 2 : MXTE_MEMO_INITIAL_SIZE;
+		mxTagMemoEntry *entries, *old = memo->entries;
+		Py_ssize_t oldSize = memo->size, i;
+
+		if (size > memo->budget)
+			size = memo->budget;
+		entries = (mxTagMemoEntry *) PyMem_RawCalloc(size, sizeof(mxTagMemoEntry));
+		if (entries != NULL) {
+			memo->entries = entries;
+			memo->size = size;
+			for (i = 0; i < oldSize; i++) {
+				if (old[i].table != NULL) {
+					entry = &entries[mxTagMemo_Index(memo, old[i].table, old[i].position)];
+					if (entry->table != NULL)
+						mxTagMemo_Release(entry);
+					*entry = old[i];
+				}
+			}
+			PyMem_RawFree(old);
+		}
+		else if (oldSize == 0)
+			return NULL;
+	}
+	entry = &memo->entries[mxTagMemo_Index(memo, table, position)];
+	mxTagMemo_Release(entry);
+	entry->table = table;
+	entry->position = position;
+	entry->first = 0;
+	entry->offset = -1;
+	entry->stamp = ++memo->stamp;
+	return entry;
+}
+
+/* GIL-free engine: return the entry of pending if it wasn't evicted */
+static inline
+mxTagMemoEntry *mxTagMemo_Pending(mxTagMemo *memo, mxTagMemoPending *pending)
+{
+	mxTagMemoEntry *entry = mxTagMemo_Lookup(memo, pending->table, pending->position);
+
+	if (entry != NULL && entry->stamp == pending->stamp)
+		return entry;
+	return NULL;
+}
+
+/* GIL-free engine: store the count records from buffer position first
+   (the end of the buffer) as outcome of table at position */
+static inline
+mxTagMemoEntry *mxTagMemo_StoreRecords(mxTagMemo *memo, void *table, Py_ssize_t position,
+									   Py_ssize_t first, Py_ssize_t count)
+{
+	mxTagMemoEntry *entry = mxTagMemo_Store(memo, table, position);
+	mxTagMemoPending *pending;
+
+	if (entry == NULL || count == 0)
+		return entry;
+	if (memo->pendingLength == memo->pendingAllocated) {
+		Py_ssize_t i, length = 0;
+
+		if (memo->pendingAllocated >= 2 * memo->budget) {
+			/* drop the evicted entries; at most budget are left */
+			for (i = 0; i < memo->pendingLength; i++)
+				if (mxTagMemo_Pending(memo, &memo->pending[i]) != NULL)
+					memo->pending[length++] = memo->pending[i];
+			memo->pendingLength = length;
+		}
+		else {
+			Py_ssize_t allocated = memo->pendingAllocated ? memo->pendingAllocated * 2 : 64;
+
+			pending = (mxTagMemoPending *) PyMem_RawRealloc(
+				memo->pending, allocated * sizeof(mxTagMemoPending));
+			if (pending == NULL) {
+				mxTagMemo_Release(entry);
+				return NULL;
+			}
+			memo->pending = pending;
+			memo->pendingAllocated = allocated;
+		}
+	}
+	entry->first = first;
+	entry->count = count;
+	pending = &memo->pending[memo->pendingLength++];
+	pending->table = table;
+	pending->position = position;
+	pending->stamp = entry->stamp;
+	pending->stop = first + count;
+	return entry;
+}
+
+/* GIL-free engine: the buffer items is truncated to length; copy the
+   records of the entries which would lose them to the arena, or
+   forget those entries if the arena is full */
+static inline
+void mxTagMemo_Truncate(mxTagMemo *memo, mxTagResult *items, Py_ssize_t length)
+{
+	Py_ssize_t top = memo->pendingLength, start = PY_SSIZE_T_MAX, stop = 0, i;
+	mxTagMemoEntry *entry;
+
+	/* entries are stored when their records are complete, so later
+	   entries stop at or after the earlier ones */
+	while (top > 0 && memo->pending[top - 1].stop > length)
+		top--;
+	if (top == memo->pendingLength)
+		return;
+	for (i = top; i < memo->pendingLength; i++) {
+		entry = mxTagMemo_Pending(memo, &memo->pending[i]);
+		if (entry != NULL) {
+			if (entry->first < start)
+				start = entry->first;
+			if (entry->first + entry->count > stop)
+				stop = entry->first + entry->count;
+		}
+	}
+	if (stop < start)
+		/* all of them were evicted */
+		stop = start = 0;
+	if (stop > start &&
+		memo->arenaLength + (stop - start) > memo->arenaAllocated &&
+		memo->arenaLength + (stop - start) <= memo->budget * MXTE_MEMO_RECORDS) {
+		Py_ssize_t allocated = memo->arenaAllocated ? memo->arenaAllocated : 1024;
+		mxTagResult *arena;
+
+		while (allocated < memo->arenaLength + (stop - start))
+			allocated *= 2;
+		if (allocated > memo->budget * MXTE_MEMO_RECORDS)
+			allocated = memo->budget * MXTE_MEMO_RECORDS;
+		arena = (mxTagResult *) PyMem_RawRealloc(memo->arena, allocated * sizeof(mxTagResult));
+		if (arena != NULL) {
+			memo->arena = arena;
+			memo->arenaAllocated = allocated;
+		}
+	}
+	if (stop > start && memo->arenaLength + (stop - start) > memo->arenaAllocated)
+		/* no room */
+		stop = start;
+	if (stop > start)
+		memcpy(&memo->arena[memo->arenaLength], &items[start],
+			   (stop - start) * sizeof(mxTagResult));
+	for (i = top; i < memo->pendingLength; i++) {
+		entry = mxTagMemo_Pending(memo, &memo->pending[i]);
+		if (entry == NULL)
+			continue;
+		if (stop > start)
+			entry->offset = memo->arenaLength + entry->first - start;
+		else
+			mxTagMemo_Release(entry);
+	}
+	memo->arenaLength += stop - start;
+	memo->pendingLength = top;
+}
+
+/* Return 1 if the child table of a Table/TableInList/SubTable/
+   SubTableInList entry (command, match) is child itself, i.e. it stays
+   alive while the engine runs, 0 if it had to be compiled for the
+   call */
+static inline
+int mxTagMemo_Holds(int command, PyObject *match, PyObject *child)
+{
+	PyObject *tables;
+	Py_ssize_t index;
+
+	if (command == MATCH_TABLE || command == MATCH_SUBTABLE)
+		return 1;
+	tables = PyTuple_GET_ITEM(match, 0);
+	index = PyInt_AS_LONG(PyTuple_GET_ITEM(match, 1));
+	return (index >= 0 && index < PyList_GET_SIZE(tables) &&
+			PyList_GET_ITEM(tables, index) == child);
+}
+
+#endif /* MXTE_MEMO_H */
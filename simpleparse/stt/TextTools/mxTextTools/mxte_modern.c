@@ -47,7 +47,7 @@ Py_ssize_t mxTextSearch_SearchUnicode_4BYTE(PyObject *self,
 /* --- Tagging Engine --- 1-byte version (bytes and 1-byte unicode) ------- */
 
 #undef TE_STRING_CHECK 
-#define TE_STRING_CHECK(obj) (PyBytes_Check(obj) || (PyUnicode_Check(obj) && mxte_get_string_kind(obj) == TE_KIND_1BYTE))
+#define TE_STRING_CHECK(obj) (PyBytes_Check(obj) || PyMemoryView_Check(obj) || (PyUnicode_Check(obj) && mxte_get_string_kind(obj) == TE_KIND_1BYTE))
 #undef TE_STRING_AS_STRING
 #define TE_STRING_AS_STRING(obj) ((TE_CHAR*)mxte_get_string_data(obj, TE_KIND_1BYTE))
 #undef TE_STRING_GET_SIZE
@@ -132,6 +132,32 @@ int mxTextTools_TaggingEngine_Modern(PyObject *text,
 {
     int kind;
     
+    /* tag(...,compact=1) */
+    if (mxTagTree_Check(taglist))
+        return mxTextTools_TaggingEngine_Compact(text, start, text_len,
+                                                 tagtable,
+                                                 (mxTagTreeObject *)taglist,
+                                                 context, next);
+
+    /* Callback-free tables are run without holding the GIL; the
+       standard engine below handles everything else, re-runs the
+       parses the GIL-free engine could not complete, profiles and
+       suspends */
+    if (mxTextTools_ReleaseGIL && PyList_Check(taglist) &&
+        mxTextTools_CurrentProfile() == NULL &&
+        mxTextTools_CurrentPartial() == NULL) {
+        int rc = mxTagTable_IsCallbackFree(tagtable);
+
+        if (rc < 0)
+            return 0;
+        if (rc > 0) {
+            rc = mxTextTools_TaggingEngine_NoGIL(text, start, text_len,
+                                                 tagtable, taglist, next);
+            if (rc >= 0)
+                return rc;
+        }
+    }
+
     /* Determine string kind */
     kind = mxte_get_string_kind(text);
     
@@ -193,6 +219,27 @@ int mxTextTools_TaggingEngine(PyObject *text,
 
 /* --- Search API wrappers ------------------------------------------------ */
 
+/* Two-Way search on text of any kind; returns 1 and sets the slice
+   if found, 0 otherwise */
+static
+Py_ssize_t mxte_search_twoway(mxTextSearchObject *so,
+                              const void *text,
+                              int charsize,
+                              Py_ssize_t start,
+                              Py_ssize_t stop,
+                              Py_ssize_t *sliceleft,
+                              Py_ssize_t *sliceright)
+{
+    mxtw_context *ctx = (mxtw_context *)so->data;
+    Py_ssize_t found = mxtw_search(ctx, text, charsize, start, stop);
+
+    if (found < 0)
+        return 0;
+    *sliceleft = found;
+    *sliceright = found + ctx->pattern_len;
+    return 1;
+}
+
 /* 1-byte search wrapper */
 Py_ssize_t mxTextSearch_SearchBuffer_1BYTE(PyObject *self,
                                            TE_CHAR_1BYTE *text,
@@ -203,6 +250,10 @@ Py_ssize_t mxTextSearch_SearchBuffer_1BYTE(PyObject *self,
 {
     mxTextSearchObject *so = (mxTextSearchObject *)self;
     
+    if (so->algorithm == MXTEXTSEARCH_TWOWAY)
+        return mxte_search_twoway(so, text, 1, start, stop,
+                                  sliceleft, sliceright);
+
     /* If the TextSearch was created with a Unicode pattern, we need to handle this specially */
     if (PyUnicode_Check(so->match)) {
         /* For Unicode patterns, use Unicode-aware search */
@@ -286,8 +337,11 @@ Py_ssize_t mxTextSearch_SearchUnicode_2BYTE(PyObject *self,
         return -1; /* Error: can't search for non-Unicode in Unicode text */
     }
     
-    /* For now, fall back to trivial search implementation */
-    /* TODO: Implement optimized 2-byte search algorithms */
+    if (so->algorithm == MXTEXTSEARCH_TWOWAY)
+        return mxte_search_twoway(so, text, 2, start, stop,
+                                  sliceleft, sliceright);
+
+    /* Otherwise fall back to the trivial search */
     
     Py_ssize_t match_len = PyUnicode_GET_LENGTH(so->match);
     if (match_len == 0) {
@@ -342,8 +396,11 @@ Py_ssize_t mxTextSearch_SearchUnicode_4BYTE(PyObject *self,
         return -1; /* Error: can't search for non-Unicode in Unicode text */
     }
     
-    /* For now, fall back to trivial search implementation */
-    /* TODO: Implement optimized 4-byte search algorithms */
+    if (so->algorithm == MXTEXTSEARCH_TWOWAY)
+        return mxte_search_twoway(so, text, 4, start, stop,
+                                  sliceleft, sliceright);
+
+    /* Otherwise fall back to the trivial search */
     
     Py_ssize_t match_len = PyUnicode_GET_LENGTH(so->match);
     if (match_len == 0) {
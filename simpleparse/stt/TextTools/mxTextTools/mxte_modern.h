@@ -54,7 +54,7 @@ extern Py_ssize_t mxTextSearch_SearchUnicode_4BYTE(PyObject *self,
 
 /* Determine string kind from Python Unicode object (Python 3.3+ only) */
 static inline int mxte_get_string_kind(PyObject *str) {
-    if (PyBytes_Check(str)) {
+    if (PyBytes_Check(str) || PyMemoryView_Check(str)) {
         return TE_KIND_1BYTE;
     }
     if (PyUnicode_Check(str)) {
@@ -78,6 +78,10 @@ static inline void* mxte_get_string_data(PyObject *str, int kind) {
     if (kind == TE_KIND_1BYTE && PyBytes_Check(str)) {
         return PyBytes_AS_STRING(str);
     }
+    /* memoryviews of 1-byte buffers, see mxTextTools_AsText() */
+    if (kind == TE_KIND_1BYTE && PyMemoryView_Check(str)) {
+        return PyMemoryView_GET_BUFFER(str)->buf;
+    }
     if (PyUnicode_Check(str)) {
         if (PyUnicode_READY(str) < 0) {
             return NULL;
@@ -106,6 +110,9 @@ static inline Py_ssize_t mxte_get_string_length(PyObject *str, int kind) {
     if (kind == TE_KIND_1BYTE && PyBytes_Check(str)) {
         return PyBytes_GET_SIZE(str);
     }
+    if (kind == TE_KIND_1BYTE && PyMemoryView_Check(str)) {
+        return PyMemoryView_GET_BUFFER(str)->len;
+    }
     if (PyUnicode_Check(str)) {
         if (PyUnicode_READY(str) < 0) {
             return -1;
@@ -0,0 +1,353 @@
+/*
+  mxte_nogil.c -- Tagging Engine for callback-free tables running
+                  without the GIL
+
+  The engine in mxte_nogil.h is compiled for 1-byte, 2-byte and 4-byte
+  characters, just like the standard engine in mxte_modern.c.
+  mxTextTools_TaggingEngine_NoGIL() releases the GIL, runs the matching
+  phase and converts the collected results into the taglist after
+  re-acquiring it; mxTextTools_TaggingEngine_Compact() puts them into
+  a compact TagTree instead.
+
+  Copyright (c) 2000-2002, eGenix.com Software GmbH; mailto:info@egenix.com
+  Copyright (c) 2003-2006, Mike Fletcher; mailto:mcfletch@vrplumber.com
+*/
+
+#include "mx.h"
+#include "mxstdlib.h"
+#include "mxTextTools.h"
+#include "mxte_modern.h"
+#include "mxbm_modern.h"
+
+/* Compile the command code shared with the standard engine for
+   running without the GIL (see recursecommands.h) */
+#define TE_NOGIL
+
+/* --- 1-byte version (bytes and 1-byte unicode) -------------------------- */
+
+#undef TE_STRING_AS_STRING
+#define TE_STRING_AS_STRING(obj) ((TE_CHAR*)mxte_get_string_data(obj, TE_KIND_1BYTE))
+#undef TE_STRING_GET_SIZE
+#define TE_STRING_GET_SIZE(obj) mxte_get_string_length(obj, TE_KIND_1BYTE)
+#undef TE_CHAR
+#define TE_CHAR TE_CHAR_1BYTE
+#undef TE_ENGINE_API
+#define TE_ENGINE_API mxTextTools_TaggingEngine_NoGIL_1BYTE
+#undef TE_TABLETYPE
+#define TE_TABLETYPE MXTAGTABLE_STRINGTYPE
+#undef TE_SEARCHAPI
+#define TE_SEARCHAPI mxTextSearch_SearchBuffer_1BYTE
+
+/* te_utf8_decode() */
+#include "mxte_utf8.h"
+#include "mxte_nogil.h"
+
+/* --- 2-byte Unicode version --------------------------------------------- */
+
+#undef TE_STRING_AS_STRING
+#define TE_STRING_AS_STRING(obj) ((TE_CHAR*)mxte_get_string_data(obj, TE_KIND_2BYTE))
+#undef TE_STRING_GET_SIZE
+#define TE_STRING_GET_SIZE(obj) mxte_get_string_length(obj, TE_KIND_2BYTE)
+#undef TE_CHAR
+#define TE_CHAR TE_CHAR_2BYTE
+#undef TE_ENGINE_API
+#define TE_ENGINE_API mxTextTools_TaggingEngine_NoGIL_2BYTE
+#undef TE_TABLETYPE
+#define TE_TABLETYPE MXTAGTABLE_UNICODETYPE
+#undef TE_SEARCHAPI
+#define TE_SEARCHAPI mxTextSearch_SearchUnicode_2BYTE
+
+#include "mxte_nogil.h"
+
+/* --- 4-byte Unicode version --------------------------------------------- */
+
+#undef TE_STRING_AS_STRING
+#define TE_STRING_AS_STRING(obj) ((TE_CHAR*)mxte_get_string_data(obj, TE_KIND_4BYTE))
+#undef TE_STRING_GET_SIZE
+#define TE_STRING_GET_SIZE(obj) mxte_get_string_length(obj, TE_KIND_4BYTE)
+#undef TE_CHAR
+#define TE_CHAR TE_CHAR_4BYTE
+#undef TE_ENGINE_API
+#define TE_ENGINE_API mxTextTools_TaggingEngine_NoGIL_4BYTE
+#undef TE_TABLETYPE
+#define TE_TABLETYPE MXTAGTABLE_UNICODETYPE
+#undef TE_SEARCHAPI
+#define TE_SEARCHAPI mxTextSearch_SearchUnicode_4BYTE
+
+#include "mxte_nogil.h"
+
+/* --- Result conversion -------------------------------------------------- */
+
+/* Number of records converted between offering the GIL to other
+   threads, e.g. an event loop waiting for a parse running in a worker
+   thread; a power of 2 */
+#define MXTE_NOGIL_YIELD_INTERVAL	4096
+
+/* Convert the records in results to result tuples (or match strings
+   and tag objects, depending on the record flags) and append them to
+   taglist. Must be called with the GIL held; it is released briefly
+   every MXTE_NOGIL_YIELD_INTERVAL records, so that converting a large
+   result doesn't hold up other threads for long. Returns 0 on success,
+   -1 in case of an error. */
+
+static
+int mxTagResultBuffer_AppendTo(mxTagResultBuffer *results,
+			       PyObject *textobj,
+			       PyObject *taglist)
+{
+    /* Stack of converted objects which have not yet been put into a
+       child list, together with their record index */
+    PyObject **objects = NULL;
+    Py_ssize_t *positions = NULL;
+    Py_ssize_t top = 0, i, j, k;
+    int rc = -1;
+
+    if (results->length == 0)
+	return 0;
+    objects = (PyObject **) PyMem_Malloc(results->length * sizeof(PyObject *));
+    positions = (Py_ssize_t *) PyMem_Malloc(results->length * sizeof(Py_ssize_t));
+    if (objects == NULL || positions == NULL) {
+	PyErr_NoMemory();
+	goto onError;
+    }
+
+    for (i = 0; i < results->length; i++) {
+	mxTagResult *result = &results->items[i];
+	PyObject *v, *w, *children;
+
+	if (i > 0 && (i & (MXTE_NOGIL_YIELD_INTERVAL - 1)) == 0) {
+	    /* the objects converted so far are only known here */
+	    Py_BEGIN_ALLOW_THREADS
+	    Py_END_ALLOW_THREADS
+	}
+	if (result->flags & MATCH_APPENDMATCH) {
+	    if (PyUnicode_Check(textobj))
+		v = PyUnicode_Substring(textobj, result->left, result->right);
+	    else
+		v = PyBytes_FromStringAndSize((char *)mxte_get_string_data(textobj, TE_KIND_1BYTE) +
+					      result->left,
+					      result->right - result->left);
+	}
+	else if (result->flags & MATCH_APPENDTAGOBJ) {
+	    v = result->tagobj;
+	    Py_INCREF(v);
+	}
+	else {
+	    if (result->children < 0) {
+		children = Py_None;
+		Py_INCREF(children);
+	    }
+	    else {
+		/* The child list consists of all pending objects
+		   recorded after the child list started */
+		for (j = top; j > 0 && positions[j - 1] >= result->children; j--)
+		    ;
+		children = PyList_New(top - j);
+		if (children == NULL)
+		    goto onError;
+		for (k = j; k < top; k++)
+		    PyList_SET_ITEM(children, k - j, objects[k]);
+		top = j;
+	    }
+	    v = PyTuple_New(4);
+	    if (v == NULL) {
+		Py_DECREF(children);
+		goto onError;
+	    }
+	    Py_INCREF(result->tagobj);
+	    PyTuple_SET_ITEM(v, 0, result->tagobj);
+	    w = PyLong_FromSsize_t(result->left);
+	    if (w == NULL) {
+		Py_DECREF(children);
+		Py_DECREF(v);
+		goto onError;
+	    }
+	    PyTuple_SET_ITEM(v, 1, w);
+	    w = PyLong_FromSsize_t(result->right);
+	    if (w == NULL) {
+		Py_DECREF(children);
+		Py_DECREF(v);
+		goto onError;
+	    }
+	    PyTuple_SET_ITEM(v, 2, w);
+	    PyTuple_SET_ITEM(v, 3, children);
+	}
+	if (v == NULL)
+	    goto onError;
+	objects[top] = v;
+	positions[top] = i;
+	top++;
+    }
+
+    /* Whatever is left belongs into the root list */
+    for (j = 0; j < top; j++)
+	if (PyList_Append(taglist, objects[j]))
+	    goto onError;
+    rc = 0;
+
+ onError:
+    for (j = 0; j < top; j++)
+	Py_DECREF(objects[j]);
+    PyMem_Free(objects);
+    PyMem_Free(positions);
+    return rc;
+}
+
+/* --- Dispatchers ------------------------------------------------------- */
+
+/* Have mxTagTable_IsCallbackFree() check the tables of a run which the
+   GIL-free engine could not complete again, freeing its stack: one of
+   them refers to a table which has changed since it was checked, e.g. a
+   TableInList entry which was replaced */
+
+static
+void mxte_nogil_recheck(mxTagTableObject *root,
+			mxTagError *error)
+{
+    nogil_stack_entry *entry = (nogil_stack_entry *) error->stack;
+
+    root->nogil = -1;
+    if (error->table != NULL)
+	error->table->nogil = -1;
+    while (entry != NULL) {
+	nogil_stack_entry *parent = (nogil_stack_entry *) entry->parent;
+
+	entry->table->nogil = -1;
+	PyMem_RawFree(entry);
+	entry = parent;
+    }
+    error->stack = NULL;
+}
+
+/* Run the matching phase, collecting the records in results; the GIL
+   is released meanwhile if release is set. Returns the code of the
+   engine, 0 in case of an error or if a limit of the tag() call was
+   exceeded (exception set) and -1 if the standard engine has to re-run
+   the parse (no exception set). */
+
+static
+int mxte_nogil_run(PyObject *textobj,
+		   Py_ssize_t sliceleft,
+		   Py_ssize_t sliceright,
+		   mxTagTableObject *table,
+		   mxTagResultBuffer *results,
+		   Py_ssize_t *next,
+		   int release)
+{
+    mxTagLimits *limits = mxTextTools_CurrentLimits();
+    Py_ssize_t steps = limits != NULL ? limits->steps : 0;
+    PyThreadState *threadState = NULL;
+    mxTagError error;
+    int kind, rc = ERROR_CODE;
+
+    error.type = NULL;
+    error.message[0] = '\0';
+    error.stack = NULL;
+    error.table = NULL;
+    kind = mxte_get_string_kind(textobj);
+    if (release)
+	threadState = PyEval_SaveThread();
+    switch (kind) {
+    case TE_KIND_1BYTE:
+	rc = mxTextTools_TaggingEngine_NoGIL_1BYTE(textobj, sliceleft, sliceright,
+						   table, results, &error, next);
+	break;
+    case TE_KIND_2BYTE:
+	rc = mxTextTools_TaggingEngine_NoGIL_2BYTE(textobj, sliceleft, sliceright,
+						   table, results, &error, next);
+	break;
+    case TE_KIND_4BYTE:
+	rc = mxTextTools_TaggingEngine_NoGIL_4BYTE(textobj, sliceleft, sliceright,
+						   table, results, &error, next);
+	break;
+    }
+    if (release)
+	PyEval_RestoreThread(threadState);
+
+    if (rc != ERROR_CODE)
+	return rc;
+    if (limits != NULL && limits->exceeded)
+	return mxTextTools_RaiseLimitExceeded(limits);
+    if (error.type == PyExc_MemoryError) {
+	PyErr_NoMemory();
+	return 0;
+    }
+    if (error.type != NULL) {
+	PyErr_SetString(error.type, error.message);
+	return 0;
+    }
+    /* Not completed: re-run with the standard engine, which takes the
+       steps again. Only the part of the parse up to the table which
+       could not be run is lost, but that can be all of it; checking
+       the tables again makes sure this happens once per change of a
+       table. */
+    mxte_nogil_recheck(table, &error);
+    if (limits != NULL)
+	limits->steps = steps;
+    return -1;
+}
+
+int mxTextTools_TaggingEngine_NoGIL(PyObject *textobj,
+				    Py_ssize_t sliceleft,
+				    Py_ssize_t sliceright,
+				    mxTagTableObject *table,
+				    PyObject *taglist,
+				    Py_ssize_t *next)
+{
+    mxTagResultBuffer results = {NULL, 0, 0};
+    int rc;
+
+    rc = mxte_nogil_run(textobj, sliceleft, sliceright, table,
+			&results, next, 1);
+    if (rc > 0 && mxTagResultBuffer_AppendTo(&results, textobj, taglist))
+	rc = 0;
+    PyMem_RawFree(results.items);
+    return rc;
+}
+
+/* The records of the GIL-free engine go into the tree's arrays
+   without creating a Python object per node. They are used whether
+   or not the GIL is released (see set_release_gil()); tables with
+   callbacks, profiled runs and parses the GIL-free engine can't
+   complete build the usual taglist, which is then converted. */
+
+int mxTextTools_TaggingEngine_Compact(PyObject *textobj,
+				      Py_ssize_t sliceleft,
+				      Py_ssize_t sliceright,
+				      mxTagTableObject *table,
+				      mxTagTreeObject *tree,
+				      PyObject *context,
+				      Py_ssize_t *next)
+{
+    PyObject *taglist;
+    int rc;
+
+    if (mxTextTools_CurrentProfile() == NULL &&
+	mxTextTools_CurrentPartial() == NULL) {
+	rc = mxTagTable_IsCallbackFree(table);
+	if (rc < 0)
+	    return 0;
+	if (rc > 0) {
+	    mxTagResultBuffer results = {NULL, 0, 0};
+
+	    rc = mxte_nogil_run(textobj, sliceleft, sliceright, table,
+				&results, next, mxTextTools_ReleaseGIL);
+	    if (rc == SUCCESS_CODE &&
+		mxTagTree_AppendRecords(tree, &results, textobj))
+		rc = 0;
+	    PyMem_RawFree(results.items);
+	    if (rc >= 0)
+		return rc;
+	}
+    }
+
+    taglist = PyList_New(0);
+    if (taglist == NULL)
+	return 0;
+    rc = mxTextTools_TaggingEngine_Modern(textobj, sliceleft, sliceright,
+					  table, taglist, context, next);
+    if (rc == SUCCESS_CODE && mxTagTree_AppendList(tree, taglist))
+	rc = 0;
+    Py_DECREF(taglist);
+    return rc;
+}
@@ -0,0 +1,567 @@
+/*
+  mxte_nogil -- Tagging Engine variant running without the GIL
+
+  This is the Tagging Engine of mxte_impl.h for running while the GIL
+  is released. It runs the same command code (lowlevelcommands.h,
+  speccommands.h, highcommands.h and recursecommands.h, compiled with
+  TE_NOGIL defined), but is only used for callback-free tables (see
+  mxTagTable_IsCallbackFree()), i.e. tables which never call into
+  Python code, and differs from the standard engine in these points:
+
+  - Results are not appended to Python lists, but recorded in a
+    mxTagResultBuffer, which is converted to the usual taglist by
+    mxTagResultBuffer_AppendTo() after the GIL has been re-acquired.
+
+    The buffer holds the records in the order in which the standard
+    engine would have appended them to their lists. A list created for
+    a Table/TableInList child (its "own" list) is the run of records
+    starting at the buffer position where the child table was pushed;
+    the record for the child itself follows the run and stores the
+    start position in its children field. Truncating a list in the
+    standard engine is therefore truncating the buffer.
+
+  - No reference counts are touched: all tables, tag objects and
+    command arguments are kept alive by the root table, which the
+    caller owns.
+
+  - Memoized child tables (see mxte_memo.h) refer to their result
+    records in the buffer; the buffer is therefore only truncated
+    through TRUNCATE_RESULTS, which lets the memo save the records it
+    still needs. An outcome replayed from the memo's arena is a single
+    MXTE_RESULT_REPLAY record referring to the arena records, so
+    replaying costs the same however large the child's results are;
+    mxTagResultBuffer_Expand() replaces these records with copies of
+    the records they refer to when the root table has matched.
+
+  - Errors (including running out of memory) are recorded in a
+    mxTagError, the message formatted into its buffer, and raised by
+    the caller once the GIL has been re-acquired. Exceeding the limits
+    of the tag() call (see mxte_limits.h) is reported by the caller,
+    too.
+
+  - Child tables which would have to be compiled or are not
+    callback-free (possible if a TableInList list changed after
+    mxTagTable_IsCallbackFree() checked it) stop the engine with
+    ERROR_CODE and no error type. The caller then re-runs the parse
+    with the standard engine, and has the tables checked again so
+    that later parses go to the standard engine directly.
+
+  Copyright (c) 2000, Marc-Andre Lemburg; mailto:mal@lemburg.com
+  Copyright (c) 2000-2002, eGenix.com Software GmbH; mailto:info@egenix.com
+  Copyright (c) 2003-2006, Mike Fletcher; mailto:mcfletch@vrplumber.com
+*/
+
+#ifndef TEXTTOOLS_NOGIL_STACK_STRUCTURES
+# define TEXTTOOLS_NOGIL_STACK_STRUCTURES
+
+/* codes for returnCode and childReturnCode variables (see mxte_impl.h) */
+#define EOF_CODE 3
+#define SUCCESS_CODE 2
+#define FAILURE_CODE 1
+#define ERROR_CODE 0
+#define NULL_CODE -1
+#define PENDING_CODE -2
+
+#include "mxte_memo.h"
+#include "mxte_limits.h"
+
+/* Error met by the engine; raised by the caller (see above) */
+typedef struct {
+	PyObject * type;	/* exception class or NULL if the standard
+				   engine has to re-run the parse */
+	char message[256];
+	void * stack;		/* stack of the stopped run if the standard
+				   engine has to re-run the parse; the
+				   caller has the tables on it checked again */
+	mxTagTableObject * table; /* the table the run stopped in */
+} mxTagError;
+
+typedef struct nogil_stack_entry {
+	void * parent; /* pointer to a parent table or NULL */
+
+	Py_ssize_t position; /* where the engine is currently parsing for the parent table*/
+	Py_ssize_t startPosition; /* position where we started parsing for the parent table */
+
+	mxTagTableObject * table; /* the parent table */
+	Py_ssize_t index; /* index of the child tag in the parent table */
+
+	Py_ssize_t childStart; /* text start position for the child table */
+	Py_ssize_t results; /* buffer position of the parent's result list */
+	Py_ssize_t resultsLength; /* the length of the buffer before the sub-table is called */
+} nogil_stack_entry;
+
+#define RESET_TABLE_VARIABLES {\
+	index=0;\
+	table_len = table->numentries;\
+	returnCode = NULL_CODE;\
+	loopcount = -1;\
+	loopstart = startPosition;\
+	taglist_len = results->length;\
+}
+
+#define RESET_TAG_VARIABLES {\
+	childStart = position;\
+	childPosition = position;\
+	childReturnCode = NULL_CODE;\
+	childResults = -1;\
+}
+
+#define DECODE_TAG {\
+	mxTagTableEntry *entry;\
+	entry = &table->entry[index];\
+	command = entry->cmd;\
+	flags = entry->flags;\
+	match = entry->args;\
+	failureJump = entry->jne;\
+	successJump = entry->je;\
+	tagobj = entry->tagobj;\
+	if (tagobj == NULL) { tagobj = Py_None;}\
+}
+
+#define PUSH_STACK( newTable, newResults ) {\
+	stackTemp = (nogil_stack_entry *) PyMem_RawMalloc( sizeof( nogil_stack_entry ));\
+	if (stackTemp == NULL) {\
+		childReturnCode = ERROR_CODE;\
+		errorType = PyExc_MemoryError;\
+		break;\
+	}\
+	stackTemp->parent = stackParent;\
+	stackTemp->position = position;\
+	stackTemp->startPosition = startPosition;\
+	stackTemp->table = table;\
+	stackTemp->index = index;\
+	stackTemp->childStart = childStart;\
+	stackTemp->resultsLength = taglist_len;\
+	stackTemp->results = taglist;\
+	\
+	stackParent = stackTemp;\
+	childReturnCode = PENDING_CODE;\
+	\
+	startPosition = position;\
+	table = (mxTagTableObject *) newTable;\
+	taglist = newResults;\
+}
+
+#define POP_STACK {\
+	if (stackParent) {\
+		childStart = stackParent->childStart;\
+		childPosition = position;\
+		position = stackParent->position;\
+		\
+		startPosition = stackParent->startPosition;\
+		\
+		childResults = taglist;\
+		taglist_len = stackParent->resultsLength;\
+		taglist = stackParent->results;\
+		table = stackParent->table;\
+		table_len = table->numentries;\
+		index = stackParent->index;\
+		\
+		stackTemp = stackParent->parent;\
+		PyMem_RawFree( stackParent );\
+		stackParent = stackTemp;\
+		stackTemp = NULL;\
+		\
+		childReturnCode = returnCode;\
+		returnCode = NULL_CODE;\
+	}\
+}
+
+#define TRUNCATE_RESULTS( newLength ) {\
+	mxTagMemo_Truncate(&memo, results->items, (newLength));\
+	results->length = (newLength);\
+}
+
+/* Record flag of a replayed memo outcome: the record stands for the
+   right records at arena position left, whose children fields count
+   from children (see mxTagMemoEntry.first) */
+#define MXTE_RESULT_REPLAY (1 << 16)
+
+/* Macros used by the command code shared with the standard engine
+   (see recursecommands.h); Python objects can't be created without
+   the GIL, so error messages are formatted into the mxTagError */
+#define TE_SET_ERROR( type, ... ) {\
+	errorType = (type);\
+	PyOS_snprintf(error->message, sizeof(error->message), __VA_ARGS__);\
+}
+#define TE_INCREF( object )
+#define TE_DECREF( object )
+#define TE_KEEPS_RESULTS 1
+
+/* Macro to replay the records of a memoized outcome. Records in the
+   arena stay where they are and are referred to by a single replay
+   record; records still in the buffer are copied. */
+#define TE_MEMO_REPLAY( memoEntry ) {\
+	Py_ssize_t first = results->length, i;\
+	\
+	childResults = first;\
+	if ((memoEntry)->count > 0 && (memoEntry)->offset >= 0) {\
+		mxTagResult * result = mxTagResultBuffer_Add( results );\
+		\
+		if (result == NULL) {\
+			childReturnCode = ERROR_CODE;\
+			errorType = PyExc_MemoryError;\
+		} else {\
+			result->tagobj = NULL;\
+			result->left = (memoEntry)->offset;\
+			result->right = (memoEntry)->count;\
+			result->children = (memoEntry)->first;\
+			result->flags = MXTE_RESULT_REPLAY;\
+			replayed = 1;\
+		}\
+	} else {\
+		for (i = 0; i < (memoEntry)->count; i++) {\
+			mxTagResult * result = mxTagResultBuffer_Add( results );\
+			\
+			if (result == NULL) {\
+				childReturnCode = ERROR_CODE;\
+				errorType = PyExc_MemoryError;\
+				break;\
+			}\
+			/* the buffer may have moved */\
+			*result = results->items[(memoEntry)->first + i];\
+			if (result->children >= 0 &&\
+				!(result->flags & MXTE_RESULT_REPLAY))\
+				result->children += first - (memoEntry)->first;\
+		}\
+	}\
+}
+
+/* Macro to push a child table: Table children get their own result
+   list, starting at the end of the buffer, SubTable children append
+   to ours */
+#define TE_PUSH_TABLE( newTable ) {\
+	if (command == MATCH_TABLE || command == MATCH_TABLEINLIST) {\
+		PUSH_STACK( newTable, results->length );\
+	} else {\
+		PUSH_STACK( newTable, taglist );\
+	}\
+}
+
+/* Add a record to the buffer; returns NULL if out of memory */
+static
+mxTagResult *mxTagResultBuffer_Add(mxTagResultBuffer *results)
+{
+	if (results->length == results->allocated) {
+		Py_ssize_t allocated = results->allocated ? results->allocated * 2 : 64;
+		mxTagResult *items;
+
+		if ((size_t)allocated > PY_SSIZE_T_MAX / sizeof(mxTagResult))
+			return NULL;
+		items = (mxTagResult *) PyMem_RawRealloc(
+			results->items, allocated * sizeof(mxTagResult));
+		if (items == NULL)
+			return NULL;
+		results->items = items;
+		results->allocated = allocated;
+	}
+	return &results->items[results->length++];
+}
+
+/* Append copies of the records items[start:stop] to results, replacing
+   replay records by the arena records they refer to; children fields
+   of the records count from base. Returns -1 if out of memory. */
+static
+int mxTagResultBuffer_Copy(mxTagResultBuffer *results,
+			   mxTagResult *items,
+			   Py_ssize_t start,
+			   Py_ssize_t stop,
+			   Py_ssize_t base,
+			   mxTagResult *arena)
+{
+	/* where the copy of each record starts, for the children fields */
+	Py_ssize_t *positions;
+	Py_ssize_t i;
+	int rc = 0;
+
+	if (stop <= start)
+		return 0;
+	positions = (Py_ssize_t *) PyMem_RawMalloc((stop - start) * sizeof(Py_ssize_t));
+	if (positions == NULL)
+		return -1;
+	for (i = start; i < stop && rc == 0; i++) {
+		mxTagResult record = items[i];
+
+		positions[i - start] = results->length;
+		if (record.flags & MXTE_RESULT_REPLAY) {
+			rc = mxTagResultBuffer_Copy(results, arena, record.left,
+						    record.left + record.right,
+						    record.children, arena);
+		}
+		else {
+			mxTagResult *result = mxTagResultBuffer_Add(results);
+
+			if (result == NULL) {
+				rc = -1;
+				break;
+			}
+			if (record.children >= 0)
+				record.children = positions[record.children - base];
+			*result = record;
+		}
+	}
+	PyMem_RawFree(positions);
+	return rc;
+}
+
+/* Replace the replay records of results by the records they refer to;
+   returns -1 if out of memory */
+static
+int mxTagResultBuffer_Expand(mxTagResultBuffer *results,
+			     mxTagResult *arena)
+{
+	mxTagResultBuffer expanded = {NULL, 0, 0};
+
+	if (mxTagResultBuffer_Copy(&expanded, results->items, 0, results->length,
+				   0, arena)) {
+		PyMem_RawFree(expanded.items);
+		return -1;
+	}
+	PyMem_RawFree(results->items);
+	*results = expanded;
+	return 0;
+}
+
+#endif
+
+/* TE_ENGINE_API(): the GIL-free table driven parser engine
+
+   - return codes: 2: match ok; 1: match failed; 0: error (see error)
+     or not completed, re-run the standard engine (no error type);
+     no exception is set
+   - must only be called for callback-free tables !
+   - can be called without holding the GIL
+*/
+
+int TE_ENGINE_API(
+	PyObject *textobj,
+	Py_ssize_t sliceleft,
+	Py_ssize_t sliceright,
+	mxTagTableObject *table,
+	mxTagResultBuffer *results,
+	mxTagError *error,
+	Py_ssize_t *next
+) {
+    TE_CHAR *text = NULL;		/* Pointer to the text object's data */
+
+	/* local variables pushed into stack on recurse */
+		/* whole-table variables */
+		Py_ssize_t position = sliceleft;		/* current (head) position in text for whole table */
+		Py_ssize_t startPosition = sliceleft;	/* start position for current tag */
+		Py_ssize_t table_len = table->numentries; /* table length */
+		short returnCode = NULL_CODE;		/* return code: -1 not set, 0 error, 1
+					   not ok, 2 ok */
+		Py_ssize_t index=0; 			/* index of current table entry */
+		Py_ssize_t taglist = results->length;	/* buffer position of the current result list */
+		Py_ssize_t taglist_len = results->length;
+
+		/* variables tracking status of the current tag */
+		register short childReturnCode = NULL_CODE; /* the current child's return code value */
+		Py_ssize_t childStart = startPosition;
+		register Py_ssize_t childPosition = startPosition;
+		Py_ssize_t childResults = -1; /* buffer position of the current child's result list */
+		int flags=0;			/* flags set in command */
+		int command=0;			/* command */
+		int failureJump=0;			/* rel. jump distance on 'not matched' */
+		int successJump=1;			/* dito on 'matched' */
+		PyObject *match=NULL;		/* matching parameter */
+		int loopcount = -1; 	/* loop counter */
+		Py_ssize_t loopstart = startPosition;	/* loop start position */
+		PyObject *tagobj = NULL;
+
+	nogil_stack_entry * stackParent = NULL;
+	nogil_stack_entry * stackTemp = NULL; /* just temporary storage for parent pointers */
+
+	/* Error-management variable, the message goes into error */
+	PyObject * errorType = NULL;
+
+	/* outcomes of the memoized child tables */
+	mxTagMemo memo;
+	int replayed = 0;	/* whether results hold replay records */
+
+	/* step budget and deadline; an excess is reported by the caller */
+	mxTagLimits * limits = mxTextTools_CurrentLimits();
+
+	mxTagMemo_Init(&memo);
+	text = TE_STRING_AS_STRING(textobj);
+	if (text == NULL || !table->callbackfree)
+		returnCode = ERROR_CODE;
+
+	while (1) {
+		/* this loop processes a whole table */
+		while (
+			(index < table_len) &
+			(returnCode == NULL_CODE) &
+			(index >= 0)
+		) {
+			DECODE_TAG
+			if (childReturnCode == NULL_CODE ) {
+				RESET_TAG_VARIABLES
+				if (limits != NULL && mxTagLimits_Step(limits)) {
+					MXTE_LIMITS_RECORD(limits, nogil_stack_entry, stackParent, table, position);
+					returnCode = ERROR_CODE;
+					break;
+				}
+			}
+			if (command < MATCH_MAX_LOWLEVEL) {
+#include "lowlevelcommands.h"
+			} else {
+				switch (command) {
+/* Jumps & special commands */
+#include "speccommands.h"
+/* non-table-recursion high-level stuff */
+#include "highcommands.h"
+/* the recursive table commands */
+#include "recursecommands.h"
+					default:
+						{
+							childReturnCode = ERROR_CODE;
+							TE_SET_ERROR(PyExc_ValueError,
+								 "Unrecognised command code %i",
+								 command
+							);
+						}
+				}
+			}
+			/* sanity check wanted by Marc-André for skip-before-buffer */
+			if (childPosition < 0) {
+				childReturnCode = ERROR_CODE;
+				TE_SET_ERROR(PyExc_TypeError,
+					 "tagobj (type %.50s) table entry %d moved/skipped beyond start of text (to position %d)",
+					 Py_TYPE(tagobj)->tp_name,
+					 (unsigned int)index,
+					 (unsigned int)childPosition
+				);
+			}
+
+			switch(childReturnCode) {
+				case NULL_CODE:
+				case SUCCESS_CODE:
+					{
+						/* the child's own result list, if it has one */
+						int ownList = (childResults >= 0 &&
+									   (command == MATCH_TABLE ||
+										command == MATCH_TABLEINLIST));
+						mxTagResult * result;
+
+						if (tagobj == Py_None) {
+							/* not reported; the child's list is dropped */
+							if (ownList)
+								TRUNCATE_RESULTS( childResults );
+						} else {
+							int resultFlags = 0;
+
+							if (flags & MATCH_APPENDMATCH)
+								resultFlags = MATCH_APPENDMATCH;
+							else if (flags & MATCH_APPENDTAGOBJ)
+								resultFlags = MATCH_APPENDTAGOBJ;
+							if (ownList && resultFlags)
+								TRUNCATE_RESULTS( childResults );
+							result = mxTagResultBuffer_Add( results );
+							if (result == NULL) {
+								returnCode = ERROR_CODE;
+								errorType = PyExc_MemoryError;
+								break;
+							}
+							result->tagobj = tagobj;
+							result->left = childStart;
+							result->right = childPosition;
+							result->children = (ownList && !resultFlags) ? childResults : -1;
+							result->flags = resultFlags;
+						}
+						childResults = -1;
+						/* reset for lookahead */
+						if (flags & MATCH_LOOKAHEAD) {
+							position = childStart;
+						} else {
+							position = childPosition;
+						}
+						index += successJump;
+						break;
+					}
+				case FAILURE_CODE:
+					/* the failed child table has already truncated
+					   its results */
+					childResults = -1;
+					position = childStart;
+					if (failureJump == 0) {
+						returnCode = 1;
+					} else {
+						index += failureJump;
+					}
+					break;
+				case PENDING_CODE:
+					break;
+				default:
+					returnCode = ERROR_CODE;
+			}
+			childReturnCode = NULL_CODE;
+		}
+		/* we're done the table, figure out what to do. */
+		if (returnCode == NULL_CODE) {
+			if (index >= table_len) {
+				returnCode = SUCCESS_CODE;
+			} else {
+				returnCode = FAILURE_CODE;
+			}
+		}
+		if (returnCode == FAILURE_CODE) {
+			/* truncate result list */
+			TRUNCATE_RESULTS( taglist_len );
+			/* reset position */
+			position = startPosition;
+		}
+		if (returnCode == ERROR_CODE) {
+			/* the caller discards the results; the stack is freed
+			   here unless the caller re-runs the parse, which has
+			   the tables on it checked again */
+			error->type = errorType;
+			if (errorType == NULL && (limits == NULL || !limits->exceeded)) {
+				error->stack = stackParent;
+				error->table = table;
+				stackParent = NULL;
+			}
+			while (stackParent != NULL) {
+				stackTemp = stackParent->parent;
+				PyMem_RawFree( stackParent );
+				stackParent = stackTemp;
+			}
+			mxTagMemo_Clear(&memo);
+			*next = startPosition;
+			return ERROR_CODE;
+		} else {
+			if (stackParent != NULL) {
+				/* remember the outcome of a memoized child table */
+				if (stackParent->table->entry[stackParent->index].flags & MATCH_MEMOIZE) {
+					Py_ssize_t count = 0;
+					mxTagMemoEntry * memoEntry;
+
+					if (returnCode == SUCCESS_CODE)
+						count = results->length - taglist_len;
+					memoEntry = mxTagMemo_StoreRecords(&memo, table, startPosition,
+													   taglist_len, count);
+					if (memoEntry != NULL) {
+						memoEntry->code = returnCode;
+						memoEntry->end = position;
+					}
+				}
+				/* pop stack also sets the childReturnCode for us... */
+				POP_STACK
+			} else {
+				/* this was the root table */
+				if (returnCode == FAILURE_CODE) {
+					*next = childPosition;
+				} else {
+					*next = position;
+					if (replayed &&
+						mxTagResultBuffer_Expand(results, memo.arena)) {
+						returnCode = ERROR_CODE;
+						error->type = PyExc_MemoryError;
+					}
+				}
+				mxTagMemo_Clear(&memo);
+				return returnCode;
+			}
+		}
+	} /* end of infinite loop */
+}
@@ -0,0 +1,255 @@
+/*
+  mxte_partial -- Suspending and resuming the Tagging Engine
+
+  tag(...,partial=1) tags a text which may go on past sliceright, e.g.
+  a message still arriving from the network. Whenever the outcome of
+  a command depends on the text after sliceright (a character set
+  matched up to the end, a word cut short, a search which found
+  nothing, ...), the standard engine stops before using that outcome
+  and keeps its explicit stack, the position and the entry to re-run
+  in an mxTagSuspended; tag() returns it and tag(...,resume=state)
+  re-runs the entry on the longer text and goes on from there. Every
+  entry whose outcome was used is final, so the work done for the
+  whole text is the same as for a single tag() call.
+
+  mxTagPartial_Undecided() decides which outcomes have to wait. It
+  assumes callbacks (Call, CallArg) only look at the text up to the
+  position they return, and treats their failures as undecided.
+
+  tag(...,slice_steps=n) suspends the run the same way before the
+  table entry following the first n entries run, whatever the text,
+  so that a long parse can be run in slices (e.g. giving an event loop
+  the chance to run other tasks in between).
+
+  The mxTagPartial of the running tag() call is found through the
+  thread-local mxTextTools_PartialKey; it is NULL unless the call is
+  partial, sliced or resumes a run, so the cost for the engine is one
+  branch per command. The GIL-free engine doesn't suspend, such calls are
+  run by the standard engine.
+
+  Copyright (c) 2000, Marc-Andre Lemburg; mailto:mal@lemburg.com
+  Copyright (c) 2000-2002, eGenix.com Software GmbH; mailto:info@egenix.com
+  Copyright (c) 2003-2006, Mike Fletcher; mailto:mcfletch@vrplumber.com
+*/
+
+#ifndef MXTE_PARTIAL_H
+#define MXTE_PARTIAL_H
+
+#include "mxte_memo.h"
+
+/* Name of the capsules holding an mxTagSuspended */
+#define MXTE_SUSPENDED_NAME	"mxTextTools.suspended"
+
+/* Returned by an engine which suspended the run (EOF_CODE in
+   mxte_impl.h) */
+#define MXTE_SUSPENDED_CODE	3
+
+struct mxTagSuspended {
+	PyObject * rootTable;	/* table and taglist of the run, or NULL */
+	PyObject * rootTaglist;
+	Py_ssize_t sliceleft;	/* where the run started */
+	int suspended;		/* the engine state below is held */
+
+	/* the engine's state, taken back by the engine when resuming */
+	PyObject * table;	/* table being run */
+	PyObject * taglist;	/* its results */
+	void * stack;		/* stack entries of the engine */
+	Py_ssize_t position;	/* position of the entry to re-run */
+	Py_ssize_t startPosition;
+	Py_ssize_t index;	/* the entry to re-run */
+	Py_ssize_t taglistLength;
+	Py_ssize_t loopstart;
+	int loopcount;
+	mxTagMemo memo;
+
+	/* releases the state, set by the engine which suspended */
+	void (*release)(struct mxTagSuspended *state);
+};
+
+struct mxTagPartial {
+	int partial;		/* the text may go on past sliceright */
+	mxTagSuspended * state;	/* run to resume and to suspend into */
+	Py_ssize_t slice;	/* entries to run before suspending, 0 for
+				   no limit */
+	Py_ssize_t steps;	/* entries run so far */
+};
+
+static inline
+void mxTagPartial_Init(mxTagPartial *partial)
+{
+	memset(partial, 0, sizeof(mxTagPartial));
+}
+
+static inline
+mxTagSuspended *mxTagSuspended_New(void)
+{
+	mxTagSuspended *state;
+
+	state = (mxTagSuspended *) PyMem_Malloc(sizeof(mxTagSuspended));
+	if (state == NULL) {
+		PyErr_NoMemory();
+		return NULL;
+	}
+	memset(state, 0, sizeof(mxTagSuspended));
+	return state;
+}
+
+/* Release the engine state held by state, if any; needs the GIL */
+static inline
+void mxTagSuspended_Release(mxTagSuspended *state)
+{
+	if (state->suspended && state->release != NULL)
+		state->release(state);
+	state->suspended = 0;
+}
+
+/* Free state; needs the GIL */
+static inline
+void mxTagSuspended_Free(mxTagSuspended *state)
+{
+	if (state == NULL)
+		return;
+	mxTagSuspended_Release(state);
+	Py_XDECREF(state->rootTable);
+	Py_XDECREF(state->rootTaglist);
+	PyMem_Free(state);
+}
+
+/* Count a table entry about to be run; returns 1 if the slice of
+   the run is over and the run should suspend before the entry */
+static inline
+int mxTagPartial_Step(mxTagPartial *partial)
+{
+	if (partial->slice <= 0)
+		return 0;
+	if (partial->steps >= partial->slice)
+		return 1;
+	partial->steps++;
+	return 0;
+}
+
+/* Return the length of the longest word of a WordInList argument or
+   PY_SSIZE_T_MAX if it can't be told */
+static inline
+Py_ssize_t mxTagPartial_LongestWord(PyObject *words)
+{
+	Py_ssize_t i, length, longest = 0;
+
+	if (!PyList_Check(words) && !PyTuple_Check(words))
+		return PY_SSIZE_T_MAX;
+	for (i = 0; i < PySequence_Fast_GET_SIZE(words); i++) {
+		length = PyObject_Length(PySequence_Fast_GET_ITEM(words, i));
+		if (length < 0) {
+			PyErr_Clear();
+			return PY_SSIZE_T_MAX;
+		}
+		if (length > longest)
+			longest = length;
+	}
+	return longest;
+}
+
+/* Return the number of units of the character at position: its
+   length told by the lead byte if utf8 is the UTF-8 text, else 1 */
+static inline
+Py_ssize_t mxTagPartial_Width(const unsigned char *utf8,
+			      Py_ssize_t position,
+			      Py_ssize_t sliceright)
+{
+	unsigned char lead;
+
+	if (utf8 == NULL || position >= sliceright)
+		return 1;
+	lead = utf8[position];
+	if (lead < 0xC0)
+		return 1;
+	if (lead < 0xE0)
+		return 2;
+	if (lead < 0xF0)
+		return 3;
+	return 4;
+}
+
+/* Return 1 if the character at position is cut off by sliceright */
+static inline
+int mxTagPartial_Cut(const unsigned char *utf8,
+		     Py_ssize_t position,
+		     Py_ssize_t sliceright)
+{
+	return sliceright - position < mxTagPartial_Width(utf8, position, sliceright);
+}
+
+/* Return 1 if the outcome of command, run from childStart, could
+   change if the text went on past sliceright, 0 if not; matched is
+   the outcome, childPosition where a match stopped. utf8 is the text
+   if the table matches UTF-8, NULL otherwise. */
+static inline
+int mxTagPartial_Undecided(int command,
+			   PyObject *match,
+			   int matched,
+			   Py_ssize_t childStart,
+			   Py_ssize_t childPosition,
+			   Py_ssize_t sliceright,
+			   const unsigned char *utf8)
+{
+	Py_ssize_t length;
+
+	switch (command) {
+	case MATCH_ALLIN:
+	case MATCH_ALLNOTIN:
+	case MATCH_ALLINSET:
+	case MATCH_ALLINCHARSET:
+		/* a match up to the end could go on */
+		if (matched)
+			return mxTagPartial_Cut(utf8, childPosition, sliceright);
+		return mxTagPartial_Cut(utf8, childStart, sliceright);
+	case MATCH_IS:
+	case MATCH_ISIN:
+	case MATCH_ISNOTIN:
+	case MATCH_ISINSET:
+	case MATCH_ISINCHARSET:
+	case MATCH_DISPATCH:
+		return !matched && mxTagPartial_Cut(utf8, childStart, sliceright);
+	case MATCH_WORD:
+		if (matched)
+			return 0;
+		length = PyObject_Length(match);
+		if (length < 0) {
+			PyErr_Clear();
+			return 1;
+		}
+		return length > sliceright - childStart;
+	case MATCH_WORDINLIST:
+		/* a longer word may still match */
+		return mxTagPartial_LongestWord(match) > sliceright - childStart;
+	case MATCH_WORDSTART:
+	case MATCH_WORDEND:
+		return !matched;
+	case MATCH_SWORDSTART:
+	case MATCH_SWORDEND:
+	case MATCH_SFINDWORD:
+		if (!matched)
+			return 1;
+		/* a word starting further left or declared first may
+		   still be found */
+		if (mxMultiTextSearch_Check(match))
+			return mxTagPartial_LongestWord(
+				((mxMultiTextSearchObject *)match)->match) >
+				sliceright - childPosition;
+		return 0;
+	case MATCH_CALL:
+	case MATCH_CALLARG:
+		return !matched || childPosition >= sliceright;
+	case MATCH_EOF:
+		return matched;
+	case MATCH_SKIP:
+		return childPosition >= sliceright;
+	case MATCH_MOVE:
+		/* negative positions are relative to the end */
+		return PyInt_AS_LONG(match) < 0 || childPosition >= sliceright;
+	}
+	/* jumps, loops and tables don't look at the text themselves */
+	return 0;
+}
+
+#endif /* MXTE_PARTIAL_H */
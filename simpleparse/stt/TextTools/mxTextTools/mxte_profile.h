@@ -0,0 +1,188 @@
+/*
+  mxte_profile -- Profiling counters for the Tagging Engine
+
+  tag(...,profile=...) makes the standard engine count, for each
+  table it calls, how often it was entered, how often it matched or
+  failed, how many characters it matched and the time spent in it
+  (children included). The counters are kept per calling context: a
+  node stands for a table called with a tag object from its parent
+  node, the root node for the table passed to tag(), so the nodes
+  form a call tree which can be turned into per-table totals as well
+  as into stacks for flame graphs.
+
+  The profile of the running tag() call is found through the
+  thread-local mxTextTools_ProfileKey; it is NULL unless profiling,
+  which keeps the cost for the engine to one branch per table call.
+  The GIL-free engine doesn't profile; tag() uses the standard engine
+  while profiling.
+
+  Copyright (c) 2000, Marc-Andre Lemburg; mailto:mal@lemburg.com
+  Copyright (c) 2000-2002, eGenix.com Software GmbH; mailto:info@egenix.com
+  Copyright (c) 2003-2006, Mike Fletcher; mailto:mcfletch@vrplumber.com
+*/
+
+#ifndef MXTE_PROFILE_H
+#define MXTE_PROFILE_H
+
+/* Monotonic clock in nanoseconds */
+static inline
+long long mxTagProfile_Now(void)
+{
+#if PY_VERSION_HEX >= 0x030D0000
+	PyTime_t t;
+
+	if (PyTime_PerfCounterRaw(&t) < 0)
+		return 0;
+	return (long long)t;
+#else
+	return (long long)_PyTime_GetPerfCounter();
+#endif
+}
+
+static inline
+void mxTagProfile_Init(mxTagProfile *profile)
+{
+	profile->nodes = NULL;
+	profile->length = 0;
+	profile->allocated = 0;
+	profile->failed = 0;
+}
+
+/* Return the node for table called with tagobj from node parent (-1
+   for the root node), adding it if needed. If that fails, the
+   profile is marked as failed and parent is returned. */
+static inline
+Py_ssize_t mxTagProfile_Enter(mxTagProfile *profile, Py_ssize_t parent,
+							  PyObject *table, PyObject *tagobj)
+{
+	mxTagProfileNode *node;
+	Py_ssize_t index;
+
+	if (parent >= 0)
+		index = profile->nodes[parent].child;
+	else
+		index = profile->length ? 0 : -1;
+	for (; index >= 0; index = profile->nodes[index].sibling) {
+		node = &profile->nodes[index];
+		if (node->table == table && node->tagobj == tagobj)
+			return index;
+	}
+	if (profile->length == profile->allocated) {
+		Py_ssize_t allocated = profile->allocated ? profile->allocated * 2 : 64;
+
+		node = (mxTagProfileNode *) PyMem_Realloc(
+			profile->nodes, allocated * sizeof(mxTagProfileNode));
+		if (node == NULL) {
+			profile->failed = 1;
+			return parent;
+		}
+		profile->nodes = node;
+		profile->allocated = allocated;
+	}
+	index = profile->length++;
+	node = &profile->nodes[index];
+	Py_INCREF(table);
+	node->table = table;
+	Py_INCREF(tagobj);
+	node->tagobj = tagobj;
+	node->parent = parent;
+	node->child = node->lastChild = node->sibling = -1;
+	node->entries = node->successes = node->failures = node->consumed = 0;
+	node->time = 0;
+	if (parent >= 0) {
+		mxTagProfileNode *parentNode = &profile->nodes[parent];
+
+		if (parentNode->lastChild >= 0)
+			profile->nodes[parentNode->lastChild].sibling = index;
+		else
+			parentNode->child = index;
+		parentNode->lastChild = index;
+	}
+	return index;
+}
+
+/* Count a call of the table of node */
+static inline
+void mxTagProfile_Leave(mxTagProfile *profile, Py_ssize_t node, int matched,
+						Py_ssize_t consumed, long long elapsed)
+{
+	mxTagProfileNode *n = &profile->nodes[node];
+
+	n->entries++;
+	if (matched) {
+		n->successes++;
+		n->consumed += consumed;
+	}
+	else
+		n->failures++;
+	n->time += elapsed;
+}
+
+static inline
+void mxTagProfile_Clear(mxTagProfile *profile)
+{
+	Py_ssize_t i;
+
+	for (i = 0; i < profile->length; i++) {
+		Py_DECREF(profile->nodes[i].table);
+		Py_DECREF(profile->nodes[i].tagobj);
+	}
+	PyMem_Free(profile->nodes);
+	mxTagProfile_Init(profile);
+}
+
+/* Return the call tree as nested tuples (tagobj, table, entries,
+   successes, failures, consumed, time in seconds, children) or None
+   if nothing was profiled; clears profile */
+static inline
+PyObject *mxTagProfile_AsTuple(mxTagProfile *profile)
+{
+	PyObject **built, *v = NULL;
+	Py_ssize_t i, j, count;
+
+	if (profile->length == 0) {
+		mxTagProfile_Clear(profile);
+		Py_INCREF(Py_None);
+		return Py_None;
+	}
+	built = (PyObject **) PyMem_Calloc(profile->length, sizeof(PyObject *));
+	if (built == NULL) {
+		mxTagProfile_Clear(profile);
+		return PyErr_NoMemory();
+	}
+	/* children are added after their parents */
+	for (i = profile->length - 1; i >= 0; i--) {
+		mxTagProfileNode *node = &profile->nodes[i];
+		PyObject *children;
+
+		count = 0;
+		for (j = node->child; j >= 0; j = profile->nodes[j].sibling)
+			count++;
+		children = PyTuple_New(count);
+		if (children == NULL)
+			goto onError;
+		count = 0;
+		for (j = node->child; j >= 0; j = profile->nodes[j].sibling) {
+			PyTuple_SET_ITEM(children, count++, built[j]);
+			built[j] = NULL;
+		}
+		built[i] = Py_BuildValue("(OOnnnndN)",
+								 node->tagobj, node->table,
+								 node->entries, node->successes,
+								 node->failures, node->consumed,
+								 node->time / 1e9, children);
+		if (built[i] == NULL)
+			goto onError;
+	}
+	v = built[0];
+	built[0] = NULL;
+
+ onError:
+	for (i = 0; i < profile->length; i++)
+		Py_XDECREF(built[i]);
+	PyMem_Free(built);
+	mxTagProfile_Clear(profile);
+	return v;
+}
+
+#endif /* MXTE_PROFILE_H */
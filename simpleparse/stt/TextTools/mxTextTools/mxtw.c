@@ -0,0 +1,174 @@
+/*
+  mxtw.c -- Two-Way String Search
+
+  See mxtw.h. The factorization follows Crochemore and Perrin,
+  "Two-way string-matching", J. ACM 38(3), 1991.
+
+  Copyright (c) 2024 SimpleParse Project
+  License: MIT License
+*/
+
+#include "mxtw.h"
+#include <string.h>
+
+/* Start of the maximal suffix of pattern for the ordering given by
+   reverse, and its period */
+
+static
+Py_ssize_t mxtw_maximal_suffix(const Py_UCS4 *pattern,
+			       Py_ssize_t pattern_len,
+			       int reverse,
+			       Py_ssize_t *period)
+{
+    Py_ssize_t ms = -1, j = 0, k = 1, p = 1;
+
+    while (j + k < pattern_len) {
+	Py_UCS4 a = pattern[j + k];
+	Py_UCS4 b = pattern[ms + k];
+
+	if (reverse ? a > b : a < b) {
+	    j += k;
+	    k = 1;
+	    p = j - ms;
+	}
+	else if (a == b) {
+	    if (k != p)
+		k++;
+	    else {
+		j += p;
+		k = 1;
+	    }
+	}
+	else {
+	    ms = j;
+	    j = ms + 1;
+	    k = p = 1;
+	}
+    }
+    *period = p;
+    return ms;
+}
+
+int mxtw_init(mxtw_context *ctx, PyObject *pattern)
+{
+    Py_ssize_t i, m, ell, period, p, q;
+
+    ctx->pattern = NULL;
+    if (PyBytes_Check(pattern))
+	m = PyBytes_GET_SIZE(pattern);
+    else if (PyUnicode_Check(pattern)) {
+	if (PyUnicode_READY(pattern) < 0)
+	    return -1;
+	m = PyUnicode_GET_LENGTH(pattern);
+    }
+    else {
+	PyErr_SetString(PyExc_TypeError,
+			"match must be a string or bytes for Two-Way");
+	return -1;
+    }
+    if (m == 0) {
+	PyErr_SetString(PyExc_ValueError,
+			"match must not be empty for Two-Way");
+	return -1;
+    }
+    ctx->pattern = (Py_UCS4 *)PyMem_Malloc(m * sizeof(Py_UCS4));
+    if (ctx->pattern == NULL) {
+	PyErr_NoMemory();
+	return -1;
+    }
+    for (i = 0; i < m; i++)
+	ctx->pattern[i] = PyBytes_Check(pattern) ?
+	    (Py_UCS4)((unsigned char *)PyBytes_AS_STRING(pattern))[i] :
+	    PyUnicode_READ_CHAR(pattern, i);
+    ctx->pattern_len = m;
+
+    /* Critical factorization: the later of the two maximal suffixes */
+    i = mxtw_maximal_suffix(ctx->pattern, m, 0, &p);
+    ell = mxtw_maximal_suffix(ctx->pattern, m, 1, &q);
+    if (i > ell) {
+	ell = i;
+	period = p;
+    }
+    else
+	period = q;
+    ctx->ell = ell;
+    if (period + ell + 1 <= m &&
+	memcmp(ctx->pattern, ctx->pattern + period,
+	       (ell + 1) * sizeof(Py_UCS4)) == 0) {
+	ctx->periodic = 1;
+	ctx->period = period;
+    }
+    else {
+	ctx->periodic = 0;
+	ctx->period = (ell + 1 > m - ell - 1 ? ell + 1 : m - ell - 1) + 1;
+    }
+
+    /* The shift for a character ending the window is its distance to
+       the end of the pattern from its last occurrence before the last
+       position; a bucket keeps the smallest shift of its characters */
+    for (i = 0; i < MXTW_SHIFT_SIZE; i++)
+	ctx->shift[i] = m;
+    for (i = 0; i < m - 1; i++)
+	ctx->shift[ctx->pattern[i] & (MXTW_SHIFT_SIZE - 1)] = m - 1 - i;
+    ctx->shift[ctx->pattern[m - 1] & (MXTW_SHIFT_SIZE - 1)] = 0;
+    return 0;
+}
+
+void mxtw_cleanup(mxtw_context *ctx)
+{
+    PyMem_Free(ctx->pattern);
+    ctx->pattern = NULL;
+}
+
+#define MXTW_SEARCH(TEXT)						\
+    while (j <= stop - m) {						\
+	Py_ssize_t i, skip;						\
+									\
+	skip = ctx->shift[(TEXT)[j + m - 1] & (MXTW_SHIFT_SIZE - 1)];	\
+	if (skip) {							\
+	    j += skip;							\
+	    memory = -1;						\
+	    continue;							\
+	}								\
+	i = (ell > memory ? ell : memory) + 1;				\
+	while (i < m && x[i] == (TEXT)[i + j])				\
+	    i++;							\
+	if (i < m) {							\
+	    j += i - ell;						\
+	    memory = -1;						\
+	    continue;							\
+	}								\
+	i = ell;							\
+	while (i > memory && x[i] == (TEXT)[i + j])			\
+	    i--;							\
+	if (i <= memory)						\
+	    return j;							\
+	j += ctx->period;						\
+	if (ctx->periodic)						\
+	    memory = m - ctx->period - 1;				\
+    }
+
+Py_ssize_t mxtw_search(const mxtw_context *ctx,
+		       const void *text,
+		       int charsize,
+		       Py_ssize_t start,
+		       Py_ssize_t stop)
+{
+    const Py_UCS4 *x = ctx->pattern;
+    Py_ssize_t m = ctx->pattern_len, ell = ctx->ell;
+    Py_ssize_t j = start, memory = -1;
+
+    switch (charsize) {
+    case 1:
+	MXTW_SEARCH((const Py_UCS1 *)text);
+	break;
+    case 2:
+	MXTW_SEARCH((const Py_UCS2 *)text);
+	break;
+    default:
+	MXTW_SEARCH((const Py_UCS4 *)text);
+    }
+    return -1;
+}
+
+#undef MXTW_SEARCH
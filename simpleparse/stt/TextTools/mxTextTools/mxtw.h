@@ -0,0 +1,50 @@
+/*
+  mxtw.h -- Two-Way String Search
+
+  The Crochemore-Perrin Two-Way algorithm: linear time in the worst
+  case and constant space, whatever the text. The pattern is split at
+  a critical factorization; the right part is matched left to right,
+  then the left part right to left, shifting by the period of the
+  pattern (remembering the matched prefix) when it is periodic.
+
+  A Horspool-style shift on the last character of the window, taken
+  from a small bucketed table, skips most windows of ordinary text
+  without comparing the pattern.
+
+  Copyright (c) 2024 SimpleParse Project
+  License: MIT License
+*/
+
+#ifndef MXTW_H
+#define MXTW_H
+
+#include "Python.h"
+
+#define MXTW_SHIFT_SIZE 64		/* Buckets of the shift table */
+
+typedef struct {
+    Py_UCS4 *pattern;			/* Code points (or bytes) of the pattern */
+    Py_ssize_t pattern_len;
+    Py_ssize_t ell;			/* Critical position - 1 */
+    Py_ssize_t period;			/* Shift after a match */
+    int periodic;			/* Pattern is periodic, remember
+					   the matched prefix */
+    Py_ssize_t shift[MXTW_SHIFT_SIZE];	/* Shift for the last character
+					   of a window, by bucket */
+} mxtw_context;
+
+/* Initialize ctx for pattern, a non-empty str or bytes object;
+   returns 0 or -1 with an exception set */
+int mxtw_init(mxtw_context *ctx, PyObject *pattern);
+void mxtw_cleanup(mxtw_context *ctx);
+
+/* Return the index of the first occurrence of the pattern in
+   text[start:stop] or -1; text is an array of charsize (1, 2 or 4)
+   byte characters. Doesn't need the GIL. */
+Py_ssize_t mxtw_search(const mxtw_context *ctx,
+		       const void *text,
+		       int charsize,
+		       Py_ssize_t start,
+		       Py_ssize_t stop);
+
+#endif /* MXTW_H */
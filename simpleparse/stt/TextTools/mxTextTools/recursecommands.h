@@ -1,5 +1,26 @@
-/* recursive tag-table commands */
-	
+/* recursive tag-table commands
+
+  Shared by the standard engine (mxte_impl.h) and the GIL-free engine
+  (mxte_nogil.h, TE_NOGIL defined), which keep their results in
+  different places and provide these macros for it:
+
+	TE_SET_ERROR(type, format, ...) -- record the error to report
+		when the engine stops
+	TE_INCREF(newTable) / TE_DECREF(newTable) -- hold a reference to
+		the child table until POP_STACK releases it
+	TE_KEEPS_RESULTS -- true if the current table's results are kept
+		(the standard engine's taglist may be None)
+	TE_MEMO_REPLAY(memoEntry) -- add the results of the memoized
+		successful outcome memoEntry, setting childResults
+	TE_PUSH_TABLE(newTable) -- PUSH_STACK the child table with its
+		result list: a new one for Table/TableInList, ours for
+		SubTable/SubTableInList
+
+  The GIL-free engine can neither compile tables nor run tables which
+  call back into Python; it stops with ERROR_CODE and no error set
+  instead, and the standard engine re-runs the parse.
+*/
+
 case MATCH_TABLE:
 case MATCH_SUBTABLE:
 case MATCH_TABLEINLIST:
@@ -15,28 +36,27 @@ case MATCH_SUBTABLEINLIST:
 				case MATCH_SUBTABLE:
 					{
 						/* switch to either current tag table or a compiled sub-table */
-						if (PyInt_Check(match) && 
+						if (PyInt_Check(match) &&
 							PyInt_AS_LONG(match) == MATCH_THISTABLE) {
 								newTable = (PyObject *)table;
 						} else {
 							newTable = match;
 						}
 
-						/* XXX Fix to auto-compile that match argument 
+						/* XXX Fix to auto-compile that match argument
 
 						Should also test that it _is_ a compiled TagTable,
 						rather than that it _isn't_ a tuple?
 						*/
-						if (!mxTagTable_Check(newTable)) { 
+						if (!mxTagTable_Check(newTable)) {
 							childReturnCode = ERROR_CODE;
-							errorType = PyExc_TypeError;
-							errorMessage = PyString_FromFormat(
+							TE_SET_ERROR(PyExc_TypeError,
 								 "Match argument must be compiled TagTable: was a %.50s",
 								 Py_TYPE(newTable)->tp_name
 							);
 						} else {
 							/* we decref in POP */
-							Py_INCREF(newTable);
+							TE_INCREF(newTable);
 						}
 						break;
 					}
@@ -44,76 +64,98 @@ case MATCH_SUBTABLEINLIST:
 				case MATCH_SUBTABLEINLIST:
 					{
 						/* switch to explicitly specified table in a list (compiling if necessary) */
+						PyObject * tables = PyTuple_GET_ITEM(match, 0);
+						Py_ssize_t tableIndex = PyInt_AS_LONG(PyTuple_GET_ITEM(match, 1));
 
-
-						newTable = PyList_GetItem(
-							PyTuple_GET_ITEM(match, 0),
-							PyInt_AS_LONG(
-								PyTuple_GET_ITEM(match, 1)
-							)
-						);
+						if (tableIndex >= 0 && tableIndex < PyList_GET_SIZE(tables))
+							newTable = PyList_GET_ITEM(tables, tableIndex);
 						if (newTable == NULL) {
 							childReturnCode = ERROR_CODE;
-							errorType = PyExc_TypeError;
-							errorMessage = PyString_FromFormat(
+							TE_SET_ERROR(PyExc_TypeError,
 								"Tag table entry %d: Could not find target table in list of tables",
 								(unsigned int)index
 							);
 						} else {
 							if (mxTagTable_Check(newTable)) {
 								/* This is decref'd in POP */
-								Py_INCREF(newTable);
+								TE_INCREF(newTable);
 							} else {
+#ifdef TE_NOGIL
+								/* compiling needs the GIL */
+								childReturnCode = ERROR_CODE;
+#else
 								/* These tables are considered to be
 								   cacheable. */
-								newTable = mxTagTable_New(newTable,
-										   table->tabletype,
-										   1);
+								if (table->encodingname != NULL)
+									newTable = mxTagTable_NewEncoded(newTable,
+											   table->encodingname,
+											   1);
+								else
+									newTable = mxTagTable_New(newTable,
+											   table->tabletype,
+											   1);
 								/* why didn't we increment the refcount here? does New give us a new ref? */
 								if (newTable == NULL) {
 									childReturnCode = ERROR_CODE;
-									errorType = PyExc_TypeError;
-									errorMessage = PyString_FromFormat(
+									TE_SET_ERROR(PyExc_TypeError,
 										"Tag table entry %d: Could not compile target table",
 										(unsigned int)index
 									);
 								}
+#endif
 							}
 						}
 						break;
 					}
 
 			}
+#ifdef TE_NOGIL
+			if (childReturnCode == NULL_CODE &&
+				!((mxTagTableObject *)newTable)->callbackfree) {
+				/* calling back into Python needs the GIL */
+				childReturnCode = ERROR_CODE;
+			}
+#endif
 
-			if (childReturnCode == NULL_CODE) { 
-				/* we found a valid newTable */
-				PyObject *subtags = NULL;
+			if (childReturnCode == NULL_CODE &&
+				(flags & MATCH_MEMOIZE) &&
+				TE_KEEPS_RESULTS &&
+				mxTagMemo_Holds(command, match, newTable)) {
+				/* replay the remembered outcome of the child table */
+				mxTagMemoEntry *memoEntry = mxTagMemo_Lookup(&memo, newTable, position);
 
-				if (taglist != Py_None && command != MATCH_SUBTABLE && command != MATCH_SUBTABLEINLIST) {
-					/* Create a new list for use as subtaglist 
-					
-						Will be decref'd by the child-finished clause if necessary
-					*/
-					subtags = PyList_New(0);
-					if (subtags == NULL) {
-						childReturnCode = ERROR_CODE;
-						errorType = PyExc_MemoryError;
-					}
-				} else {
-					/* Use taglist as subtaglist 
+				if (memoEntry != NULL) {
+#ifndef TE_NOGIL
+					if (profile != NULL) {
+						/* counted as a call taking no time */
+						Py_ssize_t replayed = mxTagProfile_Enter(profile, profileNode, newTable, tagobj);
 
-					We don't incref it as we check explicitly for whether
-					it's the same when we go to decref (during childReturnCode 
-					handling)
-					*/
-					subtags = taglist;
+						mxTagProfile_Leave(profile, replayed,
+										   memoEntry->code == SUCCESS_CODE,
+										   memoEntry->end - position, 0);
+					}
+#endif
+					TE_DECREF(newTable);
+					childReturnCode = memoEntry->code;
+					if (childReturnCode == SUCCESS_CODE) {
+						childPosition = memoEntry->end;
+						TE_MEMO_REPLAY( memoEntry );
+					}
+					break;
 				}
-
-				/* match other table */
-				PUSH_STACK( newTable, subtags );
+			}
+			if (childReturnCode == NULL_CODE) {
+				/* we found a valid newTable, match other table */
+				TE_PUSH_TABLE( newTable );
 				RESET_TABLE_VARIABLES
+#ifndef TE_NOGIL
+				if (profile != NULL) {
+					profileNode = mxTagProfile_Enter(profile, profileNode, newTable, tagobj);
+					stackParent->profileStart = mxTagProfile_Now();
+				}
+#endif
 			}
-		} 
+		}
 		break;
 	}
-	    
+
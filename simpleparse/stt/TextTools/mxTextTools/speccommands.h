@@ -99,3 +99,51 @@
 			PyString_AsString(match));
 	    childReturnCode = SUCCESS_CODE;
 		break;
+
+	case MATCH_DISPATCH:
+		/* Jump to the entry for the class of the current character
+		   without moving; fails (taking jne) at the end of the
+		   text, on invalid UTF-8 and for characters found in no
+		   class or in more than one */
+		{
+			Py_ssize_t k, npairs = PyTuple_GET_SIZE(match);
+			Py_UCS4 ch = 0;
+			int found = 0, valid = 0;
+
+			DPRINTF("\nDispatch on character at position %i\n"
+				" string       = '%.40s'\n",
+				childPosition,text+childPosition);
+
+			if (childPosition < sliceright) {
+#if (TE_TABLETYPE == MXTAGTABLE_STRINGTYPE)
+				if (table->is_multibyte)
+					valid = te_utf8_decode(
+						(const unsigned char *)&text[childPosition],
+						sliceright - childPosition,
+						&ch) > 0;
+				else
+#endif
+				{
+					ch = (Py_UCS4)text[childPosition];
+					valid = 1;
+				}
+			}
+			for (k = 0; valid && k < npairs; k++) {
+				PyObject *pair = PyTuple_GET_ITEM(match, k);
+
+				if (mxCharSet_Lookup(
+					(mxCharSetObject *)PyTuple_GET_ITEM(pair, 0), ch)) {
+					if (found) {
+						found = 0;
+						break;
+					}
+					found = 1;
+					successJump = PyInt_AS_LONG(PyTuple_GET_ITEM(pair, 1));
+				}
+			}
+			if (found)
+				childReturnCode = SUCCESS_CODE;
+			else
+				childReturnCode = FAILURE_CODE;
+		}
+		break;
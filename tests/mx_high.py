@@ -62,7 +62,7 @@ class MXHighTests(unittest.TestCase):
     if mxVersion >= ('2','1'):
         def testsWordStart1( self ):
             """Test simple sWordStart command"""
-            for algo in [BOYERMOORE, TRIVIAL]:
+            for algo in [BOYERMOORE, TRIVIAL, TWOWAY]:
                 self.doBasicTest(
                     (
                         ( b"ab", sWordStart, TextSearch(b"ab", algorithm=algo), 0 ),
@@ -72,7 +72,7 @@ class MXHighTests(unittest.TestCase):
                 )
         def testsWordStart2( self ):
             """Test simple sWordStart command ignore fail"""
-            for algo in [BOYERMOORE, TRIVIAL]:
+            for algo in [BOYERMOORE, TRIVIAL, TWOWAY]:
                 self.doBasicTest(
                     (
                         ( b"ab", sWordStart, TextSearch(b"ab", algorithm=algo), 1,1),
@@ -83,7 +83,7 @@ class MXHighTests(unittest.TestCase):
             
         def testsWordEnd1( self ):
             """Test simple sWordEnd command"""
-            for algo in [BOYERMOORE, TRIVIAL]:
+            for algo in [BOYERMOORE, TRIVIAL, TWOWAY]:
                 self.doBasicTest(
                     (
                         ( b"ab", sWordEnd, TextSearch(b"ab", algorithm=algo), 0 ),
@@ -93,7 +93,7 @@ class MXHighTests(unittest.TestCase):
                 )
         def testsWordEnd2( self ):
             """Test simple sWordEnd command ignore fail"""
-            for algo in [BOYERMOORE, TRIVIAL]:
+            for algo in [BOYERMOORE, TRIVIAL, TWOWAY]:
                 self.doBasicTest(
                     (
                         ( b"ab", sWordEnd, TextSearch(b"ab", algorithm=algo), 1,1),
@@ -105,7 +105,7 @@ class MXHighTests(unittest.TestCase):
 
         def testsFindWord1( self ):
             """Test simple sWordFind command"""
-            for algo in [BOYERMOORE, TRIVIAL]:
+            for algo in [BOYERMOORE, TRIVIAL, TWOWAY]:
                 self.doBasicTest(
                     (
                         ( b"ab", sFindWord, TextSearch(b"ab", algorithm=algo), 0 ),
@@ -115,7 +115,7 @@ class MXHighTests(unittest.TestCase):
                 )
         def testsFindWord2( self ):
             """Test simple sFindWord command ignore fail"""
-            for algo in [BOYERMOORE, TRIVIAL]:
+            for algo in [BOYERMOORE, TRIVIAL, TWOWAY]:
                 self.doBasicTest(
                     (
                         ( b"ab", sFindWord, TextSearch(b"ab", algorithm=algo), 1,1),
@@ -0,0 +1,188 @@
+"""Tests for running parses in slices on an asyncio event loop"""
+import asyncio
+import unittest
+from concurrent import futures
+from simpleparse.stt.TextTools import (
+    tag, TagTable, set_release_gil, AllIn, Is, Call, MatchOk,
+)
+from simpleparse.parser import Parser
+from simpleparse.baseparser import BaseParser
+from simpleparse.dispatchprocessor import DispatchProcessor, getString
+
+digits = '0123456789'
+
+declaration = r'''
+file := line*
+line := key, '=', value, '\n'
+key := [a-z]+
+value := [0-9]+
+'''
+
+text = ''.join('k%s=%d\n' % ('abc'[:i % 3 + 1], i * 1000) for i in range(500))
+
+
+class LineProcessor(DispatchProcessor):
+    def key(self, tup, buffer):
+        return getString(tup, buffer)
+
+    def value(self, tup, buffer):
+        return int(getString(tup, buffer))
+
+
+class CountingExecutor(futures.ThreadPoolExecutor):
+    def __init__(self):
+        super().__init__(1)
+        self.submitted = 0
+
+    def submit(self, *args, **named):
+        self.submitted += 1
+        return super().submit(*args, **named)
+
+
+def sliced(text, table, steps):
+    """Tag text in slices, return the result and the number of slices"""
+    result = tag(text, table, slice_steps=steps)
+    count = 1
+    while result[0] is None:
+        result = tag(text, table, slice_steps=steps, resume=result[2])
+        count += 1
+    return result, count
+
+
+class SliceTests(unittest.TestCase):
+    def setUp(self):
+        self.table = TagTable((
+            ('n', AllIn, digits),
+            (None, Is, '+', MatchOk, -1),
+        ))
+
+    def test_slices(self):
+        text = '+'.join(str(i) for i in range(100))
+        expected = tag(text, self.table)
+        for steps in (1, 2, 7, 1000):
+            result, count = sliced(text, self.table, steps)
+            self.assertEqual(result, expected)
+            # two entries per number
+            self.assertEqual(count, (2 * 100 - 1) // steps + 1)
+
+    def test_parser(self):
+        parser = Parser(declaration, 'file')
+        table = parser.getTagger('file', None, TagTable)
+        self.assertEqual(sliced(text, table, 10)[0], parser.parse(text))
+
+    def test_errors(self):
+        self.assertRaises(ValueError, tag, '1', self.table, slice_steps=0)
+        self.assertRaises(ValueError, tag, '1', self.table, slice_steps=1, profile=[])
+        state = tag('1+2', self.table, slice_steps=1)[2]
+        other = TagTable((('n', AllIn, digits),))
+        self.assertRaises(ValueError, tag, '1+2', other, resume=state)
+        self.assertEqual(tag('1+2', self.table, resume=state)[-1], 3)
+
+    def test_releases_gil(self):
+        try:
+            self.assertTrue(self.table.releases_gil())
+            set_release_gil(0)
+            self.assertFalse(self.table.releases_gil())
+        finally:
+            set_release_gil(1)
+        table = TagTable(((None, Call, lambda text, start, stop: stop),))
+        self.assertFalse(table.releases_gil())
+
+
+class TupleParser(BaseParser):
+    """Parser without tagger caching, building tag-table tuples"""
+
+    def __init__(self):
+        self.parser = Parser(declaration, 'file')
+
+    def buildTagger(self, name, processor):
+        return self.parser.buildTagger(name, processor)
+
+
+class AParseTests(unittest.TestCase):
+    def setUp(self):
+        self.parser = Parser(declaration, 'file')
+
+    def tearDown(self):
+        set_release_gil(1)
+
+    def test_sliced(self):
+        """Tables holding the GIL are tagged in slices between other tasks"""
+        set_release_gil(0)
+        ticks = []
+
+        async def ticker(done):
+            while not done.is_set():
+                ticks.append(1)
+                await asyncio.sleep(0)
+
+        async def main():
+            done = asyncio.Event()
+            task = asyncio.ensure_future(ticker(done))
+            result = await self.parser.aparse(text, sliceSteps=50)
+            done.set()
+            await task
+            return result
+
+        self.assertEqual(asyncio.run(main()), self.parser.parse(text))
+        self.assertTrue(len(ticks) > 10, len(ticks))
+
+    def test_executor(self):
+        """Tables releasing the GIL are tagged in a worker thread"""
+        executor = CountingExecutor()
+        try:
+            result = asyncio.run(self.parser.aparse(text, executor=executor))
+        finally:
+            executor.shutdown()
+        self.assertEqual(result, self.parser.parse(text))
+        self.assertEqual(executor.submitted, 1)
+
+    def test_arguments(self):
+        processor = LineProcessor()
+        for release in (0, 1):
+            set_release_gil(release)
+            self.assertEqual(
+                asyncio.run(self.parser.aparse(text, 'line', processor, start=5)),
+                self.parser.parse(text, 'line', processor, start=5),
+            )
+            data = text.encode('utf-8')
+            self.assertEqual(
+                asyncio.run(self.parser.aparse(data, encoding='utf-8', sliceSteps=7)),
+                self.parser.parse(data, encoding='utf-8'),
+            )
+        self.assertRaises(
+            ValueError, asyncio.run, self.parser.aparse(text, sliceSteps=0)
+        )
+
+    def test_tuple_tagger(self):
+        """Parsers returning tag-table tuples work as with parse"""
+        parser = TupleParser()
+        self.assertEqual(type(parser.getTagger('file')), tuple)
+        for release in (0, 1):
+            set_release_gil(release)
+            self.assertEqual(
+                asyncio.run(parser.aparse(text, 'file', sliceSteps=50)),
+                parser.parse(text, 'file'),
+            )
+
+    def test_cancel(self):
+        set_release_gil(0)
+
+        async def main():
+            task = asyncio.ensure_future(self.parser.aparse(text, sliceSteps=1))
+            await asyncio.sleep(0)
+            task.cancel()
+            await task
+
+        self.assertRaises(asyncio.CancelledError, asyncio.run, main())
+
+
+def getSuite():
+    return unittest.TestSuite((
+        unittest.defaultTestLoader.loadTestsFromTestCase(SliceTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(AParseTests),
+    ))
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
@@ -0,0 +1,282 @@
+import threading
+import unittest
+from simpleparse.parser import Parser
+from simpleparse import objectgenerator, baseparser
+from simpleparse.processor import Processor
+from simpleparse.stt.TextTools import TextTools
+
+declaration = r'''
+root := word, (',', word)*
+word := [a-z]+
+'''
+
+
+class AppendMatchProcessor(Processor):
+    _m_word = TextTools.AppendMatch
+
+
+class TaggerCacheTests(unittest.TestCase):
+    def test_cached(self):
+        """Repeated getTagger calls return the same table"""
+        parser = Parser(declaration)
+        self.assertIs(parser.getTagger(), parser.getTagger())
+        self.assertIs(parser.getTagger('word'), parser.getTagger('word'))
+        self.assertIsNot(parser.getTagger('word'), parser.getTagger())
+
+    def test_parse_results(self):
+        parser = Parser(declaration)
+        first = parser.parse('this,that')
+        second = parser.parse('this,that')
+        self.assertEqual(first, second)
+        self.assertEqual(first, (1, [('word', 0, 4, None), ('word', 5, 9, None)], 9))
+
+    def test_processor_keys(self):
+        """Method sources with different _m_ attributes get different tables"""
+        parser = Parser(declaration)
+        plain = parser.getTagger(None, Processor())
+        self.assertIs(plain, parser.getTagger(None, Processor()))
+        custom = parser.getTagger(None, AppendMatchProcessor())
+        self.assertIsNot(plain, custom)
+        success, children, next = parser.parse('this,that', processor=AppendMatchProcessor())
+        self.assertEqual(children, ['this', 'that'])
+        success, children, next = parser.parse('this,that')
+        self.assertEqual(children, [('word', 0, 4, None), ('word', 5, 9, None)])
+
+    def test_instance_attributes(self):
+        """Instance-level _o_ attributes are part of the key"""
+        parser = Parser(declaration)
+        first = Processor()
+        first._m_word = TextTools.AppendTagobj
+        first._o_word = 'first'
+        second = Processor()
+        second._m_word = TextTools.AppendTagobj
+        second._o_word = 'second'
+        self.assertNotEqual(
+            baseparser.methodSourceKey(first), baseparser.methodSourceKey(second)
+        )
+        success, children, next = parser.parse('this', processor=first)
+        self.assertEqual(children, ['first'])
+        success, children, next = parser.parse('this', processor=second)
+        self.assertEqual(children, ['second'])
+
+    def test_instance_constants(self):
+        """New instances with equal constant attributes share a table"""
+        parser = Parser(declaration)
+        first = Processor()
+        first._m_word = TextTools.AppendTagobj
+        first._o_word = 'word'
+        second = Processor()
+        second._m_word = TextTools.AppendTagobj
+        second._o_word = 'word'
+        self.assertIs(parser.getTagger(None, first), parser.getTagger(None, second))
+
+    def test_callable_attributes(self):
+        """Per-instance callables and bound methods rebuild the table"""
+
+        class Collect:
+            def __init__(self):
+                self.seen = []
+
+            def __call__(self, taglist, text, left, right, subtags):
+                self.seen.append(text[left:right])
+
+        parser = Parser(declaration)
+        first = Processor()
+        first._m_word = first_callback = Collect()
+        second = Processor()
+        second._m_word = second_callback = Collect()
+        self.assertIsNot(parser.getTagger(None, first), parser.getTagger(None, second))
+        self.assertIs(parser.getTagger(None, first), parser.getTagger(None, first))
+        parser.parse('this,that', processor=first)
+        parser.parse('other', processor=second)
+        self.assertEqual(first_callback.seen, ['this', 'that'])
+        self.assertEqual(second_callback.seen, ['other'])
+
+        class MethodProcessor(Processor):
+            def _m_word(self, taglist, text, left, right, subtags):
+                pass
+
+        self.assertIsNot(
+            parser.getTagger(None, MethodProcessor()),
+            parser.getTagger(None, MethodProcessor()),
+        )
+
+    def test_unhashable_values(self):
+        parser = Parser(declaration)
+        processor = Processor()
+        processor._o_word = target = []
+        processor._m_word = TextTools.AppendToTagobj
+        parser.parse('this,that', processor=processor)
+        parser.parse('this,that', processor=processor)
+        self.assertEqual(len(target), 4)
+
+    def test_generator_invalidation(self):
+        """Adding a definition to the generator discards cached tables"""
+        parser = Parser(declaration)
+        tagger = parser.getTagger()
+        parser._generator.addDefinition('other', objectgenerator.Literal(value='x'))
+        self.assertIsNot(tagger, parser.getTagger())
+        self.assertEqual(parser.parse('x', 'other')[0], 1)
+
+    def test_cache_size(self):
+        parser = Parser(declaration)
+        parser.taggerCacheSize = 2
+        for production in ('root', 'word', 'root', 'word'):
+            parser.getTagger(production)
+        processors = []
+        for i in range(5):
+            processor = Processor()
+            processor._o_word = 'word%s' % (i,)
+            processors.append(processor)
+            parser.getTagger(None, processor)
+        self.assertEqual(len(parser._taggerCache[1]), 2)
+
+    def test_clear(self):
+        parser = Parser(declaration)
+        tagger = parser.getTagger()
+        parser.clearTaggerCache()
+        self.assertIsNot(tagger, parser.getTagger())
+
+    def test_base_no_cache(self):
+        """Parsers which don't supply a cache token rebuild every time"""
+        class Custom(baseparser.BaseParser):
+            builds = 0
+
+            def buildTagger(self, name, processor):
+                self.builds += 1
+                return ((None, TextTools.AllIn, 'ab'),)
+
+        parser = Custom()
+        parser.parse('abab')
+        parser.parse('abab')
+        self.assertEqual(parser.builds, 2)
+
+
+class CompiledTablesTests(unittest.TestCase):
+    recursive = r'''
+    list := '(', (atom / list / ws)*, ')'
+    atom := [a-z]+
+    <ws> := [ ]+
+    '''
+
+    def test_linked_lists(self):
+        """TableInList references are re-pointed at lists of compiled tables"""
+        from simpleparse.generator import compileTables
+        parser = Parser(self.recursive, 'list')
+        compiled = compileTables(parser.buildTagger(), TextTools.TagTable)
+        self.assertIsInstance(compiled, TextTools.TagTableType)
+        seen = []
+
+        def walk(table):
+            for entry in table.compiled():
+                command = entry[1] & 0xFF
+                if command in (TextTools.TableInList, TextTools.SubTableInList):
+                    tables, index = entry[2]
+                    self.assertIsInstance(tables[index], TextTools.TagTableType)
+                    seen.append(entry)
+                elif command in (TextTools.Table, TextTools.SubTable):
+                    walk(entry[2])
+
+        walk(compiled)
+        self.assertTrue(seen)
+
+    def test_results_match(self):
+        parser = Parser(self.recursive, 'list')
+        text = '(a (b c) ((d)) e)'
+        expected = TextTools.tag(text, parser.buildTagger())
+        self.assertEqual(parser.parse(text), expected)
+        self.assertEqual(parser.parse(text.encode('ascii')), TextTools.tag(text.encode('ascii'), parser.buildTagger()))
+
+    def test_table_types(self):
+        parser = Parser(self.recursive, 'list')
+        self.assertIn('Unicode', repr(parser.getTagger(None, None, TextTools.TagTable)))
+        self.assertIn('String', repr(parser.getTagger(None, None, TextTools.BytesTagTable)))
+        self.assertIs(
+            parser.getTagger(None, None, TextTools.TagTable),
+            parser.getTagger(None, None, TextTools.TagTable),
+        )
+
+    def test_library_elements(self):
+        """Lists belonging to library generators are compiled as well"""
+        from simpleparse.common import numbers
+        parser = Parser('values := number, (",", number)*', 'values')
+        self.assertEqual(parser.parse('1,2.5,0x3')[2], 9)
+        self.assertEqual(parser.parse(b'1,2.5,0x3')[2], 9)
+
+    def test_encoded(self):
+        """Encoded bytes are parsed with a cached EncodedTagTable"""
+        parser = Parser(self.recursive.replace('[a-z]', '[a-zé]'), 'list')
+        text = '(été (b c))'
+        data = text.encode('utf-8')
+        expected = TextTools.tag(data, parser.buildTagger(), encoding='utf-8')
+        self.assertEqual(parser.parse(data, encoding='utf-8'), expected)
+        self.assertEqual(parser.parse(data, encoding='UTF8'), expected)
+        self.assertIs(
+            baseparser.encodedFactory('UTF8'), baseparser.encodedFactory('utf-8')
+        )
+        tagger = parser.getTagger(None, None, baseparser.encodedFactory('utf-8'))
+        self.assertIn('String', repr(tagger))
+        self.assertEqual(TextTools.tag(data, tagger, encoding='utf_8'), expected)
+        self.assertRaises(ValueError, TextTools.tag, data, tagger, encoding='latin-1')
+        self.assertRaises(LookupError, baseparser.encodedFactory, 'no-such-codec')
+
+
+class ParseManyTests(unittest.TestCase):
+    items = ['this,that', 'x', 'a,b,c', 'bad!', b'bytes,too', ''] * 20
+
+    def setUp(self):
+        self.parser = Parser(declaration)
+        self.expected = [self.parser.parse(item) for item in self.items]
+
+    def test_threads(self):
+        results = self.parser.parse_many(self.items, workers=3, chunksize=7)
+        self.assertEqual(list(results), self.expected)
+
+    def test_processes(self):
+        results = self.parser.parse_many(
+            iter(self.items), workers=2, executor='process', chunksize=16
+        )
+        self.assertEqual(list(results), self.expected)
+
+    def test_unordered(self):
+        for executor in ('thread', 'process'):
+            results = dict(self.parser.parse_many(
+                self.items, workers=2, executor=executor, ordered=False,
+            ))
+            self.assertEqual(
+                [results[i] for i in range(len(self.items))], self.expected
+            )
+
+    def test_processor(self):
+        parser = Parser(declaration)
+        processor = AppendMatchProcessor()
+        expected = [parser.parse(item, processor=processor) for item in self.items[:3]]
+        self.assertEqual(
+            list(parser.parse_many(self.items[:3], processor=processor, workers=2)),
+            expected,
+        )
+
+    def test_encoding(self):
+        parser = Parser(declaration.replace('[a-z]', '[a-zé]'))
+        items = ['été,a'.encode('utf-8'), b'b']
+        self.assertEqual(
+            list(parser.parse_many(items, encoding='utf-8', chunksize=1)),
+            [parser.parse(item, encoding='utf-8') for item in items],
+        )
+
+    def test_arguments(self):
+        self.assertRaises(ValueError, self.parser.parse_many, [], executor='fiber')
+        self.assertRaises(ValueError, self.parser.parse_many, [], chunksize=0)
+        self.assertEqual(list(self.parser.parse_many([])), [])
+
+    def test_unstarted(self):
+        """Results which are never iterated start no workers"""
+        before = threading.active_count()
+        results = self.parser.parse_many(self.items, workers=3)
+        self.assertEqual(threading.active_count(), before)
+        del results
+
+    def test_abandoned(self):
+        results = self.parser.parse_many(self.items, workers=2, chunksize=1)
+        self.assertEqual(next(results), self.expected[0])
+        results.close()
@@ -0,0 +1,169 @@
+"""Tests for tagging and parsing buffers other than bytes in place"""
+import array
+import mmap
+import os
+import tempfile
+import unittest
+from simpleparse.stt.TextTools import (
+    tag, set_release_gil, TextSearch, MultiTextSearch, CharSet,
+    AllIn, Word, Call, AppendMatch,
+)
+from simpleparse.parser import Parser
+from simpleparse.dispatchprocessor import DispatchProcessor, getString
+
+table = (
+    ('letters', AllIn, b'ab'),
+    ('word', Word + AppendMatch, b'cd'),
+)
+
+declaration = r'''
+file := line*
+line := key, '=', value, '\n'
+key := [a-z]+
+value := [0-9]+
+'''
+
+text = ''.join('k%s=%d\n' % ('abc'[:i % 3 + 1], i * 1000) for i in range(200))
+
+
+def buffers(data):
+    """data as the buffers to be tagged like bytes"""
+    return [
+        bytearray(data),
+        memoryview(data),
+        memoryview(b'--' + data)[2:],
+        memoryview(bytearray(data)).cast('c'),
+    ]
+
+
+class LineProcessor(DispatchProcessor):
+    def key(self, tup, buffer):
+        return getString(tup, buffer)
+
+    def value(self, tup, buffer):
+        return int(getString(tup, buffer))
+
+
+class TagTests(unittest.TestCase):
+    def tearDown(self):
+        set_release_gil(1)
+
+    def test_tag(self):
+        for release in (0, 1):
+            set_release_gil(release)
+            expected = tag(b'abacd', table)
+            for data in buffers(b'abacd'):
+                self.assertEqual(tag(data, table), expected, data)
+                self.assertEqual(tag(data, table, 1, 4), tag(b'abacd', table, 1, 4))
+
+    def test_callbacks(self):
+        """Callbacks are passed a memoryview of the buffer"""
+        seen = []
+
+        def callback(text, start, stop):
+            seen.append(text)
+            return stop
+
+        tag(bytearray(b'abc'), ((None, Call, callback),))
+        self.assertEqual(type(seen[0]), memoryview)
+        self.assertEqual(bytes(seen[0]), b'abc')
+
+    def test_rejected(self):
+        self.assertRaises(TypeError, tag, array.array('i', [1, 2]), table)
+        self.assertRaises(TypeError, tag, memoryview(b'abcdef')[::2], table)
+        view = memoryview(b'ab')
+        view.release()
+        self.assertRaises(ValueError, tag, view, table)
+
+    def test_released(self):
+        """The buffer is held during the call only"""
+        data = bytearray(b'ab')
+        tag(data, table)
+        data.extend(b'cd')
+        self.assertEqual(tag(data, table)[1], [('letters', 0, 2, None), b'cd'])
+
+    def test_encoding(self):
+        data = 'ab\xe9'.encode('utf-8')
+        self.assertEqual(
+            tag(bytearray(data), ((None, AllIn, 'ab\xe9'),), encoding='utf-8'),
+            (1, [], len(data)),
+        )
+
+    def test_mmap(self):
+        with tempfile.TemporaryFile() as file:
+            file.write(b'ab' * 1000 + b'cd')
+            file.flush()
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                self.assertEqual(
+                    tag(data, table),
+                    (1, [('letters', 0, 2000, None), b'cd'], 2002),
+                )
+
+
+class SearchTests(unittest.TestCase):
+    def test_text_search(self):
+        search = TextSearch(b'cd')
+        for data in buffers(b'xcdxcd'):
+            self.assertEqual(search.search(data), (1, 3))
+            self.assertEqual(search.find(data, 2), 4)
+            self.assertEqual(search.findall(data), [(1, 3), (4, 6)])
+
+    def test_multi_text_search(self):
+        search = MultiTextSearch([b'cd', b'x'])
+        for data in buffers(b'xcdxcd'):
+            self.assertEqual(search.search(data, 1), (1, 3))
+            self.assertEqual(search.find(data, 1), 1)
+            self.assertEqual(search.findall(data), [(0, 1), (1, 3), (3, 4), (4, 6)])
+
+    def test_charset(self):
+        charset = CharSet('ab')
+        for data in buffers(b'xabyab'):
+            self.assertEqual(charset.search(data), 1)
+            self.assertEqual(charset.match(data, 1, 1), 2)
+            self.assertEqual(charset.split(data), [b'x', b'y'])
+            self.assertEqual(charset.splitx(data), [b'x', b'ab', b'y', b'ab'])
+            self.assertEqual(charset.strip(data, 0, 1), b'y')
+
+    def test_rejected(self):
+        self.assertRaises(TypeError, TextSearch(b'cd').search, array.array('i', [1]))
+        self.assertRaises(TypeError, CharSet('ab').split, memoryview(b'abab')[::2])
+
+
+class ParserTests(unittest.TestCase):
+    def setUp(self):
+        self.parser = Parser(declaration, 'file')
+        self.data = text.encode('ascii')
+        self.expected = self.parser.parse(self.data)
+
+    def test_parse(self):
+        self.assertEqual(self.expected[-1], len(self.data))
+        for data in buffers(self.data):
+            self.assertEqual(self.parser.parse(data), self.expected)
+            self.assertEqual(self.parser.parse(data, encoding='utf-8'), self.expected)
+
+    def test_parse_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'data.txt')
+            with open(path, 'wb') as file:
+                file.write(self.data)
+            self.assertEqual(self.parser.parse_file(path), self.expected)
+            self.assertEqual(
+                self.parser.parse_file(path, 'line', LineProcessor()),
+                self.parser.parse(self.data, 'line', LineProcessor()),
+            )
+            with open(path, 'wb') as file:
+                pass
+            self.assertEqual(self.parser.parse_file(path), (1, [], 0))
+            self.assertEqual(self.parser.parse_file(path, 'line')[0], 0)
+
+
+def getSuite():
+    return unittest.TestSuite((
+        unittest.defaultTestLoader.loadTestsFromTestCase(TagTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(SearchTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(ParserTests),
+    ))
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
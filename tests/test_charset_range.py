@@ -0,0 +1,196 @@
+"""Tests for character ranges compiled to CharSet commands"""
+import unittest
+from simpleparse.parser import Parser
+from simpleparse.objectgenerator import Range, charSetDefinition, mergeRanges
+from simpleparse.stt.TextTools import (
+    tag, TagTable, BytesTagTable, EncodedTagTable, CharSet, CharSetType,
+    AllIn, IsIn, AllNotIn, IsNotIn,
+)
+from simpleparse.stt.TextTools.TextTools import AllInCharSet, IsInCharSet
+
+declaration = r'''
+file := (ws, (identifier / number / other))*, ws
+identifier := [a-zA-Z_], [a-zA-Z0-9_]*
+number := [0-9]+
+other := -[a-zA-Z0-9_ \t\n]+
+<ws> := [ \t\n]*
+'''
+
+
+def ranges(value):
+    return mergeRanges([(ord(char), ord(char)) for char in value])
+
+
+class CharSetDefinitionTests(unittest.TestCase):
+    def assertMembers(self, value, negative=0):
+        definition = charSetDefinition(ranges(value), negative)
+        if isinstance(definition, bytes):
+            charSets = (CharSet(definition), CharSet(definition.decode('latin-1')))
+        else:
+            charSets = (CharSet(definition),)
+        for charSet in charSets:
+            for ordinal in list(range(300)) + [0x10000, 0x1F600]:
+                char = chr(ordinal)
+                self.assertEqual(
+                    char in charSet, (char in value) != bool(negative),
+                    (value, negative, definition, char),
+                )
+
+    def test_merge(self):
+        self.assertEqual(
+            mergeRanges([(120, 122), (97, 99), (100, 100), (98, 98), (0, 0)]),
+            ((0, 0), (97, 100), (120, 122)),
+        )
+        self.assertEqual(mergeRanges([]), ())
+
+    def test_ranges(self):
+        self.assertEqual(charSetDefinition(ranges('cbaxz_0123456789')), b'0-9_a-cxz')
+        self.assertEqual(charSetDefinition(ranges('abc'), 1), b'^a-c')
+        self.assertEqual(
+            charSetDefinition(((0x61, 0x7A), (0x4E00, 0x9FFF), (0x1F389, 0x1F395))),
+            'a-z\u4e00-\u9fff\U0001f389-\U0001f395',
+        )
+
+    def test_special(self):
+        for value in ('-', '^', '\\', '^_', '-.', '\\]^', '[\\]', ',-.', 'a^-\\'):
+            self.assertMembers(value)
+            self.assertMembers(value, 1)
+
+    def test_all(self):
+        self.assertMembers(''.join([chr(i) for i in range(256)]))
+        self.assertMembers(''.join([chr(i) for i in range(128)]), 1)
+
+    def test_astral(self):
+        for value in ('a\U0001F600', '\U0001F600\U0001F601\U00010000-', '\\\U0001F600'):
+            self.assertMembers(value)
+            self.assertMembers(value, 1)
+
+
+class RangeTests(unittest.TestCase):
+    def commands(self, **named):
+        return [entry[1] for entry in Range(**named).toParser()]
+
+    def test_ascii(self):
+        self.assertEqual(self.commands(value='abc'), [IsInCharSet])
+        self.assertEqual(self.commands(value='abc', repeating=1), [AllInCharSet])
+        self.assertEqual(self.commands(value='abc', negative=1), [IsInCharSet])
+        table = Range(value='abc', optional=1).toParser()
+        self.assertEqual(table[0][3:], (1,))
+        self.assertIsInstance(table[0][2], CharSetType)
+
+    def test_shared(self):
+        """Equal ranges use the same CharSet object"""
+        first = Range(value='abc').toParser()[0][2]
+        second = Range(value='cba', repeating=1).toParser()[0][2]
+        self.assertIs(first, second)
+
+    def test_non_ascii(self):
+        self.assertEqual(self.commands(value='aé'), [IsInCharSet])
+        self.assertEqual(self.commands(value='aé', repeating=1), [AllInCharSet])
+        self.assertEqual(self.commands(value='aé', negative=1), [IsInCharSet])
+
+    def test_bytes_value(self):
+        self.assertEqual(self.commands(value=b'ab'), [IsIn])
+        self.assertEqual(self.commands(value=b'ab', repeating=1), [AllIn])
+        self.assertEqual(self.commands(value=b'ab', negative=1), [IsNotIn])
+        self.assertEqual(
+            self.commands(value=b'ab', negative=1, repeating=1), [AllNotIn]
+        )
+
+    def test_grammar_intervals(self):
+        """The grammar doesn't expand the ranges"""
+        parser = Parser(r'''
+        cjk := [\u4e00-\u9fff]+
+        emoji := [\U0001F300-\U0001FAFF]+
+        mixed := [-z-a0-9_\u00e9]
+        ''', 'cjk')
+        generator = parser._generator
+        self.assertEqual(
+            generator.getRootObject('cjk').ranges, ((0x4E00, 0x9FFF),)
+        )
+        self.assertEqual(
+            generator.getRootObject('emoji').ranges, ((0x1F300, 0x1FAFF),)
+        )
+        self.assertEqual(
+            generator.getRootObject('mixed').ranges,
+            ((0x2D, 0x2D), (0x30, 0x39), (0x5F, 0x5F), (0x61, 0x7A), (0xE9, 0xE9)),
+        )
+        self.assertEqual(parser.parse('中文字x'), (1, [], 3))
+        self.assertEqual(parser.parse('中文字x'.encode('utf-8'), encoding='utf-8'), (1, [], 9))
+        self.assertEqual(parser.parse('🎉🫠x', 'emoji'), (1, [], 2))
+        self.assertEqual(parser.parse('🎉🫠x'.encode('utf-8'), 'emoji', encoding='utf-8'), (1, [], 8))
+        self.assertEqual(parser.parse('é', 'mixed'), (1, [], 1))
+
+    def test_bytes_tables(self):
+        """Bytes tables match the bytes of the encoded members"""
+        table = tuple(Range(value='aé€', repeating=1).toParser())
+        # UTF-8 by default
+        self.assertEqual(tag('aé€x'.encode('utf-8'), BytesTagTable(table)), (1, [], 6))
+        self.assertEqual(tag(b'\xa9\xc3a', BytesTagTable(table)), (1, [], 3))
+        self.assertEqual(
+            tag('aé€x'.encode('cp1252'), EncodedTagTable(table, 'cp1252')), (1, [], 3)
+        )
+        self.assertRaises(
+            UnicodeEncodeError, EncodedTagTable, table, 'latin-1'
+        )
+        table = tuple(Range(value='aé', repeating=1, negative=1).toParser())
+        self.assertEqual(
+            tag('xyé'.encode('latin-1'), EncodedTagTable(table, 'latin-1')), (1, [], 2)
+        )
+        self.assertEqual(tag('xyé'.encode('utf-8'), BytesTagTable(table)), (1, [], 2))
+
+    def test_negative_eof(self):
+        """A negative range doesn't match at the end of the text"""
+        table = tuple(Range(value='abc', negative=1).toParser())
+        self.assertEqual(tag('d', table), (1, [], 1))
+        self.assertEqual(tag('d', table, 1)[0], 0)
+
+    def test_table_types(self):
+        """Str, bytes and encoded tables produce the same results"""
+        parser = Parser(declaration, 'file')
+        text = 'abc_1 42 x+y été 😀 é2\n'
+        expected = parser.parse(text)
+        self.assertEqual(
+            [(item[0], text[item[1]:item[2]]) for item in expected[1]],
+            [
+                ('identifier', 'abc_1'), ('number', '42'), ('identifier', 'x'),
+                ('other', '+'), ('identifier', 'y'), ('other', 'é'),
+                ('identifier', 't'), ('other', 'é'), ('other', '😀'),
+                ('other', 'é'), ('number', '2'),
+            ],
+        )
+        data = text.encode('utf-8')
+        result = parser.parse(data, encoding='utf-8')
+        self.assertEqual(
+            [(item[0], data[item[1]:item[2]].decode('utf-8')) for item in result[1]],
+            [(item[0], text[item[1]:item[2]]) for item in expected[1]],
+        )
+        ascii = 'abc_1 42 x+y\n'
+        self.assertEqual(
+            parser.parse(ascii.encode('ascii')), parser.parse(ascii)
+        )
+
+    def test_table_factories(self):
+        value = 'abcdefghijklmnopqrstuvwxyz_-'
+        table = tuple(Range(value=value, repeating=1).toParser())
+        self.assertEqual(tag('ab-_c!', TagTable(table)), (1, [], 5))
+        self.assertEqual(tag(b'ab-_c!', BytesTagTable(table)), (1, [], 5))
+        self.assertEqual(
+            tag('a-é'.encode('utf-8'), EncodedTagTable(table, 'utf-8')), (1, [], 2)
+        )
+        table = tuple(Range(value=value, repeating=1, negative=1).toParser())
+        self.assertEqual(
+            tag('é😀a'.encode('utf-8'), EncodedTagTable(table, 'utf-8')), (1, [], 6)
+        )
+        self.assertEqual(tag('é😀a', TagTable(table)), (1, [], 2))
+
+
+def getSuite():
+    return unittest.TestSuite((
+        unittest.defaultTestLoader.loadTestsFromTestCase(CharSetDefinitionTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(RangeTests),
+    ))
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
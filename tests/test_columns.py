@@ -0,0 +1,113 @@
+"""Tests for columnar export of results (to_arrays and to_numpy)"""
+import unittest
+from array import array
+from simpleparse.stt.TextTools import (
+    tag, to_arrays, to_numpy,
+    AllIn, Table, AppendMatch, AppendTagobj,
+)
+from simpleparse.parser import Parser
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+declaration = r'''
+file := line*
+line := key, '=', value, '\n'
+key := [a-z]+
+value := [0-9]+
+'''
+
+text = ''.join('k%s=%d\n' % ('abc'[:i % 3 + 1], i) for i in range(50))
+
+table = (
+    ('x', AllIn, 'ab'),
+    ('m', AppendMatch + AllIn, 'c'),
+    ('o', AppendTagobj + AllIn, 'd'),
+    ('t', Table, (('y', AllIn, 'e'), ('z', Table, (('w', AllIn, 'f'),)))),
+    ('x', AllIn, 'g'),
+)
+
+
+def flatten(taglist, depth=0):
+    """Rows (tag, start, stop, depth) of taglist in document order"""
+    rows = []
+    for entry in taglist:
+        if isinstance(entry, tuple) and len(entry) == 4:
+            rows.append((entry[0], entry[1], entry[2], depth))
+            if entry[3]:
+                rows.extend(flatten(entry[3], depth + 1))
+        else:
+            rows.append((entry, -1, -1, depth))
+    return rows
+
+
+class ColumnTests(unittest.TestCase):
+    def check(self, taglist, expected):
+        ids, starts, stops, depths, tags = to_arrays(taglist)
+        for column in (ids, starts, stops, depths):
+            self.assertEqual(type(column), array)
+            self.assertEqual(column.typecode, 'q')
+            self.assertEqual(len(column), len(expected))
+        rows = [
+            (tags[i], start, stop, depth)
+            for i, start, stop, depth in zip(ids, starts, stops, depths)
+        ]
+        self.assertEqual(rows, expected)
+        return tags
+
+    def test_taglist(self):
+        taglist = tag('abcdeefg', table)[1]
+        tags = self.check(taglist, flatten(taglist))
+        self.assertEqual(tags, ('x', 'c', 'o', 't', 'y', 'z', 'w'))
+
+    def test_compact(self):
+        taglist = tag('abcdeefg', table)[1]
+        tree = tag('abcdeefg', table, compact=1)[1]
+        self.assertEqual(to_arrays(tree), to_arrays(taglist))
+        self.assertEqual(to_arrays(tree[3][3]), to_arrays(taglist[3][3]))
+
+    def test_parser(self):
+        parser = Parser(declaration, 'file')
+        taglist = parser.parse(text)[1]
+        tags = self.check(taglist, flatten(taglist))
+        self.assertEqual(tags, ('line', 'key', 'value'))
+        tree = parser.parse(text, compact=True)[1]
+        self.assertEqual(to_arrays(tree), to_arrays(taglist))
+        self.assertEqual(sorted(tree.tags), ['key', 'line', 'value'])
+
+    def test_objects(self):
+        """Equal tags share an id, unhashable tags are kept by identity"""
+        key = ['unhashable']
+        taglist = [('a', 0, 1, None), (key, 1, 2, []), (key, 2, 3, None), 'a']
+        tags = self.check(taglist, flatten(taglist))
+        self.assertEqual(len(tags), 2)
+        self.assertIs(tags[1], key)
+        self.assertEqual(to_arrays([(1, 0, 1, None), (1.0, 1, 2, None)])[4], (1, 1.0))
+
+    def test_empty(self):
+        self.assertEqual(to_arrays([]), (array('q'),) * 4 + ((),))
+        self.assertEqual(to_arrays(tag('zz', table, compact=1)[1])[4], ())
+
+    def test_errors(self):
+        self.assertRaises(TypeError, to_arrays, ())
+        self.assertRaises(TypeError, to_arrays, None)
+
+    @unittest.skipUnless(numpy, 'needs numpy')
+    def test_numpy(self):
+        taglist = tag('abcdeefg', table)[1]
+        result = to_numpy(taglist)
+        expected = to_arrays(taglist)
+        for column, values in zip(result[:4], expected[:4]):
+            self.assertEqual(column.dtype, numpy.int64)
+            self.assertEqual(column.tolist(), values.tolist())
+        self.assertEqual(result[4], expected[4])
+
+
+def getSuite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(ColumnTests)
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
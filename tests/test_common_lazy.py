@@ -0,0 +1,117 @@
+"""Tests for lazily built shared (library) definitions"""
+import unittest
+from simpleparse import common
+from simpleparse.parser import Parser
+from simpleparse.objectgenerator import (
+    ElementToken, LibraryElement, Literal, SequentialGroup,
+)
+from simpleparse.common import numbers, timezone_names
+
+library = r'''
+pair := word, ',', word
+word := [a-z]+
+'''
+
+
+class LazyDefinitionTests(unittest.TestCase):
+    def setUp(self):
+        self.library = common.LazyLibrary(library)
+        self.source = {
+            'pair': self.library.element('pair'),
+            'word': self.library.element('word'),
+            'hello': common.LazyDefinition(self.literal, 'hello'),
+        }
+        self.built = []
+
+    def literal(self, value):
+        self.built.append(value)
+        return Literal(value=value)
+
+    def test_unused(self):
+        """Definitions are only built when referenced"""
+        parser = Parser("x := hello", 'x', definitionSources=[self.source])
+        self.assertEqual(parser.parse('hello'), (1, [('hello', 0, 5, None)], 5))
+        self.assertEqual(self.built, ['hello'])
+        self.assertIsNone(self.library.generator)
+        self.assertIsInstance(self.source['pair'], common.LazyDefinition)
+
+    def test_library(self):
+        parser = Parser("x := pair", 'x', definitionSources=[self.source])
+        self.assertEqual(
+            parser.parse('ab,c'),
+            (1, [('pair', 0, 4, [('word', 0, 2, None), ('word', 3, 4, None)])], 4),
+        )
+        element = self.source['pair']
+        self.assertIsInstance(element, LibraryElement)
+        self.assertIs(element.generator, self.library.generator)
+        Parser("y := word", 'y', definitionSources=[self.source]).parse('a')
+        self.assertIs(self.source['word'].generator, self.library.generator)
+
+    def test_resolve(self):
+        definition = self.source['hello']
+        element = common.resolve(self.source, 'hello')
+        self.assertIs(self.source['hello'], element)
+        self.assertIs(definition.resolve(), element)
+        self.assertIs(common.resolve(self.source, 'hello'), element)
+        self.assertEqual(self.built, ['hello'])
+        self.assertRaises(KeyError, common.resolve, self.source, 'missing')
+
+    def test_module_rules(self):
+        """Lazily built rules are still available as module attributes"""
+        rule = timezone_names.timezone_rule
+        self.assertIs(rule, timezone_names.timezone_rule)
+        self.assertIs(common.resolve(timezone_names.c, 'timezone_name'), rule)
+        self.assertRaises(AttributeError, getattr, timezone_names, 'missing_rule')
+
+
+class LazyDictTests(unittest.TestCase):
+    def setUp(self):
+        self.built = []
+        self.source = common.LazyDict(
+            hello=common.LazyDefinition(self.literal, 'hello'),
+            world=common.LazyDefinition(self.literal, 'world'),
+        )
+
+    def literal(self, value):
+        self.built.append(value)
+        return Literal(value=value)
+
+    def test_lookup(self):
+        """Looking names up gives element tokens, other access builds nothing"""
+        self.assertTrue('hello' in self.source)
+        self.assertEqual(sorted(self.source), ['hello', 'world'])
+        self.assertEqual(len(self.source), 2)
+        self.assertEqual(self.built, [])
+        element = self.source['hello']
+        self.assertIsInstance(element, Literal)
+        self.assertIs(self.source.get('hello'), element)
+        self.assertIs(common.resolve(self.source, 'hello'), element)
+        self.assertIsNone(self.source.get('missing'))
+        self.assertEqual(self.built, ['hello'])
+        self.assertTrue(all(isinstance(value, Literal) for value in self.source.values()))
+        self.assertEqual(self.built, ['hello', 'world'])
+
+    def test_library_entries(self):
+        """Library entries still work as element tokens in other grammars"""
+        self.assertIsInstance(numbers.c['int'], ElementToken)
+        self.assertIsInstance(numbers.c.get('float'), ElementToken)
+        pair = SequentialGroup(
+            children=[numbers.c['int'], Literal(value=','), numbers.c['int']],
+        )
+        parser = Parser("x := pair", 'x', definitionSources=[{'pair': pair}])
+        self.assertEqual(parser.parse('12,3')[-1], 4)
+        parser = Parser("x := number", 'x', definitionSources=[{'number': numbers.c['int']}])
+        self.assertEqual(parser.parse('12')[-1], 2)
+        # copies hold the lazy definitions, which are resolved as well
+        parser = Parser("x := float", 'x', definitionSources=[dict(numbers.c)])
+        self.assertEqual(parser.parse('1.5')[-1], 3)
+
+def getSuite():
+    return unittest.TestSuite((
+        unittest.defaultTestLoader.loadTestsFromTestCase(LazyDefinitionTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(LazyDictTests),
+    ))
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
@@ -0,0 +1,203 @@
+"""Tests for compact results (tag(...,compact=1) and TagTree)"""
+import sys
+import unittest
+from simpleparse.stt.TextTools import (
+    tag, TagTable, BytesTagTable, TagTreeType, set_release_gil,
+    AllIn, Table, Call, AppendMatch, AppendTagobj,
+)
+from simpleparse.parser import Parser
+from simpleparse.dispatchprocessor import DispatchProcessor, getString
+
+declaration = r'''
+file := line*
+line := key, '=', value, '\n'
+key := [a-z]+
+value := [0-9]+
+'''
+
+text = ''.join('k%s=%d\n' % ('abc'[:i % 3 + 1], i * 1000) for i in range(300))
+
+table = (
+    ('x', AllIn, 'ab'),
+    ('m', AppendMatch + AllIn, 'c'),
+    ('o', AppendTagobj + AllIn, 'd'),
+    ('t', Table, (('y', AllIn, 'e'), ('z', Table, (('w', AllIn, 'f'),)))),
+    ('t', Table, ((None, AllIn, 'g'),)),
+)
+
+
+class LineProcessor(DispatchProcessor):
+    def line(self, tup, buffer):
+        return dispatchChildren(self, tup, buffer)
+
+    def key(self, tup, buffer):
+        return getString(tup, buffer)
+
+    def value(self, tup, buffer):
+        return int(getString(tup, buffer))
+
+
+def dispatchChildren(processor, tup, buffer):
+    return [getattr(processor, child[0])(child, buffer) for child in tup[3]]
+
+
+class TagTests(unittest.TestCase):
+    def tearDown(self):
+        set_release_gil(1)
+
+    def test_engines(self):
+        for release in (0, 1):
+            set_release_gil(release)
+            for data in ('abcdeefg', b'abcdeefg', bytearray(b'abcdeefg')):
+                expected = tag(data, table)
+                result = tag(data, table, compact=1)
+                self.assertEqual(type(result[1]), TagTreeType)
+                self.assertEqual(result[0], expected[0])
+                self.assertEqual(result[2], expected[2])
+                self.assertEqual(result[1].tolist(), expected[1])
+                self.assertEqual(type(result[1].tolist()[1]), type(expected[1][1]))
+
+    def test_callbacks(self):
+        """Tables with callbacks are converted from the usual taglist"""
+        calls = []
+
+        def callback(text, left, right):
+            calls.append(left)
+            return left + 1
+
+        definition = (('c', Call, callback),) + table
+        result = tag('abcdeefg', definition, compact=1)
+        self.assertEqual(result, tag('abcdeefg', definition))
+        self.assertEqual(result[1][:2], [('c', 0, 1, None), ('x', 1, 2, None)])
+        self.assertEqual(calls, [0, 0])
+
+    def test_parser_table(self):
+        parser = Parser(declaration, 'file')
+        for release in (0, 1):
+            set_release_gil(release)
+            tagger = parser.getTagger('file', None, TagTable)
+            expected = tag(text, tagger)
+            result = tag(text, tagger, compact=1)
+            self.assertEqual(result[1], expected[1])
+            self.assertEqual(result[1].nodes, 3 * 300)
+            self.assertEqual(sorted(result[1].tags), ['key', 'line', 'value'])
+            data = text.encode('utf-8')
+            tagger = parser.getTagger('file', None, BytesTagTable)
+            self.assertEqual(tag(data, tagger, compact=1), tag(data, tagger))
+
+    def test_failure(self):
+        success, tree, next = tag('zz', table, compact=1)
+        self.assertEqual((success, len(tree), tree.nodes, next), (0, 0, 0, 0))
+        self.assertEqual(tree, [])
+        self.assertFalse(tree)
+
+    def test_errors(self):
+        self.assertRaises(ValueError, tag, 'ab', table, compact=1, partial=1)
+        self.assertRaises(ValueError, tag, 'ab', table, compact=1, slice_steps=1)
+        self.assertRaises(ValueError, tag, 'ab', table, taglist=[], compact=1)
+        state = tag('ab', table, partial=1)[2]
+        self.assertRaises(ValueError, tag, 'ab', table, compact=1, resume=state)
+
+    def test_profile(self):
+        profile = []
+        result = tag('abcdeefg', table, compact=1, profile=profile)
+        self.assertEqual(result, tag('abcdeefg', table))
+        self.assertEqual(len(profile), 1)
+
+
+class TagTreeTests(unittest.TestCase):
+    def setUp(self):
+        self.expected = tag('abcdeefg', table)[1]
+        self.tree = tag('abcdeefg', table, compact=1)[1]
+
+    def test_sequence(self):
+        tree, expected = self.tree, self.expected
+        self.assertEqual(len(tree), len(expected))
+        self.assertEqual(list(tree), expected)
+        for i in range(-len(expected), len(expected)):
+            self.assertEqual(tree[i], expected[i])
+        self.assertEqual(tree[1:4], expected[1:4])
+        self.assertEqual(tree[::-2], expected[::-2])
+        self.assertRaises(IndexError, lambda: tree[len(expected)])
+        self.assertRaises(IndexError, lambda: tree[-len(expected) - 1])
+        self.assertRaises(TypeError, lambda: tree['x'])
+        self.assertIn(('x', 0, 2, None), tree)
+
+    def test_entries(self):
+        tree = self.tree
+        self.assertEqual(type(tree[0]), tuple)
+        self.assertEqual(tree[1], 'c')
+        self.assertEqual(tree[2], 'o')
+        tag, left, right, children = tree[3]
+        self.assertEqual((tag, left, right), ('t', 4, 7))
+        self.assertEqual(type(children), TagTreeType)
+        self.assertEqual(len(children), 2)
+        self.assertEqual(children.nodes, 3)
+        self.assertEqual(children[1][3], [('w', 6, 7, None)])
+        self.assertEqual(tree[4][3], [])
+        self.assertEqual(tree[4][3].nodes, 0)
+        self.assertEqual(tree.nodes, 8)
+        self.assertEqual(children.tags, tree.tags)
+
+    def test_compare(self):
+        tree, expected = self.tree, self.expected
+        self.assertTrue(tree == expected)
+        self.assertTrue(expected == tree)
+        self.assertFalse(tree != expected)
+        self.assertTrue(tree == tag('abcdeefg', table, compact=1)[1])
+        self.assertTrue(tree != expected[:-1])
+        self.assertTrue(tree[3][3] != [('y', 4, 6, None), ('z', 6, 7, [])])
+        self.assertFalse(tree == tuple(expected))
+        self.assertRaises(TypeError, hash, tree)
+
+    def test_tolist(self):
+        result = self.tree.tolist()
+        self.assertEqual(type(result), list)
+        self.assertEqual(type(result[3][3]), list)
+        self.assertEqual(type(result[3][3][1][3]), list)
+        self.assertEqual(result, self.expected)
+        self.assertEqual(self.tree[3][3].tolist(), self.expected[3][3])
+
+    def test_views(self):
+        """Children keep the tree alive"""
+        children = tag('abcdeefg', table, compact=1)[1][3][3]
+        self.assertEqual(children, self.expected[3][3])
+
+    def test_size(self):
+        result = tag(text, Parser(declaration, 'file').getTagger('file', None, TagTable),
+                     compact=1)[1]
+        self.assertTrue(sys.getsizeof(result) < 40 * result.nodes + 200)
+
+
+class ParserTests(unittest.TestCase):
+    def setUp(self):
+        self.parser = Parser(declaration, 'file')
+
+    def test_parse(self):
+        result = self.parser.parse(text, compact=True)
+        self.assertEqual(type(result[1]), TagTreeType)
+        self.assertEqual(result, self.parser.parse(text))
+        self.assertEqual(
+            self.parser.parse(text, 'line', compact=True, start=5),
+            self.parser.parse(text, 'line', start=5),
+        )
+
+    def test_processor(self):
+        expected = self.parser.parse(text, processor=LineProcessor())
+        self.assertEqual(expected[1][1], ['kab', 1000])
+        self.assertEqual(
+            self.parser.parse(text, processor=LineProcessor(), compact=True),
+            expected,
+        )
+
+
+def getSuite():
+    return unittest.TestSuite((
+        unittest.defaultTestLoader.loadTestsFromTestCase(TagTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(TagTreeTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(ParserTests),
+    ))
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
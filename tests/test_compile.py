@@ -0,0 +1,123 @@
+"""Tests for compiling grammars to Python modules ahead of time
+
+The simpleparsegrammar declaration is compiled, loaded as a module
+and run through the grammar tests, as in test_printers.
+"""
+import os
+import tempfile
+import unittest
+from . import test_grammarparser
+from simpleparse import compile, simpleparsegrammar
+from simpleparse.parser import Parser
+from simpleparse.dispatchprocessor import DispatchProcessor
+from simpleparse.stt.TextTools import AppendMatch
+from simpleparse.common import numbers, strings
+
+declaration = r'''
+file := (ws, item)*, ws
+item := int / string / name / list
+list := '[', ws, (item, ws, ','?, ws)*, ']'!
+name := [a-zA-Z_], [a-zA-Z0-9_]*, ('abc'/'def')?
+<ws> := [ \t\n]*
+'''
+text = 'abc [1, "x y", [defabc, -3]] 42 \'q\'\n'
+
+
+def load(source):
+    namespace = {}
+    exec(source, namespace, namespace)
+    return namespace
+
+
+class CompiledGrammarTests(test_grammarparser.SimpleParseGrammarTests):
+    def setUp(self):
+        module = load(
+            compile.compileGrammar(simpleparsegrammar.declaration, 'declarationset')
+        )
+        self.recursiveParser = module['Parser']()
+
+    def doBasicTest(self, parserName, testValue, expected, ):
+        result = self.recursiveParser.parse(testValue, production=parserName)
+        assert result == expected, '''\nexpected:%s\n     got:%s\n''' % (expected, result)
+
+
+class CompileTests(unittest.TestCase):
+    def test_parse(self):
+        module = load(compile.compileGrammar(declaration, 'file'))
+        parser = module['Parser']()
+        original = Parser(declaration, 'file')
+        self.assertEqual(parser.parse(text), original.parse(text))
+        data = text.encode('ascii')
+        self.assertEqual(parser.parse(data), original.parse(data))
+        self.assertEqual(parser.parse('-3', 'int'), original.parse('-3', 'int'))
+        self.assertRaises(NameError, parser.parse, 'x', 'missing')
+
+    def test_module(self):
+        source = compile.compileGrammar(declaration)
+        module = load(source)
+        self.assertEqual(module['Parser']._rootProduction, 'file')
+        self.assertEqual(
+            module['LIBRARIES'],
+            ('simpleparse.common.numbers', 'simpleparse.common.strings'),
+        )
+        # the string library brings its own table list
+        self.assertIn('_l1 = []', source)
+        self.assertIn('ErrorOnFail(', source)
+        self.assertNotIn('simpleparsegrammar', source)
+
+    def test_multi_search(self):
+        comment = r'''comment := "/*", -("*/" / "\n")*, "*/"'''
+        source = compile.compileGrammar(comment, 'comment')
+        self.assertIn('MultiTextSearch(', source)
+        parser = load(source)['Parser']()
+        original = Parser(comment, 'comment')
+        for value in ('/* a * b */', '/* a\n */', '/* a'):
+            self.assertEqual(parser.parse(value), original.parse(value))
+
+    def test_error_on_fail(self):
+        parser = load(compile.compileGrammar(declaration))['Parser']()
+        with self.assertRaises(Exception) as context:
+            parser.parse('[1')
+        self.assertIn("']'", str(context.exception))
+
+    def test_processor(self):
+        """Processors customising the tables use the declaration"""
+        parser = load(compile.compileGrammar(declaration))['Parser']()
+        self.assertIsNone(parser._fallback)
+
+        class Names(DispatchProcessor):
+            _m_name = AppendMatch
+
+            def item(self, value, buffer):
+                return value[3]
+
+        result = parser.parse('abc 12', processor=Names())
+        self.assertEqual(result, (1, [['abc'], [('int', 4, 6, [])]], 6))
+        self.assertIsNotNone(parser._fallback)
+
+    def test_unsupported(self):
+        writer = compile._ModuleWriter([((None, 201, len),)])
+        self.assertRaises(ValueError, writer.formatTables, ['x'])
+
+    def test_main(self):
+        with tempfile.TemporaryDirectory() as directory:
+            grammar = os.path.join(directory, 'grammar.def')
+            output = os.path.join(directory, 'grammar_tables.py')
+            with open(grammar, 'w', encoding='utf-8') as file:
+                file.write(declaration)
+            compile.main([grammar, '-o', output, '-r', 'item', '-n', 'ItemParser'])
+            with open(output, encoding='utf-8') as file:
+                module = load(file.read())
+        parser = module['ItemParser']()
+        self.assertEqual(parser.parse('abc'), Parser(declaration, 'item').parse('abc'))
+
+
+def getSuite():
+    return unittest.TestSuite((
+        unittest.defaultTestLoader.loadTestsFromTestCase(CompiledGrammarTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(CompileTests),
+    ))
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
@@ -0,0 +1,196 @@
+"""Tests for FirstOf groups dispatching on the first character"""
+import unittest
+from simpleparse.parser import Parser
+from simpleparse.objectgenerator import (
+    Literal, CILiteral, Range, SequentialGroup, FirstOfGroup,
+)
+from simpleparse.stt.TextTools import (
+    tag, TagTable, BytesTagTable, EncodedTagTable, CharSet, Word, Skip, Fail, Here,
+)
+from simpleparse.stt.TextTools.TextTools import Dispatch
+
+declaration = r'''
+file := (ws, item)*, ws
+>item< := keyword / name / number / string / other
+keyword := "if" / "in" / "else" / c"not"
+name := [a-zA-Z_], [a-zA-Z0-9_]*
+number := [0-9]+, ('.', [0-9]+)?
+string := ('"', -'"'*, '"') / ("'", -"'"*, "'")
+other := -[ \t\n]
+<ws> := [ \t\n]*
+'''
+
+
+def commands(table):
+    """All commands in table and its nested tables"""
+    result = []
+    for entry in table:
+        result.append(entry[1])
+        argument = entry[2]
+        if entry[1] != Dispatch and isinstance(argument, tuple) and argument and isinstance(argument[0], tuple):
+            result.extend(commands(argument))
+    return result
+
+
+class DispatchCommandTests(unittest.TestCase):
+    table = (
+        (None, Dispatch, ((CharSet('a'), 1), (CharSet('b-c'), 3)), 5),
+        (None, Word, 'ab', 0, 5),
+        (None, Fail, Here),
+        (None, Word, 'bc', 0, 3),
+        (None, Fail, Here),
+        (None, Word, 'x'),
+    )
+
+    def test_jumps(self):
+        for factory, encode in (
+            (TagTable, str),
+            (BytesTagTable, str.encode),
+            (lambda table: EncodedTagTable(table, 'utf-8'), str.encode),
+        ):
+            table = factory(self.table)
+            self.assertEqual(tag(encode('ab'), table), (1, [], 2))
+            self.assertEqual(tag(encode('bc'), table), (1, [], 2))
+            self.assertEqual(tag(encode('cb'), table)[0], 0)
+            # no class, the end of the text: jne
+            self.assertEqual(tag(encode('x'), table), (1, [], 1))
+            self.assertEqual(tag(encode(''), table)[0], 0)
+
+    def test_arguments(self):
+        for argument in (CharSet('a'), ((CharSet('a'),),), ((CharSet('a'), 0),), (('a', 1),)):
+            self.assertRaises(TypeError, TagTable, ((None, Dispatch, argument),))
+
+    def test_overlapping_bytes(self):
+        """Characters found in more than one (encoded) set take jne"""
+        table = (
+            (None, Dispatch, ((CharSet('é'), 1), (CharSet('è'), 2)), 3),
+            (None, Skip, 1, 0, 3),
+            (None, Skip, 2, 0, 2),
+            (None, Skip, 3),
+        )
+        self.assertEqual(tag('è', TagTable(table)), (1, [], 2))
+        self.assertEqual(tag('è'.encode('utf-8'), BytesTagTable(table)), (1, [], 3))
+        self.assertEqual(
+            tag('è'.encode('latin-1'), EncodedTagTable(table, 'latin-1')), (1, [], 2)
+        )
+
+
+class FirstCharactersTests(unittest.TestCase):
+    def test_elements(self):
+        self.assertEqual(Literal(value='abc').firstCharacters(None), ((97, 97),))
+        self.assertEqual(Literal(value='').firstCharacters(None), None)
+        self.assertEqual(Literal(value=b'abc').firstCharacters(None), None)
+        self.assertEqual(Literal(value='a', negative=1).firstCharacters(None), None)
+        self.assertEqual(Literal(value='a', optional=1).firstCharacters(None), None)
+        self.assertEqual(Literal(value='a', repeating=1).firstCharacters(None), ((97, 97),))
+        self.assertEqual(CILiteral(value='not').firstCharacters(None), ((78, 78), (110, 110)))
+        self.assertEqual(Range(value='cab').firstCharacters(None), ((97, 99),))
+        self.assertEqual(Range(value=b'ab').firstCharacters(None), None)
+        self.assertEqual(Range(value='ab', negative=1).firstCharacters(None), None)
+
+    def test_groups(self):
+        self.assertEqual(
+            SequentialGroup(children=[
+                Literal(value='x', lookahead=1), Literal(value='y'),
+            ]).firstCharacters(None),
+            ((120, 120),),
+        )
+        self.assertEqual(
+            SequentialGroup(children=[
+                Literal(value='x', optional=1), Literal(value='y'),
+            ]).firstCharacters(None),
+            None,
+        )
+        self.assertEqual(
+            FirstOfGroup(children=[
+                Literal(value='b'), Range(value='0123'), Literal(value='c'),
+            ]).firstCharacters(None),
+            ((48, 51), (98, 99)),
+        )
+        self.assertEqual(
+            FirstOfGroup(children=[
+                Literal(value='b'), Literal(value='c', negative=1),
+            ]).firstCharacters(None),
+            None,
+        )
+
+    def test_names(self):
+        parser = Parser(r'''
+        a := b / "x"
+        b := [0-9], c
+        c := c / "y"
+        d := ?-"x", a
+        e := e, "z"
+        ''')
+        generator = parser._generator
+        self.assertEqual(
+            generator.getRootObject('a').firstCharacters(generator),
+            ((48, 57), (120, 120)),
+        )
+        self.assertEqual(generator.getRootObject('d').firstCharacters(generator), None)
+        # left-recursive references are unknown
+        self.assertEqual(generator.getRootObject('c').firstCharacters(generator), None)
+        self.assertEqual(generator.getRootObject('e').firstCharacters(generator), None)
+
+
+class FirstOfDispatchTests(unittest.TestCase):
+    def tables(self, declaration, root, dispatch):
+        previous = FirstOfGroup.maxDispatchGrowth
+        if not dispatch:
+            FirstOfGroup.maxDispatchGrowth = 0
+        try:
+            return Parser(declaration, root)._generator.buildParser(root)
+        finally:
+            FirstOfGroup.maxDispatchGrowth = previous
+
+    def test_generated(self):
+        table = self.tables('x := "a" / [bc] / ("d", "e")', 'x', 1)
+        self.assertIn(Dispatch, commands(table))
+        table = self.tables('x := "a" / [bc] / ("d", "e")', 'x', 0)
+        self.assertNotIn(Dispatch, commands(table))
+        # a single child with known first characters
+        table = self.tables('x := "a" / -"b" / ?-"c"', 'x', 1)
+        self.assertNotIn(Dispatch, commands(table))
+
+    def test_ordered(self):
+        """The first matching child wins, as for the plain chain"""
+        parser = Parser(r'''
+        x := ("ab" / "a" / [a-z]+ / -"q" / [0-9]), "!"
+        ''', 'x')
+        self.assertIn(Dispatch, commands(parser._generator.buildParser('x')))
+        for text, expected in (
+            ('ab!', 3), ('a!', 2), ('abc!', None), ('bc!', 3), ('!!', 2),
+            ('#!', 2), ('q!', 2), ('Q!', 2), ('0!', 2), ('ab', None),
+        ):
+            success, children, next = parser.parse(text)
+            self.assertEqual(success and next or None, expected, text)
+
+    def test_equivalent(self):
+        """Dispatch tables produce the results of the plain chains"""
+        text = 'if x in "a b" else \'c\' 3.14 NoT not_ ?+ \xe9t\xe9 \U0001F600\n' * 3
+        texts = [text[:i] for i in range(0, len(text), 7)] + [text]
+        new = self.tables(declaration, 'file', 1)
+        old = self.tables(declaration, 'file', 0)
+        self.assertIn(Dispatch, commands(new))
+        for factory, encode in (
+            (TagTable, lambda text: text),
+            (BytesTagTable, lambda text: text.encode('utf-8')),
+            (lambda table: EncodedTagTable(table, 'utf-8'), lambda text: text.encode('utf-8')),
+            (lambda table: EncodedTagTable(table, 'latin-1'), lambda text: text.encode('latin-1', 'replace')),
+        ):
+            newTable, oldTable = factory(new), factory(old)
+            for value in texts:
+                value = encode(value)
+                self.assertEqual(tag(value, newTable), tag(value, oldTable), value)
+
+
+def getSuite():
+    return unittest.TestSuite((
+        unittest.defaultTestLoader.loadTestsFromTestCase(DispatchCommandTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(FirstCharactersTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(FirstOfDispatchTests),
+    ))
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
@@ -0,0 +1,165 @@
+"""Tests for the on-disk cache of built parsers"""
+import os
+import tempfile
+import unittest
+from simpleparse import grammarcache, simpleparsegrammar, common
+from simpleparse.parser import Parser
+from simpleparse.common import numbers, strings
+
+declaration = r'''
+file := (ws, item)*, ws
+item := int / string / name
+name := [a-zA-Z_], [a-zA-Z0-9_]*
+<ws> := [ \t\n]*
+'''
+text = 'abc 12 "x y" def -3\n'
+
+
+class GrammarCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.temporary = tempfile.TemporaryDirectory()
+        self.directory = self.temporary.name
+
+    def tearDown(self):
+        self.temporary.cleanup()
+
+    def cacheFiles(self):
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if name.endswith(grammarcache.SUFFIX)
+        )
+
+    def test_roundtrip(self):
+        expected = Parser(declaration, 'file').parse(text)
+        Parser(declaration, 'file', cacheDirectory=self.directory)
+        self.assertEqual(len(self.cacheFiles()), 1)
+        original = simpleparsegrammar.Parser
+        simpleparsegrammar.Parser = None
+        try:
+            parser = Parser(declaration, 'file', cacheDirectory=self.directory)
+        finally:
+            simpleparsegrammar.Parser = original
+        self.assertEqual(parser.parse(text), expected)
+        self.assertEqual(parser.parse(text.encode('ascii')),
+                         Parser(declaration, 'file').parse(text.encode('ascii')))
+
+    def test_library_references(self):
+        """Library definitions are looked up, not copied"""
+        Parser(declaration, 'file', cacheDirectory=self.directory)
+        parser = Parser(declaration, 'file', cacheDirectory=self.directory)
+        self.assertIs(parser._generator.definitionSources[0], common.SOURCES[0])
+        self.assertEqual(parser.parse('-3')[1][0][0], 'item')
+
+    def test_key(self):
+        Parser(declaration, 'file', cacheDirectory=self.directory)
+        Parser(declaration, 'item', cacheDirectory=self.directory)
+        Parser(declaration + 'x := "x"\n', 'file', cacheDirectory=self.directory)
+        Parser(declaration, 'file', cacheDirectory=self.directory)
+        self.assertEqual(len(self.cacheFiles()), 3)
+
+    def test_corrupt(self):
+        Parser(declaration, 'file', cacheDirectory=self.directory)
+        name, = self.cacheFiles()
+        path = os.path.join(self.directory, name)
+        with open(path, 'wb') as file:
+            file.write(b'\x80\x05garbage')
+        parser = Parser(declaration, 'file', cacheDirectory=self.directory)
+        self.assertEqual(parser.parse(text), Parser(declaration, 'file').parse(text))
+        key = name[:-len(grammarcache.SUFFIX)]
+        self.assertTrue(grammarcache.load(
+            Parser.__new__(Parser), self.directory, key, common.SOURCES,
+        ))
+
+    def test_unwritable(self):
+        path = os.path.join(self.directory, 'file')
+        with open(path, 'w'):
+            pass
+        parser = Parser(declaration, 'file', cacheDirectory=path)
+        self.assertEqual(parser.parse(text), Parser(declaration, 'file').parse(text))
+
+    def test_environment(self):
+        os.environ['SIMPLEPARSE_CACHE_DIR'] = self.directory
+        try:
+            Parser(declaration, 'file')
+        finally:
+            del os.environ['SIMPLEPARSE_CACHE_DIR']
+        self.assertEqual(len(self.cacheFiles()), 1)
+
+
+@unittest.skipUnless(hasattr(os, 'getuid'), 'needs POSIX ownership')
+class TrustTests(unittest.TestCase):
+    """Cache files are only loaded from private directories"""
+    def setUp(self):
+        self.temporary = tempfile.TemporaryDirectory()
+        self.directory = os.path.join(self.temporary.name, 'cache')
+
+    def tearDown(self):
+        self.temporary.cleanup()
+
+    def key(self):
+        name, = os.listdir(self.directory)
+        return name[:-len(grammarcache.SUFFIX)]
+
+    def load(self):
+        return grammarcache.load(
+            Parser.__new__(Parser), self.directory, self.key(), common.SOURCES,
+        )
+
+    def test_created_private(self):
+        Parser(declaration, 'file', cacheDirectory=self.directory)
+        self.assertEqual(os.stat(self.directory).st_mode & 0o777, 0o700)
+        self.assertTrue(grammarcache.trusted(self.directory))
+        self.assertTrue(self.load())
+
+    def test_shared_directory(self):
+        for mode in (0o770, 0o777, 0o1777):
+            os.makedirs(self.directory, exist_ok=True)
+            os.chmod(self.directory, mode)
+            self.assertFalse(grammarcache.trusted(self.directory))
+            parser = Parser(declaration, 'file', cacheDirectory=self.directory)
+            self.assertEqual(os.listdir(self.directory), [])
+            self.assertEqual(parser.parse(text), Parser(declaration, 'file').parse(text))
+        # files written while the directory was private aren't loaded either
+        os.chmod(self.directory, 0o700)
+        Parser(declaration, 'file', cacheDirectory=self.directory)
+        self.assertTrue(self.load())
+        os.chmod(self.directory, 0o777)
+        self.assertFalse(self.load())
+
+    def test_shared_file(self):
+        Parser(declaration, 'file', cacheDirectory=self.directory)
+        os.chmod(os.path.join(self.directory, self.key() + grammarcache.SUFFIX), 0o666)
+        self.assertFalse(self.load())
+
+    @unittest.skipUnless(hasattr(os, 'getuid') and os.getuid() == 0, 'needs root')
+    def test_foreign_owner(self):
+        Parser(declaration, 'file', cacheDirectory=self.directory)
+        path = os.path.join(self.directory, self.key() + grammarcache.SUFFIX)
+        os.chown(path, 12345, 12345)
+        self.assertFalse(self.load())
+        os.chown(path, 0, 0)
+        self.assertTrue(self.load())
+        os.chown(self.directory, 12345, 12345)
+        self.assertFalse(grammarcache.trusted(self.directory))
+        self.assertFalse(self.load())
+
+    def test_environment(self):
+        os.makedirs(self.directory)
+        os.chmod(self.directory, 0o777)
+        os.environ['SIMPLEPARSE_CACHE_DIR'] = self.directory
+        try:
+            Parser(declaration, 'file')
+        finally:
+            del os.environ['SIMPLEPARSE_CACHE_DIR']
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+def getSuite():
+    return unittest.TestSuite([
+        unittest.defaultTestLoader.loadTestsFromTestCase(GrammarCacheTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(TrustTests),
+    ])
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
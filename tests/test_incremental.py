@@ -0,0 +1,248 @@
+"""Tests for suspending and resuming tag() on text arriving in pieces"""
+import unittest
+from simpleparse.stt.TextTools import (
+    tag, TagTable, TextSearch, set_release_gil,
+    AllIn, Is, Word, Call, Table, sWordStart, EOF, Here, MatchFail, MatchOk,
+)
+from simpleparse.parser import Parser
+from simpleparse.dispatchprocessor import DispatchProcessor, getString, dispatchList
+
+digits = '0123456789'
+
+declaration = r'''
+message := header*, '\r\n'
+header := name, ':', ' '?, value, '\r\n'
+name := [A-Za-z-]+
+value := -'\r\n'*
+'''
+
+message = 'Host: example.com\r\nContent-Type: text/plain\r\nX: 1\r\n\r\n'
+
+
+def pieces(text, size):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+def feedAll(table, chunks, **named):
+    """Tag the text in chunks, return the result and the number of calls"""
+    text = ''
+    state = None
+    calls = 0
+    for index, chunk in enumerate(chunks):
+        text += chunk
+        calls += 1
+        result = tag(
+            text, table, 0, len(text),
+            partial=index < len(chunks) - 1, resume=state, **named
+        )
+        if result[0] is not None:
+            return result, calls
+        state = result[2]
+    raise AssertionError('not decided at the end of the text')
+
+
+class HeaderProcessor(DispatchProcessor):
+    def header(self, tup, buffer):
+        return tuple(dispatchList(self, tup[3], buffer))
+
+    def name(self, tup, buffer):
+        return getString(tup, buffer)
+
+    def value(self, tup, buffer):
+        return getString(tup, buffer)
+
+
+class PartialTagTests(unittest.TestCase):
+    def setUp(self):
+        self.table = TagTable((
+            ('n', AllIn, digits),
+            (None, Is, '+'),
+            ('n', AllIn, digits),
+        ))
+
+    def tearDown(self):
+        set_release_gil(1)
+
+    def test_suspend(self):
+        for release in (0, 1):
+            set_release_gil(release)
+            result = tag('12', self.table, partial=1)
+            self.assertEqual(result[0], None)
+            self.assertEqual(result[1], [])
+            state = result[2]
+            # the digits may go on
+            taglist = result[1]
+            result = tag('12+3', self.table, resume=state, partial=1)
+            self.assertEqual(result[0], None)
+            self.assertTrue(result[1] is taglist)
+            self.assertTrue(result[2] is state)
+            result = tag('12+34x', self.table, resume=state, partial=1)
+            self.assertEqual(result, (1, [('n', 0, 2, None), ('n', 3, 5, None)], 5))
+
+    def test_final(self):
+        """A partial run is complete once resumed without partial"""
+        state = tag('12+3', self.table, partial=1)[2]
+        self.assertEqual(
+            tag('12+3', self.table, resume=state),
+            (1, [('n', 0, 2, None), ('n', 3, 4, None)], 4)
+        )
+        state = tag('12', self.table, partial=1)[2]
+        self.assertEqual(tag('12', self.table, resume=state)[0], 0)
+
+    def test_decided(self):
+        """Outcomes not depending on the rest of the text are final"""
+        self.assertEqual(tag('x', self.table, partial=1), (0, [], 0))
+        self.assertEqual(tag('1-', self.table, partial=1)[0], 0)
+        table = ((None, Word, 'ab'), (None, Is, 'c'))
+        self.assertEqual(tag('abcd', table, partial=1), (1, [], 3))
+        self.assertEqual(tag('ax', table, partial=1)[0], 0)
+        self.assertEqual(tag('a', table, partial=1)[0], None)
+
+    def test_commands(self):
+        search = TextSearch('end')
+        for table, text in [
+            (((None, Word, 'abc'),), 'ab'),
+            (((None, Is, 'a'), (None, EOF, Here)), 'a'),
+            (((None, sWordStart, search),), 'the e'),
+            (((None, Call, lambda text, start, stop: start),), 'abc'),
+        ]:
+            result = tag(text, table, partial=1)
+            self.assertEqual(result[0], None, table)
+
+    def test_pieces(self):
+        parser = Parser(declaration, 'message')
+        table = parser.getTagger('message', None, TagTable)
+        expected = parser.parse(message + 'rest')
+        for size in (1, 2, 3, 7, 100):
+            result, calls = feedAll(table, pieces(message + 'rest', size))
+            self.assertEqual(result, expected)
+            # decided by the blank line, not by the end of the text
+            self.assertTrue(calls <= len(message) // size + 1)
+
+    def test_linear(self):
+        """Every piece continues the run instead of starting over"""
+        calls = []
+
+        def digit(text, start, stop):
+            calls.append(start)
+            if start < stop and text[start] in digits:
+                return start + 1
+            return start
+
+        table = TagTable((
+            ('d', Call, digit, +1, 0),
+            (None, Is, ';'),
+        ))
+        text = '1' * 200 + ';'
+        result, count = feedAll(table, pieces(text, 1))
+        self.assertEqual(result[-1], len(text))
+        self.assertEqual(count, len(text))
+        # one call per digit, the one finding ';' and one per piece
+        self.assertTrue(len(calls) <= 2 * len(text) + 1, len(calls))
+
+    def test_errors(self):
+        # waiting for the digits after '+'
+        state = tag('12+', self.table, partial=1)[2]
+        self.assertRaises(TypeError, tag, '12', self.table, resume='state')
+        self.assertRaises(ValueError, tag, '12', self.table, resume=state, taglist=[])
+        self.assertRaises(ValueError, tag, '1', self.table, resume=state)
+        other = TagTable(((None, Is, '1'),))
+        self.assertRaises(ValueError, tag, '123', other, resume=state)
+        self.assertRaises(ValueError, tag, '12', self.table, partial=1, profile=[])
+        # the run can still be resumed after those
+        self.assertEqual(tag('12+3', self.table, resume=state)[-1], 4)
+        self.assertRaises(ValueError, tag, '12+3', self.table, resume=state)
+
+    def test_nested(self):
+        """tag() calls made by callbacks don't suspend"""
+        inner = []
+
+        def callback(text, start, stop):
+            inner.append(tag(text, self.table, start, stop))
+            return stop
+
+        self.assertEqual(tag('1+2', ((None, Call, callback),), partial=1)[0], None)
+        self.assertEqual(inner, [(1, [('n', 0, 1, None), ('n', 2, 3, None)], 3)])
+
+    def test_tables(self):
+        child = TagTable((('d', AllIn, digits),))
+        table = TagTable((
+            ('list', Table, child),
+            (None, Is, ',', MatchOk),
+            (None, Table, child, MatchFail, -1),
+        ))
+        expected = tag('1,22,333', table)
+        for size in (1, 2, 4):
+            self.assertEqual(feedAll(table, pieces('1,22,333', size))[0], expected)
+
+
+class IncrementalParseTests(unittest.TestCase):
+    def setUp(self):
+        self.parser = Parser(declaration, 'message')
+
+    def test_feed(self):
+        parse = self.parser.incremental()
+        results = [parse.feed(piece) for piece in pieces(message, 5)]
+        self.assertEqual(results[:-1], [None] * (len(results) - 1))
+        self.assertTrue(parse.done)
+        self.assertEqual(results[-1], self.parser.parse(message))
+        self.assertEqual(parse.close(), results[-1])
+        self.assertEqual(parse.feed('more'), results[-1])
+        self.assertEqual(parse.buffer, message + 'more')
+
+    def test_close(self):
+        parse = self.parser.incremental()
+        self.assertEqual(parse.feed('Host: x\r'), None)
+        self.assertFalse(parse.done)
+        self.assertEqual(parse.close(), self.parser.parse('Host: x\r'))
+        self.assertEqual(self.parser.incremental('name').close(), (0, [], 0))
+
+    def test_processor(self):
+        parse = self.parser.incremental(processor=HeaderProcessor())
+        for piece in pieces(message, 3):
+            result = parse.feed(piece)
+        self.assertEqual(result, (1, [
+            ('Host', 'example.com'), ('Content-Type', 'text/plain'), ('X', '1'),
+        ], len(message)))
+
+    def test_bytes(self):
+        data = 'Name: caf\xe9\r\n\r\n'.encode('utf-8')
+        parse = self.parser.incremental(encoding='utf-8')
+        for i in range(len(data)):
+            result = parse.feed(data[i:i + 1])
+        self.assertEqual(result, self.parser.parse(data, encoding='utf-8'))
+        self.assertEqual(type(parse.buffer), bytes)
+        self.assertEqual(parse.buffer, data)
+
+    def test_long(self):
+        """Long texts in short pieces give the result on the last one"""
+        text = 'Name: value\r\n' * 5000 + '\r\n'
+        for data, encoding in ((text, None), (text.encode('ascii'), 'ascii')):
+            expected = self.parser.parse(data, encoding=encoding)
+            parse = self.parser.incremental(encoding=encoding)
+            results = [parse.feed(piece) for piece in pieces(data, 7)]
+            self.assertEqual(results[-1], expected)
+            self.assertEqual(results[-2], None)
+            self.assertEqual(parse.buffer, data)
+
+    def test_batch(self):
+        """Batched str pieces are joined and tagged once enough arrived"""
+        text = 'Name: value\r\n' * 5000 + '\r\n'
+        parse = self.parser.incremental(batch=True)
+        runs = []
+        parse._run = lambda partial, run=parse._run: runs.append(1) or run(partial)
+        for piece in pieces(text, 7):
+            parse.feed(piece)
+        self.assertTrue(len(runs) < 16384 // 7 + 100, len(runs))
+        self.assertEqual(parse.close(), self.parser.parse(text))
+        self.assertEqual(parse.buffer, text)
+
+def getSuite():
+    return unittest.TestSuite((
+        unittest.defaultTestLoader.loadTestsFromTestCase(PartialTagTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(IncrementalParseTests),
+    ))
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
@@ -0,0 +1,175 @@
+"""Tests for parsing the records of a file one at a time"""
+import io
+import unittest
+from simpleparse.parser import Parser
+from simpleparse.error import ParserSyntaxError
+from simpleparse.dispatchprocessor import DispatchProcessor, getString
+
+declaration = r'''
+file := line*
+line := key, '=', value, '\n'
+key := [a-z]+
+value := [0-9]+
+'''
+
+text = ''.join('k%s=%d\n' % ('abc'[:i % 3 + 1], i * 1000) for i in range(200))
+
+
+def shift(children, delta):
+    return [
+        (tagobj, start + delta, stop + delta, shift(sub, delta) if sub else sub)
+        for tagobj, start, stop, sub in children
+    ]
+
+
+class Reader:
+    """File returning at most size characters per read, counting them"""
+
+    def __init__(self, text):
+        self.file = io.StringIO(text)
+        self.reads = 0
+
+    def read(self, size):
+        self.reads += 1
+        return self.file.read(size)
+
+
+class LineProcessor(DispatchProcessor):
+    def key(self, tup, buffer):
+        return getString(tup, buffer)
+
+    def value(self, tup, buffer):
+        return int(getString(tup, buffer))
+
+
+class IterParseTests(unittest.TestCase):
+    def setUp(self):
+        self.parser = Parser(declaration, 'file')
+
+    def records(self, text, chunkSize, **named):
+        """Return the records of text with positions in text"""
+        result = []
+        offset = 0
+        for (name, start, stop, children), buffer in self.parser.iterparse(
+            io.StringIO(text), record='line', chunkSize=chunkSize, **named
+        ):
+            self.assertEqual(name, 'line')
+            # records follow each other, work out the offset of buffer
+            delta = offset - start
+            result.append(('line', offset, stop + delta, shift(children, delta)))
+            self.assertEqual(text[offset:stop + delta], buffer[start:stop])
+            offset = stop + delta
+        return result
+
+    def test_records(self):
+        expected = self.parser.parse(text)[1]
+        for chunkSize in (1, 2, 5, 16, 1000, 100000):
+            self.assertEqual(self.records(text, chunkSize), expected)
+
+    def test_empty(self):
+        self.assertEqual(list(self.parser.iterparse(io.StringIO(''), record='line')), [])
+
+    def test_production(self):
+        parser = Parser(declaration, 'line')
+        records = list(parser.iterparse(io.StringIO('a=1\nb=2\n'), chunkSize=3))
+        self.assertEqual([buffer[start:stop] for (name, start, stop, children), buffer in records],
+                         ['a=1\n', 'b=2\n'])
+        records = list(self.parser.iterparse(io.StringIO('a=1\n'), 'line'))
+        self.assertEqual(records[0][0][0], 'line')
+
+    def test_processor(self):
+        """The processor sees the children of each record as parse() would"""
+        values = list(self.parser.iterparse(
+            io.StringIO('a=1\nbb=22\n'), record='line', processor=LineProcessor(), chunkSize=2
+        ))
+        self.assertEqual(values, [(1, ['a', 1], 4), (1, ['bb', 22], 6)])
+
+    def test_bytes(self):
+        data = 'ké=1\n'.encode('utf-8')
+        parser = Parser(r'''
+        line := key, '=', value, '\n'
+        key := [a-zé]+
+        value := [0-9]+
+        ''', 'line')
+        records = list(parser.iterparse(io.BytesIO(data * 3), chunkSize=2, encoding='utf-8'))
+        self.assertEqual(len(records), 3)
+        (name, start, stop, children), buffer = records[-1]
+        self.assertEqual(buffer[start:stop], data)
+
+    def test_flat(self):
+        """The text held doesn't grow with the file"""
+        reader = Reader(text * 20)
+        sizes = set()
+        count = 0
+        for (name, start, stop, children), buffer in self.parser.iterparse(
+            reader, record='line', chunkSize=64
+        ):
+            sizes.add(len(buffer))
+            count += 1
+        self.assertEqual(count, 4000)
+        self.assertTrue(max(sizes) < 3 * 64, max(sizes))
+        self.assertTrue(reader.reads > len(text) * 20 // 64)
+
+    def test_syntax_error(self):
+        records = self.parser.iterparse(io.StringIO(text + 'a=\n' + text), record='line', chunkSize=16)
+        with self.assertRaises(ParserSyntaxError) as context:
+            for record in records:
+                pass
+        error = context.exception
+        self.assertEqual(error.production, 'line')
+        self.assertEqual(error.buffer[error.position:error.position + 3], 'a=\n')
+        self.assertTrue(('at offset %d' % len(text)) in str(error), str(error))
+
+    def test_max_record_size(self):
+        records = self.parser.iterparse(
+            io.StringIO('a=1\n' + 'x' * 1000), record='line', chunkSize=16, maxRecordSize=100
+        )
+        self.assertEqual(next(records)[0][:3], ('line', 0, 4))
+        with self.assertRaises(ParserSyntaxError) as context:
+            next(records)
+        self.assertTrue('longer than 100' in str(context.exception))
+
+    def test_no_text(self):
+        parser = Parser(r'''
+        line := [a-z]*, '\n'?
+        ''', 'line')
+        records = parser.iterparse(io.StringIO('ab\ncd\n1'), chunkSize=4)
+        self.assertEqual(len([next(records), next(records)]), 2)
+        self.assertRaises(ParserSyntaxError, next, records)
+
+    def test_optional_tail(self):
+        """Records aren't produced while text to come could extend them"""
+        for declaration, production, data in (
+            (r'''
+            entry := name, ' ', value, ('  # ', comment)?, '\n'?
+            name := [a-z]+
+            value := [0-9]+
+            comment := [a-z ]+
+            ''', 'entry', 'abc 123  # note\nde 4\nfg 56  # x y\n'),
+            (r'''
+            rec := 'ab', 'cd'?, ';'?
+            ''', 'rec', 'abcd;ab;abcdab'),
+        ):
+            parser = Parser(declaration, production)
+            expected = []
+            position = 0
+            while position < len(data):
+                success, children, position = parser.parse(data, start=position)
+                expected.append(position)
+            for chunkSize in (1, 2, 3, 4, 8, 16):
+                stops = []
+                offset = 0
+                for (name, start, stop, children), buffer in parser.iterparse(
+                    io.StringIO(data), chunkSize=chunkSize
+                ):
+                    offset += stop - start
+                    stops.append(offset)
+                self.assertEqual(stops, expected, (production, chunkSize))
+
+
+def getSuite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(IterParseTests)
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
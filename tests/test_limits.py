@@ -0,0 +1,121 @@
+"""Tests for the step budget and deadline of tag() and parse()"""
+import time
+import unittest
+from simpleparse.stt.TextTools import (
+    tag, TagTable, set_release_gil,
+    AllIn, Is, Call, Table, MatchFail, MatchOk,
+    Error, LimitExceeded,
+)
+from simpleparse.parser import Parser
+
+digits = '0123456789'
+
+declaration = r'''
+expr := (term, '+', expr) / (term, '-', expr) / term
+term := (factor, '*', term) / (factor, '/', term) / factor
+factor := ('(', expr, ')') / number
+<number> := [0-9]+
+'''
+
+
+class LimitsTests(unittest.TestCase):
+    def setUp(self):
+        self.child = TagTable((('digits', AllIn, digits),))
+        self.table = TagTable((
+            ('n', Table, self.child),
+            (None, Is, '+'),
+            ('n', Table, self.child, MatchFail, MatchOk),
+        ))
+
+    def tearDown(self):
+        set_release_gil(1)
+
+    def test_steps(self):
+        expected = tag('12+34', self.table)
+        for release in (0, 1):
+            set_release_gil(release)
+            # three entries in the table, two in the child tables
+            self.assertEqual(tag('12+34', self.table, max_steps=5), expected)
+            self.assertEqual(tag('12+34', self.table, max_steps=None), expected)
+            with self.assertRaises(LimitExceeded) as context:
+                tag('12+34', self.table, max_steps=4)
+            error = context.exception
+            self.assertTrue(isinstance(error, Error))
+            self.assertEqual(error.limit, 'steps')
+            self.assertEqual(error.steps, 4)
+            self.assertEqual(error.position, 3)
+            self.assertEqual(error.production, 'n')
+            self.assertEqual(error.stack, ((None, self.table), ('n', self.child)))
+            self.assertEqual(
+                str(error), "step limit of 4 exceeded at position 3 in production 'n'"
+            )
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, tag, '1', self.table, max_steps=-1)
+        self.assertRaises(TypeError, tag, '1', self.table, max_steps='1')
+        self.assertRaises(TypeError, tag, '1', self.table, deadline='now')
+        # the limits are gone after an error
+        self.assertEqual(tag('1+2', self.table)[-1], 3)
+
+    def test_deadline(self):
+        for release in (0, 1):
+            set_release_gil(release)
+            with self.assertRaises(LimitExceeded) as context:
+                tag('12+34', self.table, deadline=time.monotonic() - 1)
+            self.assertEqual(context.exception.limit, 'deadline')
+            self.assertEqual(context.exception.position, 0)
+            self.assertEqual(context.exception.production, None)
+            result = tag('12+34', self.table, deadline=time.monotonic() + 60)
+            self.assertEqual(result[-1], 5)
+
+    def test_nested(self):
+        """tag() calls made by callbacks count against their caller's limits"""
+        def callback(text, position, stop):
+            return tag(text, self.table, position, stop)[-1]
+
+        table = ((None, Call, callback),)
+        self.assertEqual(tag('1+2', table, max_steps=6)[-1], 3)
+        self.assertRaises(LimitExceeded, tag, '1+2', table, max_steps=5)
+
+    def test_parser(self):
+        parser = Parser(declaration, 'expr')
+        text = '(' * 20 + '1' + ')' * 20
+        with self.assertRaises(LimitExceeded) as context:
+            parser.parse(text, max_steps=1000)
+        error = context.exception
+        self.assertTrue(error.production in ('expr', 'term', 'factor'))
+        self.assertTrue(0 < error.position < len(text))
+        self.assertTrue(str(error).endswith('in production %r' % (error.production,)))
+        self.assertEqual(parser.parse('(1)+2', max_steps=1000)[-1], 5)
+
+    def test_unreported(self):
+        """Productions which aren't reported are named as well"""
+        parser = Parser(r'''
+        list := item, (',', item)*
+        <item> := ('[', list, ']') / number
+        number := [0-9]+
+        ''', 'list')
+        with self.assertRaises(LimitExceeded) as context:
+            parser.parse('[[[1]]]', max_steps=4)
+        error = context.exception
+        self.assertEqual([tagobj for tagobj, table in error.stack], [None] * 4)
+        self.assertEqual(error.production, 'item')
+        self.assertEqual(str(error), "step limit of 4 exceeded at position 0 in production 'item'")
+
+    def test_parser_deadline(self):
+        """A runaway parse stops at its deadline"""
+        parser = Parser(declaration, 'expr')
+        text = '(' * 30 + '1' + ')' * 30
+        start = time.monotonic()
+        self.assertRaises(
+            LimitExceeded, parser.parse, text, deadline=start + 0.05
+        )
+        self.assertTrue(time.monotonic() - start < 5)
+
+
+def getSuite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(LimitsTests)
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
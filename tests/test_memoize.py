@@ -0,0 +1,209 @@
+"""Tests for memoized (packrat) table calls"""
+import time
+import unittest
+from simpleparse.stt.TextTools import (
+    tag, TagTable, set_release_gil, set_memo_size,
+    AllIn, Is, Call, Table, SubTable, TableInList, SubTableInList,
+    MatchOk, Memoize,
+)
+from simpleparse.parser import Parser
+
+declaration = r'''
+expr := (term, '+', expr) / (term, '-', expr) / term
+term := (factor, '*', term) / (factor, '/', term) / factor
+factor := ('(', expr, ')') / number
+number := [0-9]+
+'''
+
+digits = '0123456789'
+
+
+class MemoizeTests(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.child = TagTable((
+            (None, Call, self.count),
+            ('digits', AllIn, digits),
+        ))
+
+    def tearDown(self):
+        set_memo_size(65536)
+        set_release_gil(1)
+
+    def count(self, text, position, stop):
+        self.calls += 1
+        return position + 1
+
+    def alternatives(self, first, second):
+        """Table trying first followed by 'x', then second followed by 'y'"""
+        return (
+            (None, SubTable, (first, (None, Is, 'x')), +1, MatchOk),
+            (None, SubTable, (second, (None, Is, 'y'))),
+        )
+
+    def test_constants(self):
+        self.assertEqual(Memoize, 1 << 13)
+        self.assertEqual(set_memo_size(100), 65536)
+        self.assertEqual(set_memo_size(65536), 100)
+        self.assertRaises(ValueError, set_memo_size, -1)
+
+    def test_table(self):
+        expected = (1, [('n', 0, 3, [('digits', 1, 3, None)])], 4)
+        table = self.alternatives(
+            ('n', Table, self.child), ('n', Table, self.child)
+        )
+        self.assertEqual(tag('123y', table), expected)
+        self.assertEqual(self.calls, 2)
+        self.calls = 0
+        table = self.alternatives(
+            ('n', Table | Memoize, self.child), ('n', Table | Memoize, self.child)
+        )
+        self.assertEqual(tag('123y', table), expected)
+        self.assertEqual(self.calls, 1)
+        # the memo doesn't outlive the tag() call
+        self.assertEqual(tag('123y', table), expected)
+        self.assertEqual(self.calls, 2)
+
+    def test_subtable(self):
+        table = self.alternatives(
+            (None, SubTable | Memoize, self.child),
+            (None, SubTable | Memoize, self.child),
+        )
+        self.assertEqual(tag('123y', table), (1, [('digits', 1, 3, None)], 4))
+        self.assertEqual(self.calls, 1)
+
+    def test_table_in_list(self):
+        tables = [self.child]
+        for command in (TableInList, SubTableInList):
+            self.calls = 0
+            plain = self.alternatives(
+                ('n', command, (tables, 0)), ('n', command, (tables, 0))
+            )
+            memoized = self.alternatives(
+                ('n', command | Memoize, (tables, 0)),
+                ('n', command | Memoize, (tables, 0)),
+            )
+            self.assertEqual(tag('123y', memoized), tag('123y', plain))
+            self.assertEqual(self.calls, 3)
+
+    def test_failure(self):
+        """Failures are remembered as well"""
+        table = self.alternatives(
+            ('n', Table | Memoize, self.child), ('n', Table | Memoize, self.child)
+        )
+        self.assertEqual(tag('1y', table), (0, [], 0))
+        self.assertEqual(self.calls, 1)
+
+    def test_memo_size(self):
+        table = self.alternatives(
+            ('n', Table | Memoize, self.child), ('n', Table | Memoize, self.child)
+        )
+        set_memo_size(0)
+        self.assertEqual(tag('123y', table)[-1], 4)
+        self.assertEqual(self.calls, 2)
+
+    def test_parser(self):
+        memoized = Parser(declaration, 'expr', memoize=True)
+        plain = Parser(declaration, 'expr')
+        for text in ('1', '(1)+2*3', '((1-2)/3)*(4+5)', '((1)', '1+', '2*(3'):
+            for release in (0, 1):
+                set_release_gil(release)
+                self.assertEqual(memoized.parse(text), plain.parse(text))
+
+    def test_small_budget(self):
+        """Evicted and forgotten outcomes are re-parsed"""
+        plain = Parser(declaration, 'expr')
+        memoized = Parser(declaration, 'expr', memoize=True)
+        for text in ('((1-2)/3)*(4+5)-((6))', '(1*(())+(1)', '((1*2)+(3)/4'):
+            expected = plain.parse(text)
+            for size in (1, 2, 3, 16):
+                set_memo_size(size)
+                for release in (0, 1):
+                    set_release_gil(release)
+                    self.assertEqual(memoized.parse(text), expected)
+
+    def test_linear(self):
+        """Nested alternatives don't re-parse shared prefixes
+
+        Without memoization each level of parentheses multiplies the
+        work by nine, which would take minutes here.
+        """
+        parser = Parser(declaration, 'expr', memoize=True)
+        depth = 12
+        text = '(' * depth + '1' + ')' * depth + '+2*3'
+        for release in (0, 1):
+            set_release_gil(release)
+            self.assertEqual(parser.parse(text)[-1], len(text))
+
+    def test_deep(self):
+        """Replayed outcomes nested in replayed outcomes"""
+        parser = Parser(declaration, 'expr', memoize=True)
+        texts = [
+            '(' * 40 + '1' + ')' * 40 + '+2*3',
+            '((1*(2+3))/((4)))-(((5)))*6+' * 8 + '7',
+            '(((1+2)*3)' + ')' * 2,
+        ]
+        set_release_gil(0)
+        expected = [parser.parse(text) for text in texts]
+        set_release_gil(1)
+        for text, result in zip(texts, expected):
+            self.assertEqual(parser.parse(text), result)
+            self.assertEqual(parser.parse(text, compact=True), result)
+
+    def test_deep_scaling(self):
+        """Replaying doesn't copy the results of nested productions
+
+        The GIL-free engine used to copy all records of a replayed
+        outcome, so the time grew with the square of the depth.
+        """
+        parser = Parser(declaration, 'expr', memoize=True)
+
+        def best(depth):
+            text = '(' * depth + '1' + ')' * depth + '+2*3'
+            times = []
+            for i in range(7):
+                start = time.perf_counter()
+                parser.parse(text)
+                times.append(time.perf_counter() - start)
+            return min(times)
+
+        # linear is 8 times the time, quadratic 64; both depths are
+        # past the growth of the memo, which costs a step of its own
+        self.assertLess(best(2048), 32 * best(256))
+
+    def test_productions(self):
+        parser = Parser(declaration, 'expr', memoize=['term'])
+        generator = parser._generator
+        self.assertTrue(generator.memoizes('term'))
+        self.assertFalse(generator.memoizes('expr'))
+        found = {}
+        def collect(table):
+            for entry in table:
+                command, argument = entry[1], entry[2]
+                if command & 0xFF in (TableInList, SubTableInList):
+                    found.setdefault(entry[0], set()).add(bool(command & Memoize))
+                elif command & 0xFF in (Table, SubTable) and isinstance(argument, tuple):
+                    collect(argument)
+        collect(generator.buildParser('expr'))
+        self.assertEqual(found, {'term': {True}, 'expr': {False}})
+
+    def test_set_memoize(self):
+        parser = Parser(declaration, 'expr')
+        generator = parser._generator
+        generation = generator.generation
+        generator.setMemoize(None)
+        self.assertEqual(generator.generation, generation)
+        generator.setMemoize(True)
+        self.assertEqual(generator.generation, generation + 1)
+        self.assertTrue(generator.memoizes('number'))
+        generator.setMemoize(True)
+        self.assertEqual(generator.generation, generation + 1)
+        self.assertEqual(parser.parse('(1)+2')[-1], 5)
+
+
+def getSuite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(MemoizeTests)
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
@@ -0,0 +1,161 @@
+"""Tests for MultiTextSearch and repeating negative groups of literals"""
+import pickle
+import unittest
+from simpleparse.parser import Parser
+from simpleparse.objectgenerator import FirstOfGroup
+from simpleparse.stt.TextTools import (
+    tag, TagTable, BytesTagTable, EncodedTagTable,
+    MultiTextSearch, MultiTextSearchType, sWordStart, sWordEnd, sFindWord,
+    WordInList, Move, ToEOF,
+)
+from simpleparse.stt.TextTools.TextTools import find, findall
+
+FACTORIES = (
+    (TagTable, lambda text: text),
+    (BytesTagTable, lambda text: text.encode('utf-8')),
+    (lambda table: EncodedTagTable(table, 'utf-8'), lambda text: text.encode('utf-8')),
+    (lambda table: EncodedTagTable(table, 'latin-1'), lambda text: text.encode('latin-1')),
+)
+
+
+class MultiTextSearchTests(unittest.TestCase):
+    def test_search(self):
+        search = MultiTextSearch(['*/', '"', 'abcd', 'bc', 'ab'])
+        self.assertIsInstance(search, MultiTextSearchType)
+        self.assertEqual(search.match, ('*/', '"', 'abcd', 'bc', 'ab'))
+        for text, expected in (
+            ('xx */ y', (3, 5)),
+            # the leftmost occurrence, although "bc" ends first
+            ('xabcd', (1, 5)),
+            # the first word given of those starting there
+            ('xabc', (1, 3)),
+            ('xbcd', (1, 3)),
+            ('\xe9€\U0001F600 "', (4, 5)),
+            ('nothing', (0, 0)),
+            ('', (0, 0)),
+        ):
+            self.assertEqual(search.search(text), expected, text)
+        self.assertEqual(search.search('abcd', 1), (1, 3))
+        self.assertEqual(search.search('xx */', 0, 4), (0, 0))
+        self.assertEqual(search.find('x "'), 2)
+        self.assertEqual(search.find('x'), -1)
+        self.assertEqual(search.findall('abcd"*/bc'), [(0, 4), (4, 5), (5, 7), (7, 9)])
+
+    def test_bytes(self):
+        search = MultiTextSearch((b'ab', b'b'))
+        self.assertEqual(search.findall(b'aabab'), [(1, 3), (3, 5)])
+        self.assertRaises(TypeError, search.search, 'ab')
+        self.assertRaises(TypeError, MultiTextSearch(('ab',)).search, b'ab')
+
+    def test_arguments(self):
+        self.assertRaises(TypeError, MultiTextSearch, ())
+        self.assertRaises(TypeError, MultiTextSearch, ('a', b'b'))
+        self.assertRaises(TypeError, MultiTextSearch, (1,))
+        self.assertRaises(ValueError, MultiTextSearch, ('a', ''))
+
+    def test_helpers(self):
+        text = 'one {{ two }} {% three %}'
+        self.assertEqual(find(text, ['{%', '{{']), 4)
+        self.assertEqual(find(text, ('{%', '{{'), 5), 14)
+        self.assertEqual(findall(text, ['{{', '{%', '}}', '%}']), [(4, 6), (11, 13), (14, 16), (23, 25)])
+
+    def test_pickle(self):
+        search = MultiTextSearch(('a', 'bc'))
+        copy = pickle.loads(pickle.dumps(search))
+        self.assertEqual(copy.match, search.match)
+        table = BytesTagTable(((None, sWordStart, search),))
+        copy = pickle.loads(pickle.dumps(table))
+        self.assertEqual(copy.compiled()[0][2].match, (b'a', b'bc'))
+
+
+class MultiSearchCommandTests(unittest.TestCase):
+    def test_commands(self):
+        search = MultiTextSearch(('*/', '\xe9'))
+        for factory, encode in FACTORIES:
+            for command, expected in (
+                (sWordStart, (1, [('x', 0, 2, None)], 2)),
+                (sWordEnd, (1, [('x', 0, 4, None)], 4)),
+                (sFindWord, (1, [('x', 2, 4, None)], 4)),
+            ):
+                text = encode('ab*/\xe9')
+                table = factory((('x', command, search),))
+                self.assertEqual(tag(text, table), expected, (command, factory))
+            table = factory((('x', sWordEnd, search),))
+            result = tag(encode('ab\xe9*/'), table)
+            self.assertEqual(result[-1], len(encode('ab\xe9')))
+            self.assertEqual(tag(encode('abc'), table)[0], 0)
+
+    def test_converted(self):
+        """Words are converted for the table as for Word"""
+        search = MultiTextSearch(('\xe9', 'b'))
+        self.assertIs(TagTable(((None, sWordStart, search),)).compiled()[0][2], search)
+        self.assertEqual(
+            EncodedTagTable(((None, sWordStart, search),), 'latin-1').compiled()[0][2].match,
+            (b'\xe9', b'b'),
+        )
+        self.assertRaises(
+            UnicodeError, EncodedTagTable, ((None, sWordStart, MultiTextSearch(('€',))),), 'latin-1'
+        )
+
+
+class NegativeGroupTests(unittest.TestCase):
+    def tables(self, declaration, root):
+        tables = []
+        for size in (FirstOfGroup.minSearchSize, 10**9):
+            previous = FirstOfGroup.minSearchSize
+            FirstOfGroup.minSearchSize = size
+            try:
+                tables.append(Parser(declaration, root)._generator.buildParser(root))
+            finally:
+                FirstOfGroup.minSearchSize = previous
+        return tables
+
+    def test_generated(self):
+        search, chain = self.tables('x := -("*/" / "ab")*', 'x')
+        self.assertEqual(search[0][1], sWordStart)
+        self.assertEqual(search[0][2].match, ('*/', 'ab'))
+        self.assertEqual(search[1][1:], (Move, ToEOF))
+        self.assertNotEqual(chain[0][1], sWordStart)
+        search, chain = self.tables('x := -("*/" / "ab")+', 'x')
+        self.assertIn(WordInList + 4096, [entry[1] for entry in search])
+        # case-insensitive literals aren't searched for
+        search, chain = self.tables('x := -(c"ab" / "cd")*', 'x')
+        self.assertEqual(search, chain)
+
+    def test_equivalent(self):
+        """Search tables produce the results of the character loops"""
+        texts = [
+            '', 'a', '*/', 'xx*/', 'xab', 'a*/b', 'x"y"*/ab\xe9', '/*/**/', 'aaab',
+            '\xe9\xe9*/ab', 'xyz' * 5 + '"',
+        ]
+        for declaration in (
+            'x := -("*/" / \'"\' / "ab")*',
+            'x := -("*/" / \'"\' / "ab")+',
+            'x := -("*/" / \'"\' / "ab")*, "*/"',
+            'x := -("*/" / \'"\' / "ab")+, ("*/" / \'"\' / "ab")',
+            'x := (-("*/" / "\xe9")+ / "*/" / "\xe9")*',
+            'x := (a / "*/" / \'"\' / "ab")*\na := -("*/" / \'"\' / "ab")+',
+            'x := -("*/" / "ab")+!, "*/"',
+        ):
+            search, chain = self.tables(declaration, 'x')
+            for factory, encode in FACTORIES:
+                for text in texts:
+                    text = encode(text)
+                    try:
+                        expected = tag(text, factory(chain))
+                    except Exception as err:
+                        self.assertRaises(type(err), tag, text, factory(search))
+                    else:
+                        self.assertEqual(tag(text, factory(search)), expected, (declaration, text))
+
+
+def getSuite():
+    return unittest.TestSuite((
+        unittest.defaultTestLoader.loadTestsFromTestCase(MultiTextSearchTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(MultiSearchCommandTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(NegativeGroupTests),
+    ))
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
@@ -0,0 +1,227 @@
+"""Tests for tagging with callback-free tables without the GIL"""
+import threading
+import unittest
+from simpleparse.stt.TextTools import (
+    tag, TagTable, BytesTagTable, set_release_gil,
+    AllIn, Word, Is, IsIn, Table, SubTable, TableInList, Call,
+    SubTableInList, sFindWord, AppendMatch, AppendTagobj, LookAhead,
+    CallTag, MatchFail, MatchOk, Skip,
+    ThisTable, TextSearch, MultiTextSearch, sWordStart,
+)
+from simpleparse.parser import Parser
+
+declaration = r'''
+file := (ws, item)*, ws
+item := number / string / name / list
+list := '[', ws, (item, ws, ','?, ws)*, ']'
+name := [a-zA-Z_], [a-zA-Z0-9_]*
+<ws> := [ \t\n]*
+number := [0-9]+
+string := '"', -'"'*, '"'
+'''
+text = 'abc [1, 2, "x y", [foo, 3]] 42 "q"\n' * 50
+
+digits = '0123456789'
+
+
+class NoGILTests(unittest.TestCase):
+    def setUp(self):
+        self.previous = set_release_gil(1)
+
+    def tearDown(self):
+        set_release_gil(self.previous)
+
+    def compare(self, table, text, *args):
+        """Tagging with and without releasing the GIL gives equal results"""
+        released = tag(text, table, *args)
+        set_release_gil(0)
+        try:
+            held = tag(text, table, *args)
+        finally:
+            set_release_gil(1)
+        self.assertEqual(released, held)
+        return released
+
+    def test_toggle(self):
+        self.assertEqual(set_release_gil(0), True)
+        self.assertEqual(set_release_gil(1), False)
+
+    def test_parser(self):
+        parser = Parser(declaration, 'file')
+        for source in (text, text.encode('ascii'), text + 'ሴ',
+                       text + '\U0001F600'):
+            released = parser.parse(source)
+            set_release_gil(0)
+            try:
+                held = parser.parse(source)
+            finally:
+                set_release_gil(1)
+            self.assertEqual(released, held)
+            self.assertEqual(released[-1], len(text))
+
+    def test_flags(self):
+        child = TagTable((('digits', AllIn, digits),))
+        table = TagTable((
+            ('match', AllIn + AppendMatch, 'ab'),
+            ('tagobj', Is + AppendTagobj, ' '),
+            ('table', Table, child),
+            (None, Table, child, +1),
+            ('matchtable', Table + AppendMatch, child, +1),
+            ('ahead', Word + LookAhead, 'x'),
+            ('sub', SubTable, child, +1),
+            ('x', Is, 'x'),
+        ))
+        result = self.compare(table, 'ab 12x')
+        self.assertEqual(result, (1, [
+            'ab', 'tagobj',
+            ('table', 3, 5, [('digits', 3, 5, None)]),
+            ('ahead', 5, 6, None),
+            ('x', 5, 6, None),
+        ], 6))
+        self.compare(table, 'ab 1', 0, 4)
+        self.compare(table, 'ab 12y')
+
+    def test_failure_truncates(self):
+        child = TagTable((
+            ('a', Is, 'a'),
+            ('b', Is, 'b'),
+        ))
+        table = TagTable((
+            ('first', Table, child, +2, MatchOk),
+            ('second', SubTable, child, +1),
+            ('a', Is, 'a'),
+        ))
+        self.assertEqual(self.compare(table, 'ac'), (1, [('a', 0, 1, None)], 1))
+        self.assertEqual(self.compare(table, 'ab'),
+                         (1, [('first', 0, 2, [('a', 0, 1, None), ('b', 1, 2, None)])], 2))
+        self.assertEqual(self.compare(table, 'c')[0], 0)
+
+    def test_recursion(self):
+        table = TagTable((
+            ('open', Is, '(', +3),
+            ('nested', Table, ThisTable, MatchFail),
+            ('close', Is, ')', MatchFail, MatchOk),
+            ('x', Is, 'x'),
+        ))
+        self.assertEqual(self.compare(table, '((x))')[2], 5)
+        self.assertEqual(self.compare(table, '((x)')[0], 0)
+
+    def test_table_in_list(self):
+        tables = [TagTable((('digits', AllIn, digits),))]
+        table = TagTable((
+            ('number', TableInList, (tables, 0)),
+            ('sub', SubTableInList, (tables, 0), +1),
+        ))
+        self.assertEqual(
+            self.compare(table, '12'),
+            (1, [('number', 0, 2, [('digits', 0, 2, None)])], 2),
+        )
+
+    def test_bytes_and_search(self):
+        table = BytesTagTable((
+            ('find', sFindWord, TextSearch(b'needle', algorithm=0)),
+            ('rest', IsIn, b'!'),
+        ))
+        self.assertEqual(
+            self.compare(table, b'hay needle!'),
+            (1, [('find', 4, 10, None), ('rest', 10, 11, None)], 11),
+        )
+
+    def test_multi_search(self):
+        for factory, value in ((TagTable, 'a "b" */ c'), (BytesTagTable, b'a "b" */ c')):
+            table = factory((
+                ('text', sWordStart, MultiTextSearch(('*/', '"b"'))),
+                ('rest', AllIn, value[2:]),
+            ))
+            self.assertEqual(
+                self.compare(table, value),
+                (1, [('text', 0, 2, None), ('rest', 2, 10, None)], 10),
+            )
+
+    def test_callbacks(self):
+        """Tables which call back into Python use the standard engine"""
+        seen = []
+
+        def call(taglist, text, left, right, children):
+            seen.append(text[left:right])
+
+        def skip(text, start, stop):
+            return start + 1
+
+        table = TagTable((
+            (call, AllIn + CallTag, 'ab'),
+            ('skip', Call, skip),
+        ))
+        self.assertEqual(self.compare(table, 'abc'), (1, [('skip', 2, 3, None)], 3))
+        self.assertEqual(seen, ['ab', 'ab'])
+
+    def test_errors(self):
+        """Errors are raised by the GIL-free engine itself"""
+        table = TagTable((
+            ('digits', AllIn, digits),
+            ('back', Skip, -5),
+        ))
+        self.assertTrue(table.releases_gil())
+        messages = []
+        for release in (1, 0):
+            set_release_gil(release)
+            with self.assertRaises(TypeError) as context:
+                tag('12', table)
+            messages.append(str(context.exception))
+        set_release_gil(1)
+        self.assertEqual(messages[0], messages[1])
+        self.assertIn('moved/skipped beyond start of text', messages[0])
+        # no re-run by the standard engine, which would re-check the table
+        self.assertTrue(table.releases_gil())
+
+    def test_fallback(self):
+        """Tables changed after the check are re-run by the standard engine"""
+        seen = []
+
+        def call(text, start, stop):
+            seen.append(start)
+            return stop
+
+        tables = [TagTable((('letters', AllIn, 'ab'),))]
+        table = TagTable((
+            ('digits', AllIn, digits),
+            ('rest', TableInList, (tables, 0)),
+        ))
+        self.assertEqual(self.compare(table, '12ab')[1][1],
+                         ('rest', 2, 4, [('letters', 2, 4, None)]))
+        self.assertTrue(table.releases_gil())
+        tables[0] = TagTable((('call', Call, call),))
+        self.assertEqual(tag('12ab', table), (1, [
+            ('digits', 0, 2, None),
+            ('rest', 2, 4, [('call', 2, 4, None)]),
+        ], 4))
+        # called once, by the standard engine, which runs later parses
+        self.assertEqual(seen, [2])
+        self.assertFalse(table.releases_gil())
+        tag('12ab', table)
+        self.assertEqual(seen, [2, 2])
+
+    def test_threads(self):
+        parser = Parser(declaration, 'file')
+        expected = parser.parse(text)
+        results = []
+
+        def run():
+            for i in range(20):
+                results.append(parser.parse(text))
+        threads = [threading.Thread(target=run) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 80)
+        for result in results:
+            self.assertEqual(result, expected)
+
+
+def getSuite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(NoGILTests)
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
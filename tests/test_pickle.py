@@ -0,0 +1,118 @@
+"""Tests for pickling parsers, generators and compiled tag tables"""
+import pickle
+import unittest
+from simpleparse.parser import Parser
+from simpleparse.processor import Processor
+from simpleparse.error import ParserSyntaxError
+from simpleparse.stt.TextTools import (
+    tag, TagTable, BytesTagTable, EncodedTagTable, Word, AllIn,
+    TableInList, tagtable_cache_info,
+)
+from simpleparse import baseparser
+
+declaration = r'''
+file := (ws, item)*, ws
+item := number / name / list
+list := '[', ws, (item, ws, ','?, ws)*, ']'!
+name := [a-zA-Zé_], [a-zA-Z0-9_]*
+number := [0-9]+
+<ws> := [ \t\n]*
+'''
+text = 'abc [1, 2, [foo, 3]] 42 été\n'
+
+
+def roundtrip(obj):
+    return pickle.loads(pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+
+
+class NameProcessor(Processor):
+    def __call__(self, value, buffer):
+        return value
+
+
+class PickleTests(unittest.TestCase):
+    def test_table_types(self):
+        definition = ((None, Word, 'a'),)
+        for table in (
+            TagTable(definition),
+            BytesTagTable(definition),
+            EncodedTagTable(definition, 'latin-1'),
+        ):
+            copy = roundtrip(table)
+            self.assertEqual(copy.tabletype, table.tabletype)
+            self.assertEqual(copy.encoding, table.encoding)
+            self.assertEqual(copy.compiled(), table.compiled())
+        self.assertEqual(
+            tag(b'a', roundtrip(BytesTagTable(definition))), (1, [], 1)
+        )
+
+    def test_not_cached(self):
+        """Unpickled tables are not entered into the TagTable cache"""
+        data = pickle.dumps(TagTable(((None, Word, 'a'),)))
+        size = tagtable_cache_info()['size']
+        pickle.loads(data)
+        self.assertEqual(tagtable_cache_info()['size'], size)
+
+    def test_linked_tables(self):
+        """Tables referring to each other through a list survive"""
+        tables = []
+        tables.append(TagTable((
+            ('a', Word, 'a'),
+            ('nested', TableInList, (tables, 0), 1, -1),
+        ), 0))
+        copy = roundtrip(tables)
+        self.assertEqual(tag('aaa', copy[0]), tag('aaa', tables[0]))
+
+    def test_parser(self):
+        parser = Parser(declaration, 'file')
+        expected = parser.parse(text)
+        copy = roundtrip(parser)
+        self.assertEqual(copy.parse(text), expected)
+        self.assertEqual(copy.parse('item', 'name'), parser.parse('item', 'name'))
+        self.assertRaises(ParserSyntaxError, copy.parse, '[1')
+
+    def test_cached_tables(self):
+        """Compiled tables are carried over, except for processors"""
+        parser = Parser(declaration, 'file')
+        data = text.encode('utf-8')
+        parser.parse(text)
+        parser.parse(data, encoding='utf-8')
+        parser.parse(text, processor=NameProcessor())
+        copy = roundtrip(parser)
+        keys = set(copy._taggerCache[1])
+        self.assertEqual(keys, {
+            ('file', None, None),
+            ('file', None, TagTable),
+            ('file', None, baseparser.encodedFactory('utf-8')),
+        })
+        self.assertIs(copy._taggerCache[0][0], copy._generator)
+        self.assertEqual(
+            copy.parse(data, encoding='utf-8'),
+            parser.parse(data, encoding='utf-8'),
+        )
+
+    def test_generator(self):
+        parser = Parser(declaration, 'file')
+        parser.parse(text, processor=NameProcessor())
+        generator = roundtrip(parser._generator)
+        self.assertIsNone(generator.methodSource)
+        self.assertEqual(generator.getNames(), parser._generator.getNames())
+        self.assertEqual(
+            tag(text, generator.buildParser('file')), parser.parse(text)
+        )
+
+    def test_version(self):
+        parser = Parser(declaration, 'file')
+        state = parser.__getstate__()
+        self.assertEqual(state['_pickleVersion'], parser.pickleVersion)
+        state['_pickleVersion'] = parser.pickleVersion + 1
+        copy = Parser.__new__(Parser)
+        self.assertRaises(ValueError, copy.__setstate__, state)
+
+
+def getSuite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(PickleTests)
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
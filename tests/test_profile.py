@@ -0,0 +1,158 @@
+"""Tests for the per-production profiling counters"""
+import unittest
+from simpleparse.stt.TextTools import (
+    tag, TagTable, set_release_gil,
+    AllIn, Is, Call, Table, SubTable, MatchFail, MatchOk, Memoize,
+)
+from simpleparse.parser import Parser
+from simpleparse.profiling import Profile
+
+digits = '0123456789'
+
+declaration = r'''
+list := item, (',', item)*
+item := ('[', list, ']') / number
+number := [0-9]+
+'''
+
+
+class ProfileTests(unittest.TestCase):
+    def setUp(self):
+        self.child = TagTable((('digits', AllIn, digits),))
+        self.table = TagTable((
+            ('n', Table, self.child),
+            (None, Is, '+'),
+            ('n', Table, self.child, MatchFail, MatchOk),
+        ))
+
+    def tearDown(self):
+        set_release_gil(1)
+
+    def test_tag(self):
+        for release in (0, 1):
+            set_release_gil(release)
+            profile = []
+            result = tag('12+345', self.table, profile=profile)
+            self.assertEqual(result[-1], 6)
+            self.assertEqual(len(profile), 1)
+            tagobj, table, entries, successes, failures, consumed, seconds, children = profile[0]
+            self.assertEqual((tagobj, table), (None, self.table))
+            self.assertEqual((entries, successes, failures, consumed), (1, 1, 0, 6))
+            self.assertTrue(seconds >= 0)
+            self.assertEqual(len(children), 1)
+            self.assertEqual(children[0][:6], ('n', self.child, 2, 2, 0, 5))
+            self.assertEqual(children[0][7], ())
+            self.assertTrue(children[0][6] <= seconds)
+
+    def test_failure(self):
+        profile = []
+        self.assertEqual(tag('x', self.table, profile=profile), (0, [], 0))
+        self.assertEqual(profile[0][2:6], (1, 0, 1, 0))
+        self.assertEqual(profile[0][7][0][2:6], (1, 0, 1, 0))
+
+    def test_off(self):
+        """Calls without profile, also nested in profiled ones, don't count"""
+        inner = []
+
+        def callback(text, position, stop):
+            inner.append(tag(text, self.table, position, stop))
+            return position
+
+        table = TagTable((
+            (None, Call, callback, +1, +1),
+            (None, SubTable, self.table),
+        ))
+        profile = []
+        self.assertEqual(tag('1+2', table, profile=profile)[-1], 3)
+        self.assertEqual(inner[0][-1], 3)
+        self.assertEqual(len(profile), 1)
+        self.assertEqual(len(profile[0][7]), 1)
+        self.assertEqual(profile[0][7][0][:6], (None, self.table, 1, 1, 0, 3))
+        self.assertEqual(len(profile[0][7][0][7]), 1)
+        self.assertEqual(tag('1+2', table, profile=None)[-1], 3)
+
+    def test_error(self):
+        def callback(text, position, stop):
+            raise ValueError(position)
+
+        table = TagTable((('n', Table, self.child), (None, Call, callback)))
+        profile = []
+        self.assertRaises(ValueError, tag, '1', table, profile=profile)
+        self.assertEqual(profile, [])
+        self.assertEqual(tag('1+2', self.table)[-1], 3)
+
+    def test_memoize(self):
+        """Replayed outcomes are counted as calls taking no time"""
+        first = (('n', Table | Memoize, self.child), (None, Is, 'x'))
+        table = (
+            (None, SubTable, first, +1, MatchOk),
+            ('n', Table | Memoize, self.child),
+        )
+        profile = []
+        self.assertEqual(tag('12', table, profile=profile)[-1], 2)
+        called, replayed = profile[0][7]
+        self.assertEqual(called[0], None)
+        self.assertEqual(called[7][0][:6], ('n', self.child, 1, 1, 0, 2))
+        self.assertEqual(replayed[:7], ('n', self.child, 1, 1, 0, 2, 0))
+
+    def test_parser(self):
+        parser = Parser(declaration, 'list')
+        text = '[1,[2,3]],4'
+        expected = parser.parse(text)
+        self.assertEqual(parser.parse(text, profile=True), expected)
+        stats = parser.lastProfile.stats()
+        self.assertEqual(sorted(stats), ['item', 'list'])
+        self.assertEqual(stats['list']['entries'], 3)
+        self.assertEqual(stats['list']['successes'], 3)
+        self.assertEqual(stats['list']['consumed'], len(text) + 7 + 3)
+        self.assertEqual(stats['item']['entries'], 6)
+        self.assertEqual(stats['item']['failures'], 0)
+        for totals in stats.values():
+            self.assertTrue(0 <= totals['time'])
+        # recursive calls aren't counted twice
+        self.assertTrue(stats['item']['time'] <= stats['list']['time'])
+
+    def test_collect(self):
+        parser = Parser(declaration, 'list')
+        profile = Profile()
+        parser.parse('1,2', profile=profile)
+        parser.parse('[3]', profile=profile)
+        self.assertEqual(profile.calls, 2)
+        stats = profile.stats()
+        self.assertEqual(stats['list']['entries'], 3)
+        self.assertEqual(stats['item']['entries'], 4)
+        profile.clear()
+        self.assertEqual(profile.stats(), {})
+        self.assertEqual(profile.collapsed(), '')
+
+    def test_collapsed(self):
+        parser = Parser(declaration, 'list')
+        parser.parse('[[[1]]],' * 200, profile=True)
+        lines = parser.lastProfile.collapsed(unit=1e-9).splitlines()
+        self.assertTrue(lines)
+        stacks = set()
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertTrue(int(count) > 0)
+            stacks.add(stack)
+            self.assertTrue(stack.startswith('list'))
+        self.assertTrue('list;item;list;item' in stacks)
+
+    def test_anonymous(self):
+        """Tables are named by the names given or by their tag object"""
+        profile = Profile({self.table: 'sum'})
+        tag('1+2', (('sum', Table, self.table), (None, Table, self.table)), 0, 3, profile=profile)
+        stats = profile.stats()
+        self.assertEqual(sorted(stats), ['<root>', 'n', 'sum'])
+        # the second call fails at the end of the text
+        self.assertEqual(stats['sum']['entries'], 2)
+        self.assertEqual(stats['sum']['failures'], 1)
+        self.assertEqual(stats['n']['entries'], 3)
+
+
+def getSuite():
+    return unittest.defaultTestLoader.loadTestsFromTestCase(ProfileTests)
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
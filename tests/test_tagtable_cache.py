@@ -0,0 +1,104 @@
+"""Tests for the LRU cache of compiled TagTables"""
+import unittest
+from simpleparse.stt.TextTools import (
+    tag, Word, TableInList, TagTable, EncodedTagTable,
+    tagtable_cache_info, set_tagtable_cache_size,
+    clear_tagtable_cache,
+)
+
+
+class TagTableCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.previous = set_tagtable_cache_size(3)
+        clear_tagtable_cache()
+        self.tables = [((None, Word, 'a%d' % i),) for i in range(5)]
+
+    def tearDown(self):
+        set_tagtable_cache_size(self.previous)
+        clear_tagtable_cache()
+
+    def test_stats(self):
+        """Lookups are counted as hits and misses"""
+        tag('a0', self.tables[0])
+        tag('a0', self.tables[0])
+        tag('a1', self.tables[1])
+        info = tagtable_cache_info()
+        self.assertEqual(info['hits'], 1)
+        self.assertEqual(info['misses'], 2)
+        self.assertEqual(info['evictions'], 0)
+        self.assertEqual(info['size'], 2)
+        self.assertEqual(info['maxsize'], 3)
+
+    def test_lru_eviction(self):
+        """Filling the cache evicts least recently used tables only"""
+        for table in self.tables[:3]:
+            tag('a', table)
+        tag('a', self.tables[0])  # refresh 0, leaving 1 as the oldest
+        tag('a', self.tables[3])
+        info = tagtable_cache_info()
+        self.assertEqual(info['evictions'], 1)
+        self.assertEqual(info['size'], 3)
+        for index in (0, 2, 3):
+            tag('a', self.tables[index])
+        self.assertEqual(tagtable_cache_info()['hits'], 4)
+        tag('a', self.tables[1])
+        self.assertEqual(tagtable_cache_info()['misses'], 5)
+
+    def test_resize(self):
+        """Shrinking the cache evicts the oldest tables"""
+        for table in self.tables[:3]:
+            tag('a', table)
+        self.assertEqual(set_tagtable_cache_size(1), 3)
+        info = tagtable_cache_info()
+        self.assertEqual(info['size'], 1)
+        self.assertEqual(info['evictions'], 2)
+        tag('a', self.tables[2])
+        self.assertEqual(tagtable_cache_info()['hits'], 1)
+
+    def test_disabled(self):
+        """A size of 0 disables caching"""
+        set_tagtable_cache_size(0)
+        tag('a0', self.tables[0])
+        tag('a0', self.tables[0])
+        info = tagtable_cache_info()
+        self.assertEqual(info['size'], 0)
+        self.assertEqual(info['misses'], 2)
+
+    def test_bad_size(self):
+        self.assertRaises(ValueError, set_tagtable_cache_size, -1)
+
+    def test_results(self):
+        """Evicted tables are recompiled transparently"""
+        set_tagtable_cache_size(1)
+        for i, table in enumerate(self.tables * 2):
+            self.assertEqual(tag('a%d' % (i % 5), table)[0], 1)
+
+    def test_encoded(self):
+        """Encoded tables are cached per normalized encoding"""
+        table = ((None, Word, 'é'),)
+        data = 'é'.encode('utf-8')
+        self.assertEqual(tag(data, table, encoding='utf-8')[2], 2)
+        self.assertEqual(tag(data, table, encoding='UTF8')[2], 2)
+        self.assertEqual(tag(b'\xe9', table, encoding='latin-1')[2], 1)
+        info = tagtable_cache_info()
+        self.assertEqual(info['hits'], 1)
+        self.assertEqual(info['misses'], 2)
+
+    def test_encoded_table(self):
+        table = ((None, Word, 'é'),)
+        compiled = EncodedTagTable(table, 'utf8')
+        self.assertIs(EncodedTagTable(table, 'utf-8'), compiled)
+        data = 'é'.encode('utf-8')
+        self.assertEqual(tag(data, compiled, encoding='utf-8')[2], 2)
+        self.assertRaises(ValueError, tag, data, compiled, encoding='latin-1')
+        self.assertRaises(TypeError, tag, data, TagTable(table), encoding='utf-8')
+        self.assertRaises(LookupError, EncodedTagTable, table, 'no-such-codec')
+
+    def test_encoded_table_in_list(self):
+        """TableInList targets of encoded tables are compiled with the encoding"""
+        table = (
+            (None, Word, 'é'),
+            (None, TableInList, ([((None, Word, 'ü'),)], 0)),
+        )
+        data = 'éü'.encode('utf-8')
+        self.assertEqual(tag(data, table, encoding='utf-8'), (1, [], 4))
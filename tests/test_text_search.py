@@ -0,0 +1,102 @@
+"""Tests for the Two-Way TextSearch algorithm and the AUTO choice"""
+import pickle
+import random
+import unittest
+from simpleparse.stt.TextTools import (
+    tag, TagTable, BytesTagTable, TextSearch, sWordStart, sWordEnd, sFindWord,
+    BOYERMOORE, TRIVIAL, TWOWAY, AUTO,
+)
+
+ALPHABETS = ('ab', 'abc', 'a', 'abcdefghij', 'a\xe9', 'aĀā', 'b\U00010000')
+
+
+def randomCases(count, seed=0):
+    """Random (text, match) pairs, many of them periodic"""
+    random.seed(seed)
+    for i in range(count):
+        alphabet = random.choice(ALPHABETS)
+        unit = ''.join(random.choice(alphabet) for j in range(random.randint(1, 5)))
+        match = (unit * 20)[:random.randint(1, 70)] + random.choice(['', random.choice(alphabet)])
+        text = ''.join(
+            random.choice([unit, match, random.choice(alphabet)])
+            for j in range(random.randint(0, 30))
+        )
+        yield text, match
+
+
+class TwoWayTests(unittest.TestCase):
+    def test_find(self):
+        for text, match in randomCases(3000):
+            search = TextSearch(match, algorithm=TWOWAY)
+            self.assertEqual(search.find(text), text.find(match), (text, match))
+            start = len(text) // 3
+            self.assertEqual(
+                search.find(text, start, len(text) - 1),
+                text.find(match, start, len(text) - 1), (text, match),
+            )
+            if max(text + match) <= '\xff':
+                search = TextSearch(match.encode('latin-1'), algorithm=TWOWAY)
+                self.assertEqual(
+                    search.find(text.encode('latin-1')), text.find(match), (text, match)
+                )
+
+    def test_findall(self):
+        for text, match in randomCases(500, 1):
+            self.assertEqual(
+                TextSearch(match, algorithm=TWOWAY).findall(text),
+                TextSearch(match, algorithm=TRIVIAL).findall(text),
+            )
+        self.assertEqual(TextSearch('{{').findall('a{{b{{{{'), [(1, 3), (4, 6), (6, 8)])
+
+    def test_commands(self):
+        for command, expected in ((sWordStart, 6), (sWordEnd, 9), (sFindWord, 9)):
+            for text, match in (('xyzxyzabc', 'abc'), ('Āā' * 3 + 'abc', 'abc')):
+                search = TextSearch(match, algorithm=TWOWAY)
+                self.assertEqual(tag(text, TagTable(((None, command, search),)))[-1], expected)
+            search = TextSearch(b'abc', algorithm=TWOWAY)
+            self.assertEqual(
+                tag(b'xyzxyzabc', BytesTagTable(((None, command, search),)))[-1], expected
+            )
+            self.assertEqual(
+                tag(b'xyzxyzab', BytesTagTable(((None, command, search, 1, 1),)))[-1], 0
+            )
+
+    def test_arguments(self):
+        self.assertRaises(ValueError, TextSearch, '', algorithm=TWOWAY)
+        self.assertRaises(TypeError, TextSearch, 1, algorithm=TWOWAY)
+        self.assertRaises(
+            TypeError, TextSearch, b'ab', bytes(range(256)), algorithm=TWOWAY
+        )
+
+    def test_pickle(self):
+        search = pickle.loads(pickle.dumps(TextSearch('abab', algorithm=TWOWAY)))
+        self.assertEqual(search.algorithm, TWOWAY)
+        self.assertEqual(search.find('abaababab'), 3)
+        self.assertIn('Two-Way', repr(search))
+
+
+class AutoTests(unittest.TestCase):
+    def test_choice(self):
+        for match, algorithm in (
+            ('a', TRIVIAL), ('', TRIVIAL), ('ab', TWOWAY), ('Āā', TWOWAY),
+            (b'a', BOYERMOORE), (b'hello', BOYERMOORE), (b'x' * 40, TWOWAY),
+            (b'aaaaaaab', TWOWAY), (b'abcdefghijklmnopqrstuvwxyz0123456789', TWOWAY),
+        ):
+            self.assertEqual(TextSearch(match).algorithm, algorithm, match)
+            self.assertEqual(TextSearch(match, algorithm=AUTO).algorithm, algorithm, match)
+        self.assertEqual(TextSearch(b'ab' * 20, bytes(range(256))).algorithm, BOYERMOORE)
+
+    def test_find(self):
+        for text, match in randomCases(1000, 2):
+            self.assertEqual(TextSearch(match).find(text), text.find(match), (text, match))
+
+
+def getSuite():
+    return unittest.TestSuite((
+        unittest.defaultTestLoader.loadTestsFromTestCase(TwoWayTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(AutoTests),
+    ))
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")
@@ -0,0 +1,103 @@
+"""Tests for FirstOf groups of literals compiled to WordInList"""
+import pickle
+import unittest
+from simpleparse.parser import Parser
+from simpleparse.objectgenerator import Literal, CILiteral, FirstOfGroup
+from simpleparse.common import timezone_names
+from simpleparse.stt.TextTools import (
+    tag, TagTable, BytesTagTable, EncodedTagTable,
+)
+from simpleparse.stt.TextTools.TextTools import WordInList
+
+FACTORIES = (
+    (TagTable, lambda text: text),
+    (BytesTagTable, lambda text: text.encode('utf-8')),
+    (lambda table: EncodedTagTable(table, 'utf-8'), lambda text: text.encode('utf-8')),
+    (lambda table: EncodedTagTable(table, 'latin-1'), lambda text: text.encode('latin-1')),
+)
+
+
+class WordInListCommandTests(unittest.TestCase):
+    table = ((None, WordInList, ('ab', 'abc', ('ABCD', 1), 'x', '', '\xe9')),)
+
+    def test_first_declared(self):
+        for factory, encode in FACTORIES:
+            table = factory(self.table)
+            for text, expected in (
+                ('abcd', 2), ('ABCDE', 4), ('aBcD', 4), ('abc', 2), ('a', 0),
+                ('x', 1), ('', 0), ('\xe9!', len(encode('\xe9'))), ('zz', 0),
+            ):
+                result = tag(encode(text), table)
+                self.assertEqual(result[-1] if result[0] else 0, expected, (text, factory))
+
+    def test_arguments(self):
+        for argument in ('ab', ('ab', 1), (('ab',),), (('\xe9', 1),), ((b'ab', 'x'),)):
+            self.assertRaises(TypeError, TagTable, ((None, WordInList, argument),))
+
+    def test_pickle(self):
+        """The compiled definition compiles to an equivalent table"""
+        table = TagTable(self.table)
+        self.assertEqual(table.compiled()[0][2], self.table[0][2])
+        copy = pickle.loads(pickle.dumps(table))
+        self.assertEqual(tag('ABCD', copy), (1, [], 4))
+
+
+class FirstOfWordListTests(unittest.TestCase):
+    def test_generated(self):
+        group = FirstOfGroup(children=[
+            Literal(value='in'), CILiteral(value='not'), Literal(value='if'),
+        ])
+        self.assertEqual(
+            group.toParser(), [(None, WordInList, ('in', ('not', 1), 'if'))]
+        )
+        group.repeating = 1
+        self.assertEqual(group.toParser()[0][1], WordInList)
+        for child in (
+            Literal(value='x', negative=1), Literal(value='x', repeating=1),
+            Literal(value='x', lookahead=1), CILiteral(value='\xe9t\xe9'),
+            Literal(value=''),
+        ):
+            group = FirstOfGroup(children=[Literal(value='in'), child])
+            self.assertIsNone(group.wordList())
+
+    def compare(self, declaration, root, texts):
+        parsers = []
+        for size in (FirstOfGroup.minWordListSize, 10**9):
+            previous = FirstOfGroup.minWordListSize
+            FirstOfGroup.minWordListSize = size
+            try:
+                parsers.append(Parser(declaration, root)._generator.buildParser(root))
+            finally:
+                FirstOfGroup.minWordListSize = previous
+        words, chain = parsers
+        for factory, encode in FACTORIES:
+            for text in texts:
+                text = encode(text)
+                self.assertEqual(
+                    tag(text, factory(words)), tag(text, factory(chain)), text
+                )
+
+    def test_timezones(self):
+        names = sorted(timezone_names.timezone_mapping)
+        self.compare(
+            '''names := (timezone_name / [a-zA-Z0-9]+, ' ')*''', 'names',
+            [' '.join(names) + ' ', 'Alphabet Zulu Z1 NZDTx ESTA ', 'Nope ', ''],
+        )
+
+    def test_case_insensitive(self):
+        self.compare(
+            '''words := (c"select" / c"sel" / "SELECTED" / c"from" / "\xe9t\xe9" / [a-zA-Z]+ / ' ')*''',
+            'words',
+            ['SELECT sel SeLeCtEd SELECTED From FROMAGE \xe9t\xe9 ', 'selec', ''],
+        )
+
+
+def getSuite():
+    return unittest.TestSuite((
+        unittest.defaultTestLoader.loadTestsFromTestCase(WordInListCommandTests),
+        unittest.defaultTestLoader.loadTestsFromTestCase(FirstOfWordListTests),
+    ))
+
+
+if __name__ == "__main__":
+    unittest.main(defaultTest="getSuite")